@@ -0,0 +1,125 @@
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+import operator
+import re
+import logging
+from src.models import MetricAlert, SystemLog, db
+from src.database.metric_store import MetricStore
+from src.database.sketch import quantile_name
+
+logger = logging.getLogger(__name__)
+
+CONDITIONS = {
+    '>': operator.gt,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '<=': operator.le,
+    '==': operator.eq
+}
+
+# 告警规则支持的聚合：avg/min/max/last 及 pNN 分位数（如 p95、p99.9）
+BASIC_AGGREGATIONS = ('avg', 'min', 'max', 'last')
+
+# 事件驱动的规则：序列出现新的异常事件时立即评估，阈值与事件分数的绝对值比较
+ANOMALY_AGGREGATION = 'anomaly'
+PERCENTILE_PATTERN = re.compile(r'^p(\d{1,2}(\.\d+)?)$')
+
+def parse_aggregation(aggregation: Optional[str]) -> Optional[float]:
+    """校验聚合名称，分位数返回 0~1 的分位点，其他聚合返回 None，不支持时抛出 ValueError"""
+    aggregation = aggregation or 'avg'
+    if aggregation in BASIC_AGGREGATIONS or aggregation == ANOMALY_AGGREGATION:
+        return None
+    match = PERCENTILE_PATTERN.match(aggregation)
+    if not match:
+        raise ValueError(f"Unsupported alert aggregation: {aggregation}")
+    return float(match.group(1)) / 100
+
+def evaluate_rule(rule: MetricAlert, store: MetricStore, now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """按规则的聚合方式统计最近 duration 秒的数值，超过阈值时返回告警信息，否则返回 None"""
+    now = now or datetime.utcnow()
+    start = now - timedelta(seconds=rule.duration or 60)
+    key = (rule.metric_type, rule.metric_name)
+    aggregation = rule.aggregation or 'avg'
+    if aggregation == ANOMALY_AGGREGATION:
+        # 由异常检测器的事件监听器评估，见 alert_on_anomalies
+        return None
+    quantile = parse_aggregation(aggregation)
+    if aggregation == 'last':
+        # 窗口内最新的一个样本
+        points = store.read_range(start, now, [key]).get(key)
+        value = points[-1][1] if points else None
+    elif quantile is None:
+        value = store.aggregate(start, now, [key]).get(key, {}).get(aggregation)
+    else:
+        # 分位数由汇总桶草图合并得到，不读取原始样本
+        value = store.quantiles(start, now, (quantile,), [key]).get(key, {}).get(quantile_name(quantile))
+    if value is None:
+        return None
+    compare = CONDITIONS.get(rule.condition)
+    if compare is None or not compare(value, rule.threshold):
+        return None
+    return _alert(rule, aggregation, value)
+
+def _alert(rule: MetricAlert, aggregation: str, value: float) -> Dict[str, Any]:
+    return {
+        'id': rule.id,
+        'name': rule.name,
+        'metric': f'{rule.metric_type}.{rule.metric_name}',
+        'aggregation': aggregation,
+        'value': value,
+        'condition': rule.condition,
+        'threshold': rule.threshold,
+        'severity': rule.severity
+    }
+
+def evaluate_alerts(store: MetricStore, now: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """评估所有启用的告警规则（需在应用上下文中调用），返回触发的告警"""
+    triggered = []
+    for rule in MetricAlert.query.filter_by(enabled=True):
+        try:
+            alert = evaluate_rule(rule, store, now)
+        except Exception as e:
+            logger.error(f"Failed to evaluate alert rule {rule.name}: {e}")
+            continue
+        if alert:
+            triggered.append(alert)
+    return triggered
+
+def evaluate_anomaly_rules(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """用新打开的异常事件评估 aggregation 为 anomaly 的规则（需在应用上下文中调用）
+
+    条件和阈值与事件分数的绝对值比较，未设置阈值时该序列的任一新事件都会触发。
+    """
+    rules = MetricAlert.query.filter_by(enabled=True, aggregation=ANOMALY_AGGREGATION).all()
+    triggered = []
+    for event in events:
+        score = abs(event['score'])
+        for rule in rules:
+            if (rule.metric_type, rule.metric_name) != (event['type'], event['metric']):
+                continue
+            if rule.threshold is not None:
+                compare = CONDITIONS.get(rule.condition)
+                if compare is None or not compare(score, rule.threshold):
+                    continue
+            triggered.append(_alert(rule, ANOMALY_AGGREGATION, score))
+    return triggered
+
+def record_alerts(alerts: List[Dict[str, Any]]) -> None:
+    """把触发的告警写入系统日志"""
+    if not alerts:
+        return
+    try:
+        for alert in alerts:
+            level = 'ERROR' if alert['severity'] in ('error', 'critical') else 'WARNING'
+            message = f"{alert['name']}: {alert['aggregation']}({alert['metric']}) = {alert['value']:.2f}"
+            if alert['threshold'] is not None:
+                message += f" {alert['condition']} {alert['threshold']}"
+            db.session.add(SystemLog(level=level, type='alert', message=message))
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Failed to record alerts: {e}")
+        db.session.rollback()
+
+def alert_on_anomalies(events: List[Dict[str, Any]]) -> None:
+    """异常检测器的事件监听器：新事件立即评估异常规则，触发的告警写入系统日志"""
+    record_alerts(evaluate_anomaly_rules(events))
@@ -0,0 +1,326 @@
+from typing import Dict, Any, List, Optional, Callable
+from collections import deque
+from datetime import datetime, timedelta
+import bisect
+import math
+import threading
+import logging
+from src.models import db, AnomalyEvent
+from src.database.metric_store import Series
+from src.database.streaming_stats import get_streaming_stats
+from src.utils.time_buckets import EPOCH
+
+logger = logging.getLogger(__name__)
+
+WEEK_HOURS = 168
+# 正态分布下 MAD 与标准差的换算系数
+MAD_SCALE = 1.4826
+
+EventListener = Callable[[List[Dict[str, Any]]], None]
+
+class SeriesDetector:
+    """单个序列的在线异常检测状态，内存占用与样本数无关
+
+    - ewma: 指数加权均值/方差的 z 分数
+    - mad: 最近 window 个样本的中位数/MAD 稳健分数
+    - seasonal: 按周内小时 (168 个槽) 的基线，每小时结束时把该小时的均值和方差并入对应槽
+
+    分数的尺度下限与序列相关：取 min_scale、relative_scale × |基线| 和观测到的最小取值间隔（量化步长）
+    中的最大值，平稳或按固定步长取值的序列（如磁盘使用率）不会因方差接近 0 而把一个步长判为异常。
+    """
+
+    __slots__ = ('count', 'mean', 'var', 'window', 'ordered', 'hour', 'hour_count', 'hour_mean', 'hour_m2',
+                 'slot_mean', 'slot_var', 'slot_hours', 'last_value', 'quantum', 'shift_count')
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.window = deque(maxlen=window)
+        self.ordered: List[float] = []
+        self.hour: Optional[int] = None
+        self.hour_count = 0
+        self.hour_mean = 0.0
+        self.hour_m2 = 0.0
+        self.slot_mean = [0.0] * WEEK_HOURS
+        self.slot_var = [0.0] * WEEK_HOURS
+        self.slot_hours = [0] * WEEK_HOURS
+        self.last_value: Optional[float] = None
+        self.quantum = 0.0  # 相邻不同原始值之间的最小间隔
+        self.shift_count = 0  # 连续异常的样本数
+
+    def observe(self, value: float) -> None:
+        """记录原始样本值（截断之前），用于估计序列的量化步长"""
+        if self.last_value is not None and value != self.last_value:
+            diff = abs(value - self.last_value)
+            self.quantum = diff if not self.quantum else min(self.quantum, diff)
+        self.last_value = value
+
+    def scale_floor(self, center: float, min_scale: float, relative_scale: float) -> float:
+        """以 center 为基线时分数尺度的下限"""
+        return max(min_scale, relative_scale * abs(center), self.quantum)
+
+    def scores(self, hour: int, value: float, warmup: int, min_scale: float,
+               relative_scale: float) -> Dict[str, tuple]:
+        """计算各检测器的 (分数, 基线)，尚未预热的检测器不出现"""
+        def floor(center: float) -> float:
+            return self.scale_floor(center, min_scale, relative_scale)
+
+        scores = {}
+        if self.count >= warmup:
+            scores['ewma'] = ((value - self.mean) / max(math.sqrt(self.var), floor(self.mean)), self.mean)
+        if len(self.ordered) == self.window.maxlen:
+            median = self._median(self.ordered)
+            mad = self._median(sorted(abs(item - median) for item in self.ordered))
+            scores['mad'] = ((value - median) / max(MAD_SCALE * mad, floor(median)), median)
+        slot = hour % WEEK_HOURS
+        if self.slot_hours[slot]:
+            expected = self.slot_mean[slot]
+            scores['seasonal'] = ((value - expected) / max(math.sqrt(self.slot_var[slot]), floor(expected)), expected)
+        return scores
+
+    def rebase(self, level: float) -> None:
+        """持续的水平位移：EWMA 均值和周内小时基线整体平移到新水平，清空中位数窗口重新预热"""
+        shift = level - self.mean
+        self.mean = level
+        self.slot_mean = [mean + shift for mean in self.slot_mean]
+        self.window.clear()
+        self.ordered = []
+        self.shift_count = 0
+
+    def update(self, hour: int, value: float, alpha: float, seasonal_alpha: float) -> None:
+        """并入一个样本（调用方负责对异常值截断）"""
+        if self.count == 0:
+            self.mean = value
+        else:
+            # 指数加权均值和方差的增量形式
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.var = (1 - alpha) * (self.var + diff * increment)
+        self.count += 1
+
+        if len(self.window) == self.window.maxlen:
+            self.ordered.pop(bisect.bisect_left(self.ordered, self.window[0]))
+        self.window.append(value)
+        bisect.insort(self.ordered, value)
+
+        if self.hour is None or hour > self.hour:
+            self._close_hour(seasonal_alpha)
+            self.hour = hour
+        if hour == self.hour:
+            self.hour_count += 1
+            delta = value - self.hour_mean
+            self.hour_mean += delta / self.hour_count
+            self.hour_m2 += delta * (value - self.hour_mean)
+
+    def seed(self, hour: int, mean: float, variance: float, seasonal_alpha: float) -> None:
+        """用已完成小时的均值和方差更新周内小时基线"""
+        slot = hour % WEEK_HOURS
+        if not self.slot_hours[slot]:
+            self.slot_mean[slot] = mean
+            self.slot_var[slot] = variance
+        else:
+            # 跨周的指数加权：小时内方差与各周均值之间的波动都计入基线方差
+            diff = mean - self.slot_mean[slot]
+            self.slot_mean[slot] += seasonal_alpha * diff
+            self.slot_var[slot] = (1 - seasonal_alpha) * (self.slot_var[slot] + seasonal_alpha * diff * diff) \
+                + seasonal_alpha * variance
+        self.slot_hours[slot] += 1
+
+    def _close_hour(self, seasonal_alpha: float) -> None:
+        if self.hour is not None and self.hour_count:
+            self.seed(self.hour, self.hour_mean, self.hour_m2 / self.hour_count, seasonal_alpha)
+        self.hour_count = 0
+        self.hour_mean = 0.0
+        self.hour_m2 = 0.0
+
+    @staticmethod
+    def _median(ordered: List[float]) -> float:
+        middle = len(ordered) // 2
+        if len(ordered) % 2:
+            return ordered[middle]
+        return (ordered[middle - 1] + ordered[middle]) / 2
+
+class AnomalyDetector:
+    """写入路径上的在线异常检测
+
+    作为指标存储的监听器，对每个写入的样本计算 EWMA、中位数/MAD 和周内小时基线
+    三种分数，超过阈值的检测器数不少于 anomaly_min_detectors 时判为异常。同一序列
+    间隔不超过 anomaly_merge_gap 秒的异常样本合并为一个事件，事件在检测到时立即写入
+    AnomalyEvent 表并通知事件监听器。异常样本按阈值截断后再更新状态，避免污染基线。
+    """
+
+    def __init__(self, config: Dict):
+        self.alpha = config.get('anomaly_ewma_alpha', 0.02)
+        self.window = config.get('anomaly_window', 120)
+        self.warmup = config.get('anomaly_warmup', 30)
+        self.seasonal_alpha = config.get('anomaly_seasonal_alpha', 0.3)
+        self.thresholds = {
+            'ewma': config.get('anomaly_z_threshold', 4.0),
+            'mad': config.get('anomaly_mad_threshold', 5.0),
+            'seasonal': config.get('anomaly_seasonal_threshold', 4.0)
+        }
+        self.min_detectors = config.get('anomaly_min_detectors', 1)
+        self.min_scale = config.get('anomaly_min_scale', 1e-3)
+        self.relative_scale = config.get('anomaly_relative_scale', 0.01)
+        self.shift_samples = config.get('anomaly_shift_samples', 30)
+        self.merge_gap = timedelta(seconds=config.get('anomaly_merge_gap', 300))
+
+        self._series: Dict[Series, SeriesDetector] = {}
+        self._open: Dict[Series, Dict[str, Any]] = {}
+        self._listeners: List[EventListener] = []
+        self._lock = threading.Lock()
+        self._processed = 0
+        self._anomalies = 0
+        self._events = 0
+
+    def add_listener(self, listener: EventListener) -> None:
+        """注册新事件的回调，参数为本批新打开的事件"""
+        self._listeners.append(listener)
+
+    def ingest(self, rows: List[Dict[str, Any]]) -> None:
+        """检测一批样本，新事件写入数据库（需在应用上下文中调用）"""
+        if not rows:
+            return
+        changed: Dict[int, Dict[str, Any]] = {}
+        with self._lock:
+            for row in rows:
+                key = (row['type'], row['metric'])
+                timestamp = row['timestamp']
+                value = float(row['value'])
+                hour = int((timestamp - EPOCH).total_seconds() // 3600)
+                detector = self._series.get(key)
+                if detector is None:
+                    detector = self._series[key] = SeriesDetector(self.window)
+
+                scores = detector.scores(hour, value, self.warmup, self.min_scale, self.relative_scale)
+                detector.observe(value)
+                fired = {name: score for name, score in scores.items() if abs(score[0]) > self.thresholds[name]}
+                if len(fired) >= self.min_detectors and fired:
+                    event = self._record(key, timestamp, value, fired)
+                    changed[id(event)] = event
+                    detector.shift_count += 1
+                    if self.shift_samples and detector.shift_count >= self.shift_samples:
+                        # 连续异常视为持续的水平位移，基线直接移到新水平，不再截断
+                        detector.rebase(value)
+                    elif 'ewma' in scores:
+                        # 截断到 EWMA 阈值边界后再更新，单次突变不拉偏基线
+                        bound = self.thresholds['ewma'] * max(
+                            math.sqrt(detector.var), detector.scale_floor(detector.mean, self.min_scale, self.relative_scale)
+                        )
+                        value = min(max(value, detector.mean - bound), detector.mean + bound)
+                else:
+                    detector.shift_count = 0
+                detector.update(hour, value, self.alpha, self.seasonal_alpha)
+            self._processed += len(rows)
+
+        if changed:
+            opened = [event for event in changed.values() if event['id'] is None]
+            self._persist(opened, [event for event in changed.values() if event['id'] is not None])
+            for event in opened:
+                logger.warning(
+                    f"Anomaly on {event['type']}.{event['metric']}: {event['value']} "
+                    f"(expected {event['expected']:.2f}, score {event['score']:.1f}, {','.join(event['detectors'])})"
+                )
+            for listener in self._listeners if opened else []:
+                try:
+                    listener(opened)
+                except Exception as e:
+                    logger.error(f"Anomaly listener {listener} failed: {e}", exc_info=True)
+
+    def _record(self, key: Series, timestamp: datetime, value: float, fired: Dict[str, tuple]) -> Dict[str, Any]:
+        """把异常样本并入序列当前事件或打开新事件"""
+        name = max(fired, key=lambda item: abs(fired[item][0]) / self.thresholds[item])
+        score, expected = fired[name]
+        severity = 'critical' if abs(score) >= 2 * self.thresholds[name] else 'warning'
+        self._anomalies += 1
+
+        event = self._open.get(key)
+        if event is not None and timedelta(0) <= timestamp - event['end_time'] <= self.merge_gap:
+            event['end_time'] = timestamp
+            event['sample_count'] += 1
+            event['detectors'] = sorted(set(event['detectors']) | set(fired))
+            if abs(score) > abs(event['score']):
+                event.update(value=value, expected=expected, score=score,
+                             direction='high' if score > 0 else 'low')
+            if severity == 'critical':
+                event['severity'] = severity
+            return event
+
+        self._events += 1
+        event = self._open[key] = {
+            'id': None,
+            'type': key[0],
+            'metric': key[1],
+            'start_time': timestamp,
+            'end_time': timestamp,
+            'detectors': sorted(fired),
+            'direction': 'high' if score > 0 else 'low',
+            'value': value,
+            'expected': expected,
+            'score': score,
+            'sample_count': 1,
+            'severity': severity
+        }
+        return event
+
+    def _persist(self, opened: List[Dict[str, Any]], extended: List[Dict[str, Any]]) -> None:
+        columns = ('end_time', 'detectors', 'direction', 'value', 'expected', 'score', 'sample_count', 'severity')
+        try:
+            models = []
+            for event in opened:
+                model = AnomalyEvent(**{key: value for key, value in event.items() if key != 'id'})
+                db.session.add(model)
+                models.append((event, model))
+            for event in extended:
+                AnomalyEvent.query.filter_by(id=event['id']).update(
+                    {column: event[column] for column in columns}, synchronize_session=False
+                )
+            db.session.commit()
+            for event, model in models:
+                event['id'] = model.id
+        except Exception as e:
+            logger.error(f"Failed to save anomaly events: {e}")
+            db.session.rollback()
+
+    def seed(self, streaming_stats) -> int:
+        """用流式统计中已完成的小时桶初始化周内小时基线，返回使用的桶数"""
+        if streaming_stats.resolution != 3600:
+            return 0
+        now = datetime.utcnow()
+        current = int((now - EPOCH).total_seconds() // 3600)
+        seeded = 0
+        buckets = streaming_stats.buckets(now - streaming_stats.retention, now)
+        with self._lock:
+            for key, series in buckets.items():
+                detector = self._series.get(key)
+                if detector is None:
+                    detector = self._series[key] = SeriesDetector(self.window)
+                for bucket, stats in sorted(series.items()):
+                    hour = int((bucket - EPOCH).total_seconds() // 3600)
+                    if hour < current and stats.count:
+                        detector.seed(hour, stats.mean, stats.variance, self.seasonal_alpha)
+                        seeded += 1
+        if seeded:
+            logger.info(f"Seeded anomaly baselines from {seeded} hourly buckets")
+        return seeded
+
+    def get_stats(self) -> Dict[str, Any]:
+        """检测器状态"""
+        with self._lock:
+            return {
+                'series': len(self._series),
+                'processed': self._processed,
+                'anomalous_samples': self._anomalies,
+                'events': self._events
+            }
+
+def get_anomaly_detector(app) -> AnomalyDetector:
+    """获取应用的异常检测器，未初始化时按应用配置创建并用流式统计初始化季节基线"""
+    detector = getattr(app, 'anomaly_detector', None)
+    if detector is None:
+        detector = AnomalyDetector(app.config.get('MONITOR', {}))
+        detector.seed(get_streaming_stats(app))
+        app.anomaly_detector = detector
+    return detector
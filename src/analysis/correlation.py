@@ -0,0 +1,279 @@
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta
+import math
+import logging
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from src.models import db, MonitorRollup, ProcessData, AnomalyEvent, AnalysisReport
+from src.database.metric_store import Series, metric_name, resolve_metric
+from src.database.queries import seconds_since
+from src.database.rollup import RollupManager, RAW_RESOLUTION, get_rollup_manager
+from src.visualization.chart_renderer import add_series, line_chart
+from src.utils.time_buckets import bucket_start
+
+logger = logging.getLogger(__name__)
+
+# 进程序列的类型名，指标名为进程名
+PROCESS_TYPES = (('process_cpu', ProcessData.cpu_percent), ('process_memory', ProcessData.memory_percent))
+
+# 排名时偏离分数的上限，避免基线几乎恒定的序列仅凭偏离程度排在前面
+MAX_DEVIATION = 10.0
+
+# 网格单元: (type, metric, 网格下标, 加权和, 权重)
+GridCell = Tuple[str, str, int, float, float]
+
+def to_grid(cells: List[GridCell], count: int) -> Tuple[List[Series], np.ndarray, np.ndarray]:
+    """把所有序列的网格单元用一次 bincount 汇总为矩阵
+
+    返回 (序列键, 各网格点加权均值矩阵, 有数据标记)，矩阵形状为 (序列 × 时间点)。
+    """
+    if not cells:
+        return [], np.zeros((0, count)), np.zeros((0, count), dtype=bool)
+    types, metrics, index, totals, weights = zip(*cells)
+    labels, rows = np.unique([f'{type}\x00{metric}' for type, metric in zip(types, metrics)], return_inverse=True)
+    keys = [tuple(label.split('\x00', 1)) for label in labels.tolist()]
+    columns = np.asarray(index, dtype=np.int64)
+
+    inside = (columns >= 0) & (columns < count)
+    flat = rows.ravel()[inside] * count + columns[inside]
+    size = len(keys) * count
+    sums = np.bincount(flat, weights=np.asarray(totals, dtype=np.float64)[inside], minlength=size)
+    counts = np.bincount(flat, weights=np.asarray(weights, dtype=np.float64)[inside], minlength=size)
+    grid = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0).reshape(len(keys), count)
+    return keys, grid, (counts > 0).reshape(len(keys), count)
+
+def forward_fill(values: np.ndarray, observed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """缺失点沿用同一序列上一个观测值（采集间隔大于网格步长的序列不会变成锯齿），首个观测之前仍为缺失"""
+    positions = np.where(observed, np.arange(values.shape[1]), -1)
+    np.maximum.accumulate(positions, axis=1, out=positions)
+    filled = positions >= 0
+    return np.take_along_axis(values, np.maximum(positions, 0), axis=1), filled
+
+def standardize(values: np.ndarray, observed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """按行中心化并归一化为单位范数，缺失点取 0（即用均值填补），返回 (z 矩阵, 是否非常数)"""
+    counts = observed.sum(axis=1)
+    means = np.where(observed, values, 0.0).sum(axis=1) / np.maximum(counts, 1)
+    centered = np.where(observed, values - means[:, None], 0.0)
+    norms = np.sqrt(np.einsum('ij,ij->i', centered, centered))
+    varying = norms > 1e-12 * np.maximum(np.abs(means), 1) * np.sqrt(np.maximum(counts, 1))
+    return centered / np.where(varying, norms, 1.0)[:, None], varying
+
+def lagged_correlation(z: np.ndarray, max_lag: int, rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """滞后互相关矩阵，z 为 standardize 的结果
+
+    返回形状 (len(rows), 序列数, 2·max_lag+1)，[i, j, max_lag + k] 为 corr(x_i[t], x_j[t+k])：
+    k < 0 时序列 j 的变化早于序列 i。补零后的滑动窗口视图展开为 (序列·滞后 × 时间) 矩阵，
+    所有滞后通过一次矩阵乘法算出，rows 为空时计算完整矩阵。
+    """
+    n, size = z.shape
+    rows = np.arange(n) if rows is None else rows
+    lags = 2 * max_lag + 1
+    windows = sliding_window_view(np.pad(z, ((0, 0), (max_lag, max_lag))), size, axis=1)
+    return (z[rows] @ windows.reshape(n * lags, size).T).reshape(len(rows), n, lags)
+
+class CorrelationAnalyzer:
+    """跨指标相关性与根因排名
+
+    把事件窗口前后的全部序列（汇总层指标 + ProcessData 中按进程名聚合的 CPU/内存）
+    对齐到同一时间网格，用 NumPy 一次计算相关矩阵和目标序列的滞后互相关，按
+    "与目标的最大滞后相关 × 事件窗口内相对基线的偏离" 排出最可能的关联序列。
+    计算量与 序列数 × 网格点数 成正比，网格点数由 correlation_max_points 限制。
+    """
+
+    def __init__(self, rollups: RollupManager, config: Dict):
+        self.rollups = rollups
+        self.context = timedelta(hours=config.get('correlation_context_hours', 6))
+        self.max_points = config.get('correlation_max_points', 360)
+        self.max_lag = config.get('correlation_max_lag', 10)
+        self.top = config.get('correlation_top', 10)
+        self.max_processes = config.get('correlation_max_processes', 50)
+        self.min_points = config.get('correlation_min_points', 10)
+        self.min_scale = config.get('anomaly_min_scale', 1e-3)
+        self.max_reports = config.get('correlation_max_reports', 5)
+
+    def grid_step(self, start: datetime, end: datetime) -> int:
+        """网格步长：不超过 max_points 个点，取整到分钟"""
+        seconds = (end - start).total_seconds() / self.max_points
+        return max(60, int(math.ceil(seconds / 60)) * 60)
+
+    @staticmethod
+    def _grid_index(column, start: datetime, step: int):
+        """列相对 start 的网格下标表达式，加 1ms 避免浮点误差把桶起点上的时间算进前一个网格"""
+        return db.cast((seconds_since(column, start) + 0.001) / step, db.Integer)
+
+    def _metric_cells(self, start: datetime, end: datetime, step: int) -> List[GridCell]:
+        """汇总层指标按 (序列, 网格) 在 SQL 中聚合，没有汇总时读取原始数据"""
+        resolution = self.rollups.select_resolution(start, end, step=step)
+        if resolution != RAW_RESOLUTION:
+            index = self._grid_index(MonitorRollup.bucket, start, step)
+            cells = db.session.query(
+                MonitorRollup.type, MonitorRollup.metric, index,
+                db.func.sum(MonitorRollup.avg_value * MonitorRollup.sample_count), db.func.sum(MonitorRollup.sample_count)
+            ).filter(
+                MonitorRollup.resolution == resolution,
+                MonitorRollup.bucket.between(start, end)
+            ).group_by(MonitorRollup.type, MonitorRollup.metric, index).all()
+            if cells:
+                return cells
+        return [
+            (type, metric, int((point[0] - start).total_seconds() // step), point[1] * point[4], point[4])
+            for (type, metric), points in self.rollups.read_range(start, end, step=step).items() for point in points
+        ]
+
+    def _process_cells(self, start: datetime, end: datetime, step: int) -> List[GridCell]:
+        """ProcessData 按 (进程名, 网格) 在 SQL 中聚合，只取窗口内 CPU 峰值最高的若干进程"""
+        if not self.max_processes:
+            return []
+        window = db.and_(ProcessData.timestamp.between(start, end), ProcessData.name.isnot(None))
+        names = [name for name, in db.session.query(ProcessData.name).filter(window).group_by(ProcessData.name)
+                 .order_by(db.func.max(ProcessData.cpu_percent).desc()).limit(self.max_processes)]
+        if not names:
+            return []
+        index = self._grid_index(ProcessData.timestamp, start, step)
+        query = db.session.query(
+            ProcessData.name, index,
+            *[value for _, column in PROCESS_TYPES for value in (db.func.sum(column), db.func.count(column))]
+        ).filter(window, ProcessData.name.in_(names)).group_by(ProcessData.name, index)
+
+        cells = []
+        for name, position, *sums in query:
+            for offset, (type, _) in enumerate(PROCESS_TYPES):
+                total, count = sums[offset * 2:offset * 2 + 2]
+                if count:
+                    cells.append((type, name, position, total, count))
+        return cells
+
+    def grid(self, start: datetime, end: datetime, step: int) -> Tuple[List[Series], np.ndarray, np.ndarray]:
+        """读取窗口内全部序列并对齐到从 start 开始的网格，返回 (序列键, 数值矩阵, 有数据标记)"""
+        count = int((end - start).total_seconds() // step) + 1
+        return to_grid(self._metric_cells(start, end, step) + self._process_cells(start, end, step), count)
+
+    def analyze(self, target: str, incident_start: datetime, incident_end: datetime,
+                now: Optional[datetime] = None) -> Dict[str, Any]:
+        """分析事件窗口 [incident_start, incident_end] 内与目标序列一起变化的序列"""
+        target_key = resolve_metric(target)
+        now = now or datetime.utcnow()
+        start = incident_start - self.context
+        step = self.grid_step(start, incident_end)
+        start = bucket_start(start, step)
+        # 事件之后保留最大滞后的余量，滞后于目标的序列也能被看到
+        end = min(incident_end + timedelta(seconds=step * self.max_lag), now)
+        keys, values, observed = self.grid(start, end, step)
+        result = {
+            'target': metric_name(*target_key),
+            'incident': {'start': incident_start.isoformat(), 'end': incident_end.isoformat()},
+            'period': {'start': start.isoformat(), 'end': end.isoformat()},
+            'step': step,
+            'series_count': len(keys),
+            'contributors': [],
+            'matrix': {'series': [], 'values': []}
+        }
+        if target_key not in keys:
+            logger.info(f"No data for {result['target']} between {start} and {end}")
+            return result
+
+        values, filled = forward_fill(values, observed)
+        enough = filled.sum(axis=1) >= self.min_points
+        keys = [key for key, keep in zip(keys, enough) if keep]
+        values, filled = values[enough], filled[enough]
+        if target_key not in keys:
+            return result
+        z, varying = standardize(values, filled)
+        target = keys.index(target_key)
+
+        # 与目标的滞后互相关，取绝对值最大的滞后
+        lagged = lagged_correlation(z, self.max_lag, np.array([target]))[0]
+        best = np.abs(lagged).argmax(axis=1)
+        best_correlation = lagged[np.arange(len(keys)), best]
+        zero_lag = lagged[:, self.max_lag]
+
+        # 事件窗口内均值相对窗口外基线的偏离（以基线标准差为单位）
+        offsets = np.arange(values.shape[1]) * step
+        incident = (offsets >= (bucket_start(incident_start, step) - start).total_seconds()) \
+            & (offsets <= (incident_end - start).total_seconds())
+        inside = filled & incident
+        outside = filled & ~incident
+        inside_count = np.maximum(inside.sum(axis=1), 1)
+        outside_count = np.maximum(outside.sum(axis=1), 1)
+        base_mean = np.where(outside, values, 0.0).sum(axis=1) / outside_count
+        base_std = np.sqrt(np.where(outside, (values - base_mean[:, None]) ** 2, 0.0).sum(axis=1) / outside_count)
+        incident_mean = np.where(inside, values, 0.0).sum(axis=1) / inside_count
+        deviation = np.where(inside.any(axis=1) & outside.any(axis=1),
+                             (incident_mean - base_mean) / np.maximum(base_std, self.min_scale), 0.0)
+
+        score = np.abs(best_correlation) * np.minimum(np.abs(deviation), MAX_DEVIATION)
+        score[target] = -1
+        score[~varying] = -1
+        ranked = [index for index in np.argsort(-score)[:self.top] if score[index] > 0]
+        result['series_count'] = len(keys)
+        result['contributors'] = [{
+            'series': metric_name(*keys[index]),
+            'correlation': round(float(zero_lag[index]), 4),
+            'lag_correlation': round(float(best_correlation[index]), 4),
+            # 正数表示该序列的变化早于目标序列
+            'lead_seconds': int((self.max_lag - best[index]) * step),
+            'deviation': round(float(deviation[index]), 2),
+            'direction': 'up' if deviation[index] > 0 else 'down',
+            'baseline': float(base_mean[index]),
+            'incident_mean': float(incident_mean[index]),
+            'score': round(float(score[index]), 4)
+        } for index in ranked]
+
+        # 目标与排名靠前序列之间的同期相关矩阵
+        selected = [target] + ranked
+        matrix = z[selected] @ z[selected].T
+        result['matrix'] = {
+            'series': [metric_name(*keys[index]) for index in selected],
+            'values': np.round(matrix, 4).tolist()
+        }
+
+        # 图表：目标和前 5 个关联序列的标准化曲线
+        chart = line_chart(f'Correlated with {result["target"]}', 'Time', 'Z-score')
+        for index in selected[:6]:
+            scale = base_std[index] if base_std[index] > self.min_scale else 1.0
+            add_series(chart, metric_name(*keys[index]), [start + timedelta(seconds=int(offset)) for offset in offsets],
+                       ((values[index] - base_mean[index]) / scale).tolist())
+        result['chart'] = chart
+        return result
+
+    def incident_window(self, target: str, now: Optional[datetime] = None,
+                        lookback: timedelta = timedelta(hours=24)) -> Tuple[datetime, datetime]:
+        """默认事件窗口：目标序列最近一次异常事件，没有事件时取最近一小时"""
+        now = now or datetime.utcnow()
+        type, metric = resolve_metric(target)
+        event = AnomalyEvent.query.filter(
+            AnomalyEvent.type == type, AnomalyEvent.metric == metric, AnomalyEvent.start_time >= now - lookback
+        ).order_by(AnomalyEvent.start_time.desc()).first()
+        if event is not None:
+            return event.start_time, max(event.end_time, event.start_time + timedelta(minutes=1))
+        return now - timedelta(hours=1), now
+
+    def new_events(self, target: str, since: datetime) -> List[AnomalyEvent]:
+        """目标序列 since 之后新记录的异常事件，按分数绝对值从大到小，最多 correlation_max_reports 个"""
+        type, metric = resolve_metric(target)
+        return AnomalyEvent.query.filter(
+            AnomalyEvent.type == type, AnomalyEvent.metric == metric, AnomalyEvent.created_at >= since
+        ).order_by(db.func.abs(AnomalyEvent.score).desc()).limit(self.max_reports).all()
+
+    def create_report(self, target: str, incident_start: Optional[datetime] = None,
+                      incident_end: Optional[datetime] = None) -> AnalysisReport:
+        """生成并保存 correlation 类型的分析报告（需在应用上下文中调用）"""
+        if incident_start is None or incident_end is None:
+            incident_start, incident_end = self.incident_window(target)
+        content = self.analyze(target, incident_start, incident_end)
+        report = AnalysisReport(
+            title=f'Root Cause Analysis: {content["target"]}',
+            report_type='correlation',
+            content=content
+        )
+        db.session.add(report)
+        db.session.commit()
+        return report
+
+def get_correlation_analyzer(app) -> CorrelationAnalyzer:
+    """获取应用的相关性分析器，未初始化时按应用配置创建"""
+    analyzer = getattr(app, 'correlation_analyzer', None)
+    if analyzer is None:
+        analyzer = CorrelationAnalyzer(get_rollup_manager(app), app.config.get('MONITOR', {}))
+        app.correlation_analyzer = analyzer
+    return analyzer
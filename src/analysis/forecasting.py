@@ -0,0 +1,163 @@
+from typing import Dict, Any, List, Optional, Tuple, Hashable
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from statistics import NormalDist
+import logging
+import numpy as np
+from src.utils.time_buckets import bucket_start
+
+logger = logging.getLogger(__name__)
+
+# 季节周期(小时)
+DAY_HOURS = 24
+WEEK_HOURS = 168
+
+def design_matrix(hours: np.ndarray, periods: List[Tuple[float, int]]) -> np.ndarray:
+    """构造 [常数, 线性趋势, 各周期的 sin/cos 傅里叶项] 设计矩阵，hours 为相对起点的小时数"""
+    columns = [np.ones_like(hours), hours]
+    for period, harmonics in periods:
+        for k in range(1, harmonics + 1):
+            angle = 2 * np.pi * k * hours / period
+            columns += [np.sin(angle), np.cos(angle)]
+    return np.column_stack(columns)
+
+def stacked_statistics(X: np.ndarray, values: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """按序列堆叠计算加权最小二乘的充分统计量 (XᵀWX, XᵀWy, Σwy²)
+
+    values、weights 为 (时间点 × 序列) 矩阵，缺失点权重为 0；返回形状
+    (序列 × p × p)、(序列 × p)、(序列)。
+    """
+    values = np.where(weights > 0, values, 0.0)
+    gram = np.einsum('ns,np,nq->spq', weights, X, X, optimize=True)
+    rhs = (X.T @ (weights * values)).T
+    sum_yy = (weights * values * values).sum(axis=0)
+    return gram, rhs, sum_yy
+
+def fit_block(hours: np.ndarray, values: np.ndarray, observed: np.ndarray, future_hours: np.ndarray,
+              periods: List[Tuple[float, int]], z: float, ridge: float = 1e-6) -> Dict[str, np.ndarray]:
+    """对一组序列同时做加权最小二乘拟合
+
+    values、observed 为 (时间点 × 序列) 矩阵，observed 标记有数据的位置，缺失点权重为 0。
+    各序列的正规方程 XᵀWX β = XᵀWy 按序列堆叠后一次求解，并按
+    σ²(1 + x₀ᵀ(XᵀWX)⁻¹x₀) 计算预测区间。
+    """
+    X = design_matrix(hours, periods)
+    F = design_matrix(future_hours, periods)
+    weights = observed.astype(np.float64)
+    gram, rhs, sum_yy = stacked_statistics(X, values, weights)
+    # 轻微的岭正则，避免数据过少时矩阵奇异
+    inverse = np.linalg.inv(gram + ridge * np.eye(X.shape[1]))
+    coef = np.einsum('spq,sq->sp', inverse, rhs)
+
+    # 最优解处残差平方和 = Σwy² - βᵀXᵀWy
+    dof = np.maximum(weights.sum(axis=0) - X.shape[1], 1)
+    sigma2 = np.maximum(sum_yy - np.einsum('sp,sp->s', coef, rhs), 0) / dof
+    forecast = (F @ coef.T).T
+    leverage = np.einsum('hp,spq,hq->sh', F, inverse, F, optimize=True)
+    band = z * np.sqrt(sigma2[:, None] * (1 + leverage))
+    return {
+        'coef': coef,
+        'forecast': forecast,
+        'lower': forecast - band,
+        'upper': forecast + band,
+        'sigma': np.sqrt(sigma2)
+    }
+
+def align_series(series: Dict[Hashable, List[Tuple[datetime, float]]],
+                 step: int) -> Tuple[List[Hashable], datetime, np.ndarray, np.ndarray]:
+    """把多个序列对齐到从最早时间桶开始的公共网格
+
+    返回 (序列键, 网格起点, 各桶均值矩阵, 有数据标记矩阵)，矩阵形状为 (时间点 × 序列)。
+    """
+    keys = list(series)
+    first = bucket_start(min(points[0][0] for points in series.values()), step)
+    last = bucket_start(max(points[-1][0] for points in series.values()), step)
+    size = int((last - first).total_seconds() // step) + 1
+
+    totals = np.zeros((size, len(keys)))
+    counts = np.zeros((size, len(keys)))
+    for column, key in enumerate(keys):
+        points = series[key]
+        index = np.fromiter(((timestamp - first).total_seconds() for timestamp, _ in points),
+                            dtype=np.float64, count=len(points)).astype(np.int64) // step
+        values = np.fromiter((value for _, value in points), dtype=np.float64, count=len(points))
+        totals[:, column] = np.bincount(index, weights=values, minlength=size)
+        counts[:, column] = np.bincount(index, minlength=size)
+    observed = counts > 0
+    return keys, first, np.divide(totals, counts, out=np.zeros_like(totals), where=observed), observed
+
+def seasonal_periods(span_hours: float, daily_harmonics: int, weekly_harmonics: int) -> List[Tuple[float, int]]:
+    """历史跨度覆盖两个完整周期的季节项"""
+    periods = []
+    for period, harmonics in ((DAY_HOURS, daily_harmonics), (WEEK_HOURS, weekly_harmonics)):
+        if harmonics and span_hours >= 2 * period:
+            periods.append((period, harmonics))
+    return periods
+
+class Forecaster:
+    """批量时序预测
+
+    把多个序列对齐到同一时间网格（通常是 1 小时汇总），以线性趋势加日/周
+    傅里叶项为特征，按序列堆叠的加权最小二乘一次拟合所有序列，返回预测值
+    和置信区间。历史跨度不足两个周期的季节项自动省略。序列较多时可按块
+    分发到进程池并行拟合。
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or {}
+        self.daily_harmonics = config.get('forecast_daily_harmonics', 3)
+        self.weekly_harmonics = config.get('forecast_weekly_harmonics', 2)
+        self.confidence = config.get('forecast_confidence', 0.95)
+        self.workers = config.get('forecast_workers', 0)
+        self.block_size = config.get('forecast_block_size', 256)
+
+    def forecast(self, series: Dict[Hashable, List[Tuple[datetime, float]]], horizon: int,
+                 step: int = 3600) -> Dict[Hashable, Dict[str, Any]]:
+        """预测各序列之后 horizon 个 step 的值
+
+        返回 {key: {'timestamps', 'predicted', 'lower', 'upper', 'slope'(每小时), 'trend', 'current', 'residual_std', 'samples'}}，
+        样本数不足以拟合的序列不出现在结果中。
+        """
+        series = {key: points for key, points in series.items() if points}
+        if not series:
+            return {}
+        keys, first, values, observed = align_series(series, step)
+        size = len(values)
+        last = first + timedelta(seconds=step * (size - 1))
+
+        hours = np.arange(size) * step / 3600
+        future_hours = (np.arange(1, horizon + 1) + size - 1) * step / 3600
+        periods = seasonal_periods(size * step / 3600, self.daily_harmonics, self.weekly_harmonics)
+        parameters = 2 + 2 * sum(harmonics for _, harmonics in periods)
+
+        # 观测点不足以估计参数和残差的序列不参与拟合
+        fitted = np.flatnonzero(observed.sum(axis=0) > parameters)
+        if not len(fitted):
+            return {}
+        z = NormalDist().inv_cdf((1 + self.confidence) / 2)
+        blocks = [fitted[offset:offset + self.block_size] for offset in range(0, len(fitted), self.block_size)]
+        arguments = [(hours, values[:, block], observed[:, block], future_hours, periods, z) for block in blocks]
+        if self.workers > 1 and len(blocks) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                results = list(pool.map(fit_block, *zip(*arguments)))
+        else:
+            results = [fit_block(*args) for args in arguments]
+
+        timestamps = [last + timedelta(seconds=step * i) for i in range(1, horizon + 1)]
+        forecasts = {}
+        for block, result in zip(blocks, results):
+            for offset, column in enumerate(block):
+                slope = float(result['coef'][offset, 1])
+                forecasts[keys[column]] = {
+                    'timestamps': timestamps,
+                    'predicted': result['forecast'][offset].tolist(),
+                    'lower': result['lower'][offset].tolist(),
+                    'upper': result['upper'][offset].tolist(),
+                    'slope': slope,
+                    'trend': 'up' if slope > 0 else 'down',
+                    'current': float(values[np.flatnonzero(observed[:, column])[-1], column]),
+                    'residual_std': float(result['sigma'][offset]),
+                    'samples': int(observed[:, column].sum())
+                }
+        logger.debug(f"Forecast {len(forecasts)} series with {parameters} parameters over {size} points")
+        return forecasts
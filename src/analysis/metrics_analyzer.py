@@ -1,29 +1,25 @@
-import pandas as pd
-import numpy as np
-from sklearn.linear_model import LinearRegression
-from typing import Dict
-import sqlite3
+import math
+from typing import Dict, Optional, Union
 from datetime import datetime, timedelta
+from src.database.metric_store import MetricStore, as_metric_store, resolve_metric
+from src.database.streaming_stats import RunningStats
+from src.analysis.model_registry import ModelRegistry
 
 class MetricsAnalyzer:
-    def __init__(self, db_path: str):
-        self.db_path = db_path
-        
+    def __init__(self, store: Union[MetricStore, str], registry: Optional[ModelRegistry] = None):
+        # 兼容传入数据库路径的旧用法
+        self.store = as_metric_store(store)
+        # 预测模型按小时增量更新，同一小时内的重复预测直接命中缓存
+        self.registry = registry or ModelRegistry(self.store)
+    
     def analyze_trends(self, metric_name: str, hours: int = 24) -> Dict:
-        """分析指标趋势"""
-        query = """
-            SELECT timestamp, metric_value 
-            FROM metrics 
-            WHERE metric_name = ? 
-            AND timestamp >= datetime('now', '-{} hours')
-            ORDER BY timestamp
-        """.format(hours)
-        
-        with sqlite3.connect(self.db_path) as conn:
-            df = pd.read_sql_query(query, conn, params=(metric_name,))
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
+        """分析指标趋势（统计量和回归累加量由存储端聚合，不读取原始样本）"""
+        now = datetime.utcnow()
+        start = now - timedelta(hours=hours)
+        series = resolve_metric(metric_name)
+        sums = self.store.regression_sums(start, now, [series]).get(series)
         
-        if len(df) == 0:
+        if not sums:
             return {
                 'current_value': 0,
                 'mean': 0,
@@ -33,58 +29,32 @@ class MetricsAnalyzer:
                 'trend': 'no data'
             }
             
+        stats = RunningStats.from_sums(sums, start)
         return {
-            'current_value': df['metric_value'].iloc[-1],
-            'mean': df['metric_value'].mean(),
-            'max': df['metric_value'].max(),
-            'min': df['metric_value'].min(),
-            'std': df['metric_value'].std(),
-            'trend': self._calculate_trend(df['metric_value'])
+            'current_value': stats.last_value,
+            'mean': stats.mean,
+            'max': stats.max_value,
+            'min': stats.min_value,
+            'std': math.sqrt(stats.variance),
+            'trend': self._calculate_trend(stats)
         }
     
     def predict_next_hours(self, metric_name: str, hours: int = 6) -> Dict[str, float]:
-        """预测未来几小时的指标值"""
-        query = """
-            SELECT timestamp, metric_value 
-            FROM metrics 
-            WHERE metric_name = ? 
-            ORDER BY timestamp DESC 
-            LIMIT 168
-        """
-        
-        with sqlite3.connect(self.db_path) as conn:
-            df = pd.read_sql_query(query, conn, params=(metric_name,))
-            
-        if len(df) < 2:
+        """预测未来几小时的指标值（趋势 + 日/周季节项，模型由注册表增量维护）"""
+        forecast = self.registry.predict(resolve_metric(metric_name), horizon=hours)
+        if not forecast:
             return {}
-            
-        df['hour'] = pd.to_datetime(df['timestamp']).dt.hour
-        df['day_of_week'] = pd.to_datetime(df['timestamp']).dt.dayofweek
-        
-        X = df[['hour', 'day_of_week']]
-        y = df['metric_value']
-        
-        model = LinearRegression()
-        model.fit(X, y)
-        
-        current_time = datetime.now()
-        future_times = pd.date_range(current_time, periods=hours, freq='H')
-        
-        future_features = pd.DataFrame({
-            'hour': future_times.hour,
-            'day_of_week': future_times.dayofweek
-        })
-        
-        predictions = model.predict(future_features)
         
-        return {str(time): pred for time, pred in zip(future_times, predictions)}
+        return {str(time): pred for time, pred in zip(forecast['timestamps'], forecast['predicted'])}
     
-    def _calculate_trend(self, values: pd.Series) -> str:
-        """计算趋势方向"""
-        if len(values) < 2:
+    def _calculate_trend(self, stats: RunningStats) -> str:
+        """计算趋势方向（每个采样间隔的变化量）"""
+        if stats.count < 2:
             return "stable"
             
-        slope = np.polyfit(range(len(values)), values, 1)[0]
+        # 时间斜率乘以平均采样间隔，等价于按样本序号拟合的斜率
+        interval = (stats.last_timestamp - stats.first_timestamp).total_seconds() / (stats.count - 1)
+        slope = stats.slope * interval
         
         if slope > 0.1:
             return "increasing"
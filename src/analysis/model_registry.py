@@ -0,0 +1,342 @@
+from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from statistics import NormalDist
+import logging
+import threading
+import numpy as np
+from src.models import db, ForecastModel
+from src.database.metric_store import MetricStore, Series, get_metric_store
+from src.utils.time_buckets import bucket_start
+from src.analysis.forecasting import (
+    DAY_HOURS, WEEK_HOURS, align_series, design_matrix, seasonal_periods, stacked_statistics
+)
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+WEEK = WEEK_HOURS * HOUR
+
+class SeriesModel:
+    """单个序列的预测模型状态
+
+    保存带指数遗忘的加权最小二乘充分统计量 XᵀWX、XᵀWy、Σwy²，新数据到达时
+    先按经过的小时数衰减旧状态再累加，结果与对全部历史重新拟合一致。
+    特征为相对 origin 的线性趋势加日/周傅里叶项，origin 固定在整周边界。
+    """
+
+    __slots__ = ('origin', 'watermark', 'gram', 'rhs', 'sum_yy', 'weight', 'count',
+                 'first_timestamp', 'last_timestamp', 'last_value', 'solution')
+
+    def __init__(self, origin: datetime, parameters: int):
+        self.origin = origin
+        self.watermark: Optional[datetime] = None
+        self.gram = np.zeros((parameters, parameters))
+        self.rhs = np.zeros(parameters)
+        self.sum_yy = 0.0
+        self.weight = 0.0
+        self.count = 0
+        self.first_timestamp: Optional[datetime] = None
+        self.last_timestamp: Optional[datetime] = None
+        self.last_value: Optional[float] = None
+        self.solution: Optional[Dict[str, Any]] = None
+
+    def hours(self, timestamp: datetime) -> float:
+        """时间戳相对 origin 的小时数"""
+        return (timestamp - self.origin).total_seconds() / HOUR
+
+    def solve(self, layout: List[Tuple[float, int]], daily_harmonics: int, weekly_harmonics: int,
+              ridge: float) -> Optional[Dict[str, Any]]:
+        """求解回归系数，跨度不足两个周期的季节项不参与求解；结果缓存到下次更新"""
+        if self.solution is not None or not self.count:
+            return self.solution
+        span = self.hours(self.watermark) - self.hours(self.first_timestamp) + 1
+        active = seasonal_periods(span, daily_harmonics, weekly_harmonics)
+        columns = [0, 1]
+        offset = 2
+        for period, harmonics in layout:
+            if (period, harmonics) in active:
+                columns += range(offset, offset + 2 * harmonics)
+            offset += 2 * harmonics
+        # 样本不足以估计参数和残差时不预测
+        if self.count <= len(columns):
+            return None
+
+        index = np.array(columns)
+        inverse = np.linalg.inv(self.gram[np.ix_(index, index)] + ridge * np.eye(len(index)))
+        coef = inverse @ self.rhs[index]
+        sigma2 = max(self.sum_yy - float(coef @ self.rhs[index]), 0) / max(self.weight - len(index), 1)
+        self.solution = {'index': index, 'inverse': inverse, 'coef': coef, 'sigma': float(np.sqrt(sigma2))}
+        return self.solution
+
+    def to_model(self, model: ForecastModel, layout: List[Tuple[float, int]]) -> ForecastModel:
+        """写入数据库模型"""
+        model.origin = self.origin
+        model.watermark = self.watermark
+        model.layout = [list(item) for item in layout]
+        model.gram = self.gram.tolist()
+        model.rhs = self.rhs.tolist()
+        model.sum_yy = self.sum_yy
+        model.weight = self.weight
+        model.count = self.count
+        model.first_timestamp = self.first_timestamp
+        model.last_timestamp = self.last_timestamp
+        model.last_value = self.last_value
+        model.updated_at = datetime.utcnow()
+        return model
+
+    @classmethod
+    def from_model(cls, model: ForecastModel) -> 'SeriesModel':
+        """从数据库模型恢复"""
+        state = cls(model.origin, len(model.rhs))
+        state.watermark = model.watermark
+        state.gram = np.array(model.gram, dtype=np.float64)
+        state.rhs = np.array(model.rhs, dtype=np.float64)
+        state.sum_yy = model.sum_yy
+        state.weight = model.weight
+        state.count = model.count
+        state.first_timestamp = model.first_timestamp
+        state.last_timestamp = model.last_timestamp
+        state.last_value = model.last_value
+        return state
+
+class ModelRegistry:
+    """预测模型注册表
+
+    按序列保存训练到某个小时桶 (watermark) 的模型状态。refresh 只读取 watermark
+    之后已完整的小时汇总增量更新，predict 直接用缓存的系数计算，结果按
+    (序列, 预测步数) 放入有容量上限的 LRU 缓存，模型未更新前重复请求不再计算。
+    """
+
+    def __init__(self, store: Optional[MetricStore] = None, config: Optional[Dict] = None):
+        config = config or {}
+        self.store = store
+        self.daily_harmonics = config.get('forecast_daily_harmonics', 3)
+        self.weekly_harmonics = config.get('forecast_weekly_harmonics', 2)
+        self.layout = [(period, harmonics) for period, harmonics in
+                       ((DAY_HOURS, self.daily_harmonics), (WEEK_HOURS, self.weekly_harmonics)) if harmonics]
+        self.parameters = 2 + 2 * sum(harmonics for _, harmonics in self.layout)
+        self.decay = config.get('forecast_decay', 0.999)  # 每小时的遗忘因子，1 表示不遗忘
+        self.history = timedelta(days=config.get('forecast_history_days', 28))
+        self.cache_size = config.get('forecast_cache_size', 1024)
+        self.z = NormalDist().inv_cdf((1 + config.get('forecast_confidence', 0.95)) / 2)
+        self.ridge = 1e-6
+
+        self._models: Dict[Series, SeriesModel] = {}
+        self._cache: 'OrderedDict[Tuple[Series, int], Tuple[datetime, Dict[str, Any]]]' = OrderedDict()
+        self._checked: Dict[Series, datetime] = {}
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+
+    def keys(self) -> List[Series]:
+        """已有模型的序列"""
+        with self._lock:
+            return list(self._models)
+
+    def watermark(self, series: Series) -> Optional[datetime]:
+        """序列模型已训练到的小时桶"""
+        with self._lock:
+            model = self._models.get(series)
+            return model.watermark if model else None
+
+    def fold(self, series: Dict[Series, List[Tuple[datetime, float]]], through: datetime) -> int:
+        """把各序列 watermark 之后、through (含) 之前的小时均值并入模型，返回并入的桶数"""
+        folded = 0
+        with self._lock:
+            groups: Dict[Tuple[Optional[datetime], Optional[datetime]], Dict[Series, List]] = {}
+            for key, points in series.items():
+                model = self._models.get(key)
+                watermark = model.watermark if model else None
+                points = [(bucket_start(timestamp, HOUR), value) for timestamp, value in points
+                          if (watermark is None or timestamp >= watermark + timedelta(hours=1))
+                          and timestamp < through + timedelta(hours=1)]
+                if points:
+                    group = (model.origin, watermark) if model else (None, None)
+                    groups.setdefault(group, {})[key] = points
+
+            for (origin, watermark), points in groups.items():
+                keys, first, values, observed = align_series(points, HOUR)
+                if origin is None:
+                    origin = bucket_start(first, WEEK)
+                    for key in keys:
+                        self._models[key] = SeriesModel(origin, self.parameters)
+                hours = (first - origin).total_seconds() / HOUR + np.arange(len(values))
+                through_hours = (through - origin).total_seconds() / HOUR
+                # 新数据按距 through 的小时数衰减，旧状态整体衰减经过的小时数
+                weights = observed * self.decay ** (through_hours - hours)[:, None]
+                gram, rhs, sum_yy = stacked_statistics(design_matrix(hours, self.layout), values, weights)
+                carried = 1.0 if watermark is None else self.decay ** ((through - watermark).total_seconds() / HOUR)
+
+                for column, key in enumerate(keys):
+                    model = self._models[key]
+                    rows = np.flatnonzero(observed[:, column])
+                    model.gram = model.gram * carried + gram[column]
+                    model.rhs = model.rhs * carried + rhs[column]
+                    model.sum_yy = model.sum_yy * carried + float(sum_yy[column])
+                    model.weight = model.weight * carried + float(weights[:, column].sum())
+                    model.count += len(rows)
+                    if model.first_timestamp is None:
+                        model.first_timestamp = first + timedelta(hours=int(rows[0]))
+                    model.last_timestamp = first + timedelta(hours=int(rows[-1]))
+                    model.last_value = float(values[rows[-1], column])
+                    model.watermark = through
+                    model.solution = None
+                    self._dirty.add(key)
+                    folded += len(rows)
+        if folded:
+            logger.debug(f"Folded {folded} hourly buckets into {sum(len(p) for p in groups.values())} forecast models")
+        return folded
+
+    def refresh(self, series: Optional[List[Series]] = None, now: Optional[datetime] = None) -> int:
+        """从指标存储读取 watermark 之后完整的小时汇总并更新模型，返回并入的桶数
+
+        不指定 series 时更新已有模型并发现新序列；新序列读取 forecast_history_days 的历史。
+        """
+        now = now or datetime.utcnow()
+        through = bucket_start(now, HOUR) - timedelta(hours=1)
+        end = through + timedelta(hours=1) - timedelta(microseconds=1)
+        history_start = through + timedelta(hours=1) - self.history
+        with self._lock:
+            watermarks = {key: model.watermark for key, model in self._models.items()}
+            for key in (series if series is not None else watermarks):
+                self._checked[key] = through
+
+        def start_after(watermark: Optional[datetime]) -> datetime:
+            return history_start if watermark is None else max(watermark + timedelta(hours=1), history_start)
+
+        points: Dict[Series, List[Tuple[datetime, float]]] = {}
+        if series is None:
+            # 一次读取所有序列中最早 watermark 之后的数据
+            start = min((start_after(watermark) for watermark in watermarks.values()), default=history_start)
+            if start <= end:
+                points = self.store.read_range(start, end, step=HOUR)
+            discovered = [key for key in points if key not in watermarks]
+            if discovered and start > history_start:
+                points.update(self.store.read_range(history_start, end, discovered, step=HOUR))
+        else:
+            groups: Dict[datetime, List[Series]] = {}
+            for key in series:
+                groups.setdefault(start_after(watermarks.get(key)), []).append(key)
+            for start, keys in groups.items():
+                if start <= end:
+                    points.update(self.store.read_range(start, end, keys, step=HOUR))
+        return self.fold(points, through)
+
+    def predict(self, series: Series, horizon: int = 24, refresh: bool = True) -> Optional[Dict[str, Any]]:
+        """预测序列之后 horizon 小时的值
+
+        返回 {'timestamps', 'predicted', 'lower', 'upper', 'slope'(每小时), 'trend', 'current', 'residual_std', 'samples'}，
+        样本不足时返回 None。refresh 为真且有新的完整小时时先增量更新该序列；返回的结果为缓存对象，调用方不应修改。
+        """
+        if refresh and self.store is not None:
+            through = bucket_start(datetime.utcnow(), HOUR) - timedelta(hours=1)
+            if self._checked.get(series) != through:
+                self.refresh([series])
+
+        with self._lock:
+            model = self._models.get(series)
+            if model is None:
+                return None
+            key = (series, horizon)
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == model.watermark:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return cached[1]
+
+            self._misses += 1
+            forecast = self._forecast(model, horizon)
+            self._cache[key] = (model.watermark, forecast)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return forecast
+
+    def _forecast(self, model: SeriesModel, horizon: int) -> Optional[Dict[str, Any]]:
+        """用模型系数计算预测值和置信区间"""
+        solution = model.solve(self.layout, self.daily_harmonics, self.weekly_harmonics, self.ridge)
+        if solution is None:
+            return None
+        future = model.hours(model.watermark) + np.arange(1, horizon + 1)
+        F = design_matrix(future, self.layout)[:, solution['index']]
+        predicted = F @ solution['coef']
+        leverage = np.einsum('hp,pq,hq->h', F, solution['inverse'], F)
+        band = self.z * solution['sigma'] * np.sqrt(1 + leverage)
+        slope = float(solution['coef'][1])
+        return {
+            'timestamps': [model.watermark + timedelta(hours=i) for i in range(1, horizon + 1)],
+            'predicted': predicted.tolist(),
+            'lower': (predicted - band).tolist(),
+            'upper': (predicted + band).tolist(),
+            'slope': slope,
+            'trend': 'up' if slope > 0 else 'down',
+            'current': model.last_value,
+            'residual_std': solution['sigma'],
+            'samples': model.count
+        }
+
+    def save(self) -> int:
+        """把有更新的模型写入数据库，返回写入的模型数"""
+        with self._lock:
+            snapshot = {key: self._models[key] for key in self._dirty if key in self._models}
+            self._dirty.clear()
+
+        try:
+            if snapshot:
+                existing = {
+                    (model.type, model.metric): model
+                    for model in ForecastModel.query.filter(ForecastModel.type.in_({key[0] for key in snapshot}))
+                }
+                for key, state in snapshot.items():
+                    model = existing.get(key)
+                    if model is None:
+                        model = ForecastModel(type=key[0], metric=key[1])
+                        db.session.add(model)
+                    state.to_model(model, self.layout)
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Failed to save forecast models: {e}")
+            db.session.rollback()
+            # 下次保存重试
+            with self._lock:
+                self._dirty.update(snapshot)
+            return 0
+        return len(snapshot)
+
+    def load(self) -> int:
+        """从数据库恢复模型，特征布局与当前配置不一致的模型丢弃后重新训练"""
+        layout = [list(item) for item in self.layout]
+        loaded = 0
+        with self._lock:
+            for model in ForecastModel.query.all():
+                if model.layout != layout:
+                    continue
+                self._models[(model.type, model.metric)] = SeriesModel.from_model(model)
+                loaded += 1
+            self._cache.clear()
+        if loaded:
+            logger.info(f"Loaded {loaded} forecast models")
+        return loaded
+
+    def get_stats(self) -> Dict[str, Any]:
+        """注册表状态"""
+        with self._lock:
+            return {
+                'models': len(self._models),
+                'cached_predictions': len(self._cache),
+                'cache_hits': self._hits,
+                'cache_misses': self._misses,
+                'dirty': len(self._dirty)
+            }
+
+def get_model_registry(app) -> ModelRegistry:
+    """获取应用的预测模型注册表，未初始化时按应用配置创建并从数据库恢复"""
+    registry = getattr(app, 'model_registry', None)
+    if registry is None:
+        registry = ModelRegistry(get_metric_store(app), app.config.get('MONITOR', {}))
+        with app.app_context():
+            registry.load()
+        app.model_registry = registry
+    return registry
@@ -1,6 +1,12 @@
 import click
+from datetime import datetime, timedelta
+from flask import current_app
 from flask.cli import with_appcontext
 from src.models import db
+from src.database.rollup import get_rollup_manager
+from src.database.metric_store import get_metric_store
+from src.database.streaming_stats import get_streaming_stats
+from src.database.schema import ensure_columns, ensure_indexes
 
 @click.command('init-db')
 @with_appcontext
@@ -8,4 +14,33 @@ def init_db_command():
     """Clear existing data and create new tables."""
     db.drop_all()
     db.create_all()
-    click.echo('Initialized the database.') 
\ No newline at end of file
+    click.echo('Initialized the database.')
+
+@click.command('rebuild-rollups')
+@click.option('--days', default=30, help='Number of days of raw data to roll up.')
+@with_appcontext
+def rebuild_rollups_command(days):
+    """Rebuild rollup tiers from raw monitor data."""
+    end = datetime.utcnow()
+    processed = get_rollup_manager(current_app).rebuild(end - timedelta(days=days), end)
+    click.echo(f'Rebuilt rollups from {processed} raw samples.')
+
+@click.command('rebuild-stats')
+@click.option('--hours', default=24 * 7, help='Number of hours of raw data to recompute.')
+@with_appcontext
+def rebuild_stats_command(hours):
+    """Rebuild streaming statistics checkpoints from raw monitor data."""
+    end = datetime.utcnow()
+    processed = get_streaming_stats(current_app).rebuild(
+        get_metric_store(current_app), end - timedelta(hours=hours), end
+    )
+    click.echo(f'Rebuilt streaming stats from {processed} raw samples.')
+
+@click.command('upgrade-indexes')
+@with_appcontext
+def upgrade_indexes_command():
+    """Add columns and indexes declared on the models that are missing from existing tables."""
+    added = ensure_columns()
+    click.echo(f'Added {len(added)} columns: {", ".join(added) or "none"}')
+    created = ensure_indexes()
+    click.echo(f'Created {len(created)} indexes: {", ".join(created) or "none"}')
@@ -0,0 +1,400 @@
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, date, timedelta
+from urllib.parse import quote
+import os
+import shutil
+import threading
+import logging
+import numpy as np
+from src.database.metric_store import MetricStore, Series, metric_name
+from src.database.regression import RegressionSums, array_sums, merge_sums
+from src.database.sketch import QuantileSketch, merge_sketches
+from src.utils.time_buckets import bucket_start
+
+logger = logging.getLogger(__name__)
+
+# pyarrow 为可选依赖，未安装时不启用归档层
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+def archive_available() -> bool:
+    return pa is not None
+
+class ParquetArchive:
+    """冷数据 Parquet 归档
+
+    按 day=YYYY-MM-DD/series=type.metric 的 Hive 分区目录保存，每个文件只有
+    timestamp、value 两列并按时间排序，行组带有最小/最大统计信息。读取时
+    用 pyarrow.dataset 的过滤表达式下推：日期和序列条件裁剪分区目录，
+    时间条件依据行组统计跳过行组，只读取需要的列。
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for the Parquet archive")
+        self.directory = config.get('archive_dir', os.path.join('data', 'archive'))
+        self.row_group_size = config.get('archive_row_group_size', 65536)
+        self.compression = config.get('archive_compression', 'zstd')
+        self.partitioning = ds.partitioning(pa.schema([('day', pa.string()), ('series', pa.string())]), flavor='hive')
+        self._lock = threading.Lock()
+        self._dataset = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _days(self) -> List[str]:
+        return sorted(name[4:] for name in os.listdir(self.directory) if name.startswith('day='))
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        """已归档数据的结束时间（最后一个归档日的次日零点）"""
+        days = self._days()
+        if not days:
+            return None
+        return datetime.fromisoformat(days[-1]) + timedelta(days=1)
+
+    def _get_dataset(self):
+        with self._lock:
+            if self._dataset is None:
+                self._dataset = ds.dataset(self.directory, format='parquet', partitioning=self.partitioning)
+            return self._dataset
+
+    def write_day(self, day: date, data: Dict[Series, List[Tuple[datetime, float]]]) -> int:
+        """把一天的序列写入归档，返回写入的样本数
+
+        每个分区只保留一个 part-0.parquet：分区已存在时（重复执行、上次删除热数据失败、
+        迟到数据）与已有数据合并并按时间戳去重后整体替换，同一天不会被归档两次。
+        """
+        written = 0
+        for (type, metric), points in data.items():
+            if not points:
+                continue
+            table = pa.table({
+                'timestamp': pa.array([timestamp for timestamp, _ in points], pa.timestamp('ms')),
+                'value': pa.array([value for _, value in points], pa.float64())
+            })
+            directory = os.path.join(self.directory, f'day={day.isoformat()}',
+                                     f"series={quote(metric_name(type, metric), safe='')}")
+            os.makedirs(directory, exist_ok=True)
+            existing = sorted(name for name in os.listdir(directory) if name.endswith('.parquet'))
+            if existing:
+                table = pa.concat_tables(
+                    [pq.read_table(os.path.join(directory, name), columns=['timestamp', 'value']) for name in existing]
+                    + [table]
+                )
+            table = table.sort_by([('timestamp', 'ascending')])
+            timestamps = table.column('timestamp').to_numpy()
+            unique = np.concatenate(([True], timestamps[1:] != timestamps[:-1])) if len(timestamps) else timestamps
+            if not unique.all():
+                table = table.filter(pa.array(unique))
+            path = os.path.join(directory, 'part-0.parquet')
+            # 先写临时文件再改名，读取方不会看到写了一半的文件
+            pq.write_table(table, path + '.tmp', row_group_size=self.row_group_size, compression=self.compression)
+            os.replace(path + '.tmp', path)
+            # 旧版本按 part-N 追加的文件已合并进 part-0
+            for name in existing:
+                if name != 'part-0.parquet':
+                    os.remove(os.path.join(directory, name))
+            written += len(points)
+        with self._lock:
+            self._dataset = None
+        return written
+
+    def _scan(self, start: datetime, end: datetime, series: Optional[List[Series]], columns: List[str]):
+        if not self._days():
+            return None
+        condition = (
+            (ds.field('day') >= start.date().isoformat()) & (ds.field('day') <= end.date().isoformat())
+            & (ds.field('timestamp') >= pa.scalar(start, pa.timestamp('ms')))
+            & (ds.field('timestamp') <= pa.scalar(end, pa.timestamp('ms')))
+        )
+        if series:
+            condition = condition & ds.field('series').isin([metric_name(*key) for key in series])
+        return self._get_dataset().to_table(columns=columns, filter=condition)
+
+    def read_range(self, start: datetime, end: datetime,
+                   series: Optional[List[Series]] = None) -> Dict[Series, List[Tuple[datetime, float]]]:
+        """读取 [start, end] 内的归档序列，按时间升序"""
+        table = self._scan(start, end, series, ['series', 'timestamp', 'value'])
+        if table is None or not table.num_rows:
+            return {}
+        table = table.sort_by([('series', 'ascending'), ('timestamp', 'ascending')])
+        names = np.array(table.column('series').to_pylist(), dtype=object)
+        timestamps = table.column('timestamp').to_numpy().astype('datetime64[ms]').astype(object)
+        values = table.column('value').to_numpy()
+        bounds = np.concatenate(([0], np.flatnonzero(names[1:] != names[:-1]) + 1, [len(names)]))
+
+        result = {}
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            type, _, metric = names[low].partition('.')
+            result[(type, metric)] = list(zip(timestamps[low:high].tolist(), values[low:high].tolist()))
+        return result
+
+    def read_buckets(self, start: datetime, end: datetime, step: float,
+                     series: Optional[List[Series]] = None) -> Dict[Series, List[Tuple[datetime, float]]]:
+        """[start, end] 内各归档序列按 step(秒) 对齐的时间桶平均值，在 NumPy 中向量化分桶"""
+        table = self._scan(start, end, series, ['series', 'timestamp', 'value'])
+        if table is None or not table.num_rows:
+            return {}
+        resolution = max(int(step), 1)
+        table = table.sort_by([('series', 'ascending'), ('timestamp', 'ascending')])
+        names = np.array(table.column('series').to_pylist(), dtype=object)
+        seconds = table.column('timestamp').to_numpy().astype('datetime64[s]').astype(np.int64)
+        buckets = seconds - seconds % resolution
+        values = table.column('value').to_numpy()
+        bounds = np.concatenate(([0], np.flatnonzero(names[1:] != names[:-1]) + 1, [len(names)]))
+
+        result = {}
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            type, _, metric = names[low].partition('.')
+            starts, inverse = np.unique(buckets[low:high], return_inverse=True)
+            averages = np.bincount(inverse, weights=values[low:high]) / np.bincount(inverse)
+            result[(type, metric)] = list(zip(starts.astype('datetime64[s]').astype(object).tolist(), averages.tolist()))
+        return result
+
+    def aggregate(self, start: datetime, end: datetime,
+                  series: Optional[List[Series]] = None) -> Dict[Series, Dict[str, Any]]:
+        """统计 [start, end] 内各序列的 min/max/avg/count，只读取 series 和 value 两列"""
+        table = self._scan(start, end, series, ['series', 'value'])
+        if table is None or not table.num_rows:
+            return {}
+        grouped = table.group_by('series').aggregate(
+            [('value', 'min'), ('value', 'max'), ('value', 'sum'), ('value', 'count')]
+        )
+        result = {}
+        for row in grouped.to_pylist():
+            type, _, metric = row['series'].partition('.')
+            result[(type, metric)] = {
+                'min': row['value_min'],
+                'max': row['value_max'],
+                'avg': row['value_sum'] / row['value_count'],
+                'count': row['value_count']
+            }
+        return result
+
+    def sketches(self, start: datetime, end: datetime, series: Optional[List[Series]] = None,
+                 relative_accuracy: float = 0.01) -> Dict[Series, QuantileSketch]:
+        """[start, end] 内各归档序列的分位数草图，只读取 series 和 value 两列"""
+        table = self._scan(start, end, series, ['series', 'value'])
+        if table is None or not table.num_rows:
+            return {}
+        table = table.sort_by([('series', 'ascending')])
+        names = np.array(table.column('series').to_pylist(), dtype=object)
+        values = table.column('value').to_numpy()
+        bounds = np.concatenate(([0], np.flatnonzero(names[1:] != names[:-1]) + 1, [len(names)]))
+
+        result = {}
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            type, _, metric = names[low].partition('.')
+            result[(type, metric)] = QuantileSketch(relative_accuracy).add_values(values[low:high])
+        return result
+
+    def regression_sums(self, start: datetime, end: datetime, series: Optional[List[Series]] = None,
+                        origin: Optional[datetime] = None) -> Dict[Series, RegressionSums]:
+        """统计 [start, end] 内各序列的回归累加量，x 为相对 origin（默认 start）的秒数"""
+        origin = origin or start
+        table = self._scan(start, end, series, ['series', 'timestamp', 'value'])
+        if table is None or not table.num_rows:
+            return {}
+        table = table.sort_by([('series', 'ascending')])
+        names = np.array(table.column('series').to_pylist(), dtype=object)
+        timestamps = table.column('timestamp').to_numpy().astype('datetime64[ms]')
+        x = (timestamps - np.datetime64(origin, 'ms')) / np.timedelta64(1, 's')
+        values = table.column('value').to_numpy()
+        bounds = np.concatenate(([0], np.flatnonzero(names[1:] != names[:-1]) + 1, [len(names)]))
+
+        result = {}
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            type, _, metric = names[low].partition('.')
+            result[(type, metric)] = array_sums(x[low:high], values[low:high], origin)
+        return result
+
+    def delete_before(self, cutoff: datetime) -> int:
+        """删除整天都早于 cutoff 的分区目录，返回删除的天数"""
+        expired = [day for day in self._days() if datetime.fromisoformat(day) + timedelta(days=1) <= cutoff]
+        for day in expired:
+            shutil.rmtree(os.path.join(self.directory, f'day={day}'))
+        if expired:
+            with self._lock:
+                self._dataset = None
+            logger.info(f"Dropped {len(expired)} archived days before {cutoff}")
+        return len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取归档文件统计"""
+        files = 0
+        size = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.parquet'):
+                    files += 1
+                    size += os.path.getsize(os.path.join(root, name))
+        days = self._days()
+        return {
+            'days': len(days),
+            'first_day': days[0] if days else None,
+            'last_day': days[-1] if days else None,
+            'files': files,
+            'bytes': size
+        }
+
+class TieredMetricStore(MetricStore):
+    """热数据 + 归档冷数据的组合存储
+
+    写入只进入热存储；读取时早于归档水位的部分从 Parquet 归档读取，热存储
+    总是按完整范围读取（归档后的热数据已删除，迟到的旧数据仍能读到）。
+    delete_before 只清理热存储，归档按自己的保留期删除。
+    """
+
+    def __init__(self, hot: MetricStore, archive: ParquetArchive):
+        super().__init__()
+        self.hot = hot
+        self.archive = archive
+        self.sketch_accuracy = hot.sketch_accuracy
+
+    def add_listener(self, listener) -> None:
+        self.hot.add_listener(listener)
+
+    def write_batch(self, rows: List[Dict[str, Any]]) -> int:
+        return self.hot.write_batch(rows)
+
+    def _cold_end(self, start: datetime, end: datetime) -> Optional[datetime]:
+        watermark = self.archive.watermark
+        if watermark is None or start >= watermark:
+            return None
+        return min(end, watermark - timedelta(microseconds=1))
+
+    def read_range(self, start: datetime, end: datetime,
+                   series: Optional[List[Series]] = None,
+                   step: Optional[float] = None) -> Dict[Series, List[Tuple[datetime, float]]]:
+        cold_end = self._cold_end(start, end)
+        if cold_end is None:
+            return self.hot.read_range(start, end, series, step)
+
+        if step:
+            return self._read_buckets(start, end, cold_end, series, step)
+
+        result = self.archive.read_range(start, cold_end, series)
+        for key, points in self.hot.read_range(start, end, series).items():
+            merged = result.setdefault(key, [])
+            if merged and points and points[0][0] < merged[-1][0]:
+                merged.extend(points)
+                merged.sort(key=lambda point: point[0])
+            else:
+                merged.extend(points)
+        return result
+
+    def _read_buckets(self, start: datetime, end: datetime, cold_end: datetime,
+                      series: Optional[List[Series]], step: float) -> Dict[Series, List[Tuple[datetime, float]]]:
+        """按 step 读取：热存储带 step 读取（可使用汇总层），归档只补热存储缺少的时间桶
+
+        汇总层的保留期通常长于原始数据，已归档日期的桶多半仍能从汇总层得到；
+        只有热存储从 start 起已经有数据的序列才跳过归档读取。
+        """
+        result = self.hot.read_range(start, end, series, step)
+        first_bucket = bucket_start(start, max(int(step), 1))
+        missing = None if series is None else [
+            key for key in series if not result.get(key) or result[key][0][0] > first_bucket
+        ]
+        if missing == []:
+            return result
+        for key, points in self.archive.read_buckets(start, cold_end, step, missing).items():
+            hot = result.get(key)
+            if not hot:
+                result[key] = points
+                continue
+            covered = {bucket for bucket, _ in hot}
+            extra = [point for point in points if point[0] not in covered]
+            if extra:
+                result[key] = sorted(hot + extra, key=lambda point: point[0])
+        return result
+
+    def aggregate(self, start: datetime, end: datetime,
+                  series: Optional[List[Series]] = None) -> Dict[Series, Dict[str, Any]]:
+        result = self.hot.aggregate(start, end, series)
+        cold_end = self._cold_end(start, end)
+        if cold_end is None:
+            return result
+        for key, cold in self.archive.aggregate(start, cold_end, series).items():
+            hot = result.get(key)
+            if hot is None:
+                result[key] = cold
+                continue
+            count = hot['count'] + cold['count']
+            result[key] = {
+                'min': min(hot['min'], cold['min']),
+                'max': max(hot['max'], cold['max']),
+                'avg': (hot['avg'] * hot['count'] + cold['avg'] * cold['count']) / count,
+                'count': count
+            }
+        return result
+
+    def regression_sums(self, start: datetime, end: datetime,
+                        series: Optional[List[Series]] = None) -> Dict[Series, RegressionSums]:
+        result = self.hot.regression_sums(start, end, series)
+        cold_end = self._cold_end(start, end)
+        if cold_end is None:
+            return result
+        for key, sums in self.archive.regression_sums(start, cold_end, series, origin=start).items():
+            merge_sums(result, key, sums)
+        return result
+
+    def sketches(self, start: datetime, end: datetime,
+                 series: Optional[List[Series]] = None) -> Dict[Series, QuantileSketch]:
+        result = self.hot.sketches(start, end, series)
+        cold_end = self._cold_end(start, end)
+        if cold_end is None:
+            return result
+        for key, sketch in self.archive.sketches(start, cold_end, series, self.sketch_accuracy).items():
+            merge_sketches(result, key, sketch)
+        return result
+
+    def delete_before(self, cutoff: datetime) -> int:
+        return self.hot.delete_before(cutoff)
+
+    def first_timestamp(self) -> Optional[datetime]:
+        return self.hot.first_timestamp()
+
+    def check(self) -> bool:
+        return self.hot.check()
+
+    def close(self) -> None:
+        self.hot.close()
+
+def archive_cold_data(store: MetricStore, archive: ParquetArchive, before: datetime) -> int:
+    """把热存储中早于 before 所在日零点的数据逐日转存到归档并从热存储删除，返回归档的样本数
+
+    每天先写归档再删除热数据；按日期从早到晚处理，删除"早于次日零点"的数据
+    只会删到已经归档的部分。
+    """
+    first = store.first_timestamp()
+    if first is None:
+        return 0
+    boundary = datetime.combine(before.date(), datetime.min.time())
+    day = datetime.combine(first.date(), datetime.min.time())
+    archived = 0
+    while day < boundary:
+        day_end = day + timedelta(days=1)
+        try:
+            data = store.read_range(day, day_end - timedelta(microseconds=1))
+            if data:
+                archived += archive.write_day(day.date(), data)
+            store.delete_before(day_end)
+        except Exception as e:
+            logger.error(f"Failed to archive metrics of {day.date()}: {e}")
+            break
+        day = day_end
+    if archived:
+        logger.info(f"Archived {archived} samples before {boundary}")
+    return archived
+
+def create_archive(config: Dict[str, Any]) -> Optional[ParquetArchive]:
+    """按配置创建归档，未启用或缺少 pyarrow 时返回 None"""
+    if not config.get('archive_after_days'):
+        return None
+    if pa is None:
+        logger.info("Parquet archive not available, install pyarrow to enable it")
+        return None
+    return ParquetArchive(config)
@@ -0,0 +1,297 @@
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+from datetime import datetime
+import struct
+import numpy as np
+import logging
+from src.models import MetricChunk, db
+from src.database.queries import series_filter
+from src.database.regression import RegressionSums, array_sums, merge_sums
+from src.utils.time_buckets import to_epoch_ms, from_epoch_ms
+
+logger = logging.getLogger(__name__)
+
+# 块头: 样本数
+_HEADER = struct.Struct('>I')
+
+# 时间戳二阶差分的分段编码: (前缀, 前缀位数, 数值位数)，按有符号范围从小到大
+_DOD_BUCKETS = [
+    (0b10, 2, 7),
+    (0b110, 3, 9),
+    (0b1110, 4, 12)
+]
+_DOD_FALLBACK = (0b1111, 4, 64)
+
+def _float_to_bits(value: float) -> int:
+    return struct.unpack('>Q', struct.pack('>d', value))[0]
+
+def _bits_to_float(bits: int) -> float:
+    return struct.unpack('>d', struct.pack('>Q', bits))[0]
+
+def _to_signed(value: int, nbits: int) -> int:
+    if value >= 1 << (nbits - 1):
+        value -= 1 << nbits
+    return value
+
+class BitWriter:
+    """按位写入缓冲区"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._acc = 0
+        self._acc_bits = 0
+
+    def write(self, value: int, nbits: int) -> None:
+        self._acc = (self._acc << nbits) | (value & ((1 << nbits) - 1))
+        self._acc_bits += nbits
+        while self._acc_bits >= 8:
+            self._acc_bits -= 8
+            self._buffer.append((self._acc >> self._acc_bits) & 0xFF)
+        self._acc &= (1 << self._acc_bits) - 1
+
+    def getvalue(self) -> bytes:
+        if self._acc_bits:
+            return bytes(self._buffer) + bytes([(self._acc << (8 - self._acc_bits)) & 0xFF])
+        return bytes(self._buffer)
+
+class BitReader:
+    """按位读取缓冲区"""
+
+    def __init__(self, data: bytes, offset: int = 0):
+        self._data = data
+        self._pos = offset * 8
+
+    def read(self, nbits: int) -> int:
+        end_bit = self._pos + nbits
+        end_byte = (end_bit + 7) >> 3
+        chunk = int.from_bytes(self._data[self._pos >> 3:end_byte], 'big')
+        self._pos = end_bit
+        return (chunk >> (end_byte * 8 - end_bit)) & ((1 << nbits) - 1)
+
+def encode_chunk(timestamps: List[int], values: List[float]) -> bytes:
+    """Gorilla 编码：时间戳(毫秒)按二阶差分、数值按与前值的异或压缩"""
+    writer = BitWriter()
+    if timestamps:
+        writer.write(timestamps[0], 64)
+        previous_bits = _float_to_bits(values[0])
+        writer.write(previous_bits, 64)
+
+        previous_timestamp = timestamps[0]
+        previous_delta = 0
+        previous_leading = -1
+        previous_trailing = 0
+        for timestamp, value in zip(timestamps[1:], values[1:]):
+            delta = timestamp - previous_timestamp
+            dod = delta - previous_delta
+            if dod == 0:
+                writer.write(0, 1)
+            else:
+                for prefix, prefix_bits, value_bits in _DOD_BUCKETS:
+                    if -(1 << (value_bits - 1)) <= dod < 1 << (value_bits - 1):
+                        break
+                else:
+                    prefix, prefix_bits, value_bits = _DOD_FALLBACK
+                writer.write(prefix, prefix_bits)
+                writer.write(dod, value_bits)
+            previous_timestamp = timestamp
+            previous_delta = delta
+
+            bits = _float_to_bits(value)
+            xor = bits ^ previous_bits
+            previous_bits = bits
+            if xor == 0:
+                writer.write(0, 1)
+                continue
+            writer.write(1, 1)
+            leading = min(64 - xor.bit_length(), 31)
+            trailing = (xor & -xor).bit_length() - 1
+            if previous_leading >= 0 and leading >= previous_leading and trailing >= previous_trailing:
+                # 有效位落在上一个窗口内，复用窗口
+                writer.write(0, 1)
+                writer.write(xor >> previous_trailing, 64 - previous_leading - previous_trailing)
+            else:
+                meaningful = 64 - leading - trailing
+                writer.write(1, 1)
+                writer.write(leading, 5)
+                writer.write(meaningful - 1, 6)
+                writer.write(xor >> trailing, meaningful)
+                previous_leading = leading
+                previous_trailing = trailing
+
+    return _HEADER.pack(len(timestamps)) + writer.getvalue()
+
+def decode_chunk(data: bytes) -> Tuple[List[int], List[float]]:
+    """解码 encode_chunk 的结果，返回 (毫秒时间戳列表, 数值列表)"""
+    count = _HEADER.unpack_from(data)[0]
+    timestamps: List[int] = []
+    values: List[float] = []
+    if not count:
+        return timestamps, values
+
+    reader = BitReader(data, _HEADER.size)
+    timestamp = _to_signed(reader.read(64), 64)
+    bits = reader.read(64)
+    timestamps.append(timestamp)
+    values.append(_bits_to_float(bits))
+
+    delta = 0
+    leading = 0
+    trailing = 0
+    for _ in range(count - 1):
+        if reader.read(1):
+            # 前缀 10/110/1110 对应各分段，1111 为 64 位兜底
+            value_bits = _DOD_FALLBACK[2]
+            for _, _, bucket_bits in _DOD_BUCKETS:
+                if not reader.read(1):
+                    value_bits = bucket_bits
+                    break
+            delta += _to_signed(reader.read(value_bits), value_bits)
+        timestamp += delta
+        timestamps.append(timestamp)
+
+        if reader.read(1):
+            if reader.read(1):
+                leading = reader.read(5)
+                meaningful = reader.read(6) + 1
+                trailing = 64 - leading - meaningful
+            bits ^= reader.read(64 - leading - trailing) << trailing
+        values.append(_bits_to_float(bits))
+
+    return timestamps, values
+
+class ChunkStore:
+    """压缩时序块存储
+
+    每个序列按固定时间窗口打包为一个 MetricChunk，时间戳和数值以 Gorilla 方式
+    编码为 BLOB。块头记录起止时间和 min/max/sum，范围扫描和聚合可以直接
+    依据块头跳过或汇总整块，只有落在查询边界上的块才需要解码。
+    """
+
+    def write(self, type: str, metric: str, points: List[Tuple[datetime, float]]) -> Optional[MetricChunk]:
+        """把一个序列的样本编码为一个块（调用方负责提交事务）"""
+        if not points:
+            return None
+        points = sorted(points, key=lambda point: point[0])
+        values = [float(value) for _, value in points]
+        chunk = MetricChunk(
+            type=type,
+            metric=metric,
+            start_time=points[0][0],
+            end_time=points[-1][0],
+            sample_count=len(points),
+            min_value=min(values),
+            max_value=max(values),
+            sum_value=sum(values),
+            last_value=values[-1],
+            data=encode_chunk([to_epoch_ms(timestamp) for timestamp, _ in points], values)
+        )
+        db.session.add(chunk)
+        return chunk
+
+    def _query(self, start: datetime, end: datetime,
+               series: Optional[List[Tuple[str, str]]] = None,
+               min_value: Optional[float] = None, max_value: Optional[float] = None):
+        query = MetricChunk.query.filter(MetricChunk.start_time <= end, MetricChunk.end_time >= start)
+        if series:
+            query = query.filter(series_filter(MetricChunk.type, MetricChunk.metric, series))
+        # 依据块头的值域跳过不可能命中的块
+        if min_value is not None:
+            query = query.filter(MetricChunk.max_value >= min_value)
+        if max_value is not None:
+            query = query.filter(MetricChunk.min_value <= max_value)
+        return query.order_by(MetricChunk.start_time)
+
+    def iter_rows(self, start: datetime, end: datetime,
+                  series: Optional[List[Tuple[str, str]]] = None,
+                  end_inclusive: bool = True,
+                  min_value: Optional[float] = None,
+                  max_value: Optional[float] = None) -> Iterator[Tuple[datetime, str, str, float]]:
+        """逐行读取块内样本 (timestamp, type, metric, value)，可按值域过滤"""
+        start_ms = to_epoch_ms(start)
+        end_ms = to_epoch_ms(end)
+        for chunk in self._query(start, end, series, min_value, max_value):
+            timestamps, values = decode_chunk(chunk.data)
+            for timestamp, value in zip(timestamps, values):
+                if timestamp < start_ms or timestamp > end_ms or (timestamp == end_ms and not end_inclusive):
+                    continue
+                if (min_value is not None and value < min_value) or (max_value is not None and value > max_value):
+                    continue
+                yield from_epoch_ms(timestamp), chunk.type, chunk.metric, value
+
+    def aggregate(self, start: datetime, end: datetime,
+                  series: Optional[List[Tuple[str, str]]] = None) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """统计时间范围内各序列的 min/max/avg/count
+
+        完全落在范围内的块直接使用块头，只解码跨越范围边界的块。
+        """
+        partials: Dict[Tuple[str, str], list] = {}
+        decoded = 0
+        start_ms = to_epoch_ms(start)
+        end_ms = to_epoch_ms(end)
+        for chunk in self._query(start, end, series):
+            if chunk.start_time >= start and chunk.end_time <= end:
+                count = chunk.sample_count
+                low, high, total = chunk.min_value, chunk.max_value, chunk.sum_value
+            else:
+                decoded += 1
+                timestamps, values = decode_chunk(chunk.data)
+                values = [value for timestamp, value in zip(timestamps, values) if start_ms <= timestamp <= end_ms]
+                if not values:
+                    continue
+                count = len(values)
+                low, high, total = min(values), max(values), sum(values)
+
+            agg = partials.get((chunk.type, chunk.metric))
+            if agg is None:
+                partials[(chunk.type, chunk.metric)] = [low, high, total, count]
+            else:
+                agg[0] = min(agg[0], low)
+                agg[1] = max(agg[1], high)
+                agg[2] += total
+                agg[3] += count
+
+        logger.debug(f"Aggregated {len(partials)} series from chunks, decoded {decoded} boundary chunks")
+        return {
+            key: {'min': low, 'max': high, 'avg': total / count, 'count': count}
+            for key, (low, high, total, count) in partials.items()
+        }
+
+    def regression_sums(self, start: datetime, end: datetime,
+                        series: Optional[List[Tuple[str, str]]] = None) -> Dict[Tuple[str, str], RegressionSums]:
+        """统计时间范围内各序列的回归累加量
+
+        块头没有 Σx、Σxy 等累加量，需要逐块解码；每次只保留一个块的样本。
+        """
+        partials: Dict[Tuple[str, str], RegressionSums] = {}
+        start_ms = to_epoch_ms(start)
+        end_ms = to_epoch_ms(end)
+        # start 的亚毫秒部分，保证 x 精确为相对 start 的秒数
+        offset = (start - from_epoch_ms(start_ms)).total_seconds()
+        for chunk in self._query(start, end, series):
+            timestamps, values = decode_chunk(chunk.data)
+            timestamps = np.array(timestamps, dtype=np.int64)
+            values = np.array(values, dtype=np.float64)
+            if chunk.start_time < start or chunk.end_time > end:
+                inside = (timestamps >= start_ms) & (timestamps <= end_ms)
+                timestamps, values = timestamps[inside], values[inside]
+            merge_sums(partials, (chunk.type, chunk.metric), array_sums((timestamps - start_ms) / 1000.0 - offset, values, start))
+        return partials
+
+    def delete_before(self, cutoff: datetime) -> int:
+        """删除所有样本都早于 cutoff 的块（调用方负责提交事务），返回删除的块数"""
+        return MetricChunk.query.filter(MetricChunk.end_time < cutoff).delete(synchronize_session=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取块存储统计"""
+        chunks, samples, size = db.session.query(
+            db.func.count(MetricChunk.id),
+            db.func.sum(MetricChunk.sample_count),
+            db.func.sum(db.func.length(MetricChunk.data))
+        ).one()
+        samples = samples or 0
+        size = size or 0
+        return {
+            'chunks': chunks,
+            'samples': samples,
+            'bytes': size,
+            'bytes_per_sample': size / samples if samples else 0
+        }
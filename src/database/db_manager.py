@@ -1,168 +1,209 @@
-from typing import Dict, Any, Optional
-import sqlite3
+from typing import Dict, Any, List, Optional, Tuple
+import threading
+import logging
 from datetime import datetime
+from src.database.fanout import BackendWriter
+from src.database.metric_store import MetricStore, create_metric_store, resolve_metric
+
+logger = logging.getLogger(__name__)
 
 class DatabaseManager:
-    def __init__(self, config: Dict[str, Any]):
-        self.sqlite_path = config.get('db_path', 'monitor.db')
+    """多后端指标存储
+
+    主存储为统一的 MetricStore（与 Web 应用共用模型、索引和汇总），
+    MongoDB / MySQL 作为可选的镜像后端。镜像后端只建立一次连接（或连接池）并复用：
+    MongoDB 复用一个自带连接池的 MongoClient，MySQL 使用 MySQLConnectionPool，
+    建表只在初始化时执行一次。每次保存的多个指标批量写入。
+
+    默认异步写入：每个后端有独立的 BackendWriter（有界队列 + 写线程 + 磁盘溢写），
+    save_metrics 只负责入队，慢或不可用的后端不会拖慢采集。async_writes 为 False 时
+    在调用线程上依次同步写入。
+    """
+
+    def __init__(self, config: Dict[str, Any], store: Optional[MetricStore] = None):
+        if store is None:
+            store_config = dict(config.get('metric_store', {}))
+            store_config.setdefault('db_path', config.get('db_path', 'monitor.db'))
+            if 'sqlite_pragmas' in config:
+                store_config.setdefault('sqlite_pragmas', config['sqlite_pragmas'])
+            store = create_metric_store(store_config)
+        self.store = store
         self.mongo_enabled = False
         self.mysql_enabled = False
-        
-        # 尝试导入可选的数据库模块
+        self.mongo_client = None
+        self._mysql_pool = None
+        self._mysql_lock = threading.Lock()
+        self.writers: Dict[str, BackendWriter] = {}
+
+        # 尝试导入可选的数据库模块，只有配置了对应后端才启用
         try:
             import pymongo
-            self.mongo_enabled = True
             self.mongo_config = config.get('mongodb', {})
-            self.mongo_client = None
+            self.mongo_enabled = 'mongodb' in config
         except ImportError:
-            print("MongoDB support not available")
-            
+            logger.info("MongoDB support not available")
+
         try:
             import mysql.connector
-            self.mysql_enabled = True
-            self.mysql_config = config.get('mysql', {})
+            self.mysql_config = dict(config.get('mysql', {}))
+            self.mysql_pool_size = self.mysql_config.pop('pool_size', 5)
+            self.mysql_enabled = 'mysql' in config
         except ImportError:
-            print("MySQL support not available")
-            
-        self.init_databases()
-        
-    def init_databases(self) -> None:
-        """初始化所有数据库连接"""
-        self._init_sqlite()
-    
-    def _init_sqlite(self) -> None:
-        """初始化SQLite数据库"""
-        try:
-            with sqlite3.connect(self.sqlite_path) as conn:
-                conn.execute('''
-                    CREATE TABLE IF NOT EXISTS metrics (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        timestamp DATETIME,
-                        metric_name TEXT,
-                        metric_value REAL
-                    )
-                ''')
-                # 添加索引以提高查询性能
-                conn.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_metrics_timestamp 
-                    ON metrics(timestamp)
-                ''')
-                conn.execute('''
-                    CREATE INDEX IF NOT EXISTS idx_metrics_name 
-                    ON metrics(metric_name)
-                ''')
-                print(f"SQLite database initialized at {self.sqlite_path}")
-        except Exception as e:
-            print(f"Error initializing SQLite database: {e}")
-    
-    def save_metrics(self, metrics: Dict[str, Any]) -> None:
-        """保存指标到所有可用的数据库"""
-        self._save_to_sqlite(metrics)
+            logger.info("MySQL support not available")
+
+        if config.get('async_writes', True):
+            for name, write in self._backends().items():
+                self.writers[name] = BackendWriter(name, write, config)
+                self.writers[name].start()
+
+    def _backends(self) -> Dict[str, Any]:
+        """已启用的后端及其批量写入函数"""
+        backends = {'store': self._write_store}
         if self.mongo_enabled:
-            self._save_to_mongo(metrics)
+            backends['mongodb'] = self._write_mongo
         if self.mysql_enabled:
-            self._save_to_mysql(metrics)
-    
-    def _save_to_sqlite(self, metrics: Dict[str, Any]) -> None:
-        """保存到SQLite"""
-        current_time = datetime.now()
-        with sqlite3.connect(self.sqlite_path) as conn:
-            for metric_name, metric_value in metrics.items():
-                if isinstance(metric_value, (int, float)):
-                    conn.execute(
-                        'INSERT INTO metrics (timestamp, metric_name, metric_value) VALUES (?, ?, ?)',
-                        (current_time, metric_name, metric_value)
+            backends['mysql'] = self._write_mysql
+        return backends
+
+    def _get_mongo(self):
+        """获取共享的 MongoClient（内部自带连接池）"""
+        if self.mongo_client is None:
+            import pymongo
+            self.mongo_client = pymongo.MongoClient(**self.mongo_config)
+        return self.mongo_client
+
+    def _get_mysql(self):
+        """从连接池获取 MySQL 连接，连接 close() 后归还连接池"""
+        if self._mysql_pool is None:
+            with self._mysql_lock:
+                if self._mysql_pool is None:
+                    from mysql.connector import pooling
+                    pool = pooling.MySQLConnectionPool(
+                        pool_name='metrics', pool_size=self.mysql_pool_size, **self.mysql_config
                     )
-    
-    def _save_to_mongo(self, metrics: Dict[str, Any]) -> None:
-        """保存到MongoDB"""
-        if not self.mongo_enabled:
+                    conn = pool.get_connection()
+                    try:
+                        cursor = conn.cursor()
+                        cursor.execute('''
+                            CREATE TABLE IF NOT EXISTS metrics (
+                                id INT AUTO_INCREMENT PRIMARY KEY,
+                                timestamp DATETIME,
+                                metric_name VARCHAR(255),
+                                metric_value FLOAT
+                            )
+                        ''')
+                        conn.commit()
+                        cursor.close()
+                    finally:
+                        conn.close()
+                    self._mysql_pool = pool
+        return self._mysql_pool.get_connection()
+
+    @staticmethod
+    def _metric_rows(records: List[Dict[str, Any]]) -> List[Tuple[datetime, str, float]]:
+        """提取数值指标为 (timestamp, metric_name, metric_value) 行"""
+        return [
+            (record['timestamp'], metric_name, metric_value)
+            for record in records
+            for metric_name, metric_value in record['metrics'].items()
+            if isinstance(metric_value, (int, float)) and not isinstance(metric_value, bool)
+        ]
+
+    def save_metrics(self, metrics: Dict[str, Any]) -> None:
+        """保存指标到所有可用的数据库"""
+        record = {'timestamp': datetime.utcnow(), 'metrics': metrics}
+        if self.writers:
+            for writer in self.writers.values():
+                writer.put(record)
             return
-            
-        try:
-            import pymongo
-            client = pymongo.MongoClient(**self.mongo_config)
-            db = client.monitoring
-            db.metrics.insert_one({
-                'timestamp': datetime.now(),
-                'metrics': metrics
-            })
-        except Exception as e:
-            print(f"MongoDB保存失败: {e}")
-    
-    def _save_to_mysql(self, metrics: Dict[str, Any]) -> None:
-        """保存到MySQL"""
-        if not self.mysql_enabled:
+
+        for name, write in self._backends().items():
+            try:
+                write([record])
+            except Exception as e:
+                logger.error(f"{name}保存失败: {e}")
+
+    def flush(self) -> None:
+        """同步写出所有后端队列中的数据"""
+        for writer in self.writers.values():
+            writer.flush()
+
+    def _write_store(self, records: List[Dict[str, Any]]) -> None:
+        """批量写入统一指标存储，扁平指标名按 resolve_metric 映射为序列"""
+        rows = []
+        for timestamp, name, value in self._metric_rows(records):
+            type, metric = resolve_metric(name)
+            rows.append({'timestamp': timestamp, 'type': type, 'metric': metric, 'value': float(value)})
+        self.store.write_batch(rows)
+
+    def _write_mongo(self, records: List[Dict[str, Any]]) -> None:
+        """批量写入MongoDB"""
+        # insert_many 会给文档加上 _id，传入副本避免修改队列中的记录
+        self._get_mongo().monitoring.metrics.insert_many([dict(record) for record in records])
+
+    def _write_mysql(self, records: List[Dict[str, Any]]) -> None:
+        """批量写入MySQL"""
+        rows = self._metric_rows(records)
+        if not rows:
             return
-            
+        conn = self._get_mysql()
         try:
-            import mysql.connector
-            conn = mysql.connector.connect(**self.mysql_config)
             cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS metrics (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    timestamp DATETIME,
-                    metric_name VARCHAR(255),
-                    metric_value FLOAT
-                )
-            ''')
-            
-            current_time = datetime.now()
-            for metric_name, metric_value in metrics.items():
-                if isinstance(metric_value, (int, float)):
-                    cursor.execute(
-                        'INSERT INTO metrics (timestamp, metric_name, metric_value) VALUES (%s, %s, %s)',
-                        (current_time, metric_name, metric_value)
-                    )
-            
+            # mysql.connector 会把 INSERT 的 executemany 改写为单条多 VALUES 语句
+            cursor.executemany(
+                'INSERT INTO metrics (timestamp, metric_name, metric_value) VALUES (%s, %s, %s)',
+                rows
+            )
             conn.commit()
             cursor.close()
+        finally:
             conn.close()
-        except Exception as e:
-            print(f"MySQL保存失败: {e}")
-    
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各后端写入器的队列深度、延迟和错误计数"""
+        return {name: writer.get_stats() for name, writer in self.writers.items()}
+
     def check_connections(self) -> Dict[str, bool]:
         """检查所有可用数据库连接"""
         status = {
-            'sqlite': self._check_sqlite()
+            'store': self.store.check()
         }
-        
+
         if self.mongo_enabled:
             status['mongodb'] = self._check_mongo()
         if self.mysql_enabled:
             status['mysql'] = self._check_mysql()
-            
+
         return status
-    
-    def _check_sqlite(self) -> bool:
-        try:
-            with sqlite3.connect(self.sqlite_path) as conn:
-                conn.execute("SELECT 1")
-            return True
-        except Exception:
-            return False
-    
+
     def _check_mongo(self) -> bool:
         if not self.mongo_enabled:
             return False
         try:
-            import pymongo
-            client = pymongo.MongoClient(**self.mongo_config)
-            client.server_info()
+            self._get_mongo().admin.command('ping')
             return True
         except Exception:
             return False
-    
+
     def _check_mysql(self) -> bool:
         if not self.mysql_enabled:
             return False
         try:
-            import mysql.connector
-            conn = mysql.connector.connect(**self.mysql_config)
-            status = conn.is_connected()
-            conn.close()
-            return status
+            conn = self._get_mysql()
+            try:
+                return conn.is_connected()
+            finally:
+                conn.close()
         except Exception:
-            return False 
\ No newline at end of file
+            return False
+
+    def close(self) -> None:
+        """停止写入器并关闭所有长连接"""
+        for writer in self.writers.values():
+            writer.stop()
+        self.store.close()
+        if self.mongo_client is not None:
+            self.mongo_client.close()
+            self.mongo_client = None
+        # MySQLConnectionPool 没有关闭接口，丢弃引用即可
+        self._mysql_pool = None
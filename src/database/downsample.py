@@ -0,0 +1,73 @@
+from typing import List, Sequence, TypeVar
+import numpy as np
+
+# 降采样方法
+METHODS = ('lttb', 'minmax')
+
+Point = TypeVar('Point', bound=tuple)
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets，返回保留点的下标
+
+    首尾点固定保留，中间每个桶选取与上一个已选点、下一个桶均值
+    构成三角形面积最大的点，能较好地保留曲线形状和尖峰。
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    selected = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        area = np.abs(
+            (x[selected] - avg_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (avg_y - y[selected])
+        )
+        selected = start + int(np.argmax(area))
+        indices[i + 1] = selected
+    return indices
+
+def minmax_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """按像素桶保留最小值和最大值，返回保留点的下标（按时间升序）"""
+    n = len(y)
+    if threshold >= n or threshold < 2:
+        return np.arange(n)
+
+    edges = np.linspace(0, n, threshold // 2 + 1).astype(np.int64)
+    indices = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end <= start:
+            continue
+        bucket = y[start:end]
+        indices.append(start + int(np.argmin(bucket)))
+        indices.append(start + int(np.argmax(bucket)))
+    return np.unique(indices)
+
+def downsample(points: Sequence[Point], max_points: int, method: str = 'lttb') -> List[Point]:
+    """把按时间升序的序列点降到最多 max_points 个
+
+    points 为以时间戳开头、第二项为数值的元组（原始点或汇总序列点均可），
+    返回选中的原始元组，不做插值。
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsample method: {method}")
+    if not max_points or len(points) <= max_points:
+        return list(points)
+
+    y = np.fromiter((point[1] for point in points), dtype=np.float64, count=len(points))
+    if method == 'lttb':
+        # 只需要相对间距，直接用 timestamp()，比转换为 datetime64 快得多
+        x = np.fromiter((point[0].timestamp() for point in points), dtype=np.float64, count=len(points))
+        indices = lttb_indices(x, y, max_points)
+    else:
+        indices = minmax_indices(y, max_points)
+    return [points[index] for index in indices]
@@ -0,0 +1,312 @@
+from typing import Dict, Any, List, Callable, Optional
+from datetime import datetime
+import json
+import os
+import queue
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class SpoolFile:
+    """追加写的本地溢写文件
+
+    每条记录一行 JSON，时间戳以 ISO 字符串保存。后端恢复后逐行流式读取、
+    按批回放，内存占用只与批量大小有关；部分回放成功时只保留剩余的行。
+    文件超过 max_bytes 时丢弃最早的记录，避免后端长时间故障时无限增长。
+    """
+
+    def __init__(self, path: str, max_bytes: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes  # 0 表示不限制
+        self._lock = threading.Lock()
+        self.count = 0
+        self.size = 0
+        self.dropped = 0
+        self.oldest: Optional[datetime] = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 启动时接管上次运行遗留的记录
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    if self.oldest is None:
+                        self.oldest = self._decode(line)['timestamp']
+                    self.count += 1
+            self.size = os.path.getsize(path)
+
+    @staticmethod
+    def _encode(record: Dict[str, Any]) -> str:
+        return json.dumps(dict(record, timestamp=record['timestamp'].isoformat()), default=str)
+
+    @staticmethod
+    def _decode(line: bytes) -> Dict[str, Any]:
+        record = json.loads(line)
+        record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+        return record
+
+    def append(self, records: List[Dict[str, Any]]) -> None:
+        """追加一批记录，超过容量时丢弃最早的记录"""
+        if not records:
+            return
+        data = ''.join(self._encode(record) + '\n' for record in records).encode('utf-8')
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                f.write(data)
+            if self.oldest is None:
+                self.oldest = records[0]['timestamp']
+            self.count += len(records)
+            self.size += len(data)
+            if self.max_bytes and self.size > self.max_bytes:
+                self._trim()
+
+    def _trim(self) -> None:
+        """丢弃最早的记录直到文件不超过 max_bytes 的 90%（留出余量，不必每次追加都重写文件），逐行流式复制"""
+        excess = self.size - int(self.max_bytes * 0.9)
+        dropped = 0
+        skipped = 0
+        with open(self.path, 'rb') as f:
+            while skipped < excess:
+                line = f.readline()
+                if not line:
+                    break
+                skipped += len(line)
+                if line.strip():
+                    dropped += 1
+            self._rewrite(f)
+        self.dropped += dropped
+        logger.warning(f"Spool {self.path} exceeded {self.max_bytes} bytes, dropped {dropped} oldest records")
+
+    def _rewrite(self, f) -> None:
+        """把 f 当前位置之后的内容写回溢写文件，并更新计数（需持有锁）"""
+        tmp_path = self.path + '.tmp'
+        count = 0
+        oldest = None
+        with open(tmp_path, 'wb') as out:
+            for line in f:
+                if not line.strip():
+                    continue
+                if oldest is None:
+                    oldest = self._decode(line)['timestamp']
+                out.write(line)
+                count += 1
+        if count:
+            os.replace(tmp_path, self.path)
+            self.size = os.path.getsize(self.path)
+        else:
+            os.remove(tmp_path)
+            os.remove(self.path)
+            self.size = 0
+        self.count = count
+        self.oldest = oldest
+
+    def replay(self, write: Callable[[List[Dict[str, Any]]], None], batch_size: int) -> int:
+        """按批回放全部记录，返回成功回放的条数；write 抛出异常时保留未回放的记录并重新抛出"""
+        with self._lock:
+            if not self.count:
+                return 0
+            replayed = 0
+            with open(self.path, 'rb') as f:
+                position = 0
+                try:
+                    batch = []
+                    for line in iter(f.readline, b''):
+                        if line.strip():
+                            batch.append(self._decode(line))
+                        if len(batch) >= batch_size:
+                            write(batch)
+                            replayed += len(batch)
+                            position = f.tell()
+                            batch = []
+                    if batch:
+                        write(batch)
+                        replayed += len(batch)
+                    position = f.tell()
+                finally:
+                    f.seek(position)
+                    self._rewrite(f)
+            return replayed
+
+class BackendWriter:
+    """单个存储后端的异步写入器
+
+    每个后端拥有独立的有界队列和写线程，按批量大小或时间间隔批量写入，
+    慢或不可用的后端不会阻塞采集线程和其他后端。写入失败或队列已满时
+    数据追加到本地溢写文件，后端恢复后先回放溢写文件再写新数据，保持写入顺序。
+    """
+
+    def __init__(self, name: str, write: Callable[[List[Dict[str, Any]]], None], config: Dict):
+        self.name = name
+        self._write_batch = write
+        self.batch_size = config.get('fanout_batch_size', 200)
+        self.flush_interval = config.get('fanout_flush_interval', 1.0)  # 最长刷新间隔(秒)
+        self.max_queue_size = config.get('fanout_queue_size', 1000)
+        self.retry_interval = config.get('fanout_retry_interval', 5.0)  # 后端故障后的重试间隔(秒)
+
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self.spool = SpoolFile(os.path.join(config.get('spool_dir', 'spool'), f'{name}.spool'),
+                               config.get('spool_max_bytes', 64 * 1024 * 1024))
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._retry_at = 0.0
+
+        self.healthy = True
+        self.enqueued = 0
+        self.written = 0
+        self.spooled = 0
+        self.replayed = 0
+        self.errors = 0
+        self.last_error = None
+        self.last_write_time = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def put(self, record: Dict[str, Any]) -> None:
+        """放入一条记录，队列已满时直接溢写到磁盘"""
+        try:
+            self._queue.put_nowait(record)
+            with self._stats_lock:
+                self.enqueued += 1
+        except queue.Full:
+            if not self.spool.count:
+                logger.warning(f"{self.name} queue full, spooling records to disk")
+            self._spool([record])
+
+    def start(self) -> None:
+        """启动写线程"""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f'backend-{self.name}', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止写线程并刷新剩余数据，写不进去的部分留在溢写文件中"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        """写线程主循环"""
+        while not self._stop_event.is_set():
+            batch = self._drain(time.monotonic() + self.flush_interval)
+            if batch or self.spool.count:
+                self._write(batch)
+
+    def _drain(self, deadline: float) -> List[Dict[str, Any]]:
+        """从队列取出一批数据，直到达到批量大小或超过截止时间"""
+        batch = []
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, 0.5)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def flush(self) -> None:
+        """同步写出队列中当前所有数据"""
+        while True:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch and not self.spool.count:
+                break
+            if not self._write(batch):
+                # 后端不可用，剩余数据直接溢写
+                self._spool(self._take_all())
+                break
+            if not batch:
+                break
+
+    def _take_all(self) -> List[Dict[str, Any]]:
+        records = []
+        try:
+            while True:
+                records.append(self._queue.get_nowait())
+        except queue.Empty:
+            return records
+
+    def _write(self, batch: List[Dict[str, Any]]) -> bool:
+        """写入一批数据，先回放溢写文件；后端故障期间在重试时间之前直接溢写"""
+        with self._flush_lock:
+            if not self.healthy and time.monotonic() < self._retry_at:
+                self._spool(batch)
+                return False
+            try:
+                if self.spool.count:
+                    replayed = self.spool.replay(self._write_batch, self.batch_size)
+                    with self._stats_lock:
+                        self.replayed += replayed
+                    logger.info(f"{self.name} replayed {replayed} spooled records")
+                if batch:
+                    self._write_batch(batch)
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += 1
+                    self.last_error = str(e)
+                if self.healthy:
+                    logger.error(f"{self.name} backend write failed, spooling to disk: {e}")
+                self.healthy = False
+                self._retry_at = time.monotonic() + self.retry_interval
+                self._spool(batch)
+                return False
+
+            self.healthy = True
+            with self._stats_lock:
+                self.written += len(batch)
+                self.last_write_time = datetime.utcnow()
+            return True
+
+    def _spool(self, records: List[Dict[str, Any]]) -> None:
+        try:
+            self.spool.append(records)
+        except Exception as e:
+            logger.error(f"Failed to spool {len(records)} {self.name} records: {e}")
+            return
+        with self._stats_lock:
+            self.spooled += len(records)
+
+    def _oldest_pending(self) -> Optional[datetime]:
+        """最早一条尚未写入后端的记录的时间"""
+        if self.spool.oldest is not None:
+            return self.spool.oldest
+        with self._queue.mutex:
+            return self._queue.queue[0]['timestamp'] if self._queue.queue else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取写入器运行状态，lag 为最早未写入记录距今的秒数"""
+        oldest = self._oldest_pending()
+        with self._stats_lock:
+            return {
+                'running': self.is_running,
+                'healthy': self.healthy,
+                'depth': self._queue.qsize(),
+                'capacity': self.max_queue_size,
+                'lag': (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'spool_depth': self.spool.count,
+                'spool_bytes': self.spool.size,
+                'spool_dropped': self.spool.dropped,
+                'spooled': self.spooled,
+                'replayed': self.replayed,
+                'errors': self.errors,
+                'last_error': self.last_error,
+                'last_write_time': self.last_write_time.isoformat() if self.last_write_time else None
+            }
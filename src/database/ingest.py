@@ -0,0 +1,172 @@
+from typing import Dict, Any, List, Callable, Optional
+from datetime import datetime
+import queue
+import threading
+import logging
+import time
+from src.models import db
+from src.database.metric_store import get_metric_store
+
+logger = logging.getLogger(__name__)
+
+class MetricIngestQueue:
+    """监控数据写入队列
+
+    采集方把样本放入有界内存队列，由单个写线程按批量大小或时间间隔
+    通过应用的指标存储批量落库，每次刷新只使用一个事务。队列写满时按配置阻塞等待或丢弃，
+    并记录丢弃计数。
+    """
+
+    def __init__(self, app, config: Dict):
+        self.app = app
+        self.batch_size = config.get('ingest_batch_size', 500)  # 单次刷新的最大行数
+        self.flush_interval = config.get('ingest_flush_interval', 5.0)  # 最长刷新间隔(秒)
+        self.max_queue_size = config.get('ingest_queue_size', 10000)
+        self.put_timeout = config.get('ingest_put_timeout', 0)  # 队列满时的等待时间(秒)，0 表示直接丢弃
+
+        self._queue = queue.Queue(maxsize=self.max_queue_size)
+        self.store = get_metric_store(app)
+        self._listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_size = 0
+        self.last_flush_duration = 0.0
+        self.last_flush_time = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_listener(self, listener: Callable[[List[Dict[str, Any]]], None]) -> None:
+        """注册刷新监听器，每次成功落库后以本批数据调用"""
+        self._listeners.append(listener)
+
+    def put(self, rows: List[Dict[str, Any]]) -> int:
+        """放入一批样本，返回成功入队的行数"""
+        accepted = 0
+        now = datetime.utcnow()
+        for row in rows:
+            row.setdefault('timestamp', now)
+            try:
+                if self.put_timeout > 0:
+                    self._queue.put(row, timeout=self.put_timeout)
+                else:
+                    self._queue.put_nowait(row)
+                accepted += 1
+            except queue.Full:
+                with self._stats_lock:
+                    self.dropped += len(rows) - accepted
+                logger.warning(f"Ingest queue full, dropped {len(rows) - accepted} samples")
+                break
+
+        with self._stats_lock:
+            self.enqueued += accepted
+        return accepted
+
+    def start(self) -> None:
+        """启动写线程"""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='metric-ingest', daemon=True)
+        self._thread.start()
+        logger.info("Metric ingest queue started")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止写线程并刷新队列中剩余的数据"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+        logger.info("Metric ingest queue stopped")
+
+    def _run(self) -> None:
+        """写线程主循环"""
+        while not self._stop_event.is_set():
+            batch = self._drain(self.batch_size, time.monotonic() + self.flush_interval)
+            if batch:
+                self._write(batch)
+
+    def _drain(self, limit: int, deadline: float) -> List[Dict[str, Any]]:
+        """从队列取出一批数据，直到达到批量大小或超过截止时间"""
+        batch = []
+        while len(batch) < limit:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=min(remaining, 0.5)))
+            except queue.Empty:
+                continue
+        return batch
+
+    def flush(self) -> int:
+        """同步刷新队列中当前所有数据，返回写入行数"""
+        written = 0
+        while True:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                break
+            written += self._write(batch)
+        return written
+
+    def _write(self, batch: List[Dict[str, Any]]) -> int:
+        """以单个事务写入一批数据"""
+        with self._flush_lock:
+            start = time.perf_counter()
+            with self.app.app_context():
+                try:
+                    self.store.write_batch(batch)
+                except Exception as e:
+                    logger.error(f"Failed to flush {len(batch)} samples: {e}")
+                    db.session.rollback()
+                    with self._stats_lock:
+                        self.failed += len(batch)
+                    return 0
+
+                for listener in self._listeners:
+                    try:
+                        listener(batch)
+                    except Exception as e:
+                        logger.error(f"Ingest listener {listener} failed: {e}", exc_info=True)
+
+            duration = time.perf_counter() - start
+            with self._stats_lock:
+                self.written += len(batch)
+                self.flushes += 1
+                self.last_flush_size = len(batch)
+                self.last_flush_duration = duration
+                self.last_flush_time = datetime.utcnow()
+            logger.debug(f"Flushed {len(batch)} samples in {duration * 1000:.1f} ms")
+            return len(batch)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取队列运行状态"""
+        with self._stats_lock:
+            return {
+                'running': self.is_running,
+                'depth': self._queue.qsize(),
+                'capacity': self.max_queue_size,
+                'enqueued': self.enqueued,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'flushes': self.flushes,
+                'last_flush_size': self.last_flush_size,
+                'last_flush_duration': self.last_flush_duration,
+                'last_flush_time': self.last_flush_time.isoformat() if self.last_flush_time else None
+            }
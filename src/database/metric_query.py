@@ -0,0 +1,256 @@
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta
+import logging
+import numpy as np
+from src.database.rollup import RollupManager, RAW_RESOLUTION, get_rollup_manager
+from src.database.query_cache import QueryCache, align_range, block_ranges, get_query_cache
+from src.utils.time_buckets import EPOCH
+
+logger = logging.getLogger(__name__)
+
+# 支持的聚合函数
+AGGREGATIONS = ('avg', 'min', 'max', 'sum', 'count', 'rate', 'percentile')
+
+# 最小步长(秒)和单次查询的最大桶数，桶数组按 range/step 分配，需限制其大小
+MIN_STEP = 1
+MAX_POINTS = 11000
+
+# 查询缓存中每块包含的桶数
+BLOCK_POINTS = 120
+
+def parse_selector(selector: str) -> List[Tuple[str, str]]:
+    """解析序列选择器，如 "cpu.usage,network.*"，返回 [(type, metric)]，metric 为 '*' 表示该类型的全部指标"""
+    series = []
+    for item in selector.split(','):
+        type, _, metric = item.strip().partition('.')
+        if not type or not metric:
+            raise ValueError(f"Invalid series selector: {item.strip()!r}, expected type.metric")
+        series.append((type, metric))
+    return series
+
+def to_epoch_seconds(timestamps: List[datetime]) -> np.ndarray:
+    """UTC 时间列表转换为秒级时间戳数组"""
+    return np.fromiter(((timestamp - EPOCH).total_seconds() for timestamp in timestamps),
+                       dtype=np.float64, count=len(timestamps))
+
+class MetricQueryEngine:
+    """时序查询引擎
+
+    按 (选择器, 起止时间, 步长, 聚合函数) 查询序列。数据一次性读入 NumPy 数组，
+    用 bincount / ufunc.at 等向量化操作分桶聚合，不做逐行的 Python 循环。
+    avg/min/max/sum/count/rate 读取满足步长的汇总层级；percentile 合并汇总桶中的分位数草图
+    （相对误差不超过 rollup_sketch_accuracy），步长小于最细汇总粒度时按原始样本精确计算。
+    配置了查询缓存时，范围按步长对齐后切分为从纪元起对齐的块（每块 BLOCK_POINTS 个桶）分别缓存，
+    写入只使包含新数据的块失效，滑动窗口查询只需重新计算最新的一块。
+    """
+
+    def __init__(self, rollups: RollupManager, cache: Optional[QueryCache] = None):
+        self.rollups = rollups
+        self.cache = cache
+
+    def query(self, selector: str, start: datetime, end: datetime, step: float,
+              agg: str = 'avg', percentile: float = 95) -> Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]]:
+        """执行查询，返回 {(type, metric): (桶起点秒级时间戳数组, 数值数组)}，不含空桶"""
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation: {agg}")
+        if step < MIN_STEP:
+            raise ValueError(f"Step must be at least {MIN_STEP} second(s)")
+        if (end - start).total_seconds() / step > MAX_POINTS:
+            raise ValueError(f"Query would return more than {MAX_POINTS} points per series, increase step or narrow the range")
+        if not 0 <= percentile <= 100:
+            raise ValueError("Percentile must be between 0 and 100")
+        series = parse_selector(selector)
+
+        if self.cache is None:
+            return self._query(series, start, end, step, agg, percentile)
+        start, end = align_range(start, end, step)
+        key = ('query', tuple(series), step, agg, percentile if agg == 'percentile' else None)
+        blocks = self.cache.get_or_compute_blocks(
+            key, block_ranges(start, end, step * BLOCK_POINTS),
+            lambda block_start, block_end: self._query_block(series, block_start, block_end, step, agg, percentile)
+        )
+
+        origin = (start - EPOCH).total_seconds()
+        origin -= origin % step
+        limit = (end - EPOCH).total_seconds()
+        parts: Dict[Tuple[str, str], List[Tuple[np.ndarray, np.ndarray]]] = {}
+        for block in blocks:
+            for name, arrays in block.items():
+                parts.setdefault(name, []).append(arrays)
+        # 拼接各块并裁剪到查询范围，缓存中的数组不被修改
+        result = {}
+        for name, arrays in parts.items():
+            timestamps = np.concatenate([item[0] for item in arrays])
+            selected = (timestamps >= origin) & (timestamps < limit)
+            if selected.any():
+                result[name] = (timestamps[selected], np.concatenate([item[1] for item in arrays])[selected])
+        return result
+
+    def _query_block(self, series: List[Tuple[str, str]], start: datetime, end: datetime, step: float,
+                     agg: str, percentile: float) -> Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]]:
+        """计算一个缓存块 [start, end)
+
+        rate 需要前一个桶的计数器，多读一个桶后丢弃；前一个桶为空时块内首个桶没有速率。
+        """
+        if agg != 'rate':
+            return self._query(series, start, end - timedelta(microseconds=1), step, agg, percentile)
+        origin = (start - EPOCH).total_seconds()
+        result = {}
+        for key, (timestamps, values) in self._query(series, start - timedelta(seconds=step),
+                                                     end - timedelta(microseconds=1), step, agg, percentile).items():
+            selected = timestamps >= origin
+            if selected.any():
+                result[key] = (timestamps[selected], values[selected])
+        return result
+
+    def _query(self, series: List[Tuple[str, str]], start: datetime, end: datetime, step: float,
+               agg: str, percentile: float) -> Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]]:
+        wildcard_types = {type for type, metric in series if metric == '*'}
+        exact = [key for key in series if key[1] != '*']
+        # 含通配符时读取全部序列后按类型筛选
+        wanted = None if wildcard_types else exact
+
+        origin = (start - EPOCH).total_seconds()
+        origin -= origin % step
+        count = int(((end - EPOCH).total_seconds() - origin) // step) + 1
+
+        if agg == 'percentile':
+            sketched = self._sketch_percentile(start, end, step, wanted, origin, count, percentile)
+            if sketched is not None:
+                return {key: value for key, value in sketched.items()
+                        if key in exact or key[0] in wildcard_types}
+            raw = self.rollups.store.read_range(start, end, wanted)
+            data = {key: [(timestamp, value, value, value, 1, value) for timestamp, value in points]
+                    for key, points in raw.items()}
+        else:
+            data = self.rollups.read_range(start, end, step=step, series=wanted)
+
+        result = {}
+        for key, points in data.items():
+            if key not in exact and key[0] not in wildcard_types:
+                continue
+            if not points:
+                continue
+            columns = np.array([point[1:] for point in points], dtype=np.float64)
+            timestamps = to_epoch_seconds([point[0] for point in points])
+            index = ((timestamps - origin) // step).astype(np.int64)
+            in_range = (index >= 0) & (index < count)
+            values = self._aggregate(agg, index[in_range], timestamps[in_range], columns[in_range], count, percentile)
+            buckets = np.flatnonzero(~np.isnan(values))
+            result[key] = (origin + buckets * step, values[buckets])
+        return result
+
+    def _sketch_percentile(self, start: datetime, end: datetime, step: float,
+                           series: Optional[List[Tuple[str, str]]], origin: float, count: int,
+                           percentile: float) -> Optional[Dict[Tuple[str, str], Tuple[np.ndarray, np.ndarray]]]:
+        """把汇总桶草图按步长合并后取分位数，步长需要原始数据或汇总行缺少草图时返回 None"""
+        if not self.rollups.sketch_accuracy:
+            return None
+        resolution = self.rollups.select_resolution(start, end, step=step)
+        if resolution == RAW_RESOLUTION:
+            return None
+        data = self.rollups.read_sketches(resolution, start, end, series)
+        if not data:
+            return None
+
+        result = {}
+        for key, buckets in data.items():
+            if any(sketch is None for _, sketch in buckets):
+                return None
+            merged = {}
+            timestamps = to_epoch_seconds([bucket for bucket, _ in buckets])
+            for index, (_, sketch) in zip(((timestamps - origin) // step).astype(np.int64).tolist(), buckets):
+                if 0 <= index < count:
+                    if index in merged:
+                        merged[index].merge(sketch)
+                    else:
+                        merged[index] = sketch
+            if merged:
+                indexes = np.array(sorted(merged), dtype=np.int64)
+                values = np.array([merged[index].quantile(percentile / 100.0) for index in indexes.tolist()])
+                result[key] = (origin + indexes * step, values)
+        return result
+
+    def _aggregate(self, agg: str, index: np.ndarray, timestamps: np.ndarray,
+                   columns: np.ndarray, count: int, percentile: float) -> np.ndarray:
+        """按桶聚合，columns 为 [avg, min, max, count, last]，空桶返回 NaN"""
+        avg, low, high, samples, last = columns.T
+        totals = np.bincount(index, weights=samples, minlength=count)
+        empty = totals == 0
+
+        if agg == 'count':
+            values = totals
+        elif agg in ('sum', 'avg'):
+            values = np.bincount(index, weights=avg * samples, minlength=count)
+            if agg == 'avg':
+                values = values / np.where(empty, 1, totals)
+        elif agg == 'min':
+            values = np.full(count, np.inf)
+            np.minimum.at(values, index, low)
+        elif agg == 'max':
+            values = np.full(count, -np.inf)
+            np.maximum.at(values, index, high)
+        elif agg == 'rate':
+            return self._rate(index, timestamps, last, count)
+        else:
+            return self._percentile(index, avg, count, percentile)
+
+        values = values.astype(np.float64)
+        values[empty] = np.nan
+        return values
+
+    @staticmethod
+    def _rate(index: np.ndarray, timestamps: np.ndarray, last: np.ndarray, count: int) -> np.ndarray:
+        """计数器每秒增长率：相邻非空桶最后一个值之差除以时间差，计数器重置时以新值为增量"""
+        last_position = np.full(count, -1, dtype=np.int64)
+        np.maximum.at(last_position, index, np.arange(len(index)))
+        buckets = np.flatnonzero(last_position >= 0)
+        values = np.full(count, np.nan)
+        if len(buckets) < 2:
+            return values
+
+        positions = last_position[buckets]
+        counters = last[positions]
+        increase = np.diff(counters)
+        increase = np.where(increase < 0, counters[1:], increase)
+        elapsed = np.diff(timestamps[positions])
+        values[buckets[1:]] = increase / np.where(elapsed > 0, elapsed, np.nan)
+        return values
+
+    @staticmethod
+    def _percentile(index: np.ndarray, values: np.ndarray, count: int, percentile: float) -> np.ndarray:
+        """按桶计算分位数（线性插值）：按 (桶, 值) 排序后直接按秩取值"""
+        order = np.lexsort((values, index))
+        sorted_values = values[order]
+        sizes = np.bincount(index, minlength=count)
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+        result = np.full(count, np.nan)
+        present = np.flatnonzero(sizes)
+        rank = (sizes[present] - 1) * percentile / 100.0
+        lower = np.floor(rank).astype(np.int64)
+        upper = np.ceil(rank).astype(np.int64)
+        fraction = rank - lower
+        low_values = sorted_values[starts[present] + lower]
+        high_values = sorted_values[starts[present] + upper]
+        result[present] = low_values + (high_values - low_values) * fraction
+        return result
+
+    def query_json(self, selector: str, start: datetime, end: datetime, step: float,
+                   agg: str = 'avg', percentile: float = 95) -> Dict[str, List[List[Any]]]:
+        """执行查询并转换为 {"type.metric": [[ISO 时间, 值], ...]}"""
+        return {
+            f'{type}.{metric}': [
+                [(EPOCH + timedelta(seconds=float(timestamp))).isoformat(), float(value)]
+                for timestamp, value in zip(timestamps, values)
+            ]
+            for (type, metric), (timestamps, values) in self.query(selector, start, end, step, agg, percentile).items()
+        }
+
+def get_query_engine(app) -> MetricQueryEngine:
+    """获取应用的查询引擎"""
+    engine = getattr(app, 'query_engine', None)
+    if engine is None:
+        engine = MetricQueryEngine(get_rollup_manager(app), get_query_cache(app))
+        app.query_engine = engine
+    return engine
@@ -0,0 +1,521 @@
+from typing import Dict, Any, List, Optional, Tuple, Callable, Union, Iterator
+from contextlib import nullcontext
+from datetime import datetime
+import bisect
+import os
+import threading
+import logging
+from flask import Flask, current_app, has_app_context
+from sqlalchemy import event
+from src.models import MonitorData, MonitorSample, MetricChunk, db
+from src.database.sample_store import SampleStore, WIDE_COLUMNS, extra_key
+from src.database.rollup import RollupManager, get_rollup_manager
+from src.database.queries import series_filter, seconds_since
+from src.database.regression import RegressionSums, merge_sums, point_sums
+from src.database.schema import ensure_columns, ensure_indexes
+from src.database.sketch import QuantileSketch, DEFAULT_QUANTILES, sketch_quantiles
+from src.utils.time_buckets import bucket_start
+
+logger = logging.getLogger(__name__)
+
+# SQLite 默认配置：WAL 模式下读写互不阻塞，synchronous=NORMAL 只在检查点时 fsync
+DEFAULT_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+    'wal_autocheckpoint': 1000
+}
+
+# 旧版扁平指标名到 (type, metric) 的映射
+LEGACY_METRICS = {
+    'cpu_percent': ('cpu', 'usage'),
+    'cpu_usage': ('cpu', 'usage'),
+    'memory_usage': ('memory', 'usage'),
+    'disk_usage': ('disk', 'usage'),
+    'bytes_sent': ('network', 'bytes_sent'),
+    'bytes_recv': ('network', 'bytes_recv')
+}
+
+Series = Tuple[str, str]
+Listener = Callable[[List[Dict[str, Any]]], None]
+
+def resolve_metric(name: str) -> Series:
+    """把指标名解析为 (type, metric)：支持旧版扁平名和 "type.metric"，其余归入 custom 类型"""
+    if name in LEGACY_METRICS:
+        return LEGACY_METRICS[name]
+    type, _, metric = name.partition('.')
+    if type and metric:
+        return type, metric
+    return 'custom', name
+
+def metric_name(type: str, metric: str) -> str:
+    """(type, metric) 对应的展示名"""
+    return extra_key(type, metric)
+
+class MetricStore:
+    """统一的指标存储接口
+
+    所有组件（采集写入、分析、导出、可视化）通过同一组操作读写指标：
+    write_batch 写入长格式样本 [{'timestamp', 'type', 'metric', 'value'}]，
+    read_range 按序列返回 [(timestamp, value)]，aggregate 返回各序列的 min/max/avg/count。
+    时间统一使用 UTC。每批写入成功后依次调用已注册的监听器（汇总、缓存失效等）。
+    """
+
+    # 分位数草图的相对精度
+    sketch_accuracy = 0.01
+
+    def __init__(self):
+        self._listeners: List[Listener] = []
+
+    def add_listener(self, listener: Listener) -> None:
+        """注册写入监听器，每批数据写入成功后以本批数据调用"""
+        self._listeners.append(listener)
+
+    def _notify(self, rows: List[Dict[str, Any]]) -> None:
+        for listener in self._listeners:
+            try:
+                listener(rows)
+            except Exception as e:
+                logger.error(f"Metric store listener {listener} failed: {e}", exc_info=True)
+
+    def write_batch(self, rows: List[Dict[str, Any]]) -> int:
+        """写入一批样本，返回写入的行数，失败时抛出异常"""
+        raise NotImplementedError
+
+    def read_range(self, start: datetime, end: datetime,
+                   series: Optional[List[Series]] = None,
+                   step: Optional[float] = None) -> Dict[Series, List[Tuple[datetime, float]]]:
+        """读取 [start, end] 内的序列，按时间升序；给定 step(秒) 时返回各时间桶的平均值"""
+        raise NotImplementedError
+
+    def aggregate(self, start: datetime, end: datetime,
+                  series: Optional[List[Series]] = None) -> Dict[Series, Dict[str, Any]]:
+        """统计 [start, end] 内各序列的 min/max/avg/count"""
+        result = {}
+        for key, points in self.read_range(start, end, series).items():
+            if not points:
+                continue
+            values = [value for _, value in points]
+            result[key] = {'min': min(values), 'max': max(values), 'avg': sum(values) / len(values), 'count': len(values)}
+        return result
+
+    def regression_sums(self, start: datetime, end: datetime,
+                        series: Optional[List[Series]] = None) -> Dict[Series, RegressionSums]:
+        """统计 [start, end] 内各序列的回归累加量（x 为相对 start 的秒数），用于计算均值、方差和趋势斜率"""
+        result = {}
+        for key, points in self.read_range(start, end, series).items():
+            sums = point_sums(points, start)
+            if sums:
+                result[key] = sums
+        return result
+
+    def sketches(self, start: datetime, end: datetime,
+                 series: Optional[List[Series]] = None) -> Dict[Series, QuantileSketch]:
+        """[start, end] 内各序列的可合并分位数草图"""
+        return {
+            key: QuantileSketch.from_values((value for _, value in points), self.sketch_accuracy)
+            for key, points in self.read_range(start, end, series).items() if points
+        }
+
+    def quantiles(self, start: datetime, end: datetime, qs=DEFAULT_QUANTILES,
+                  series: Optional[List[Series]] = None) -> Dict[Series, Dict[str, Any]]:
+        """统计 [start, end] 内各序列的分位数（默认 p50/p95/p99），由草图估计，相对误差不超过 sketch_accuracy"""
+        return sketch_quantiles(self.sketches(start, end, series), qs)
+
+    def read_series(self, type: str, metric: str, start: datetime, end: datetime) -> List[Tuple[datetime, float]]:
+        """读取单个序列 [(timestamp, value)]，与 SampleStore 接口一致，供汇总管理器回退读取原始数据"""
+        return self.read_range(start, end, [(type, metric)]).get((type, metric), [])
+
+    def iter_rows(self, start: datetime, end: datetime,
+                  series: Optional[List[Series]] = None,
+                  end_inclusive: bool = True) -> Iterator[Tuple[datetime, str, str, float]]:
+        """逐行读取长格式样本 (timestamp, type, metric, value)，供汇总重建使用"""
+        for (type, metric), points in self.read_range(start, end, series).items():
+            for timestamp, value in points:
+                if end_inclusive or timestamp < end:
+                    yield timestamp, type, metric, value
+
+    def delete_before(self, cutoff: datetime) -> int:
+        """删除早于 cutoff 的样本，返回删除的行数"""
+        raise NotImplementedError
+
+    def first_timestamp(self) -> Optional[datetime]:
+        """最早一条样本的时间，没有数据时返回 None"""
+        raise NotImplementedError
+
+    def check(self) -> bool:
+        """检查存储是否可用"""
+        return True
+
+    def close(self) -> None:
+        """释放存储占用的连接"""
+
+class SQLMetricStore(MetricStore):
+    """基于 SQLAlchemy 模型的指标存储，SQLite 和 MySQL 由数据库 URL 决定
+
+    写入宽表 MonitorSample，读取时合并旧版 MonitorData 和压缩块；给定 step 时
+    从多粒度汇总读取，aggregate 尽量下推为 SQL 聚合和块头汇总。
+    所有操作在 app 的应用上下文中执行，已处于该应用上下文时直接复用当前会话。
+    """
+
+    def __init__(self, app: Flask, rollups: Optional[RollupManager] = None):
+        super().__init__()
+        self.app = app
+        self.rollups = rollups
+        self.samples = SampleStore()
+        if rollups is not None and rollups.sketch_accuracy:
+            self.sketch_accuracy = rollups.sketch_accuracy
+
+    def _context(self):
+        if has_app_context() and current_app._get_current_object() is self.app:
+            return nullcontext()
+        return self.app.app_context()
+
+    def write_batch(self, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        with self._context():
+            try:
+                self.samples.write(rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            self._notify(rows)
+        return len(rows)
+
+    def read_range(self, start: datetime, end: datetime,
+                   series: Optional[List[Series]] = None,
+                   step: Optional[float] = None) -> Dict[Series, List[Tuple[datetime, float]]]:
+        with self._context():
+            if step and self.rollups is not None:
+                # 汇总层可能比 step 细或回退为原始数据，按样本数加权重新分桶
+                return {
+                    key: bucket_average([(point[0], point[1]) for point in points], step, [point[4] for point in points])
+                    for key, points in self.rollups.read_range(start, end, step=step, series=series).items()
+                }
+            if series and len(series) == 1:
+                points = self.samples.read_series(series[0][0], series[0][1], start, end)
+                result = {series[0]: points} if points else {}
+            else:
+                result = self.samples.read_range(start, end, series)
+        if step:
+            result = {key: bucket_average(points, step) for key, points in result.items()}
+        return result
+
+    def _sample_columns(self, start: datetime, end: datetime,
+                        series: Optional[List[Series]]) -> List[Tuple[Series, Any]]:
+        """宽表中需要聚合的 (序列, 列表达式)，extra 中的动态指标展开为 JSON 提取表达式"""
+        if series:
+            extra_series = [key for key in series if key not in WIDE_COLUMNS]
+        else:
+            extra_series = [key for key in self.samples.extra_series(start, end) if key not in WIDE_COLUMNS]
+        wanted = [(key, getattr(MonitorSample, column)) for key, column in WIDE_COLUMNS.items()
+                  if not series or key in series]
+        return wanted + [(key, MonitorSample.extra[extra_key(*key)].as_float()) for key in extra_series]
+
+    def aggregate(self, start: datetime, end: datetime,
+                  series: Optional[List[Series]] = None) -> Dict[Series, Dict[str, Any]]:
+        """宽表核心列和旧版数据用 SQL 聚合，压缩块使用块头
+
+        extra 中的动态指标通过 JSON 提取在 SQL 中聚合，未指定序列时先在 SQL 中找出出现过的键。
+        """
+        partials: Dict[Series, list] = {}
+
+        def merge(key, low, high, total, count):
+            if not count:
+                return
+            agg = partials.get(key)
+            if agg is None:
+                partials[key] = [low, high, total, count]
+            else:
+                agg[0] = min(agg[0], low)
+                agg[1] = max(agg[1], high)
+                agg[2] += total
+                agg[3] += count
+
+        with self._context():
+            wanted = self._sample_columns(start, end, series)
+            if wanted:
+                columns = []
+                for _, column in wanted:
+                    columns += [db.func.min(column), db.func.max(column), db.func.sum(column), db.func.count(column)]
+                row = db.session.query(*columns).filter(MonitorSample.timestamp.between(start, end)).one()
+                for index, (key, _) in enumerate(wanted):
+                    merge(key, *row[index * 4:index * 4 + 4])
+
+            query = db.session.query(
+                MonitorData.type, MonitorData.metric,
+                db.func.min(MonitorData.value), db.func.max(MonitorData.value),
+                db.func.sum(MonitorData.value), db.func.count(MonitorData.value)
+            ).filter(MonitorData.timestamp.between(start, end))
+            if series:
+                query = query.filter(series_filter(MonitorData.type, MonitorData.metric, series))
+            for type, metric, low, high, total, count in query.group_by(MonitorData.type, MonitorData.metric):
+                merge((type, metric), low, high, total, count)
+
+            for key, stats in self.samples.chunks.aggregate(start, end, series).items():
+                merge(key, stats['min'], stats['max'], stats['avg'] * stats['count'], stats['count'])
+
+        return {
+            key: {'min': low, 'max': high, 'avg': total / count, 'count': count}
+            for key, (low, high, total, count) in partials.items()
+        }
+
+    def sketches(self, start: datetime, end: datetime,
+                 series: Optional[List[Series]] = None) -> Dict[Series, QuantileSketch]:
+        """合并汇总桶中保存的草图，不读取原始样本"""
+        if self.rollups is None:
+            return super().sketches(start, end, series)
+        with self._context():
+            return self.rollups.sketches(start, end, series)
+
+    def regression_sums(self, start: datetime, end: datetime,
+                        series: Optional[List[Series]] = None) -> Dict[Series, RegressionSums]:
+        """宽表核心列和旧版数据用 SQL 计算 Σx、Σy、Σx²、Σxy、Σy²，压缩块逐块解码
+
+        extra 中的动态指标通过 JSON 提取同样在 SQL 中聚合，未指定序列时先在 SQL 中找出出现过的键。
+        """
+        partials: Dict[Series, RegressionSums] = {}
+
+        def sql_sums(count, low, high, sum_x, sum_y, sum_xx, sum_xy, sum_yy, first_timestamp, last_timestamp):
+            return {
+                'count': count, 'min': low, 'max': high,
+                'sum_x': sum_x, 'sum_y': sum_y, 'sum_xx': sum_xx, 'sum_xy': sum_xy, 'sum_yy': sum_yy,
+                'first_timestamp': first_timestamp, 'last_timestamp': last_timestamp, 'last': None
+            }
+
+        with self._context():
+            x = seconds_since(MonitorSample.timestamp, start)
+            wanted = self._sample_columns(start, end, series)
+            if wanted:
+                columns = []
+                for _, column in wanted:
+                    present = column.isnot(None)
+                    columns += [
+                        db.func.count(column), db.func.min(column), db.func.max(column),
+                        db.func.sum(db.case((present, x))), db.func.sum(column),
+                        db.func.sum(db.case((present, x * x))), db.func.sum(x * column), db.func.sum(column * column),
+                        db.func.min(db.case((present, MonitorSample.timestamp))),
+                        db.func.max(db.case((present, MonitorSample.timestamp)))
+                    ]
+                row = db.session.query(*columns).filter(MonitorSample.timestamp.between(start, end)).one()
+                for index, (key, column) in enumerate(wanted):
+                    sums = sql_sums(*row[index * 10:index * 10 + 10])
+                    if sums['count']:
+                        # 最后时刻的值走时间索引单行查询
+                        sums['last'] = db.session.query(column).filter(
+                            MonitorSample.timestamp == sums['last_timestamp'], column.isnot(None)
+                        ).limit(1).scalar()
+                        merge_sums(partials, key, sums)
+
+            x = seconds_since(MonitorData.timestamp, start)
+            query = db.session.query(
+                MonitorData.type, MonitorData.metric,
+                db.func.count(MonitorData.value), db.func.min(MonitorData.value), db.func.max(MonitorData.value),
+                db.func.sum(x), db.func.sum(MonitorData.value), db.func.sum(x * x),
+                db.func.sum(x * MonitorData.value), db.func.sum(MonitorData.value * MonitorData.value),
+                db.func.min(MonitorData.timestamp), db.func.max(MonitorData.timestamp)
+            ).filter(MonitorData.timestamp.between(start, end), MonitorData.value.isnot(None))
+            if series:
+                query = query.filter(series_filter(MonitorData.type, MonitorData.metric, series))
+            legacy = {(row[0], row[1]): sql_sums(*row[2:]) for row in query.group_by(MonitorData.type, MonitorData.metric)}
+            if legacy:
+                last_rows = db.session.query(MonitorData.type, MonitorData.metric, MonitorData.value).filter(db.or_(*[
+                    db.and_(MonitorData.type == type, MonitorData.metric == metric,
+                            MonitorData.timestamp == sums['last_timestamp'])
+                    for (type, metric), sums in legacy.items()
+                ]))
+                for type, metric, value in last_rows:
+                    legacy[(type, metric)]['last'] = value
+                for key, sums in legacy.items():
+                    merge_sums(partials, key, sums)
+
+            for key, sums in self.samples.chunks.regression_sums(start, end, series).items():
+                merge_sums(partials, key, sums)
+
+        return partials
+
+    def delete_before(self, cutoff: datetime) -> int:
+        with self._context():
+            try:
+                deleted = self.samples.delete_before(cutoff)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+        return deleted
+
+    def first_timestamp(self) -> Optional[datetime]:
+        with self._context():
+            candidates = [
+                db.session.query(db.func.min(MonitorSample.timestamp)).scalar(),
+                db.session.query(db.func.min(MonitorData.timestamp)).scalar(),
+                db.session.query(db.func.min(MetricChunk.start_time)).scalar()
+            ]
+        candidates = [timestamp for timestamp in candidates if timestamp is not None]
+        return min(candidates) if candidates else None
+
+    def check(self) -> bool:
+        try:
+            with self._context():
+                db.session.execute(db.text('SELECT 1'))
+            return True
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        with self._context():
+            db.session.remove()
+            db.engine.dispose()
+
+class MemoryMetricStore(MetricStore):
+    """内存指标存储，用于测试和临时分析，每个序列按时间有序保存"""
+
+    def __init__(self):
+        super().__init__()
+        self._series: Dict[Series, Tuple[List[datetime], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def write_batch(self, rows: List[Dict[str, Any]]) -> int:
+        with self._lock:
+            for row in rows:
+                timestamps, values = self._series.setdefault((row['type'], row['metric']), ([], []))
+                if not timestamps or row['timestamp'] >= timestamps[-1]:
+                    timestamps.append(row['timestamp'])
+                    values.append(row['value'])
+                else:
+                    index = bisect.bisect_right(timestamps, row['timestamp'])
+                    timestamps.insert(index, row['timestamp'])
+                    values.insert(index, row['value'])
+        self._notify(rows)
+        return len(rows)
+
+    def read_range(self, start: datetime, end: datetime,
+                   series: Optional[List[Series]] = None,
+                   step: Optional[float] = None) -> Dict[Series, List[Tuple[datetime, float]]]:
+        result = {}
+        with self._lock:
+            for key in (series if series else list(self._series)):
+                if key not in self._series:
+                    continue
+                timestamps, values = self._series[key]
+                low = bisect.bisect_left(timestamps, start)
+                high = bisect.bisect_right(timestamps, end)
+                if high > low:
+                    result[key] = list(zip(timestamps[low:high], values[low:high]))
+        if step:
+            result = {key: bucket_average(points, step) for key, points in result.items()}
+        return result
+
+    def delete_before(self, cutoff: datetime) -> int:
+        deleted = 0
+        with self._lock:
+            for timestamps, values in self._series.values():
+                index = bisect.bisect_left(timestamps, cutoff)
+                del timestamps[:index]
+                del values[:index]
+                deleted += index
+        return deleted
+
+    def first_timestamp(self) -> Optional[datetime]:
+        with self._lock:
+            firsts = [timestamps[0] for timestamps, _ in self._series.values() if timestamps]
+        return min(firsts) if firsts else None
+
+def bucket_average(points: List[Tuple[datetime, float]], step: float,
+                   weights: Optional[List[float]] = None) -> List[Tuple[datetime, float]]:
+    """按 step(秒) 对齐的时间桶求（加权）平均，返回 [(桶起点, 平均值)]"""
+    resolution = max(int(step), 1)
+    buckets: Dict[datetime, list] = {}
+    for index, (timestamp, value) in enumerate(points):
+        weight = weights[index] if weights else 1
+        bucket = buckets.setdefault(bucket_start(timestamp, resolution), [0.0, 0])
+        bucket[0] += value * weight
+        bucket[1] += weight
+    return [(bucket, total / count) for bucket, (total, count) in buckets.items() if count]
+
+def _apply_sqlite_pragmas(engine, pragmas: Dict[str, Any]) -> None:
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(connection, _):
+        cursor = connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+def database_url(config: Dict[str, Any]) -> str:
+    """根据配置生成数据库 URL：url > mysql 连接参数 > db_path(SQLite)"""
+    if config.get('url'):
+        return config['url']
+    if config.get('backend') == 'mysql':
+        mysql = config.get('mysql', {})
+        return (
+            f"mysql+pymysql://{mysql.get('user', mysql.get('username'))}:{mysql.get('password', '')}"
+            f"@{mysql.get('host', 'localhost')}:{mysql.get('port', 3306)}/{mysql.get('database')}?charset=utf8mb4"
+        )
+    return 'sqlite:///' + os.path.abspath(config.get('db_path', 'monitor.db'))
+
+def create_metric_store(config: Dict[str, Any]) -> MetricStore:
+    """在 Web 应用之外创建指标存储
+
+    backend 为 memory 时使用内存存储，segments 时使用内存映射段文件，否则创建
+    只用于数据库访问的 Flask 应用，建表、补建索引，SQLite 默认启用 WAL，并挂上多粒度汇总。
+    """
+    if config.get('backend') == 'memory':
+        return with_archive(MemoryMetricStore(), config)
+    if config.get('backend') == 'segments':
+        from src.database.segment_store import SegmentMetricStore
+        return with_archive(SegmentMetricStore(config), config)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url(config)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            _apply_sqlite_pragmas(db.engine, dict(DEFAULT_SQLITE_PRAGMAS, **config.get('sqlite_pragmas', {})))
+        db.create_all()
+        ensure_columns()
+        ensure_indexes()
+
+    rollups = RollupManager(config)
+    store = SQLMetricStore(app, rollups)
+    store.add_listener(rollups.ingest)
+    logger.info(f"Metric store initialized at {app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1]}")
+    return with_archive(store, config)
+
+def with_archive(store: MetricStore, config: Dict[str, Any]) -> MetricStore:
+    """配置了 archive_after_days 且 pyarrow 可用时，为存储加上 Parquet 归档层"""
+    from src.database.archive import TieredMetricStore, create_archive
+    archive = create_archive(config)
+    return TieredMetricStore(store, archive) if archive is not None else store
+
+def as_metric_store(store: Union[MetricStore, str]) -> MetricStore:
+    """兼容旧接口：传入数据库路径时创建对应的 SQLite 存储"""
+    if isinstance(store, MetricStore):
+        return store
+    return create_metric_store({'db_path': store})
+
+def get_metric_store(app) -> MetricStore:
+    """获取应用的指标存储，未初始化时按 raw_backend 配置创建
+
+    默认基于应用数据库；raw_backend 为 segments 时原始样本写入段文件，
+    汇总仍写入数据库，汇总管理器回退读取原始数据时改读段文件。
+    启用归档时再包一层 Parquet 冷数据，长时间范围的原始数据回退读取同样覆盖归档。
+    """
+    store = getattr(app, 'metric_store', None)
+    if store is None:
+        config = app.config.get('MONITOR', {})
+        rollups = get_rollup_manager(app)
+        if config.get('raw_backend') == 'segments':
+            from src.database.segment_store import SegmentMetricStore
+            store = SegmentMetricStore(config)
+        else:
+            store = SQLMetricStore(app, rollups)
+        store = with_archive(store, config)
+        if not isinstance(store, SQLMetricStore):
+            # 汇总管理器回退读取原始数据时经过段文件/归档层
+            rollups.store = store
+        app.metric_store = store
+    return store
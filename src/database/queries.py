@@ -0,0 +1,20 @@
+from typing import List, Tuple
+from src.models import db
+
+def series_filter(type_column, metric_column, series: List[Tuple[str, str]]):
+    """按 (type, metric) 列表生成过滤条件
+
+    展开为 OR 连接的等值条件，数据库可以对每个序列分别走
+    (type, metric, timestamp) 复合索引；行值 IN 写法在 SQLite 上
+    只能退化为时间索引扫描后逐行过滤。
+    """
+    return db.or_(*[db.and_(type_column == type, metric_column == metric) for type, metric in series])
+
+def seconds_since(column, origin):
+    """生成"column 相对 origin 的秒数"表达式，用于在 SQL 中累计回归所需的 Σx、Σx²、Σxy"""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        return (db.func.julianday(column) - db.func.julianday(origin)) * 86400.0
+    if dialect in ('mysql', 'mariadb'):
+        return db.func.timestampdiff(db.literal_column('MICROSECOND'), origin, column) / 1000000.0
+    return db.extract('epoch', column - origin)
@@ -0,0 +1,121 @@
+from typing import Dict, Any, List, Callable, Hashable, Tuple
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import threading
+import logging
+from src.utils.time_buckets import EPOCH, bucket_start
+
+logger = logging.getLogger(__name__)
+
+def align_range(start: datetime, end: datetime, step: float) -> Tuple[datetime, datetime]:
+    """把查询范围对齐到 step 的整数倍，返回 [起点, 终点) ，终点为 end 所在桶的结束时间
+
+    同一个桶内重复轮询"最近 1 小时"会得到相同的范围，从而命中同一个缓存键。
+    """
+    resolution = max(int(step), 1)
+    return bucket_start(start, resolution), bucket_start(end, resolution) + timedelta(seconds=resolution)
+
+def block_ranges(start: datetime, end: datetime, span: float) -> List[Tuple[datetime, datetime]]:
+    """把 [start, end) 切分为从纪元起按 span(秒) 对齐的块，首尾两块可能超出查询范围"""
+    first = int((start - EPOCH).total_seconds() // span)
+    last = int(((end - EPOCH).total_seconds() - 1e-6) // span)
+    return [(EPOCH + timedelta(seconds=index * span), EPOCH + timedelta(seconds=(index + 1) * span))
+            for index in range(first, max(last, first) + 1)]
+
+class QueryCache:
+    """查询结果缓存
+
+    LRU 有界缓存，每个条目记录其覆盖数据的结束时间。写入队列每次落库后，
+    只有覆盖范围晚于本批最早样本的条目（即包含最新时间桶的结果）被失效，
+    完全落在历史时间桶内的结果不会再变化，可以一直保留到被 LRU 淘汰。
+    滑动窗口查询应通过 get_or_compute_blocks 按对齐块缓存：每次写入只失效
+    最新的一块，已结束的块在窗口滑动时继续命中。
+    """
+
+    def __init__(self, config: Dict):
+        self.max_entries = config.get('query_cache_size', 256)
+        self._entries: 'OrderedDict[Hashable, Tuple[datetime, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, key: Hashable, end: datetime, compute: Callable[[], Any]) -> Any:
+        """读取缓存，未命中时计算并写入；end 为结果覆盖数据的结束时间（不含）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        value = compute()
+
+        with self._lock:
+            # 计算期间有新数据落库时不写入，避免缓存过期结果
+            if generation == self._generation:
+                self._entries[key] = (end, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def get_or_compute_blocks(self, key: Hashable, blocks: List[Tuple[datetime, datetime]],
+                              compute: Callable[[datetime, datetime], Any]) -> List[Any]:
+        """按块读取缓存，每块以 (key, 块起点, 块终点) 为键单独缓存，未命中的块调用 compute(起点, 终点) 计算"""
+        return [
+            self.get_or_compute((key, block_start, block_end), block_end,
+                                lambda block_start=block_start, block_end=block_end: compute(block_start, block_end))
+            for block_start, block_end in blocks
+        ]
+
+    def invalidate_from(self, timestamp: datetime) -> int:
+        """失效覆盖范围晚于 timestamp 的条目，返回失效的条目数"""
+        with self._lock:
+            self._generation += 1
+            stale = [key for key, (end, _) in self._entries.items() if end > timestamp]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        if stale:
+            logger.debug(f"Invalidated {len(stale)} cached queries covering data after {timestamp}")
+        return len(stale)
+
+    def on_ingest(self, rows: List[Dict[str, Any]]) -> None:
+        """写入队列监听器：按本批最早的样本时间失效缓存"""
+        if rows:
+            self.invalidate_from(min(row['timestamp'] for row in rows))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'capacity': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
+
+def get_query_cache(app) -> QueryCache:
+    """获取应用的查询缓存，未初始化时按应用配置创建"""
+    cache = getattr(app, 'query_cache', None)
+    if cache is None:
+        cache = QueryCache(app.config.get('MONITOR', {}))
+        app.query_cache = cache
+    return cache
@@ -0,0 +1,50 @@
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta
+import numpy as np
+
+# 回归累加量: 样本数、极值、Σx、Σy、Σx²、Σxy、Σy²（x 为相对查询起点的秒数）和首末样本时间/最后值
+RegressionSums = Dict[str, Any]
+
+def array_sums(x: np.ndarray, y: np.ndarray, origin: datetime) -> Optional[RegressionSums]:
+    """由相对 origin 的秒数数组和数值数组计算回归累加量"""
+    if not len(y):
+        return None
+    first = int(np.argmin(x))
+    last = int(np.argmax(x))
+    return {
+        'count': len(y),
+        'min': float(y.min()),
+        'max': float(y.max()),
+        'sum_x': float(x.sum()),
+        'sum_y': float(y.sum()),
+        'sum_xx': float(x @ x),
+        'sum_xy': float(x @ y),
+        'sum_yy': float(y @ y),
+        'first_timestamp': origin + timedelta(seconds=float(x[first])),
+        'last_timestamp': origin + timedelta(seconds=float(x[last])),
+        'last': float(y[last])
+    }
+
+def point_sums(points: List[Tuple[datetime, float]], origin: datetime) -> Optional[RegressionSums]:
+    """计算一组样本 [(timestamp, value)] 的回归累加量"""
+    timestamps = np.array([timestamp for timestamp, _ in points], dtype='datetime64[us]')
+    x = (timestamps - np.datetime64(origin, 'us')) / np.timedelta64(1, 's')
+    y = np.array([value for _, value in points], dtype=float)
+    return array_sums(x, y, origin)
+
+def merge_sums(partials: Dict[Any, RegressionSums], key: Any, sums: Optional[RegressionSums]) -> None:
+    """把一份累加量合并进 partials[key]"""
+    if not sums or not sums['count']:
+        return
+    target = partials.get(key)
+    if target is None:
+        partials[key] = dict(sums)
+        return
+    for name in ('count', 'sum_x', 'sum_y', 'sum_xx', 'sum_xy', 'sum_yy'):
+        target[name] += sums[name]
+    target['min'] = min(target['min'], sums['min'])
+    target['max'] = max(target['max'], sums['max'])
+    target['first_timestamp'] = min(target['first_timestamp'], sums['first_timestamp'])
+    if sums['last_timestamp'] >= target['last_timestamp']:
+        target['last_timestamp'] = sums['last_timestamp']
+        target['last'] = sums['last']
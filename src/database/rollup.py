@@ -0,0 +1,338 @@
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta
+import threading
+import logging
+from src.models import MonitorRollup, db
+from src.database.sample_store import SampleStore
+from src.database.queries import series_filter
+from src.database.downsample import downsample
+from src.database.sketch import QuantileSketch, DEFAULT_QUANTILES, merge_sketches, sketch_quantiles
+from src.utils.time_buckets import bucket_start
+
+logger = logging.getLogger(__name__)
+
+# 原始数据的"粒度"
+RAW_RESOLUTION = 0
+
+# 默认汇总层级：粒度(秒)和各自的保留天数
+DEFAULT_ROLLUP_TIERS = [
+    {'name': '1m', 'resolution': 60, 'retention_days': 7},
+    {'name': '5m', 'resolution': 300, 'retention_days': 30},
+    {'name': '1h', 'resolution': 3600, 'retention_days': 365}
+]
+
+# 序列点: (时间桶起点, 平均值, 最小值, 最大值, 样本数, 最后值)
+SeriesPoint = Tuple[datetime, float, float, float, int, float]
+
+def aggregate_rows(rows: List[Dict[str, Any]], resolutions: List[int],
+                   sketch_accuracy: float = 0) -> Dict[tuple, list]:
+    """把原始样本聚合为各粒度的时间桶
+
+    返回 {(粒度, type, metric, 桶起点): [min, max, sum, count, last, last_timestamp, sketch]}，
+    sketch_accuracy 为 0 时不构造分位数草图，sketch 为 None。
+    """
+    partials = {}
+    for row in rows:
+        timestamp = row['timestamp']
+        value = float(row['value'])
+        for resolution in resolutions:
+            key = (resolution, row['type'], row['metric'], bucket_start(timestamp, resolution))
+            agg = partials.get(key)
+            if agg is None:
+                sketch = None
+                if sketch_accuracy:
+                    sketch = QuantileSketch(sketch_accuracy)
+                    sketch.add(value)
+                partials[key] = [value, value, value, 1, value, timestamp, sketch]
+                continue
+            if value < agg[0]:
+                agg[0] = value
+            if value > agg[1]:
+                agg[1] = value
+            agg[2] += value
+            agg[3] += 1
+            if timestamp >= agg[5]:
+                agg[4] = value
+                agg[5] = timestamp
+            if agg[6] is not None:
+                agg[6].add(value)
+    return partials
+
+def summarize_points(points: List[SeriesPoint]) -> Dict[str, Any]:
+    """汇总一组序列点，按样本数加权计算平均值"""
+    samples = sum(point[4] for point in points)
+    return {
+        'avg': sum(point[1] * point[4] for point in points) / samples if samples else 0,
+        'max': max(point[3] for point in points),
+        'min': min(point[2] for point in points),
+        'first': points[0][1],
+        'current': points[-1][5],
+        'samples': samples
+    }
+
+class RollupManager:
+    """多粒度降采样管理器
+
+    作为写入队列的监听器，把每批新样本持续合并进 1分钟/5分钟/1小时 汇总表。
+    查询时选择满足分辨率要求的最粗粒度，长时间范围只需读取少量汇总行。
+    每个汇总桶同时保存可合并的分位数草图，任意范围的分位数由桶草图合并得到。
+    """
+
+    def __init__(self, config: Dict):
+        self.tiers = sorted(config.get('rollup_tiers', DEFAULT_ROLLUP_TIERS), key=lambda t: t['resolution'])
+        self.raw_retention_days = config.get('retention_days', 30)
+        self.resolutions = [tier['resolution'] for tier in self.tiers]
+        # 分位数草图的相对精度，0 表示不保存草图
+        self.sketch_accuracy = config.get('rollup_sketch_accuracy', 0.01)
+        # 范围分位数最多合并的汇总桶数，决定选用的汇总粒度
+        self.sketch_buckets = config.get('sketch_query_buckets', 60)
+        self.store = SampleStore()
+        self._lock = threading.Lock()
+
+    def ingest(self, rows: List[Dict[str, Any]]) -> None:
+        """合并一批原始样本到所有汇总层级（需在应用上下文中调用）"""
+        if not rows:
+            return
+        with self._lock:
+            self._merge(aggregate_rows(rows, self.resolutions, self.sketch_accuracy))
+
+    def _merge(self, partials: Dict[tuple, list]) -> None:
+        """把聚合结果合并进汇总表"""
+        by_resolution: Dict[int, List[tuple]] = {}
+        for key in partials:
+            by_resolution.setdefault(key[0], []).append(key)
+
+        try:
+            for resolution, keys in by_resolution.items():
+                buckets = {key[3] for key in keys}
+                existing = {
+                    (rollup.type, rollup.metric, rollup.bucket): rollup
+                    for rollup in MonitorRollup.query.filter(
+                        MonitorRollup.resolution == resolution,
+                        MonitorRollup.bucket.in_(buckets)
+                    )
+                }
+
+                for key in keys:
+                    min_value, max_value, total, count, last_value, last_timestamp, sketch = partials[key]
+                    rollup = existing.get(key[1:])
+                    if rollup is None:
+                        db.session.add(MonitorRollup(
+                            resolution=resolution,
+                            type=key[1],
+                            metric=key[2],
+                            bucket=key[3],
+                            min_value=min_value,
+                            max_value=max_value,
+                            avg_value=total / count,
+                            sample_count=count,
+                            last_value=last_value,
+                            last_timestamp=last_timestamp,
+                            sketch=sketch.to_bytes() if sketch is not None else None
+                        ))
+                        continue
+
+                    # 没有草图的旧汇总行无法补齐，保持为空，由 rebuild-rollups 重建
+                    if sketch is not None and rollup.sketch is not None:
+                        rollup.sketch = QuantileSketch.from_bytes(rollup.sketch).merge(sketch).to_bytes()
+
+                    merged_count = rollup.sample_count + count
+                    rollup.avg_value = (rollup.avg_value * rollup.sample_count + total) / merged_count
+                    rollup.sample_count = merged_count
+                    rollup.min_value = min(rollup.min_value, min_value)
+                    rollup.max_value = max(rollup.max_value, max_value)
+                    if rollup.last_timestamp is None or last_timestamp >= rollup.last_timestamp:
+                        rollup.last_value = last_value
+                        rollup.last_timestamp = last_timestamp
+
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Failed to merge rollups: {e}")
+            db.session.rollback()
+
+    def select_resolution(self, start: datetime, end: datetime,
+                          step: Optional[float] = None, max_points: Optional[int] = None) -> int:
+        """选择满足分辨率要求的最粗汇总粒度，返回 RAW_RESOLUTION 表示读取原始数据"""
+        if step is None and max_points:
+            step = (end - start).total_seconds() / max_points
+        now = datetime.utcnow()
+
+        # 保留期覆盖查询起点的层级
+        covering = [
+            tier['resolution'] for tier in self.tiers
+            if start >= now - timedelta(days=tier['retention_days'])
+        ]
+        if not step or step < self.resolutions[0]:
+            # 原始数据仍在保留期内时直接读原始数据
+            if start >= now - timedelta(days=self.raw_retention_days) or not covering:
+                return RAW_RESOLUTION
+            return covering[0]
+
+        fitting = [resolution for resolution in covering if resolution <= step]
+        if fitting:
+            return fitting[-1]
+        return covering[0] if covering else RAW_RESOLUTION
+
+    def read_series(self, type: str, metric: str, start: datetime, end: datetime,
+                    step: Optional[float] = None, max_points: Optional[int] = None,
+                    method: str = 'lttb') -> List[SeriesPoint]:
+        """读取单个序列"""
+        return self.read_range(start, end, step, max_points, series=[(type, metric)], method=method).get((type, metric), [])
+
+    def read_range(self, start: datetime, end: datetime,
+                   step: Optional[float] = None, max_points: Optional[int] = None,
+                   series: Optional[List[Tuple[str, str]]] = None,
+                   method: str = 'lttb') -> Dict[Tuple[str, str], List[SeriesPoint]]:
+        """读取时间范围内的序列，返回 {(type, metric): [序列点]}
+
+        指定 max_points 时，先选择合适的汇总粒度，再按 method (lttb/minmax)
+        把每个序列降到最多 max_points 个点，返回的数据量与时间范围无关。
+        """
+        resolution = self.select_resolution(start, end, step, max_points)
+        result = {}
+        if resolution != RAW_RESOLUTION:
+            result = self._read_rollups(resolution, start, end, series)
+            if not result:
+                logger.debug(f"No {resolution}s rollups between {start} and {end}, falling back to raw data")
+        if not result:
+            result = self._read_raw(start, end, series)
+        if max_points:
+            result = {key: downsample(points, max_points, method) for key, points in result.items()}
+        return result
+
+    def _read_rollups(self, resolution: int, start: datetime, end: datetime,
+                      series: Optional[List[Tuple[str, str]]]) -> Dict[Tuple[str, str], List[SeriesPoint]]:
+        query = db.session.query(
+            MonitorRollup.type, MonitorRollup.metric, MonitorRollup.bucket,
+            MonitorRollup.avg_value, MonitorRollup.min_value, MonitorRollup.max_value,
+            MonitorRollup.sample_count, MonitorRollup.last_value
+        ).filter(
+            MonitorRollup.resolution == resolution,
+            MonitorRollup.bucket.between(bucket_start(start, resolution), end)
+        )
+        if series:
+            query = query.filter(series_filter(MonitorRollup.type, MonitorRollup.metric, series))
+
+        result = {}
+        for type, metric, bucket, avg_value, min_value, max_value, count, last_value in query.order_by(MonitorRollup.bucket):
+            result.setdefault((type, metric), []).append((bucket, avg_value, min_value, max_value, count, last_value))
+        return result
+
+    def _read_raw(self, start: datetime, end: datetime,
+                  series: Optional[List[Tuple[str, str]]]) -> Dict[Tuple[str, str], List[SeriesPoint]]:
+        if series and len(series) == 1:
+            points = self.store.read_series(series[0][0], series[0][1], start, end)
+            return {series[0]: [(timestamp, value, value, value, 1, value) for timestamp, value in points]} if points else {}
+        return {
+            key: [(timestamp, value, value, value, 1, value) for timestamp, value in points]
+            for key, points in self.store.read_range(start, end, series).items()
+        }
+
+    def read_sketches(self, resolution: int, start: datetime, end: datetime,
+                      series: Optional[List[Tuple[str, str]]] = None
+                      ) -> Dict[Tuple[str, str], List[Tuple[datetime, Optional[QuantileSketch]]]]:
+        """读取某一汇总层级的桶草图，返回 {(type, metric): [(桶起点, 草图)]}，旧汇总行的草图为 None"""
+        query = db.session.query(
+            MonitorRollup.type, MonitorRollup.metric, MonitorRollup.bucket, MonitorRollup.sketch
+        ).filter(
+            MonitorRollup.resolution == resolution,
+            MonitorRollup.bucket.between(bucket_start(start, resolution), end)
+        )
+        if series:
+            query = query.filter(series_filter(MonitorRollup.type, MonitorRollup.metric, series))
+
+        result = {}
+        for type, metric, bucket, data in query.order_by(MonitorRollup.bucket):
+            sketch = QuantileSketch.from_bytes(data) if data is not None else None
+            result.setdefault((type, metric), []).append((bucket, sketch))
+        return result
+
+    def sketches(self, start: datetime, end: datetime,
+                 series: Optional[List[Tuple[str, str]]] = None) -> Dict[Tuple[str, str], QuantileSketch]:
+        """合并时间范围内各序列的汇总桶草图，返回 {(type, metric): 草图}
+
+        按 sketch_query_buckets 选择汇总粒度（范围两端按整桶计入），只读取汇总行；
+        范围短到需要原始数据、没有汇总或汇总行缺少草图时，由原始样本构造草图。
+        """
+        resolution = RAW_RESOLUTION
+        if self.sketch_accuracy:
+            resolution = self.select_resolution(start, end, max_points=self.sketch_buckets)
+        result: Dict[Tuple[str, str], QuantileSketch] = {}
+        if resolution != RAW_RESOLUTION:
+            complete = True
+            for key, buckets in self.read_sketches(resolution, start, end, series).items():
+                for _, sketch in buckets:
+                    if sketch is None:
+                        complete = False
+                    else:
+                        merge_sketches(result, key, sketch)
+            if result and complete:
+                return result
+            if not complete:
+                logger.debug(f"{resolution}s rollups between {start} and {end} lack sketches, falling back to raw data")
+
+        raw = self._read_raw(start, end, series)
+        if not raw:
+            return result
+        return {
+            key: QuantileSketch.from_values((point[1] for point in points), self.sketch_accuracy or 0.01)
+            for key, points in raw.items()
+        }
+
+    def quantiles(self, start: datetime, end: datetime, qs=DEFAULT_QUANTILES,
+                  series: Optional[List[Tuple[str, str]]] = None) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """时间范围内各序列的分位数，返回 {(type, metric): {'p50', 'p95', 'p99', 'count', 'min', 'max'}}"""
+        return sketch_quantiles(self.sketches(start, end, series), qs)
+
+    def rebuild(self, start: datetime, end: datetime, chunk: timedelta = timedelta(hours=6)) -> int:
+        """根据原始数据重建时间范围内的汇总，返回处理的原始样本数"""
+        processed = 0
+        with self._lock:
+            for resolution in self.resolutions:
+                MonitorRollup.query.filter(
+                    MonitorRollup.resolution == resolution,
+                    MonitorRollup.bucket >= bucket_start(start, resolution),
+                    MonitorRollup.bucket < end
+                ).delete(synchronize_session=False)
+            db.session.commit()
+
+            # 从最粗粒度的桶起点开始，保证重建后的桶完整
+            window_start = bucket_start(start, self.resolutions[-1])
+            while window_start < end:
+                window_end = min(window_start + chunk, end)
+                rows = [
+                    {'type': type, 'metric': metric, 'value': value, 'timestamp': timestamp}
+                    for timestamp, type, metric, value in self.store.iter_rows(
+                        window_start, window_end, end_inclusive=False
+                    )
+                ]
+                self._merge(aggregate_rows(rows, self.resolutions, self.sketch_accuracy))
+                processed += len(rows)
+                window_start = window_end
+        logger.info(f"Rebuilt rollups from {processed} raw samples between {start} and {end}")
+        return processed
+
+    def apply_retention(self, now: Optional[datetime] = None) -> int:
+        """按各层级的保留期清理汇总数据，返回删除的行数"""
+        now = now or datetime.utcnow()
+        deleted = 0
+        with self._lock:
+            try:
+                for tier in self.tiers:
+                    deleted += MonitorRollup.query.filter(
+                        MonitorRollup.resolution == tier['resolution'],
+                        MonitorRollup.bucket < now - timedelta(days=tier['retention_days'])
+                    ).delete(synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Failed to apply rollup retention: {e}")
+                db.session.rollback()
+        return deleted
+
+def get_rollup_manager(app) -> RollupManager:
+    """获取应用的汇总管理器，未初始化时按应用配置创建"""
+    manager = getattr(app, 'rollup_manager', None)
+    if manager is None:
+        manager = RollupManager(app.config.get('MONITOR', {}))
+        app.rollup_manager = manager
+    return manager
@@ -0,0 +1,232 @@
+from typing import Dict, Any, List, Optional, Tuple, Iterator
+from datetime import datetime, timedelta
+import json
+import logging
+from src.models import MonitorData, MonitorSample, db
+from src.database.chunk_store import ChunkStore
+from src.database.queries import series_filter
+from src.utils.time_buckets import bucket_start
+
+logger = logging.getLogger(__name__)
+
+# 核心指标 (type, metric) 到宽表列名的映射，其余指标写入 extra
+WIDE_COLUMNS = {
+    ('cpu', 'usage'): 'cpu_usage',
+    ('memory', 'usage'): 'memory_usage',
+    ('disk', 'usage'): 'disk_usage',
+    ('network', 'bytes_sent_speed'): 'net_sent_speed',
+    ('network', 'bytes_recv_speed'): 'net_recv_speed',
+    ('network', 'bytes_sent'): 'net_bytes_sent',
+    ('network', 'bytes_recv'): 'net_bytes_recv'
+}
+
+def extra_key(type: str, metric: str) -> str:
+    """动态指标在 extra 中的键"""
+    return f'{type}.{metric}'
+
+def parse_extra_key(key: str) -> Tuple[str, str]:
+    type, _, metric = key.partition('.')
+    return type, metric
+
+class SampleStore:
+    """宽表样本存储
+
+    写入时把同一时刻的 (type, metric, value) 行合并为一条 MonitorSample，
+    读取时再展开为按序列分组的长格式，兼容原有 MonitorData 的读取方式。
+    升级前写入的 MonitorData 数据同样可以读到。
+    超过压缩期的样本由 compact 转存为压缩块，读取时透明合并。
+    """
+
+    def __init__(self):
+        self.chunks = ChunkStore()
+
+    def write(self, rows: List[Dict[str, Any]]) -> int:
+        """写入一批长格式样本（调用方负责提交事务），返回宽表行数"""
+        samples: Dict[datetime, Dict[str, Any]] = {}
+        for row in rows:
+            sample = samples.get(row['timestamp'])
+            if sample is None:
+                sample = samples[row['timestamp']] = {'timestamp': row['timestamp']}
+            column = WIDE_COLUMNS.get((row['type'], row['metric']))
+            if column is not None:
+                sample[column] = row['value']
+            else:
+                sample.setdefault('extra', {})[extra_key(row['type'], row['metric'])] = row['value']
+
+        db.session.bulk_insert_mappings(MonitorSample, list(samples.values()))
+        return len(samples)
+
+    def read_range(self, start: datetime, end: datetime,
+                   series: Optional[List[Tuple[str, str]]] = None) -> Dict[Tuple[str, str], List[Tuple[datetime, float]]]:
+        """读取时间范围内的序列，返回 {(type, metric): [(timestamp, value)]}，按时间升序"""
+        result: Dict[Tuple[str, str], List[Tuple[datetime, float]]] = {}
+        for timestamp, type, metric, value in self.iter_rows(start, end, series):
+            result.setdefault((type, metric), []).append((timestamp, value))
+        for points in result.values():
+            points.sort(key=lambda point: point[0])
+        return result
+
+    def read_series(self, type: str, metric: str,
+                    start: datetime, end: datetime) -> List[Tuple[datetime, float]]:
+        """读取单个序列 [(timestamp, value)]，按时间升序
+
+        只查询时间戳和值两列并以元组返回，不构造 ORM 对象：
+        旧数据走 (type, metric, timestamp, value) 覆盖索引，宽表核心指标只读对应列。
+        """
+        points = db.session.query(MonitorData.timestamp, MonitorData.value).filter(
+            MonitorData.type == type,
+            MonitorData.metric == metric,
+            MonitorData.timestamp.between(start, end)
+        ).order_by(MonitorData.timestamp).all()
+
+        points.extend(
+            (timestamp, value) for timestamp, _, _, value in self.chunks.iter_rows(start, end, [(type, metric)])
+        )
+
+        column = WIDE_COLUMNS.get((type, metric))
+        if column is not None:
+            column = getattr(MonitorSample, column)
+            points.extend(db.session.query(MonitorSample.timestamp, column).filter(
+                MonitorSample.timestamp.between(start, end),
+                column.isnot(None)
+            ).order_by(MonitorSample.timestamp))
+        else:
+            points.extend(
+                (timestamp, value) for timestamp, _, _, value in self.iter_rows(
+                    start, end, [(type, metric)], include_chunks=False, include_legacy=False
+                )
+            )
+
+        points.sort(key=lambda point: point[0])
+        return [tuple(point) for point in points]
+
+    def extra_series(self, start: datetime, end: datetime) -> List[Tuple[str, str]]:
+        """[start, end] 内 extra 中出现过的动态指标序列
+
+        只取键名，不在 Python 中解码每行的 JSON：SQLite 用 json_each 展开键并去重，
+        MySQL 对 JSON_KEYS 去重（各行的键集合通常相同，只返回少量行）。
+        """
+        in_range = MonitorSample.timestamp.between(start, end)
+        dialect = db.engine.dialect.name
+        if dialect == 'sqlite':
+            entries = db.func.json_each(MonitorSample.extra).table_valued('key')
+            keys = [key for key, in db.session.query(entries.c.key).select_from(MonitorSample).join(
+                entries, db.true()
+            ).filter(in_range, MonitorSample.extra.isnot(None)).distinct()]
+        elif dialect in ('mysql', 'mariadb'):
+            keys = set()
+            for key_list, in db.session.query(db.func.json_keys(MonitorSample.extra)).filter(
+                in_range, MonitorSample.extra.isnot(None)
+            ).distinct():
+                keys.update(json.loads(key_list) if isinstance(key_list, str) else key_list or [])
+        else:
+            keys = set()
+            for extra, in db.session.query(MonitorSample.extra).filter(in_range, MonitorSample.extra.isnot(None)):
+                keys.update(extra or {})
+        return sorted(parse_extra_key(key) for key in keys)
+
+    def iter_rows(self, start: datetime, end: datetime,
+                  series: Optional[List[Tuple[str, str]]] = None,
+                  end_inclusive: bool = True,
+                  include_chunks: bool = True,
+                  include_legacy: bool = True) -> Iterator[Tuple[datetime, str, str, float]]:
+        """逐行读取长格式样本 (timestamp, type, metric, value)
+
+        依次读取升级前的 MonitorData、压缩块和宽表，各部分内部按时间升序。
+        """
+        # 升级前的 EAV 数据
+        if include_legacy:
+            query = db.session.query(
+                MonitorData.timestamp, MonitorData.type, MonitorData.metric, MonitorData.value
+            ).filter(
+                MonitorData.timestamp >= start,
+                MonitorData.timestamp <= end if end_inclusive else MonitorData.timestamp < end
+            )
+            if series:
+                query = query.filter(series_filter(MonitorData.type, MonitorData.metric, series))
+            for row in query.order_by(MonitorData.timestamp):
+                yield row
+
+        # 已压缩的历史数据
+        if include_chunks:
+            yield from self.chunks.iter_rows(start, end, series, end_inclusive)
+
+        # 宽表数据：只读取需要的列，一次范围扫描
+        wanted = list(WIDE_COLUMNS.items())
+        need_extra = True
+        if series:
+            wanted = [(key, column) for key, column in wanted if key in series]
+            need_extra = any(key not in WIDE_COLUMNS for key in series)
+        extra_keys = {extra_key(*key) for key in series} if series else None
+
+        columns = [MonitorSample.timestamp] + [getattr(MonitorSample, column) for _, column in wanted]
+        if need_extra:
+            columns.append(MonitorSample.extra)
+        query = db.session.query(*columns).filter(
+            MonitorSample.timestamp >= start,
+            MonitorSample.timestamp <= end if end_inclusive else MonitorSample.timestamp < end
+        )
+
+        for row in query.order_by(MonitorSample.timestamp):
+            timestamp = row[0]
+            for index, ((type, metric), _) in enumerate(wanted, start=1):
+                if row[index] is not None:
+                    yield timestamp, type, metric, row[index]
+            if need_extra and row[-1]:
+                for key, value in row[-1].items():
+                    if extra_keys is None or key in extra_keys:
+                        type, metric = parse_extra_key(key)
+                        yield timestamp, type, metric, value
+
+    def delete_before(self, cutoff: datetime) -> int:
+        """删除早于 cutoff 的样本（调用方负责提交事务），返回删除的行数"""
+        deleted = MonitorSample.query.filter(MonitorSample.timestamp < cutoff).delete(synchronize_session=False)
+        deleted += MonitorData.query.filter(MonitorData.timestamp < cutoff).delete(synchronize_session=False)
+        deleted += self.chunks.delete_before(cutoff)
+        return deleted
+
+    def compact(self, before: datetime, chunk_seconds: int = 7200) -> int:
+        """把早于 before 的原始样本按时间窗口压缩为块，返回压缩的样本数
+
+        每个窗口在单独的事务中写入块并删除对应的原始行，只处理完整的窗口。
+        """
+        boundary = bucket_start(before, chunk_seconds)
+        first = [
+            timestamp for timestamp in (
+                db.session.query(db.func.min(MonitorSample.timestamp)).scalar(),
+                db.session.query(db.func.min(MonitorData.timestamp)).scalar()
+            ) if timestamp is not None
+        ]
+        if not first:
+            return 0
+
+        compacted = 0
+        window_start = bucket_start(min(first), chunk_seconds)
+        while window_start < boundary:
+            window_end = window_start + timedelta(seconds=chunk_seconds)
+            points: Dict[Tuple[str, str], List[Tuple[datetime, float]]] = {}
+            for timestamp, type, metric, value in self.iter_rows(
+                window_start, window_end, end_inclusive=False, include_chunks=False
+            ):
+                points.setdefault((type, metric), []).append((timestamp, value))
+
+            if points:
+                try:
+                    for (type, metric), series_points in points.items():
+                        self.chunks.write(type, metric, series_points)
+                    MonitorSample.query.filter(
+                        MonitorSample.timestamp >= window_start, MonitorSample.timestamp < window_end
+                    ).delete(synchronize_session=False)
+                    MonitorData.query.filter(
+                        MonitorData.timestamp >= window_start, MonitorData.timestamp < window_end
+                    ).delete(synchronize_session=False)
+                    db.session.commit()
+                    compacted += sum(len(series_points) for series_points in points.values())
+                except Exception as e:
+                    logger.error(f"Failed to compact samples between {window_start} and {window_end}: {e}")
+                    db.session.rollback()
+                    break
+            window_start = window_end
+
+        logger.info(f"Compacted {compacted} samples before {boundary} into chunks")
+        return compacted
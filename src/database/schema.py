@@ -0,0 +1,44 @@
+from typing import List
+import logging
+from src.models import db
+
+logger = logging.getLogger(__name__)
+
+def ensure_indexes() -> List[str]:
+    """为已存在的表补建模型中声明的索引（需在应用上下文中调用），返回新建的索引名
+
+    db.create_all 不会修改已存在的表，升级后的旧数据库通过这里补齐索引。
+    """
+    inspector = db.inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    created = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            logger.info(f"Creating index {index.name} on {table.name}")
+            index.create(bind=db.engine)
+            created.append(index.name)
+    return created
+
+def ensure_columns() -> List[str]:
+    """为已存在的表补加模型中新增的可空列（需在应用上下文中调用），返回新增的 表.列 名"""
+    inspector = db.inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            logger.info(f"Adding column {column.name} to {table.name}")
+            with db.engine.begin() as connection:
+                connection.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            added.append(f'{table.name}.{column.name}')
+    return added
@@ -0,0 +1,352 @@
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime
+import json
+import mmap
+import os
+import threading
+import logging
+import numpy as np
+from src.database.metric_store import MetricStore, Series
+from src.database.regression import RegressionSums, array_sums
+from src.utils.time_buckets import EPOCH, to_epoch_ms
+
+logger = logging.getLogger(__name__)
+
+# 段文件和元数据文件的扩展名
+SEGMENT_SUFFIX = '.seg'
+META_SUFFIX = '.json'
+
+def record_dtype(metrics: List[str], value_dtype: str) -> np.dtype:
+    """定长记录: 毫秒时间戳 + 每个指标一个数值"""
+    return np.dtype([('ts', '<i8'), ('values', np.dtype(value_dtype).newbyteorder('<'), (len(metrics),))])
+
+def to_datetimes(timestamps: np.ndarray) -> List[datetime]:
+    """毫秒时间戳数组转换为 datetime 列表"""
+    return timestamps.astype('datetime64[ms]').astype(object).tolist()
+
+class Segment:
+    """单个追加写段文件
+
+    记录按写入顺序定长排列，文件名为第一条记录的毫秒时间戳，旁边的 JSON 文件
+    保存指标列表和数值类型。读取时把文件 mmap 后用 numpy.frombuffer 直接
+    映射为结构化数组，范围读取只是数组切片，不复制数据。
+    """
+
+    def __init__(self, path: str, metrics: List[str], value_dtype: str):
+        self.path = path
+        self.metrics = metrics
+        self.columns = {metric: index for index, metric in enumerate(metrics)}
+        self.value_dtype = value_dtype
+        self.dtype = record_dtype(metrics, value_dtype)
+        self.count = 0
+        self.first_ts: Optional[int] = None
+        self.last_ts: Optional[int] = None
+        self.sorted = True
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._mapped = 0
+
+    @classmethod
+    def create(cls, directory: str, first_ts: int, metrics: List[str], value_dtype: str) -> 'Segment':
+        name = str(first_ts)
+        suffix = 0
+        while os.path.exists(os.path.join(directory, name + SEGMENT_SUFFIX)):
+            suffix += 1
+            name = f'{first_ts}-{suffix}'
+        path = os.path.join(directory, name + SEGMENT_SUFFIX)
+        with open(path[:-len(SEGMENT_SUFFIX)] + META_SUFFIX, 'w', encoding='utf-8') as f:
+            json.dump({'metrics': metrics, 'dtype': value_dtype}, f)
+        open(path, 'wb').close()
+        return cls(path, metrics, value_dtype)
+
+    @classmethod
+    def load(cls, path: str) -> 'Segment':
+        """打开已有段文件，截掉异常退出时写了一半的尾部记录，并重建时间索引"""
+        with open(path[:-len(SEGMENT_SUFFIX)] + META_SUFFIX, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        segment = cls(path, meta['metrics'], meta['dtype'])
+        size = os.path.getsize(path)
+        if size % segment.dtype.itemsize:
+            logger.warning(f"Truncating partial record at the end of {path}")
+            os.truncate(path, size - size % segment.dtype.itemsize)
+        segment.count = size // segment.dtype.itemsize
+        if segment.count:
+            timestamps = segment.view()['ts']
+            segment.first_ts = int(timestamps[0])
+            segment.last_ts = int(timestamps.max())
+            segment.sorted = bool(np.all(timestamps[1:] >= timestamps[:-1]))
+        return segment
+
+    @property
+    def size(self) -> int:
+        return self.count * self.dtype.itemsize
+
+    def append(self, records: np.ndarray) -> None:
+        """追加一批记录（调用方保证 dtype 一致）"""
+        if self._file is None:
+            self._file = open(self.path, 'ab', buffering=0)
+        self._file.write(records.tobytes())
+        timestamps = records['ts']
+        if self.last_ts is not None and int(timestamps[0]) < self.last_ts:
+            self.sorted = False
+        if len(timestamps) > 1 and not np.all(timestamps[1:] >= timestamps[:-1]):
+            self.sorted = False
+        if self.first_ts is None:
+            self.first_ts = int(timestamps[0])
+        self.first_ts = min(self.first_ts, int(timestamps.min()))
+        self.last_ts = max(self.last_ts or self.first_ts, int(timestamps.max()))
+        self.count += len(records)
+
+    def view(self) -> np.ndarray:
+        """整个段的只读结构化数组视图，文件增长后重新映射"""
+        if not self.count:
+            return np.empty(0, dtype=self.dtype)
+        if self._mmap is None or self._mapped < self.count:
+            with open(self.path, 'rb') as f:
+                # 旧的映射可能仍被之前返回的视图引用，交给垃圾回收释放
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mapped = self.count
+        return np.frombuffer(self._mmap, dtype=self.dtype, count=self.count)
+
+    def slice(self, start_ms: int, end_ms: int) -> np.ndarray:
+        """[start_ms, end_ms] 内的记录；有序段用二分查找得到零拷贝切片"""
+        records = self.view()
+        if self.sorted:
+            timestamps = records['ts']
+            low = np.searchsorted(timestamps, start_ms, side='left')
+            high = np.searchsorted(timestamps, end_ms, side='right')
+            return records[low:high]
+        timestamps = records['ts']
+        return records[(timestamps >= start_ms) & (timestamps <= end_ms)]
+
+    def overlaps(self, start_ms: int, end_ms: int) -> bool:
+        return self.count > 0 and self.first_ts <= end_ms and self.last_ts >= start_ms
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self) -> None:
+        """关闭并删除段文件和元数据"""
+        self.close()
+        self._mmap = None
+        os.remove(self.path)
+        os.remove(self.path[:-len(SEGMENT_SUFFIX)] + META_SUFFIX)
+
+class SegmentMetricStore(MetricStore):
+    """基于内存映射段文件的原始样本存储
+
+    每个采集类型（type）一组段文件，每条记录为 时间戳 + 该类型所有指标的
+    float32/float64 向量，按 segment_seconds 的时间窗口轮换新段，出现新指标时
+    也会开启新段。每个类型维护按起始时间排序的段列表（段级时间索引），段内
+    按时间二分查找，24 小时范围读取只是对映射数组的切片。
+    保留期清理直接删除整段文件，不执行 DELETE。
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__()
+        self.directory = config.get('segment_dir', os.path.join('data', 'segments'))
+        self.segment_seconds = config.get('segment_seconds', 3600)  # 单个段覆盖的时间窗口(秒)
+        self.value_dtype = config.get('segment_dtype', 'float64')
+        self._segments: Dict[str, List[Segment]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        for type in sorted(os.listdir(self.directory)):
+            directory = os.path.join(self.directory, type)
+            if not os.path.isdir(directory):
+                continue
+            segments = []
+            for name in os.listdir(directory):
+                if not name.endswith(SEGMENT_SUFFIX):
+                    continue
+                try:
+                    segments.append(Segment.load(os.path.join(directory, name)))
+                except Exception as e:
+                    logger.error(f"Failed to load segment {name} of {type}: {e}")
+            segments.sort(key=lambda segment: segment.first_ts if segment.first_ts is not None else -1)
+            self._segments[type] = segments
+        logger.info(f"Loaded {sum(len(s) for s in self._segments.values())} segments from {self.directory}")
+
+    def _window(self, timestamp_ms: int) -> int:
+        window_ms = self.segment_seconds * 1000
+        return timestamp_ms - timestamp_ms % window_ms
+
+    def _active(self, type: str, first_ts: int, metrics: List[str]) -> Segment:
+        """返回可追加的段：最新段的时间窗口相同且包含全部指标时复用，否则开启新段"""
+        segments = self._segments.setdefault(type, [])
+        if segments:
+            last = segments[-1]
+            if (last.first_ts is None or self._window(last.first_ts) == self._window(first_ts)) \
+                    and set(metrics) <= set(last.columns):
+                return last
+            last.close()
+            # 新段沿用已有指标并追加新指标，保持列顺序稳定
+            metrics = last.metrics + [metric for metric in metrics if metric not in last.columns]
+        directory = os.path.join(self.directory, type)
+        os.makedirs(directory, exist_ok=True)
+        segment = Segment.create(directory, first_ts, metrics, self.value_dtype)
+        segments.append(segment)
+        return segment
+
+    def write_batch(self, rows: List[Dict[str, Any]]) -> int:
+        # 按类型把同一时刻的长格式样本合并为一条向量记录
+        grouped: Dict[str, Dict[int, Dict[str, float]]] = {}
+        for row in rows:
+            grouped.setdefault(row['type'], {}).setdefault(to_epoch_ms(row['timestamp']), {})[row['metric']] = row['value']
+
+        with self._lock:
+            for type, records in grouped.items():
+                timestamps = sorted(records)
+                start = 0
+                while start < len(timestamps):
+                    window = self._window(timestamps[start])
+                    end = start
+                    while end < len(timestamps) and self._window(timestamps[end]) == window:
+                        end += 1
+                    batch = timestamps[start:end]
+                    metrics = sorted({metric for timestamp in batch for metric in records[timestamp]})
+                    segment = self._active(type, batch[0], metrics)
+                    array = np.empty(len(batch), dtype=segment.dtype)
+                    array['ts'] = batch
+                    values = np.full((len(batch), len(segment.metrics)), np.nan)
+                    for index, timestamp in enumerate(batch):
+                        for metric, value in records[timestamp].items():
+                            values[index, segment.columns[metric]] = value
+                    array['values'] = values
+                    segment.append(array)
+                    start = end
+
+        self._notify(rows)
+        return len(rows)
+
+    def read_slices(self, type: str, start: datetime, end: datetime) -> List[Tuple[List[str], np.ndarray]]:
+        """读取一个类型在 [start, end] 内的记录，返回 [(指标列表, 结构化数组切片)]，切片直接引用映射内存"""
+        start_ms = to_epoch_ms(start)
+        end_ms = to_epoch_ms(end)
+        with self._lock:
+            segments = [segment for segment in self._segments.get(type, []) if segment.overlaps(start_ms, end_ms)]
+            return [(segment.metrics, segment.slice(start_ms, end_ms)) for segment in segments]
+
+    def read_columns(self, type: str, metric: str, start: datetime, end: datetime) -> Tuple[np.ndarray, np.ndarray]:
+        """读取单个序列的 (毫秒时间戳数组, 数值数组)，跳过缺失值；只涉及一个段时不复制数据"""
+        parts = []
+        for metrics, records in self.read_slices(type, start, end):
+            if metric not in metrics or not len(records):
+                continue
+            values = records['values'][:, metrics.index(metric)]
+            timestamps = records['ts']
+            present = ~np.isnan(values)
+            if not present.all():
+                timestamps, values = timestamps[present], values[present]
+            parts.append((timestamps, values))
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        if len(parts) == 1:
+            return parts[0]
+        timestamps = np.concatenate([part[0] for part in parts])
+        values = np.concatenate([part[1] for part in parts])
+        order = np.argsort(timestamps, kind='stable')
+        return timestamps[order], values[order]
+
+    def _series(self, series: Optional[List[Series]]) -> List[Series]:
+        if series:
+            return list(series)
+        with self._lock:
+            return [
+                (type, metric)
+                for type, segments in self._segments.items()
+                for metric in dict.fromkeys(metric for segment in segments for metric in segment.metrics)
+            ]
+
+    def read_range(self, start: datetime, end: datetime,
+                   series: Optional[List[Series]] = None,
+                   step: Optional[float] = None) -> Dict[Series, List[Tuple[datetime, float]]]:
+        result = {}
+        for type, metric in self._series(series):
+            timestamps, values = self.read_columns(type, metric, start, end)
+            if not len(timestamps):
+                continue
+            if step:
+                # 向量化分桶平均，代替汇总表
+                step_ms = max(int(step), 1) * 1000
+                buckets, inverse = np.unique(timestamps // step_ms, return_inverse=True)
+                values = np.bincount(inverse, weights=values) / np.bincount(inverse)
+                timestamps = buckets * step_ms
+            result[(type, metric)] = list(zip(to_datetimes(timestamps), values.tolist()))
+        return result
+
+    def aggregate(self, start: datetime, end: datetime,
+                  series: Optional[List[Series]] = None) -> Dict[Series, Dict[str, Any]]:
+        result = {}
+        for type, metric in self._series(series):
+            _, values = self.read_columns(type, metric, start, end)
+            if len(values):
+                result[(type, metric)] = {
+                    'min': float(values.min()),
+                    'max': float(values.max()),
+                    'avg': float(values.mean()),
+                    'count': int(len(values))
+                }
+        return result
+
+    def regression_sums(self, start: datetime, end: datetime,
+                        series: Optional[List[Series]] = None) -> Dict[Series, RegressionSums]:
+        result = {}
+        origin_ms = to_epoch_ms(start)
+        offset = (start - EPOCH).total_seconds() - origin_ms / 1000.0
+        for type, metric in self._series(series):
+            timestamps, values = self.read_columns(type, metric, start, end)
+            sums = array_sums((timestamps - origin_ms) / 1000.0 - offset, values.astype(np.float64), start)
+            if sums:
+                result[(type, metric)] = sums
+        return result
+
+    def delete_before(self, cutoff: datetime) -> int:
+        """删除所有记录都早于 cutoff 的整段文件，返回删除的记录数；跨越 cutoff 的段保留到整段过期"""
+        cutoff_ms = to_epoch_ms(cutoff)
+        deleted = 0
+        with self._lock:
+            for type, segments in self._segments.items():
+                expired = [segment for segment in segments if segment.count and segment.last_ts < cutoff_ms]
+                for segment in expired:
+                    try:
+                        segment.remove()
+                    except OSError as e:
+                        logger.error(f"Failed to remove segment {segment.path}: {e}")
+                        continue
+                    segments.remove(segment)
+                    deleted += segment.count
+        if deleted:
+            logger.info(f"Dropped segments holding {deleted} records older than {cutoff}")
+        return deleted
+
+    def first_timestamp(self) -> Optional[datetime]:
+        with self._lock:
+            firsts = [segment.first_ts for segments in self._segments.values() for segment in segments if segment.count]
+        return to_datetimes(np.array([min(firsts)]))[0] if firsts else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取段文件统计"""
+        with self._lock:
+            segments = [segment for type_segments in self._segments.values() for segment in type_segments]
+            records = sum(segment.count for segment in segments)
+            size = sum(segment.size for segment in segments)
+        return {
+            'types': len(self._segments),
+            'segments': len(segments),
+            'records': records,
+            'bytes': size
+        }
+
+    def check(self) -> bool:
+        return os.access(self.directory, os.W_OK)
+
+    def close(self) -> None:
+        with self._lock:
+            for segments in self._segments.values():
+                for segment in segments:
+                    segment.close()
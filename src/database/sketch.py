@@ -0,0 +1,232 @@
+from typing import Dict, Any, Iterable, Optional, Sequence
+import math
+import struct
+import numpy as np
+
+# 默认输出的分位数
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+# 绝对值小于该值的样本计入零桶
+MIN_INDEXABLE = 1e-9
+
+FORMAT_VERSION = 1
+
+def quantile_name(q: float) -> str:
+    """分位数的键名，如 0.95 -> 'p95'，0.999 -> 'p99.9'"""
+    return f'p{q * 100:g}'
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _read_varint(data: bytes, position: int):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+class QuantileSketch:
+    """可合并的分位数草图（DDSketch）
+
+    样本按对数间隔分桶：正数 x 落入编号 ceil(log_γ(x)) 的桶，γ = (1+α)/(1-α)，
+    负数按绝对值计入另一组桶，接近 0 的计入零桶。任一分位数返回所在桶的中点，
+    相对误差不超过 α。两个草图的合并就是桶计数相加，与合并顺序无关，因此汇总
+    桶的草图可任意组合成更大时间范围的结果。桶数超过 max_bins 时合并最小的桶。
+    """
+
+    __slots__ = ('relative_accuracy', 'gamma', 'log_gamma', 'max_bins', 'positive', 'negative',
+                 'zero_count', 'count', 'min_value', 'max_value')
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_bins = max_bins
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min_value = math.inf
+        self.max_value = -math.inf
+
+    def add(self, value: float, count: int = 1) -> None:
+        """加入样本"""
+        if value > MIN_INDEXABLE:
+            index = math.ceil(math.log(value) / self.log_gamma)
+            self.positive[index] = self.positive.get(index, 0) + count
+        elif value < -MIN_INDEXABLE:
+            index = math.ceil(math.log(-value) / self.log_gamma)
+            self.negative[index] = self.negative.get(index, 0) + count
+        else:
+            self.zero_count += count
+        self.count += count
+        if value < self.min_value:
+            self.min_value = value
+        if value > self.max_value:
+            self.max_value = value
+        if len(self.positive) + len(self.negative) > self.max_bins:
+            self._collapse()
+
+    def add_values(self, values: np.ndarray) -> 'QuantileSketch':
+        """批量加入样本（向量化计算桶编号）"""
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return self
+        for store, selected in ((self.positive, values[values > MIN_INDEXABLE]),
+                                (self.negative, -values[values < -MIN_INDEXABLE])):
+            if len(selected):
+                indexes, counts = np.unique(np.ceil(np.log(selected) / self.log_gamma).astype(np.int64),
+                                            return_counts=True)
+                for index, count in zip(indexes.tolist(), counts.tolist()):
+                    store[index] = store.get(index, 0) + count
+        self.zero_count += int(np.count_nonzero(np.abs(values) <= MIN_INDEXABLE))
+        self.count += len(values)
+        self.min_value = min(self.min_value, float(values.min()))
+        self.max_value = max(self.max_value, float(values.max()))
+        if len(self.positive) + len(self.negative) > self.max_bins:
+            self._collapse()
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """合并另一个草图（需使用相同的相对精度）"""
+        if not other.count:
+            return self
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for store, incoming in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in incoming.items():
+                store[index] = store.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        if len(self.positive) + len(self.negative) > self.max_bins:
+            self._collapse()
+        return self
+
+    def _collapse(self) -> None:
+        """合并绝对值最小的桶，直到桶数不超过 max_bins（只影响最低分位数的精度）"""
+        excess = len(self.positive) + len(self.negative) - self.max_bins
+        if self.negative:
+            indexes = sorted(self.negative)[:excess + 1]
+            target = indexes[-1]
+            for index in indexes[:-1]:
+                self.negative[target] += self.negative.pop(index)
+            excess -= len(indexes) - 1
+        if excess > 0 and self.positive:
+            indexes = sorted(self.positive)[:excess + 1]
+            target = indexes[-1]
+            for index in indexes[:-1]:
+                self.positive[target] += self.positive.pop(index)
+
+    def _value(self, index: int) -> float:
+        """桶 (γ^(i-1), γ^i] 的代表值，与桶内任意值的相对误差不超过 α"""
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """估计分位数 q (0~1)，空草图返回 None"""
+        if not self.count:
+            return None
+        if not 0 <= q <= 1:
+            raise ValueError("Quantile must be between 0 and 1")
+        if q == 0:
+            return self.min_value
+        if q == 1:
+            return self.max_value
+        rank = q * (self.count - 1)
+        seen = 0
+        value = None
+        # 按数值从小到大：负数桶按编号降序，零桶，正数桶按编号升序
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                value = -self._value(index)
+                break
+        else:
+            seen += self.zero_count
+            if seen > rank:
+                value = 0.0
+            else:
+                for index in sorted(self.positive):
+                    seen += self.positive[index]
+                    if seen > rank:
+                        value = self._value(index)
+                        break
+        if value is None:
+            value = self.max_value
+        return min(max(value, self.min_value), self.max_value)
+
+    def quantiles(self, qs: Sequence[float] = DEFAULT_QUANTILES) -> Dict[str, Any]:
+        """返回 {'p50': ..., 'p95': ..., 'count', 'min', 'max'}"""
+        result = {quantile_name(q): self.quantile(q) for q in qs}
+        result['count'] = self.count
+        result['min'] = self.min_value if self.count else None
+        result['max'] = self.max_value if self.count else None
+        return result
+
+    def to_bytes(self) -> bytes:
+        """紧凑二进制编码：桶编号差值和计数用变长整数"""
+        out = bytearray(struct.pack('<Bdd', FORMAT_VERSION, self.relative_accuracy,
+                                    self.min_value if self.count else 0.0))
+        out += struct.pack('<d', self.max_value if self.count else 0.0)
+        _write_varint(out, self.zero_count)
+        for store in (self.positive, self.negative):
+            _write_varint(out, len(store))
+            previous = 0
+            for index in sorted(store):
+                delta = index - previous
+                # zigzag 编码处理负的桶编号
+                _write_varint(out, (delta << 1) ^ (delta >> 63))
+                _write_varint(out, store[index])
+                previous = index
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data: bytes, max_bins: int = 2048) -> 'QuantileSketch':
+        """从 to_bytes 的编码恢复"""
+        version, relative_accuracy, min_value, max_value = struct.unpack_from('<Bddd', data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported sketch format version: {version}")
+        sketch = cls(relative_accuracy, max_bins)
+        position = struct.calcsize('<Bddd')
+        sketch.zero_count, position = _read_varint(data, position)
+        total = sketch.zero_count
+        for store in (sketch.positive, sketch.negative):
+            size, position = _read_varint(data, position)
+            index = 0
+            for _ in range(size):
+                zigzag, position = _read_varint(data, position)
+                index += (zigzag >> 1) ^ -(zigzag & 1)
+                count, position = _read_varint(data, position)
+                store[index] = count
+                total += count
+        sketch.count = total
+        if total:
+            sketch.min_value = min_value
+            sketch.max_value = max_value
+        return sketch
+
+    @classmethod
+    def from_values(cls, values: Iterable[float], relative_accuracy: float = 0.01) -> 'QuantileSketch':
+        """由一组样本值构造草图"""
+        return cls(relative_accuracy).add_values(np.fromiter(values, dtype=np.float64))
+
+def merge_sketches(result: Dict[Any, QuantileSketch], key: Any, sketch: QuantileSketch) -> None:
+    """把草图合并进 result[key]"""
+    existing = result.get(key)
+    if existing is None:
+        result[key] = sketch
+    else:
+        existing.merge(sketch)
+
+def sketch_quantiles(sketches: Dict[Any, QuantileSketch],
+                     qs: Sequence[float] = DEFAULT_QUANTILES) -> Dict[Any, Dict[str, Any]]:
+    """各草图的分位数"""
+    return {key: sketch.quantiles(qs) for key, sketch in sketches.items() if sketch.count}
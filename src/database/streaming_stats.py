@@ -0,0 +1,362 @@
+from typing import Dict, Any, List, Optional, Tuple
+from datetime import datetime, timedelta
+import math
+import threading
+import time
+import logging
+from src.models import MetricStats, db
+from src.database.metric_store import MetricStore, Series
+from src.database.regression import RegressionSums
+from src.utils.time_buckets import EPOCH, bucket_start
+
+logger = logging.getLogger(__name__)
+
+class RunningStats:
+    """单个序列的可合并运行统计
+
+    数值用 Welford 算法累计均值和方差，时间与数值的协方差按同样方式累计，
+    用于计算最小二乘趋势斜率。两个时间桶的统计可按 Chan 的并行公式合并，
+    任意时间窗口的结果只需合并窗口内的桶。
+    """
+
+    __slots__ = ('count', 'mean', 'm2', 'min_value', 'max_value', 'mean_time', 'm2_time', 'comoment',
+                 'first_value', 'first_timestamp', 'last_value', 'last_timestamp')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min_value = math.inf
+        self.max_value = -math.inf
+        self.mean_time = 0.0
+        self.m2_time = 0.0
+        self.comoment = 0.0
+        self.first_value = None
+        self.first_timestamp = None
+        self.last_value = None
+        self.last_timestamp = None
+
+    def update(self, timestamp: datetime, value: float) -> None:
+        """加入一个样本"""
+        seconds = (timestamp - EPOCH).total_seconds()
+        self.count += 1
+        delta_time = seconds - self.mean_time
+        self.mean_time += delta_time / self.count
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.m2_time += delta_time * (seconds - self.mean_time)
+        self.comoment += delta_time * (value - self.mean)
+
+        if value < self.min_value:
+            self.min_value = value
+        if value > self.max_value:
+            self.max_value = value
+        if self.first_timestamp is None or timestamp < self.first_timestamp:
+            self.first_value = value
+            self.first_timestamp = timestamp
+        if self.last_timestamp is None or timestamp >= self.last_timestamp:
+            self.last_value = value
+            self.last_timestamp = timestamp
+
+    def merge(self, other: 'RunningStats') -> 'RunningStats':
+        """把另一份统计合并进来"""
+        if not other.count:
+            return self
+        if not self.count:
+            for name in self.__slots__:
+                setattr(self, name, getattr(other, name))
+            return self
+
+        count = self.count + other.count
+        weight = self.count * other.count / count
+        delta_time = other.mean_time - self.mean_time
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * weight
+        self.m2_time += other.m2_time + delta_time * delta_time * weight
+        self.comoment += other.comoment + delta_time * delta * weight
+        self.mean += delta * other.count / count
+        self.mean_time += delta_time * other.count / count
+        self.count = count
+
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+        if other.first_timestamp < self.first_timestamp:
+            self.first_value = other.first_value
+            self.first_timestamp = other.first_timestamp
+        if other.last_timestamp >= self.last_timestamp:
+            self.last_value = other.last_value
+            self.last_timestamp = other.last_timestamp
+        return self
+
+    @property
+    def variance(self) -> float:
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def slope(self) -> float:
+        """最小二乘趋势斜率（每秒）"""
+        return self.comoment / self.m2_time if self.m2_time > 0 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        """汇总为报告使用的统计结果"""
+        result = {
+            'avg': self.mean,
+            'max': self.max_value,
+            'min': self.min_value,
+            'std': math.sqrt(max(self.variance, 0.0)),
+            'first': self.first_value,
+            'current': self.last_value,
+            'samples': self.count
+        }
+        if self.count > 1:
+            # 趋势值为拟合直线在整个时间范围上的变化量
+            change = self.slope * (self.last_timestamp - self.first_timestamp).total_seconds()
+            result['slope'] = self.slope * 3600
+            result['trend'] = 'up' if change > 0 else 'down'
+            result['trend_value'] = abs(change)
+        return result
+
+    def to_model(self, model: MetricStats) -> MetricStats:
+        model.count = self.count
+        model.mean = self.mean
+        model.m2 = self.m2
+        model.min_value = self.min_value
+        model.max_value = self.max_value
+        model.mean_time = self.mean_time
+        model.m2_time = self.m2_time
+        model.comoment = self.comoment
+        model.first_value = self.first_value
+        model.first_timestamp = self.first_timestamp
+        model.last_value = self.last_value
+        model.last_timestamp = self.last_timestamp
+        return model
+
+    @classmethod
+    def from_sums(cls, sums: RegressionSums, origin: datetime) -> 'RunningStats':
+        """由 SQL 聚合得到的回归累加量构造统计（x 为相对 origin 的秒数），首个样本的值未知"""
+        stats = cls()
+        count = sums['count']
+        mean_x = sums['sum_x'] / count
+        stats.count = count
+        stats.mean = sums['sum_y'] / count
+        stats.m2 = max(sums['sum_yy'] - count * stats.mean * stats.mean, 0.0)
+        stats.mean_time = (origin - EPOCH).total_seconds() + mean_x
+        stats.m2_time = max(sums['sum_xx'] - count * mean_x * mean_x, 0.0)
+        stats.comoment = sums['sum_xy'] - count * mean_x * stats.mean
+        stats.min_value = sums['min']
+        stats.max_value = sums['max']
+        stats.first_timestamp = sums['first_timestamp']
+        stats.last_value = sums['last']
+        stats.last_timestamp = sums['last_timestamp']
+        return stats
+
+    @classmethod
+    def from_model(cls, model: MetricStats) -> 'RunningStats':
+        stats = cls()
+        stats.count = model.count
+        stats.mean = model.mean
+        stats.m2 = model.m2
+        stats.min_value = model.min_value
+        stats.max_value = model.max_value
+        stats.mean_time = model.mean_time
+        stats.m2_time = model.m2_time
+        stats.comoment = model.comoment
+        stats.first_value = model.first_value
+        stats.first_timestamp = model.first_timestamp
+        stats.last_value = model.last_value
+        stats.last_timestamp = model.last_timestamp
+        return stats
+
+# 性能分析按序列检查的平均值阈值，同一类型下单位不同的序列（如字节数）不参与
+PERFORMANCE_THRESHOLDS: Dict[Series, float] = {
+    ('cpu', 'usage'): 70,
+    ('memory', 'usage'): 80,
+}
+
+def summarize_by_series(stats: Dict[Series, RunningStats]) -> Dict[str, Dict[str, Any]]:
+    """返回 {'type.metric': 统计结果}，各序列单位不同，不跨序列合并"""
+    return {f'{type}.{metric}': series_stats.summary() for (type, metric), series_stats in stats.items()}
+
+def threshold_breaches(summaries: Dict[str, Dict[str, Any]],
+                       thresholds: Dict[Series, float] = PERFORMANCE_THRESHOLDS) -> List[Tuple[Series, float, float]]:
+    """返回平均值超过阈值的序列，格式为 [(序列, 平均值, 阈值)]"""
+    breaches = []
+    for (type, metric), threshold in thresholds.items():
+        avg = summaries.get(f'{type}.{metric}', {}).get('avg')
+        if avg is not None and avg > threshold:
+            breaches.append(((type, metric), avg, threshold))
+    return breaches
+
+class StreamingStats:
+    """流式统计引擎
+
+    作为指标存储的写入监听器，按序列和时间桶（默认 1 小时）在内存中累计
+    RunningStats，定期把有变化的桶写入 MetricStats 表作为检查点，启动时从
+    检查点恢复。查询任意时间窗口只需合并窗口内各序列的桶，代价与序列数和
+    桶数相关，与原始样本数无关。窗口按桶对齐：起点所在的桶整体计入。
+    """
+
+    def __init__(self, config: Dict):
+        self.resolution = config.get('stats_resolution', 3600)
+        self.retention = timedelta(hours=config.get('stats_retention_hours', 7 * 24))
+        self.checkpoint_interval = config.get('stats_checkpoint_interval', 60)
+        self._buckets: Dict[Series, Dict[datetime, RunningStats]] = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._last_checkpoint = time.time()
+
+    def ingest(self, rows: List[Dict[str, Any]]) -> None:
+        """累计一批样本，距上次检查点超过间隔时写入检查点（需在应用上下文中调用）"""
+        if not rows:
+            return
+        with self._lock:
+            for row in rows:
+                key = (row['type'], row['metric'])
+                bucket = bucket_start(row['timestamp'], self.resolution)
+                buckets = self._buckets.setdefault(key, {})
+                stats = buckets.get(bucket)
+                if stats is None:
+                    stats = buckets[bucket] = RunningStats()
+                stats.update(row['timestamp'], float(row['value']))
+                self._dirty.add((key, bucket))
+        if time.time() - self._last_checkpoint >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def summarize(self, start: datetime, end: datetime,
+                  series: Optional[List[Series]] = None) -> Dict[Series, RunningStats]:
+        """合并 [start, end] 内各序列的统计"""
+        first_bucket = bucket_start(start, self.resolution)
+        result = {}
+        with self._lock:
+            for key in (series if series else list(self._buckets)):
+                merged = RunningStats()
+                for bucket, stats in self._buckets.get(key, {}).items():
+                    if first_bucket <= bucket <= end:
+                        merged.merge(stats)
+                if merged.count:
+                    result[key] = merged
+        return result
+
+    def buckets(self, start: datetime, end: datetime,
+                series: Optional[List[Series]] = None) -> Dict[Series, Dict[datetime, RunningStats]]:
+        """返回 [start, end] 内各序列逐桶统计的副本"""
+        first_bucket = bucket_start(start, self.resolution)
+        result = {}
+        with self._lock:
+            for key in (series if series else list(self._buckets)):
+                buckets = {
+                    bucket: self._copy(stats) for bucket, stats in self._buckets.get(key, {}).items()
+                    if first_bucket <= bucket <= end
+                }
+                if buckets:
+                    result[key] = buckets
+        return result
+
+    def summarize_by_series(self, start: datetime, end: datetime) -> Dict[str, Dict[str, Any]]:
+        """按序列返回统计，格式为 {'type.metric': 统计结果}"""
+        return summarize_by_series(self.summarize(start, end))
+
+    def checkpoint(self) -> int:
+        """把有变化的桶写入数据库并清理过期的桶，返回写入的桶数"""
+        with self._lock:
+            cutoff = bucket_start(datetime.utcnow() - self.retention, self.resolution)
+            for key in list(self._buckets):
+                buckets = self._buckets[key]
+                for bucket in [bucket for bucket in buckets if bucket < cutoff]:
+                    del buckets[bucket]
+                    self._dirty.discard((key, bucket))
+                if not buckets:
+                    del self._buckets[key]
+            dirty = {(key, bucket): self._buckets[key][bucket] for key, bucket in self._dirty}
+            snapshot = {item: self._copy(stats) for item, stats in dirty.items()}
+            self._dirty.clear()
+            self._last_checkpoint = time.time()
+
+        try:
+            if snapshot:
+                existing = {
+                    ((stats.type, stats.metric), stats.bucket): stats
+                    for stats in MetricStats.query.filter(
+                        MetricStats.bucket.in_({bucket for _, bucket in snapshot})
+                    )
+                }
+                for (key, bucket), stats in snapshot.items():
+                    model = existing.get((key, bucket))
+                    if model is None:
+                        model = MetricStats(type=key[0], metric=key[1], bucket=bucket)
+                        db.session.add(model)
+                    stats.to_model(model)
+            MetricStats.query.filter(MetricStats.bucket < cutoff).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"Failed to checkpoint streaming stats: {e}")
+            db.session.rollback()
+            # 下次检查点重试
+            with self._lock:
+                self._dirty.update(item for item in snapshot if item[0] in self._buckets)
+            return 0
+        return len(snapshot)
+
+    @staticmethod
+    def _copy(stats: RunningStats) -> RunningStats:
+        return RunningStats().merge(stats)
+
+    def load(self) -> int:
+        """从检查点恢复保留期内的桶，返回恢复的桶数"""
+        cutoff = bucket_start(datetime.utcnow() - self.retention, self.resolution)
+        loaded = 0
+        with self._lock:
+            for model in MetricStats.query.filter(MetricStats.bucket >= cutoff):
+                self._buckets.setdefault((model.type, model.metric), {})[model.bucket] = RunningStats.from_model(model)
+                loaded += 1
+        if loaded:
+            logger.info(f"Loaded {loaded} streaming stats buckets from checkpoint")
+        return loaded
+
+    def rebuild(self, store: MetricStore, start: datetime, end: datetime,
+                chunk: timedelta = timedelta(hours=6)) -> int:
+        """根据原始数据重建时间范围内的统计并写入检查点，返回处理的原始样本数"""
+        start = bucket_start(start, self.resolution)
+        with self._lock:
+            for key in list(self._buckets):
+                buckets = self._buckets[key]
+                for bucket in [bucket for bucket in buckets if start <= bucket < end]:
+                    del buckets[bucket]
+        MetricStats.query.filter(MetricStats.bucket >= start, MetricStats.bucket < end).delete(synchronize_session=False)
+        db.session.commit()
+
+        processed = 0
+        window_start = start
+        while window_start < end:
+            window_end = min(window_start + chunk, end)
+            rows = [
+                {'type': type, 'metric': metric, 'value': value, 'timestamp': timestamp}
+                for timestamp, type, metric, value in store.iter_rows(window_start, window_end, end_inclusive=False)
+            ]
+            self.ingest(rows)
+            processed += len(rows)
+            window_start = window_end
+        self.checkpoint()
+        logger.info(f"Rebuilt streaming stats from {processed} raw samples between {start} and {end}")
+        return processed
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取引擎状态"""
+        with self._lock:
+            return {
+                'series': len(self._buckets),
+                'buckets': sum(len(buckets) for buckets in self._buckets.values()),
+                'dirty': len(self._dirty),
+                'last_checkpoint': datetime.utcfromtimestamp(self._last_checkpoint).isoformat()
+            }
+
+def get_streaming_stats(app) -> StreamingStats:
+    """获取应用的流式统计引擎，未初始化时按应用配置创建并从检查点恢复"""
+    engine = getattr(app, 'streaming_stats', None)
+    if engine is None:
+        engine = StreamingStats(app.config.get('MONITOR', {}))
+        with app.app_context():
+            engine.load()
+        app.streaming_stats = engine
+    return engine
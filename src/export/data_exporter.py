@@ -1,11 +1,27 @@
 import pandas as pd
-import sqlite3
-from typing import List, Optional
+from typing import List, Optional, Union
 from datetime import datetime, timedelta
+from src.database.metric_store import MetricStore, as_metric_store, resolve_metric, metric_name
 
 class DataExporter:
-    def __init__(self, db_path: str):
-        self.db_path = db_path
+    def __init__(self, store: Union[MetricStore, str]):
+        # 兼容传入数据库路径的旧用法
+        self.store = as_metric_store(store)
+    
+    def _load(self,
+              metrics: Optional[List[str]] = None,
+              start_date: Optional[datetime] = None,
+              end_date: Optional[datetime] = None) -> pd.DataFrame:
+        """从指标存储读取数据，返回 timestamp / metric_name / metric_value 三列，按时间排序"""
+        series = [resolve_metric(metric) for metric in metrics] if metrics else None
+        points = self.store.read_range(start_date or datetime(1970, 1, 1), end_date or datetime.utcnow(), series)
+        rows = [
+            (timestamp, metric_name(type, metric), value)
+            for (type, metric), series_points in points.items()
+            for timestamp, value in series_points
+        ]
+        df = pd.DataFrame(rows, columns=['timestamp', 'metric_name', 'metric_value'])
+        return df.sort_values(['timestamp', 'metric_name'], kind='stable').reset_index(drop=True)
     
     def export_to_csv(self, 
                       output_path: str,
@@ -13,27 +29,8 @@ class DataExporter:
                       start_date: Optional[datetime] = None,
                       end_date: Optional[datetime] = None) -> None:
         """导出监控数据到CSV文件"""
-        query = "SELECT * FROM metrics WHERE 1=1"
-        params = []
-        
-        if metrics:
-            query += " AND metric_name IN ({})".format(','.join(['?'] * len(metrics)))
-            params.extend(metrics)
-            
-        if start_date:
-            query += " AND timestamp >= ?"
-            params.append(start_date)
-            
-        if end_date:
-            query += " AND timestamp <= ?"
-            params.append(end_date)
-            
-        with sqlite3.connect(self.db_path) as conn:
-            df = pd.read_sql_query(query, conn, params=params)
-            df.to_csv(output_path, index=False)
+        self._load(metrics, start_date, end_date).to_csv(output_path, index=False)
     
     def export_to_json(self, output_path: str, **kwargs) -> None:
-        """导出监控数据到JSON文件"""
-        with sqlite3.connect(self.db_path) as conn:
-            df = pd.read_sql_query("SELECT * FROM metrics", conn)
-            df.to_json(output_path, orient='records') 
\ No newline at end of file
+        """导出监控数据到JSON文件，支持与 export_to_csv 相同的筛选参数"""
+        self._load(**kwargs).to_json(output_path, orient='records', date_format='iso')
\ No newline at end of file
@@ -5,6 +5,7 @@ import yaml
 from visualization.data_visualizer import DataVisualizer
 from analysis.metrics_analyzer import MetricsAnalyzer
 from export.data_exporter import DataExporter
+from database.metric_store import create_metric_store
 from datetime import datetime, timedelta
 
 def load_config(config_path: str) -> dict:
@@ -19,10 +20,11 @@ def main():
     monitor = SystemMonitor()
     alert_manager = AlertManager(config['smtp'])
     
-    # 初始化新组件
-    visualizer = DataVisualizer(config['db_path'])
-    analyzer = MetricsAnalyzer(config['db_path'])
-    exporter = DataExporter(config['db_path'])
+    # 初始化新组件，共用同一个指标存储
+    store = create_metric_store(config.get('metric_store', {'db_path': config['db_path']}))
+    visualizer = DataVisualizer(store)
+    analyzer = MetricsAnalyzer(store)
+    exporter = DataExporter(store)
     
     while True:
         # 收集指标
@@ -113,6 +113,13 @@ class Backup(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class MonitorData(db.Model):
+    __table_args__ = (
+        # 按序列读取时间范围，包含 value 列，查询只需读索引
+        db.Index('ix_monitor_data_series_time', 'type', 'metric', 'timestamp', 'value'),
+        # 不限序列的时间范围读取和过期清理
+        db.Index('ix_monitor_data_timestamp', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     type = db.Column(db.String(50))  # cpu, memory, disk, network
@@ -122,14 +129,159 @@ class MonitorData(db.Model):
     def __repr__(self):
         return f'<MonitorData {self.type}.{self.metric}: {self.value}>'
 
+class MonitorSample(db.Model):
+    """宽表监控样本：每个采集时刻一行，核心指标各占一列"""
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    cpu_usage = db.Column(db.Float)
+    memory_usage = db.Column(db.Float)
+    disk_usage = db.Column(db.Float)
+    net_sent_speed = db.Column(db.Float)
+    net_recv_speed = db.Column(db.Float)
+    net_bytes_sent = db.Column(db.Float)
+    net_bytes_recv = db.Column(db.Float)
+    extra = db.Column(db.JSON)  # 其他动态指标 {"type.metric": value}
+
+    def __repr__(self):
+        return f'<MonitorSample {self.timestamp}>'
+
+class MonitorRollup(db.Model):
+    """监控数据降采样汇总（1分钟/5分钟/1小时）"""
+    __table_args__ = (
+        db.UniqueConstraint('resolution', 'type', 'metric', 'bucket', name='uq_monitor_rollup_bucket'),
+        # 不限序列的时间范围读取和按层级清理
+        db.Index('ix_monitor_rollup_resolution_bucket', 'resolution', 'bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    resolution = db.Column(db.Integer, nullable=False)  # 汇总粒度(秒)
+    type = db.Column(db.String(50), nullable=False)
+    metric = db.Column(db.String(50), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False)  # 时间桶起点
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+    avg_value = db.Column(db.Float)
+    sample_count = db.Column(db.Integer, default=0)
+    last_value = db.Column(db.Float)
+    last_timestamp = db.Column(db.DateTime)
+    sketch = db.Column(db.LargeBinary)  # 可合并的分位数草图 (QuantileSketch.to_bytes)
+
+    def __repr__(self):
+        return f'<MonitorRollup {self.resolution}s {self.type}.{self.metric}@{self.bucket}: {self.avg_value}>'
+
+class MetricStats(db.Model):
+    """按时间桶保存的流式统计检查点（Welford 均值/方差、极值和线性趋势累加量）"""
+    __table_args__ = (
+        db.UniqueConstraint('type', 'metric', 'bucket', name='uq_metric_stats_bucket'),
+        db.Index('ix_metric_stats_bucket', 'bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    metric = db.Column(db.String(50), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False)  # 时间桶起点
+    count = db.Column(db.Integer, nullable=False)
+    mean = db.Column(db.Float)
+    m2 = db.Column(db.Float)  # 与均值之差的平方和
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+    mean_time = db.Column(db.Float)  # 样本时间（秒）的均值
+    m2_time = db.Column(db.Float)
+    comoment = db.Column(db.Float)  # 时间与数值的协方差累加量
+    first_value = db.Column(db.Float)
+    first_timestamp = db.Column(db.DateTime)
+    last_value = db.Column(db.Float)
+    last_timestamp = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<MetricStats {self.type}.{self.metric}@{self.bucket}: {self.mean} ({self.count})>'
+
+class ForecastModel(db.Model):
+    """序列预测模型的持久化状态（带遗忘因子的最小二乘充分统计量及其训练截止时间）"""
+    __table_args__ = (
+        db.UniqueConstraint('type', 'metric', name='uq_forecast_model_series'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    metric = db.Column(db.String(50), nullable=False)
+    origin = db.Column(db.DateTime, nullable=False)  # 趋势项的时间原点（整周边界）
+    watermark = db.Column(db.DateTime, nullable=False)  # 已训练到的最后一个小时桶
+    layout = db.Column(db.JSON, nullable=False)  # 季节周期和谐波数 [[周期小时, 谐波数], ...]
+    gram = db.Column(db.JSON, nullable=False)  # XᵀWX
+    rhs = db.Column(db.JSON, nullable=False)  # XᵀWy
+    sum_yy = db.Column(db.Float, nullable=False)
+    weight = db.Column(db.Float, nullable=False)  # 有效样本数 Σw
+    count = db.Column(db.Integer, nullable=False)
+    first_timestamp = db.Column(db.DateTime)
+    last_timestamp = db.Column(db.DateTime)
+    last_value = db.Column(db.Float)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ForecastModel {self.type}.{self.metric}@{self.watermark}: {self.count}>'
+
+class AnomalyEvent(db.Model):
+    """写入路径上在线检测到的指标异常，连续的异常样本合并为一个事件"""
+    __table_args__ = (
+        db.Index('ix_anomaly_event_start_time', 'start_time'),
+        db.Index('ix_anomaly_event_series_time', 'type', 'metric', 'start_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    metric = db.Column(db.String(50), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    detectors = db.Column(db.JSON)  # 触发的检测器: ewma, mad, seasonal
+    direction = db.Column(db.String(10))  # high, low
+    value = db.Column(db.Float)  # 偏离最大的样本值
+    expected = db.Column(db.Float)  # 该样本对应的基线
+    score = db.Column(db.Float)  # 偏离最大的标准化分数
+    sample_count = db.Column(db.Integer, default=1)
+    severity = db.Column(db.String(20))  # warning, critical
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AnomalyEvent {self.type}.{self.metric}@{self.start_time}: {self.score:.1f}>'
+
+class MetricChunk(db.Model):
+    """压缩的时序数据块：单个序列一个时间窗口内的样本"""
+    __table_args__ = (
+        db.Index('ix_metric_chunk_series_time', 'type', 'metric', 'start_time', 'end_time'),
+        db.Index('ix_metric_chunk_end_time', 'end_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    metric = db.Column(db.String(50), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)  # 块内第一个样本的时间
+    end_time = db.Column(db.DateTime, nullable=False)  # 块内最后一个样本的时间
+    sample_count = db.Column(db.Integer, nullable=False)
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+    sum_value = db.Column(db.Float)
+    last_value = db.Column(db.Float)
+    data = db.Column(db.LargeBinary, nullable=False)  # Gorilla 编码后的时间戳和数值
+
+    def __repr__(self):
+        return f'<MetricChunk {self.type}.{self.metric} {self.start_time}~{self.end_time} ({self.sample_count})>'
+
 class ProcessData(db.Model):
+    __table_args__ = (
+        # 支持"某一时刻的 Top 进程"查询，无需全表排序
+        db.Index('ix_process_data_timestamp_cpu', 'timestamp', 'cpu_percent'),
+        db.Index('ix_process_data_timestamp_memory', 'timestamp', 'memory_percent'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
-    pid = db.Column(db.Integer)
+    pid = db.Column(db.Integer)  # 按进程名聚合时为空
     name = db.Column(db.String(100))
     cpu_percent = db.Column(db.Float)
     memory_percent = db.Column(db.Float)
-    status = db.Column(db.String(20)) 
+    status = db.Column(db.String(20))
+    process_count = db.Column(db.Integer, default=1)  # 聚合的进程数
 
 class TaskExecution(db.Model):
     """任务执行记录"""
@@ -155,6 +307,7 @@ class MetricAlert(db.Model):
     condition = db.Column(db.String(20))  # >, <, >=, <=, ==
     threshold = db.Column(db.Float)
     duration = db.Column(db.Integer)  # 持续时间(秒)
+    aggregation = db.Column(db.String(20))  # avg, min, max, last, p50, p95, p99 等，anomaly 表示按异常事件触发，默认 avg
     severity = db.Column(db.String(20))  # info, warning, error, critical
     enabled = db.Column(db.Boolean, default=True)
     notify_channels = db.Column(db.JSON)  # email, sms, webhook等
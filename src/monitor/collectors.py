@@ -0,0 +1,465 @@
+from typing import Dict, Any, List, Optional, Callable, Type
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import threading
+import logging
+import time
+import psutil
+from src.models import ProcessData, db
+from src.monitor.process_tracker import ProcessTracker, ProcessRetentionPolicy
+from src.monitor.sampler import get_cpu_temperature, get_disk_temperature
+from src.database.metric_store import get_metric_store
+
+logger = logging.getLogger(__name__)
+
+# 已注册的采集插件 {name: Collector 子类}
+COLLECTORS: Dict[str, Type['Collector']] = {}
+
+def register_collector(cls: Type['Collector']) -> Type['Collector']:
+    """注册采集插件（类装饰器）"""
+    COLLECTORS[cls.name] = cls
+    return cls
+
+class Collector:
+    """采集插件基类
+
+    子类实现 collect()，返回长格式样本 [{'type', 'metric', 'value'}]，时间戳由框架统一填写。
+    需要保存非指标数据（如进程列表）的插件可以实现 persist()，在应用上下文中调用。
+    """
+
+    name = ''
+    default_interval = 60  # 采集间隔(秒)
+    default_timeout = 10  # 单次采集超时(秒)
+
+    def __init__(self, config: Dict):
+        self.config = config
+        self.interval = config.get('interval', self.default_interval)
+        self.timeout = config.get('timeout', self.default_timeout)
+        self.enabled = config.get('enabled', True)
+
+    def collect(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def persist(self, timestamp: datetime) -> None:
+        """保存本次采集的附加数据，默认不做任何事"""
+
+    @staticmethod
+    def _row(type: str, metric: str, value: float) -> Dict[str, Any]:
+        return {'type': type, 'metric': metric, 'value': value}
+
+class _CounterRate:
+    """根据累计计数器计算两次采集之间的速率"""
+
+    def __init__(self):
+        self._last: Optional[Dict[str, float]] = None
+        self._last_time = 0.0
+
+    def update(self, counters: Dict[str, float]) -> Dict[str, float]:
+        now = time.monotonic()
+        if self._last is None:
+            rates = {key: 0.0 for key in counters}
+        else:
+            time_diff = max(now - self._last_time, 0.1)  # 避免除以零
+            rates = {key: (value - self._last.get(key, value)) / time_diff for key, value in counters.items()}
+        self._last = counters
+        self._last_time = now
+        return rates
+
+@register_collector
+class CpuCollector(Collector):
+    name = 'cpu'
+    default_interval = 60
+
+    def __init__(self, config: Dict):
+        super().__init__(config)
+        # 上次采集的 CPU 时间保存在实例上：psutil.cpu_percent(interval=None) 按线程记录上一次的值，
+        # 而采集在线程池的任意线程上执行，会使每个线程的首次采集为 0 且统计区间不确定
+        self._lock = threading.Lock()
+        self._last_times = psutil.cpu_times()
+
+    @staticmethod
+    def _busy_and_total(times) -> tuple:
+        """与 psutil 相同的口径：总时间不重复计入 guest，忙碌时间不含 idle 和 iowait"""
+        total = sum(times)
+        total -= getattr(times, 'guest', 0) + getattr(times, 'guest_nice', 0)
+        busy = total - times.idle - getattr(times, 'iowait', 0)
+        return busy, total
+
+    def collect(self) -> List[Dict[str, Any]]:
+        times = psutil.cpu_times()
+        with self._lock:
+            last_busy, last_total = self._busy_and_total(self._last_times)
+            self._last_times = times
+        busy, total = self._busy_and_total(times)
+        elapsed = total - last_total
+        usage = min(max((busy - last_busy) / elapsed * 100, 0.0), 100.0) if elapsed > 0 else 0.0
+        return [self._row('cpu', 'usage', round(usage, 1))]
+
+@register_collector
+class MemoryCollector(Collector):
+    name = 'memory'
+    default_interval = 60
+
+    def collect(self) -> List[Dict[str, Any]]:
+        memory = psutil.virtual_memory()
+        swap = psutil.swap_memory()
+        return [
+            self._row('memory', 'usage', memory.percent),
+            self._row('memory', 'available', memory.available),
+            self._row('memory', 'swap_usage', swap.percent)
+        ]
+
+@register_collector
+class DiskCollector(Collector):
+    name = 'disk'
+    default_interval = 300
+
+    def collect(self) -> List[Dict[str, Any]]:
+        disk = psutil.disk_usage(self.config.get('path', '/'))
+        return [
+            self._row('disk', 'usage', disk.percent),
+            self._row('disk', 'free', disk.free)
+        ]
+
+@register_collector
+class DiskIOCollector(Collector):
+    name = 'diskio'
+    default_interval = 60
+
+    def __init__(self, config: Dict):
+        super().__init__(config)
+        self._rate = _CounterRate()
+
+    def collect(self) -> List[Dict[str, Any]]:
+        io_stats = psutil.disk_io_counters()
+        if io_stats is None:
+            return []
+        counters = {'read_bytes': io_stats.read_bytes, 'write_bytes': io_stats.write_bytes}
+        rates = self._rate.update(counters)
+        rows = [self._row('disk', metric, value) for metric, value in counters.items()]
+        rows.extend(self._row('disk', f'{metric}_speed', value) for metric, value in rates.items())
+        return rows
+
+@register_collector
+class NetworkCollector(Collector):
+    name = 'net'
+    default_interval = 60
+
+    def __init__(self, config: Dict):
+        super().__init__(config)
+        self._rate = _CounterRate()
+
+    def collect(self) -> List[Dict[str, Any]]:
+        net_io = psutil.net_io_counters()
+        counters = {
+            'bytes_sent': net_io.bytes_sent,
+            'bytes_recv': net_io.bytes_recv,
+            'packets_sent': net_io.packets_sent,
+            'packets_recv': net_io.packets_recv,
+            'errin': net_io.errin,
+            'errout': net_io.errout,
+            'dropin': net_io.dropin,
+            'dropout': net_io.dropout
+        }
+        rates = self._rate.update(counters)
+        rows = [self._row('network', metric, value) for metric, value in counters.items()]
+        for metric in ('bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv'):
+            rows.append(self._row('network', f'{metric}_speed', rates[metric]))
+        return rows
+
+@register_collector
+class LoadCollector(Collector):
+    name = 'load'
+    default_interval = 60
+
+    def collect(self) -> List[Dict[str, Any]]:
+        load_avg = psutil.getloadavg()
+        return [
+            self._row('system', 'load_1', load_avg[0]),
+            self._row('system', 'load_5', load_avg[1]),
+            self._row('system', 'load_15', load_avg[2])
+        ]
+
+@register_collector
+class ProcessCollector(Collector):
+    name = 'processes'
+    default_interval = 300
+
+    def __init__(self, config: Dict):
+        super().__init__(config)
+        # 跟踪器在两次采集之间保留句柄，CPU 使用率为采集间隔内的平均值
+        self.tracker = ProcessTracker()
+        self.tracker.scan()
+        self.policy = ProcessRetentionPolicy(config.get('retention', {}))
+
+    def collect(self) -> List[Dict[str, Any]]:
+        count = self.tracker.scan()
+        return [self._row('process', 'count', count)]
+
+    def persist(self, timestamp: datetime) -> None:
+        """只保存保留策略选中的活跃进程"""
+        process_rows = []
+        for record in self.policy.select(self.tracker.records()):
+            process_rows.append({
+                'pid': record['pid'],
+                'name': record['name'],
+                'cpu_percent': record['cpu_percent'],
+                'memory_percent': record['memory_percent'],
+                'status': self.tracker.status(record['pid']) if record['pid'] is not None else None,
+                'process_count': record.get('process_count', 1),
+                'timestamp': timestamp
+            })
+        db.session.bulk_insert_mappings(ProcessData, process_rows)
+        db.session.commit()
+
+@register_collector
+class TemperatureCollector(Collector):
+    name = 'temperatures'
+    default_interval = 600
+    default_timeout = 30
+
+    def collect(self) -> List[Dict[str, Any]]:
+        rows = []
+        cpu_temperature = get_cpu_temperature()
+        if cpu_temperature is not None:
+            rows.append(self._row('temperature', 'cpu', cpu_temperature))
+        for device, temperature in get_disk_temperature().items():
+            rows.append(self._row('temperature', device.rsplit('/', 1)[-1], temperature))
+        return rows
+
+@register_collector
+class ConnectionCollector(Collector):
+    name = 'connections'
+    default_interval = 300
+
+    def collect(self) -> List[Dict[str, Any]]:
+        return [self._row('network', 'connections', len(psutil.net_connections()))]
+
+class CollectorRegistry:
+    """采集插件注册表
+
+    按配置实例化所有已注册的插件，同步执行并统计每个插件的
+    墙钟时间和 CPU 时间，便于把开销大的插件调整到更长的间隔。
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or {}
+        self.collectors: Dict[str, Collector] = {
+            name: cls(config.get(name, {})) for name, cls in COLLECTORS.items()
+        }
+        self._stats: Dict[str, Dict[str, Any]] = {name: self._empty_stats() for name in self.collectors}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, Any]:
+        return {
+            'runs': 0,
+            'failures': 0,
+            'timeouts': 0,
+            'samples': 0,
+            'last_wall_time': 0.0,
+            'last_cpu_time': 0.0,
+            'total_wall_time': 0.0,
+            'total_cpu_time': 0.0,
+            'last_run': None,
+            'last_error': None
+        }
+
+    def get(self, name: str) -> Optional[Collector]:
+        return self.collectors.get(name)
+
+    def enabled(self) -> List[Collector]:
+        return [collector for collector in self.collectors.values() if collector.enabled]
+
+    def run(self, collector: Collector) -> Optional[List[Dict[str, Any]]]:
+        """执行一次插件并记录耗时，失败或超时返回 None"""
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        error = None
+        rows = None
+        try:
+            rows = collector.collect()
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Collector {collector.name} failed: {e}")
+        wall_time = time.perf_counter() - wall_start
+        cpu_time = time.thread_time() - cpu_start
+
+        timed_out = error is None and wall_time > collector.timeout
+        if timed_out:
+            logger.warning(f"Collector {collector.name} took {wall_time:.2f}s (timeout {collector.timeout}s), result discarded")
+            rows = None
+
+        with self._lock:
+            stats = self._stats[collector.name]
+            stats['runs'] += 1
+            stats['last_wall_time'] = wall_time
+            stats['last_cpu_time'] = cpu_time
+            stats['total_wall_time'] += wall_time
+            stats['total_cpu_time'] += cpu_time
+            stats['last_run'] = datetime.utcnow()
+            if error is not None:
+                stats['failures'] += 1
+                stats['last_error'] = error
+            elif timed_out:
+                stats['timeouts'] += 1
+            else:
+                stats['samples'] += len(rows)
+        return rows
+
+    def run_all(self, names: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """同步执行指定（默认全部）已启用的插件，返回合并后的样本"""
+        rows = []
+        for collector in self.enabled():
+            if names is None or collector.name in names:
+                rows.extend(self.run(collector) or [])
+        return rows
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各插件的运行统计"""
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                collector = self.collectors[name]
+                runs = stats['runs']
+                result[name] = dict(
+                    stats,
+                    enabled=collector.enabled,
+                    interval=collector.interval,
+                    timeout=collector.timeout,
+                    avg_wall_time=stats['total_wall_time'] / runs if runs else 0.0,
+                    avg_cpu_time=stats['total_cpu_time'] / runs if runs else 0.0,
+                    last_run=stats['last_run'].isoformat() if stats['last_run'] else None
+                )
+            return result
+
+class CollectorManager:
+    """采集调度器
+
+    后台线程按各插件自己的间隔把到期的插件提交到线程池执行，
+    慢插件不会阻塞其他插件；上一次还未结束的插件不会重复提交。
+    同一轮到期的插件共用一个时间戳，结果交给写入队列批量落库。
+    """
+
+    def __init__(self, app, config: Dict, sink: Optional[Callable[[List[Dict[str, Any]]], Any]] = None):
+        self.app = app
+        self.registry = CollectorRegistry(config.get('collectors', {}))
+        self.tick = config.get('collector_tick', 1.0)  # 调度检查间隔(秒)
+        self.sink = sink
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.get('collector_workers', 4), thread_name_prefix='collector'
+        )
+        self._next_run: Dict[str, float] = {}
+        self._running: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """启动调度线程"""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-collector', daemon=True)
+        self._thread.start()
+        logger.info(f"Collector manager started with {[c.name for c in self.registry.enabled()]}")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止调度线程，等待执行中的插件结束"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._executor.shutdown(wait=True)
+        logger.info("Collector manager stopped")
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.run_due()
+            except Exception as e:
+                logger.error(f"Error scheduling collectors: {e}", exc_info=True)
+            self._stop_event.wait(self.tick)
+
+    def run_due(self, now: Optional[float] = None) -> List[str]:
+        """提交所有到期的插件，返回本轮提交的插件名"""
+        now = time.monotonic() if now is None else now
+        timestamp = datetime.utcnow()
+        submitted = []
+        with self._lock:
+            for collector in self.registry.enabled():
+                if self._next_run.get(collector.name, 0.0) > now:
+                    continue
+                if collector.name in self._running:
+                    logger.debug(f"Collector {collector.name} still running, skipping this round")
+                    continue
+                self._next_run[collector.name] = now + collector.interval
+                self._running[collector.name] = now
+                self._executor.submit(self._execute, collector, timestamp)
+                submitted.append(collector.name)
+        return submitted
+
+    def run_all(self) -> int:
+        """在当前线程同步执行所有已启用的插件，返回采集的样本数"""
+        timestamp = datetime.utcnow()
+        count = 0
+        for collector in self.registry.enabled():
+            count += self._collect(collector, timestamp)
+        return count
+
+    def _execute(self, collector: Collector, timestamp: datetime) -> None:
+        try:
+            self._collect(collector, timestamp)
+        finally:
+            with self._lock:
+                self._running.pop(collector.name, None)
+
+    def _collect(self, collector: Collector, timestamp: datetime) -> int:
+        """执行插件并保存结果"""
+        rows = self.registry.run(collector)
+        if rows is None:
+            return 0
+        for row in rows:
+            row['timestamp'] = timestamp
+
+        with self.app.app_context():
+            try:
+                if rows:
+                    self._emit(rows)
+                collector.persist(timestamp)
+            except Exception as e:
+                logger.error(f"Failed to save results of collector {collector.name}: {e}")
+                db.session.rollback()
+        return len(rows)
+
+    def _emit(self, rows: List[Dict[str, Any]]) -> None:
+        if self.sink is not None:
+            self.sink(rows)
+        else:
+            get_metric_store(self.app).write_batch(rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度器和各插件的运行状态"""
+        with self._lock:
+            running = sorted(self._running)
+        return {
+            'running': self.is_running,
+            'active': running,
+            'collectors': self.registry.get_stats()
+        }
+
+def get_collector_manager(app) -> CollectorManager:
+    """获取应用的采集调度器，未初始化时按应用配置创建"""
+    manager = getattr(app, 'collector_manager', None)
+    if manager is None:
+        ingest_queue = getattr(app, 'ingest_queue', None)
+        manager = CollectorManager(
+            app, app.config.get('MONITOR', {}),
+            sink=ingest_queue.put if ingest_queue is not None else None
+        )
+        app.collector_manager = manager
+    return manager
@@ -0,0 +1,192 @@
+from typing import Dict, Any, List, Tuple
+import heapq
+import threading
+import logging
+import time
+import psutil
+
+logger = logging.getLogger(__name__)
+
+class ProcessTracker:
+    """增量进程表跟踪器
+
+    在两次扫描之间保留 psutil.Process 句柄（以 (pid, create_time) 为键），
+    CPU 使用率直接取自上一次扫描以来的增量，无需二次遍历和 sleep。
+    """
+
+    # 排序字段在扫描记录中的下标
+    _SORT_FIELDS = {'cpu_percent': 0, 'memory_percent': 1}
+
+    def __init__(self):
+        self._procs: Dict[Tuple[int, float], Dict[str, Any]] = {}
+        self._pid_index: Dict[int, Tuple[int, float]] = {}
+        self._records: List[Tuple[float, float, Tuple[int, float]]] = []
+        self._lock = threading.Lock()
+
+        self.last_scan_duration = 0.0
+        self.last_scan_time = None
+        self.scan_count = 0
+        self._new_count = 0
+        self._gone_count = 0
+
+    def scan(self) -> int:
+        """扫描一次进程表，返回本次跟踪的进程数"""
+        with self._lock:
+            start = time.perf_counter()
+            total_memory = psutil.virtual_memory().total
+            procs = {}
+            pid_index = {}
+            records = []
+            new_count = 0
+
+            for pid in psutil.pids():
+                key = self._pid_index.get(pid)
+                entry = self._procs.get(key) if key else None
+                try:
+                    # 进程号被复用时丢弃旧句柄
+                    if entry is not None and not entry['proc'].is_running():
+                        entry = None
+
+                    if entry is None:
+                        proc = psutil.Process(pid)
+                        entry = {'proc': proc, 'name': proc.name()}
+                        key = (pid, proc.create_time())
+                        # 首次调用仅建立基准，返回值无意义
+                        proc.cpu_percent(None)
+                        cpu_percent = 0.0
+                        memory_percent = proc.memory_info().rss * 100.0 / total_memory
+                        new_count += 1
+                    else:
+                        proc = entry['proc']
+                        with proc.oneshot():
+                            cpu_percent = proc.cpu_percent(None)
+                            memory_percent = proc.memory_info().rss * 100.0 / total_memory
+
+                    procs[key] = entry
+                    pid_index[pid] = key
+                    records.append((cpu_percent, memory_percent, key))
+                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                    continue
+                except Exception as e:
+                    logger.error(f"Error tracking process {pid}: {e}")
+                    continue
+
+            self._gone_count = len(set(self._procs) - set(procs))
+            self._new_count = new_count
+            self._procs = procs
+            self._pid_index = pid_index
+            self._records = records
+
+            self.scan_count += 1
+            self.last_scan_time = time.time()
+            self.last_scan_duration = time.perf_counter() - start
+            logger.debug(
+                f"Process scan tracked {len(records)} processes in {self.last_scan_duration * 1000:.1f} ms "
+                f"(new: {self._new_count}, gone: {self._gone_count})"
+            )
+            return len(records)
+
+    def top(self, limit: int = 5, sort_by: str = 'cpu_percent') -> List[Dict[str, Any]]:
+        """获取上一次扫描中资源占用最高的 limit 个进程"""
+        index = self._SORT_FIELDS[sort_by]
+        with self._lock:
+            # 有界堆选取 Top-N，只为入选的进程读取状态
+            selected = heapq.nlargest(limit, self._records, key=lambda record: record[index])
+            processes = []
+            for cpu_percent, memory_percent, key in selected:
+                entry = self._procs[key]
+                try:
+                    status = entry['proc'].status()
+                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                    status = 'unknown'
+                processes.append({
+                    'pid': key[0],
+                    'name': entry['name'],
+                    'cpu_percent': cpu_percent,
+                    'memory_percent': memory_percent,
+                    'status': status
+                })
+            return processes
+
+    def records(self) -> List[Dict[str, Any]]:
+        """获取上一次扫描中所有进程的 CPU/内存占用（不读取状态）"""
+        with self._lock:
+            return [
+                {
+                    'pid': key[0],
+                    'name': self._procs[key]['name'],
+                    'cpu_percent': cpu_percent,
+                    'memory_percent': memory_percent
+                }
+                for cpu_percent, memory_percent, key in self._records
+            ]
+
+    def status(self, pid: int) -> str:
+        """获取被跟踪进程的当前状态"""
+        with self._lock:
+            key = self._pid_index.get(pid)
+            if key is None:
+                return 'unknown'
+            try:
+                return self._procs[key]['proc'].status()
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                return 'unknown'
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取扫描统计信息"""
+        with self._lock:
+            return {
+                'tracked': len(self._procs),
+                'scans': self.scan_count,
+                'last_scan_duration': self.last_scan_duration,
+                'last_scan_time': self.last_scan_time,
+                'new': self._new_count,
+                'gone': self._gone_count
+            }
+
+class ProcessRetentionPolicy:
+    """进程数据保留策略
+
+    只保留 CPU / 内存占用 Top-N 且超过最低活跃阈值的进程，
+    可选按进程名聚合，避免把大量空闲内核线程写入数据库。
+    """
+
+    def __init__(self, config: Dict):
+        self.top_cpu = config.get('top_cpu', 10)
+        self.top_memory = config.get('top_memory', 10)
+        self.min_cpu_percent = config.get('min_cpu_percent', 0.5)
+        self.min_memory_percent = config.get('min_memory_percent', 0.5)
+        self.aggregate_by_name = config.get('aggregate_by_name', False)
+
+    def select(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """从进程记录中选出需要保存的条目"""
+        if self.aggregate_by_name:
+            records = self._aggregate(records)
+
+        selected = {}
+        for record in heapq.nlargest(self.top_cpu, records, key=lambda r: r['cpu_percent']):
+            if record['cpu_percent'] >= self.min_cpu_percent:
+                selected[id(record)] = record
+        for record in heapq.nlargest(self.top_memory, records, key=lambda r: r['memory_percent']):
+            if record['memory_percent'] >= self.min_memory_percent:
+                selected[id(record)] = record
+        return sorted(selected.values(), key=lambda r: r['cpu_percent'], reverse=True)
+
+    def _aggregate(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """按进程名聚合"""
+        groups: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            group = groups.get(record['name'])
+            if group is None:
+                groups[record['name']] = {
+                    'pid': None,
+                    'name': record['name'],
+                    'cpu_percent': record['cpu_percent'],
+                    'memory_percent': record['memory_percent'],
+                    'process_count': 1
+                }
+            else:
+                group['cpu_percent'] += record['cpu_percent']
+                group['memory_percent'] += record['memory_percent']
+                group['process_count'] += 1
+        return list(groups.values())
@@ -0,0 +1,251 @@
+from typing import Dict, Any, List, Optional
+from collections import deque
+from datetime import datetime
+import subprocess
+import threading
+import logging
+import time
+import psutil
+from src.monitor.process_tracker import ProcessTracker
+
+logger = logging.getLogger(__name__)
+
+def get_cpu_temperature() -> Optional[float]:
+    """获取 CPU 温度"""
+    methods = [
+        # 方法1: 从 thermal_zone 读取
+        lambda: open('/sys/class/thermal/thermal_zone0/temp', 'r').read().strip(),
+        # 方法2: 从 coretemp 读取
+        lambda: open('/sys/class/hwmon/hwmon0/temp1_input', 'r').read().strip(),
+        # 方法3: 使用 sensors 命令
+        lambda: subprocess.check_output(['sensors'], universal_newlines=True)
+    ]
+
+    for method in methods:
+        try:
+            result = method()
+            if isinstance(result, str) and 'Core 0' in result:
+                # sensors 命令输出
+                for line in result.split('\n'):
+                    if 'Core 0' in line:
+                        return float(line.split('+')[1].split('°')[0])
+            else:
+                # thermal_zone 或 hwmon 读取
+                return float(result) / 1000.0
+        except Exception as e:
+            logger.debug(f"Temperature reading method failed: {str(e)}")
+            continue
+
+    logger.warning("Failed to read CPU temperature from all methods")
+    return None
+
+def get_disk_temperature() -> Dict[str, float]:
+    """获取硬盘温度"""
+    temperatures = {}
+
+    try:
+        # 获取所有磁盘设备
+        disks = []
+        output = subprocess.check_output(['lsblk', '-d', '-o', 'NAME'], universal_newlines=True)
+        for line in output.split('\n')[1:]:  # 跳过标题行
+            if line.strip():
+                disks.append(line.strip())
+
+        # 获取每个磁盘的温度
+        for disk in disks:
+            try:
+                output = subprocess.check_output(
+                    ['sudo', 'smartctl', '-A', f'/dev/{disk}'],
+                    universal_newlines=True
+                )
+                for line in output.split('\n'):
+                    if any(temp in line.lower() for temp in ['temperature_celsius', 'airflow_temp']):
+                        temp = float(line.split()[9])
+                        temperatures[f'/dev/{disk}'] = temp
+                        break
+            except Exception as e:
+                logger.debug(f"Failed to read temperature for disk {disk}: {str(e)}")
+
+    except Exception as e:
+        logger.warning(f"Failed to list block devices: {str(e)}")
+
+    if not temperatures:
+        logger.warning("No disk temperatures could be read")
+
+    return temperatures
+
+class MetricsSampler:
+    """后台指标采样器
+
+    由单个后台线程按固定频率采样系统指标，写入定长环形缓冲区。
+    Web 接口只读取最新快照，不再在请求线程中调用 psutil。
+    """
+
+    def __init__(self, config: Dict):
+        self.interval = config.get('sample_interval', 5)  # 采样间隔(秒)
+        self.history_size = config.get('sample_history', 720)  # 缓冲区保留的快照数
+        self.temperature_interval = config.get('temperature_interval', 60)  # 温度采样间隔(秒)
+        self.process_limit = config.get('sample_process_limit', 10)
+
+        self._buffer = deque(maxlen=self.history_size)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._cpu_count = psutil.cpu_count()
+        self.process_tracker = ProcessTracker()
+        self._last_network = None
+        self._last_network_time = None
+        self._temperature = {'cpu': None, 'disks': {}}
+        self._last_temperature_time = 0.0
+        self._sample_count = 0
+        self._last_sample_duration = 0.0
+
+        # 预热 CPU 计数器，之后的 cpu_percent(interval=None) 返回两次采样间的平均值
+        psutil.cpu_percent(interval=None)
+        logger.info(f"Metrics sampler initialized (interval={self.interval}s, history={self.history_size})")
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """启动后台采样线程"""
+        if self.is_running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='metrics-sampler', daemon=True)
+        self._thread.start()
+        logger.info("Metrics sampler started")
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止后台采样线程"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        logger.info("Metrics sampler stopped")
+
+    def _run(self) -> None:
+        """采样循环"""
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Error sampling metrics: {e}", exc_info=True)
+            if self._stop_event.wait(self.interval):
+                break
+
+    def sample(self) -> Dict[str, Any]:
+        """采样一次并写入环形缓冲区"""
+        start = time.perf_counter()
+        now = time.time()
+
+        cpu_freq = psutil.cpu_freq()
+        memory = psutil.virtual_memory()
+        disk = psutil.disk_usage('/')
+
+        snapshot = {
+            'cpu': {
+                'usage': psutil.cpu_percent(interval=None),
+                'count': self._cpu_count,
+                'freq_current': cpu_freq.current if cpu_freq else 0,
+                'freq_min': cpu_freq.min if cpu_freq else 0,
+                'freq_max': cpu_freq.max if cpu_freq else 0,
+                'load_avg': list(psutil.getloadavg())
+            },
+            'memory': {
+                'total': memory.total,
+                'available': memory.available,
+                'used': memory.used,
+                'percent': memory.percent
+            },
+            'disk': {
+                'total': disk.total,
+                'used': disk.used,
+                'free': disk.free,
+                'percent': disk.percent
+            },
+            'network': self._sample_network(now),
+            'processes': self._sample_processes(),
+            'temperature': self._sample_temperature(now),
+            'timestamp': datetime.now().isoformat()
+        }
+
+        with self._lock:
+            self._buffer.append(snapshot)
+            self._sample_count += 1
+            self._last_sample_duration = time.perf_counter() - start
+
+        return snapshot
+
+    def _sample_network(self, now: float) -> Dict[str, Any]:
+        """采样网络计数器并计算速率"""
+        net_io = psutil.net_io_counters()
+        stats = {
+            'bytes_sent': net_io.bytes_sent,
+            'bytes_recv': net_io.bytes_recv,
+            'packets_sent': net_io.packets_sent,
+            'packets_recv': net_io.packets_recv,
+            'errin': net_io.errin,
+            'errout': net_io.errout,
+            'bytes_sent_speed': 0,
+            'bytes_recv_speed': 0
+        }
+
+        if self._last_network is not None:
+            time_diff = max(now - self._last_network_time, 0.1)  # 避免除以零
+            stats['bytes_sent_speed'] = (stats['bytes_sent'] - self._last_network['bytes_sent']) / time_diff
+            stats['bytes_recv_speed'] = (stats['bytes_recv'] - self._last_network['bytes_recv']) / time_diff
+
+        self._last_network = stats
+        self._last_network_time = now
+        return stats
+
+    def _sample_processes(self) -> List[Dict[str, Any]]:
+        """采样资源占用最高的进程"""
+        self.process_tracker.scan()
+        return self.process_tracker.top(self.process_limit)
+
+    def _sample_temperature(self, now: float) -> Dict[str, Any]:
+        """采样温度信息，温度读取开销较大，按独立的间隔刷新"""
+        if now - self._last_temperature_time >= self.temperature_interval:
+            self._temperature = {
+                'cpu': get_cpu_temperature(),
+                'disks': get_disk_temperature()
+            }
+            self._last_temperature_time = now
+        return self._temperature
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """获取最新快照，O(1)"""
+        with self._lock:
+            return self._buffer[-1] if self._buffer else None
+
+    def current(self) -> Dict[str, Any]:
+        """获取最新快照，缓冲区为空时同步采样一次"""
+        snapshot = self.latest()
+        if snapshot is None:
+            snapshot = self.sample()
+        return snapshot
+
+    def history(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """获取最近 limit 个快照，按时间升序"""
+        with self._lock:
+            snapshots = list(self._buffer)
+        if limit is not None:
+            snapshots = snapshots[-limit:] if limit > 0 else []
+        return snapshots
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取采样器运行状态"""
+        with self._lock:
+            return {
+                'running': self.is_running,
+                'interval': self.interval,
+                'buffered': len(self._buffer),
+                'capacity': self.history_size,
+                'samples': self._sample_count,
+                'last_sample_duration': self._last_sample_duration,
+                'process_scan_duration': self.process_tracker.last_scan_duration
+            }
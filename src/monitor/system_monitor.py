@@ -1,16 +1,24 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 import psutil
-import time
-from datetime import datetime, timedelta
-from src.models import MonitorData, ProcessData, SystemLog, db
+from datetime import datetime
+from src.models import SystemLog, db
+from src.monitor.collectors import CollectorRegistry
+from src.database.ingest import MetricIngestQueue
+from src.database.metric_store import get_metric_store
+from flask import current_app
 import logging
 
 logger = logging.getLogger(__name__)
 
 class SystemMonitor:
-    def __init__(self, config: Dict):
+    # collect_system_metrics 使用的采集插件
+    COLLECTORS = ['cpu', 'memory', 'disk', 'net']
+
+    def __init__(self, config: Dict, ingest_queue: Optional[MetricIngestQueue] = None,
+                 collectors: Optional[CollectorRegistry] = None):
         self.metrics: Dict[str, Any] = {}
         self.config = config  # 保存配置
+        self.ingest_queue = ingest_queue
         self.thresholds = config.get('thresholds', {
             'cpu_percent': 80,
             'memory_usage': 85,
@@ -18,24 +26,18 @@ class SystemMonitor:
             'bytes_sent': 1000000000,  # 1GB
             'bytes_recv': 1000000000   # 1GB
         })
-        self._last_network = self._get_network_metrics()
-        self._last_network_time = time.time()
+        # 优先使用采集调度器的注册表，避免再创建一份进程跟踪器、每轮多做一次完整的进程扫描
+        self.collectors = collectors if collectors is not None else CollectorRegistry(config.get('collectors', {}))
+        # 与进程采集插件共用跟踪器，后续采集即可得到 CPU 增量
+        self.process_tracker = self.collectors.get('processes').tracker
         logger.info("System monitor initialized")
     
     def collect_system_metrics(self) -> Dict[str, Any]:
         """收集系统指标"""
         try:
-            # 收集基本指标
-            cpu_percent = psutil.cpu_percent(interval=0.1)  # 使用较短的间隔
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
-            
-            # 收集网络指标
-            try:
-                network = self._get_network_metrics()
-            except Exception as e:
-                logger.error(f"Failed to collect network metrics: {e}")
-                network = {}
+            rows = self.collectors.run_all(self.COLLECTORS)
+            values = {(row['type'], row['metric']): row['value'] for row in rows}
+            network = {metric: value for (type, metric), value in values.items() if type == 'network'}
             
             # 收集进程信息
             try:
@@ -46,9 +48,9 @@ class SystemMonitor:
             
             # 更新内存中的指标
             self.metrics = {
-                'cpu_percent': cpu_percent or 0.0,
-                'memory_usage': memory.percent,
-                'disk_usage': disk.percent,
+                'cpu_percent': values.get(('cpu', 'usage'), 0.0),
+                'memory_usage': values.get(('memory', 'usage'), 0.0),
+                'disk_usage': values.get(('disk', 'usage'), 0.0),
                 'timestamp': datetime.now().isoformat(),
                 'network': network,
                 'processes': processes,
@@ -61,54 +63,14 @@ class SystemMonitor:
             # 保存到数据库
             try:
                 current_time = datetime.utcnow()
-                metrics_data = [
-                    MonitorData(
-                        type='cpu',
-                        metric='usage',
-                        value=cpu_percent or 0.0,
-                        timestamp=current_time
-                    ),
-                    MonitorData(
-                        type='memory',
-                        metric='usage',
-                        value=memory.percent,
-                        timestamp=current_time
-                    ),
-                    MonitorData(
-                        type='disk',
-                        metric='usage',
-                        value=disk.percent,
-                        timestamp=current_time
-                    )
-                ]
+                for row in rows:
+                    row['timestamp'] = current_time
                 
-                # 添加网络指标
-                if network:
-                    metrics_data.extend([
-                        MonitorData(
-                            type='network',
-                            metric='bytes_sent_speed',
-                            value=network.get('bytes_sent_speed', 0),
-                            timestamp=current_time
-                        ),
-                        MonitorData(
-                            type='network',
-                            metric='bytes_recv_speed',
-                            value=network.get('bytes_recv_speed', 0),
-                            timestamp=current_time
-                        )
-                    ])
-                
-                db.session.bulk_save_objects(metrics_data)
-                db.session.commit()
-                
-                # 清理旧数据
-                retention_days = self.config.get('retention_days', 30)
-                cleanup_before = current_time - timedelta(days=retention_days)
-                db.session.query(MonitorData).filter(
-                    MonitorData.timestamp < cleanup_before
-                ).delete()
-                db.session.commit()
+                if self.ingest_queue is not None:
+                    # 交给写入队列批量落库，过期数据由定时清理任务处理
+                    self.ingest_queue.put(rows)
+                else:
+                    get_metric_store(current_app._get_current_object()).write_batch(rows)
                 
             except Exception as e:
                 logger.error(f"Failed to save metrics to database: {e}")
@@ -128,104 +90,12 @@ class SystemMonitor:
                 'system_info': {}
             }
     
-    def _get_network_metrics(self) -> Dict[str, Any]:
-        """获取网络指标"""
-        try:
-            current_time = time.time()
-            net_io = psutil.net_io_counters()
-            current_stats = {
-                'bytes_sent': net_io.bytes_sent,
-                'bytes_recv': net_io.bytes_recv,
-                'packets_sent': net_io.packets_sent,
-                'packets_recv': net_io.packets_recv,
-                'errin': net_io.errin,
-                'errout': net_io.errout,
-                'dropin': net_io.dropin,
-                'dropout': net_io.dropout
-            }
-
-            # 计算网络速率
-            if hasattr(self, '_last_network'):
-                time_diff = max(current_time - self._last_network_time, 0.1)  # 避免除以零
-                current_stats.update({
-                    'bytes_sent_speed': (current_stats['bytes_sent'] - self._last_network['bytes_sent']) / time_diff,
-                    'bytes_recv_speed': (current_stats['bytes_recv'] - self._last_network['bytes_recv']) / time_diff,
-                    'packets_sent_speed': (current_stats['packets_sent'] - self._last_network['packets_sent']) / time_diff,
-                    'packets_recv_speed': (current_stats['packets_recv'] - self._last_network['packets_recv']) / time_diff
-                })
-            else:
-                current_stats.update({
-                    'bytes_sent_speed': 0,
-                    'bytes_recv_speed': 0,
-                    'packets_sent_speed': 0,
-                    'packets_recv_speed': 0
-                })
-
-            # 更新上次的网络数据
-            self._last_network = current_stats
-            self._last_network_time = current_time
-
-            return current_stats
-        except Exception as e:
-            logger.error(f"Error getting network metrics: {e}")
-            return {
-                'bytes_sent': 0,
-                'bytes_recv': 0,
-                'packets_sent': 0,
-                'packets_recv': 0,
-                'errin': 0,
-                'errout': 0,
-                'dropin': 0,
-                'dropout': 0,
-                'bytes_sent_speed': 0,
-                'bytes_recv_speed': 0,
-                'packets_sent_speed': 0,
-                'packets_recv_speed': 0
-            }
-    
     def _get_top_processes(self, limit: int = 5) -> List[Dict[str, Any]]:
         """获取资源占用最高的进程"""
-        processes = []
         try:
-            # 先收集一次 CPU 使用率
-            for proc in psutil.process_iter(['pid', 'name', 'status']):
-                try:
-                    proc.cpu_percent()
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                    pass
-            
-            # 等待一小段时间
-            time.sleep(0.1)
-            
-            # 再次收集进程信息
-            for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'status']):
-                try:
-                    pinfo = proc.info
-                    cpu_percent = pinfo.get('cpu_percent', 0.0)
-                    memory_percent = pinfo.get('memory_percent', 0.0)
-                    
-                    if cpu_percent is None:
-                        cpu_percent = 0.0
-                    if memory_percent is None:
-                        memory_percent = 0.0
-                    
-                    processes.append({
-                        'pid': pinfo['pid'],
-                        'name': pinfo['name'],
-                        'cpu_percent': cpu_percent,
-                        'memory_percent': memory_percent,
-                        'status': pinfo['status']
-                    })
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                    continue
-                except Exception as e:
-                    logger.error(f"Error getting process info: {e}")
-                    continue
-            
-            # 按 CPU 使用率排序，确保所有值都是数字
-            processes.sort(key=lambda x: float(x['cpu_percent'] or 0), reverse=True)
-            return processes[:limit]
-            
+            # CPU 使用率取自上一次扫描以来的增量
+            self.process_tracker.scan()
+            return self.process_tracker.top(limit)
         except Exception as e:
             logger.error(f"Error in _get_top_processes: {e}", exc_info=True)
             return []
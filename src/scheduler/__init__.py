@@ -2,21 +2,24 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.executors.pool import ThreadPoolExecutor, ProcessPoolExecutor
 from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
-from src.models import Task, db, MonitorData, ProcessData, TaskExecution, AnalysisReport
+from src.models import Task, db, ProcessData, TaskExecution, AnalysisReport, AnomalyEvent, SystemLog
+from src.database.rollup import get_rollup_manager
+from src.database.sample_store import SampleStore
+from src.database.metric_store import get_metric_store
+from src.database.archive import TieredMetricStore, archive_cold_data
+from src.database.streaming_stats import RunningStats, get_streaming_stats, summarize_by_series, threshold_breaches
+from src.monitor.collectors import get_collector_manager
+from src.analysis.model_registry import get_model_registry
+from src.alert.rule_evaluator import evaluate_alerts, record_alerts
+from src.analysis.correlation import get_correlation_analyzer
+from src.visualization.chart_renderer import add_series, get_chart_renderer, line_chart
+from src.utils.time_buckets import bucket_start
 import subprocess
 import logging
 from pytz import timezone
 from sqlalchemy import inspect
 from datetime import datetime, timedelta
-import psutil
 import time
-import numpy as np
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-from sklearn.linear_model import LinearRegression
-import matplotlib.pyplot as plt
-import seaborn as sns
 from flask import current_app
 
 logger = logging.getLogger(__name__)
@@ -44,30 +47,35 @@ def init_scheduler(app):
     )
     
     # 添加任务，使用闭包保存 app 实例
-    def collect_metrics_job():
-        with app.app_context():
-            collect_metrics(app)
-            
+    # 指标采集由采集调度器按各插件自己的间隔执行，不再作为定时任务
     def analyze_performance_job():
         with app.app_context():
             analyze_performance(app)
             
     def cleanup_old_data_job():
         with app.app_context():
-            cleanup_old_data(app, retention_days=30)
+            retention_days = app.config.get('MONITOR', {}).get('retention_days', 30)
+            cleanup_old_data(app, retention_days=retention_days)
             
     def predict_resource_usage_job():
         with app.app_context():
             predict_resource_usage(app)
-    
-    # 添加数据收集任务
-    scheduler.add_job(
-        func=collect_metrics_job,
-        trigger='interval',
-        minutes=5,
-        id='collect_metrics',
-        replace_existing=True
-    )
+            
+    def compact_samples_job():
+        with app.app_context():
+            compact_samples(app)
+            
+    def archive_metrics_job():
+        with app.app_context():
+            archive_metrics(app)
+            
+    def evaluate_alert_rules_job():
+        with app.app_context():
+            evaluate_alert_rules(app)
+            
+    def analyze_correlations_job():
+        with app.app_context():
+            analyze_correlations(app)
     
     # 添加性能分析任务
     scheduler.add_job(
@@ -87,6 +95,42 @@ def init_scheduler(app):
         replace_existing=True
     )
     
+    # 添加历史数据压缩任务
+    scheduler.add_job(
+        func=compact_samples_job,
+        trigger='interval',
+        hours=1,
+        id='compact_samples',
+        replace_existing=True
+    )
+    
+    # 添加冷数据归档任务
+    scheduler.add_job(
+        func=archive_metrics_job,
+        trigger='cron',
+        hour=2,  # 每天凌晨2点执行，早于数据清理任务
+        id='archive_metrics',
+        replace_existing=True
+    )
+    
+    # 添加根因相关性分析任务
+    scheduler.add_job(
+        func=analyze_correlations_job,
+        trigger='interval',
+        minutes=30,
+        id='analyze_correlations',
+        replace_existing=True
+    )
+    
+    # 添加告警规则评估任务
+    scheduler.add_job(
+        func=evaluate_alert_rules_job,
+        trigger='interval',
+        minutes=1,
+        id='evaluate_alert_rules',
+        replace_existing=True
+    )
+    
     # 添加资源使用预测任务
     scheduler.add_job(
         func=predict_resource_usage_job,
@@ -153,47 +197,10 @@ def job_executed_listener(event):
         logger.error(f"Error in job execution listener: {e}")
 
 def collect_metrics(app):
-    """收集系统指标"""
+    """立即执行一次所有已启用的采集插件"""
     try:
-        # 收集CPU使用率
-        cpu_percent = psutil.cpu_percent(interval=1)
-        cpu_metric = MonitorData(type='cpu', metric='usage', value=cpu_percent)
-        db.session.add(cpu_metric)
-        
-        # 收集内存使用率
-        memory = psutil.virtual_memory()
-        memory_metric = MonitorData(type='memory', metric='usage', value=memory.percent)
-        db.session.add(memory_metric)
-        
-        # 收集磁盘使用率
-        disk = psutil.disk_usage('/')
-        disk_metric = MonitorData(type='disk', metric='usage', value=disk.percent)
-        db.session.add(disk_metric)
-        
-        # 收集网络IO
-        net = psutil.net_io_counters()
-        net_sent = MonitorData(type='network', metric='bytes_sent', value=net.bytes_sent)
-        net_recv = MonitorData(type='network', metric='bytes_recv', value=net.bytes_recv)
-        db.session.add(net_sent)
-        db.session.add(net_recv)
-        
-        # 收集进程信息
-        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
-            try:
-                pinfo = proc.info
-                process_data = ProcessData(
-                    pid=pinfo['pid'],
-                    name=pinfo['name'],
-                    cpu_percent=pinfo['cpu_percent'],
-                    memory_percent=pinfo['memory_percent']
-                )
-                db.session.add(process_data)
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                continue
-        
-        db.session.commit()
-        logger.info("Metrics collected successfully")
-        
+        count = get_collector_manager(app).run_all()
+        logger.info(f"Metrics collected successfully ({count} samples)")
     except Exception as e:
         logger.error(f"Failed to collect metrics: {e}")
         db.session.rollback()
@@ -205,10 +212,8 @@ def cleanup_old_data(app, retention_days):
         with app.app_context():
             cutoff_date = datetime.utcnow() - timedelta(days=retention_days)
             
-            # 清理监控数据
-            monitor_count = MonitorData.query.filter(
-                MonitorData.timestamp < cutoff_date
-            ).delete()
+            # 清理监控数据（段文件后端直接删除过期的整段文件）
+            monitor_count = get_metric_store(app).delete_before(cutoff_date)
             
             # 清理进程数据
             process_count = ProcessData.query.filter(
@@ -220,12 +225,25 @@ def cleanup_old_data(app, retention_days):
                 TaskExecution.end_time < cutoff_date
             ).delete()
             
+            # 清理异常事件及由事件生成的相关性报告
+            anomaly_count = AnomalyEvent.query.filter(
+                AnomalyEvent.end_time < cutoff_date
+            ).delete()
+            report_count = AnalysisReport.query.filter(
+                AnalysisReport.report_type == 'correlation',
+                AnalysisReport.created_at < cutoff_date
+            ).delete()
+            
             db.session.commit()
             
+            # 按各层级的保留期清理汇总数据
+            rollup_count = get_rollup_manager(app).apply_retention()
+            
             execution_time = time.time() - start_time
             logger.info(
                 f"Cleaned up data older than {retention_days} days in {execution_time:.2f} seconds "
-                f"(Metrics: {monitor_count}, Processes: {process_count}, Executions: {execution_count})"
+                f"(Metrics: {monitor_count}, Processes: {process_count}, Executions: {execution_count}, "
+                f"Anomalies: {anomaly_count}, Correlation reports: {report_count}, Rollups: {rollup_count})"
             )
             
     except Exception as e:
@@ -233,29 +251,71 @@ def cleanup_old_data(app, retention_days):
         logger.error(f"Failed to cleanup old data after {execution_time:.2f} seconds: {e}")
         db.session.rollback()
 
-def collect_advanced_metrics(app):
-    """收集高级系统指标"""
+def compact_samples(app):
+    """把超过压缩期的原始样本转存为压缩块"""
+    start_time = time.time()
     try:
         with app.app_context():
-            # 收集IO统计
-            io_stats = psutil.disk_io_counters()
-            MonitorData(type='disk', metric='read_bytes', value=io_stats.read_bytes).save()
-            MonitorData(type='disk', metric='write_bytes', value=io_stats.write_bytes).save()
-            
-            # 收集网络连接数
-            connections = len(psutil.net_connections())
-            MonitorData(type='network', metric='connections', value=connections).save()
-            
-            # 收集系统负载
-            load_avg = psutil.getloadavg()
-            MonitorData(type='system', metric='load_1', value=load_avg[0]).save()
-            MonitorData(type='system', metric='load_5', value=load_avg[1]).save()
-            MonitorData(type='system', metric='load_15', value=load_avg[2]).save()
-            
-            db.session.commit()
-            
+            config = app.config.get('MONITOR', {})
+            before = datetime.utcnow() - timedelta(hours=config.get('compress_after_hours', 24))
+            count = SampleStore().compact(before, chunk_seconds=config.get('chunk_duration', 7200))
+            logger.info(f"Compacted {count} samples in {time.time() - start_time:.2f} seconds")
+    except Exception as e:
+        logger.error(f"Failed to compact samples: {e}")
+        db.session.rollback()
+
+def archive_metrics(app):
+    """把超过归档期的原始样本转存为 Parquet 并清理过期归档"""
+    start_time = time.time()
+    store = get_metric_store(app)
+    if not isinstance(store, TieredMetricStore):
+        return
+    try:
+        config = app.config.get('MONITOR', {})
+        now = datetime.utcnow()
+        count = archive_cold_data(store.hot, store.archive, now - timedelta(days=config['archive_after_days']))
+        dropped = store.archive.delete_before(now - timedelta(days=config.get('archive_retention_days', 365)))
+        logger.info(
+            f"Archived {count} samples and dropped {dropped} archived days "
+            f"in {time.time() - start_time:.2f} seconds"
+        )
     except Exception as e:
-        logger.error(f"Failed to collect advanced metrics: {e}")
+        logger.error(f"Failed to archive metrics: {e}")
+        db.session.rollback()
+
+def evaluate_alert_rules(app):
+    """评估启用的告警规则，触发的规则记录到系统日志"""
+    try:
+        with app.app_context():
+            record_alerts(evaluate_alerts(get_metric_store(app)))
+    except Exception as e:
+        logger.error(f"Failed to evaluate alert rules: {e}")
+        db.session.rollback()
+
+def analyze_correlations(app, interval: timedelta = timedelta(minutes=30)):
+    """为目标序列在上个周期内新出现的异常事件生成根因相关性报告"""
+    try:
+        with app.app_context():
+            analyzer = get_correlation_analyzer(app)
+            since = datetime.utcnow() - interval
+            for target in app.config.get('MONITOR', {}).get('correlation_targets', ['cpu.usage']):
+                # 每个新事件一份报告（高、低两个方向），数量受 correlation_max_reports 限制
+                for event in analyzer.new_events(target, since):
+                    report = analyzer.create_report(target, event.start_time,
+                                                    max(event.end_time, event.start_time + timedelta(minutes=1)))
+                    contributors = [item['series'] for item in report.content['contributors'][:3]]
+                    logger.info(f"Correlation report for {target} anomaly at {event.start_time}: {contributors}")
+    except Exception as e:
+        logger.error(f"Failed to analyze correlations: {e}")
+        db.session.rollback()
+
+def log_system_event(level: str, event_type: str, message: str):
+    """记录系统事件"""
+    try:
+        db.session.add(SystemLog(level=level, type=event_type, message=message))
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Failed to log system event: {e}")
         db.session.rollback()
 
 def analyze_performance(app):
@@ -265,60 +325,43 @@ def analyze_performance(app):
             end_time = datetime.utcnow()
             start_time = end_time - timedelta(days=1)
             
-            # 获取性能数据
-            metrics = MonitorData.query.filter(
-                MonitorData.timestamp.between(start_time, end_time)
-            ).all()
-            
-            # 按类型分组数据
-            data_by_type = {}
-            for metric in metrics:
-                if metric.type not in data_by_type:
-                    data_by_type[metric.type] = []
-                data_by_type[metric.type].append({
-                    'timestamp': metric.timestamp,
-                    'value': metric.value
+            # 分析结果直接读取流式统计（写入时累计），代价只与序列数相关
+            # 各序列单位不同（百分比、字节数等），按序列分别统计，不按类型合并
+            analysis_results = get_streaming_stats(app).summarize_by_series(start_time, end_time)
+            if not analysis_results:
+                # 流式统计尚无状态时（如刚升级），由存储端分组聚合，不逐行读取样本
+                sums = get_metric_store(app).regression_sums(start_time, end_time)
+                analysis_results = summarize_by_series({
+                    key: RunningStats.from_sums(series_sums, start_time) for key, series_sums in sums.items()
                 })
             
-            # 分析结果
-            analysis_results = {}
-            
-            # 分析每种类型的指标
-            for metric_type, data in data_by_type.items():
-                values = [d['value'] for d in data]
-                if values:
-                    analysis_results[metric_type] = {
-                        'avg': sum(values) / len(values),
-                        'max': max(values),
-                        'min': min(values),
-                        'current': values[-1] if values else 0,
-                        'samples': len(values)
-                    }
-                    
-                    # 计算趋势
-                    if len(values) > 1:
-                        trend = values[-1] - values[0]
-                        analysis_results[metric_type]['trend'] = 'up' if trend > 0 else 'down'
-                        analysis_results[metric_type]['trend_value'] = abs(trend)
-            
-            # 生成图表
-            plt.figure(figsize=(12, 6))
-            for metric_type, data in data_by_type.items():
-                if data:
-                    timestamps = [d['timestamp'] for d in data]
-                    values = [d['value'] for d in data]
-                    plt.plot(timestamps, values, label=metric_type)
-            
-            plt.title('System Performance Metrics')
-            plt.xlabel('Time')
-            plt.ylabel('Value')
-            plt.legend()
-            plt.grid(True)
-            
-            # 保存图表
-            plot_path = f'static/performance_{datetime.now().strftime("%Y%m%d")}.png'
-            plt.savefig(plot_path)
-            plt.close()
+            # 各序列的 p50/p95/p99，由汇总桶草图合并得到
+            percentiles = {
+                f'{metric_type}.{metric_name}': values
+                for (metric_type, metric_name), values in get_metric_store(app).quantiles(start_time, end_time).items()
+            }
+            
+            # 分析周期内在线检测到的异常事件
+            anomalies = {}
+            for event_type, severity, count in db.session.query(
+                AnomalyEvent.type, AnomalyEvent.severity, db.func.count(AnomalyEvent.id)
+            ).filter(AnomalyEvent.start_time >= start_time).group_by(AnomalyEvent.type, AnomalyEvent.severity):
+                anomalies.setdefault(event_type, {})[severity] = count
+            
+            # 图表读取到最后一个完整的5分钟汇总桶，数据水位相同时图表内容不变
+            watermark = bucket_start(end_time, 300)
+            series = get_rollup_manager(app).read_range(
+                start_time, watermark - timedelta(microseconds=1), step=300
+            )
+            # 每个序列一条曲线，不同单位的序列不拼接到同一条线上
+            chart = line_chart('System Performance Metrics', 'Time', 'Value')
+            for (metric_type, metric_name), points in sorted(series.items()):
+                points = sorted(points, key=lambda point: point[0])
+                add_series(chart, f'{metric_type}.{metric_name}',
+                           [point[0] for point in points], [point[1] for point in points])
+            
+            # PNG 交给渲染进程生成，同一水位已渲染过时直接复用
+            plot_path = get_chart_renderer(app).submit('performance', watermark, chart)
             
             # 创建分析报告
             report = AnalysisReport(
@@ -326,6 +369,9 @@ def analyze_performance(app):
                 report_type='performance',
                 content={
                     'analysis': analysis_results,
+                    'percentiles': percentiles,
+                    'anomalies': anomalies,
+                    'chart': chart,
                     'plot_path': plot_path,
                     'period': {
                         'start': start_time.isoformat(),
@@ -337,11 +383,10 @@ def analyze_performance(app):
             db.session.add(report)
             db.session.commit()
             
-            # 检查性能问题
-            if analysis_results.get('cpu', {}).get('avg', 0) > 70:
-                log_system_event('WARNING', 'performance', 'High average CPU usage detected')
-            if analysis_results.get('memory', {}).get('avg', 0) > 80:
-                log_system_event('WARNING', 'performance', 'High average memory usage detected')
+            # 检查性能问题，阈值只作用于对应序列（如 cpu.usage、memory.usage）
+            for (metric_type, metric_name), avg, threshold in threshold_breaches(analysis_results):
+                log_system_event('WARNING', 'performance',
+                                 f'High average {metric_type}.{metric_name} detected: {avg:.1f} > {threshold}')
             
     except Exception as e:
         logger.error(f"Failed to analyze performance: {e}")
@@ -351,49 +396,42 @@ def predict_resource_usage(app):
     """预测资源使用趋势"""
     try:
         with app.app_context():
+            config = app.config.get('MONITOR', {})
             end_time = datetime.utcnow()
-            start_time = end_time - timedelta(days=7)  # 使用过去7天的数据
-            
-            # 获取历史数据
-            metrics = MonitorData.query.filter(
-                MonitorData.timestamp.between(start_time, end_time)
-            ).all()
-            
-            # 转换为DataFrame
-            df = pd.DataFrame([{
-                'timestamp': m.timestamp,
-                'type': m.type,
-                'metric': m.metric,
-                'value': m.value
-            } for m in metrics])
-            
-            # 按资源类型分组预测
+            start_time = end_time - timedelta(days=config.get('forecast_history_days', 28))
+            
+            # 模型只并入上次训练之后完整的1小时汇总，新序列读取完整历史
+            registry = get_model_registry(app)
+            registry.refresh(now=end_time)
+            registry.save()
+            forecasts = {}
+            for key in registry.keys():
+                forecast = registry.predict(key, horizon=24, refresh=False)
+                if forecast:
+                    forecasts[key] = forecast
+            
+            # 各序列的预测和置信区间
+            series_predictions = {
+                f'{type}.{metric}': {
+                    'timestamps': [timestamp.isoformat() for timestamp in forecast['timestamps']],
+                    'predicted': forecast['predicted'],
+                    'lower': forecast['lower'],
+                    'upper': forecast['upper'],
+                    'trend': forecast['trend'],
+                    'slope': forecast['slope']
+                }
+                for (type, metric), forecast in forecasts.items()
+            }
+            
+            # 核心资源单独列出
             predictions = {}
             for resource_type in ['cpu', 'memory', 'disk']:
-                resource_data = df[
-                    (df['type'] == resource_type) & 
-                    (df['metric'] == 'usage')
-                ].sort_values('timestamp')
-                
-                if len(resource_data) > 0:
-                    # 准备特征
-                    X = np.array(range(len(resource_data))).reshape(-1, 1)
-                    y = resource_data['value'].values
-                    
-                    # 训练模型
-                    model = LinearRegression()
-                    model.fit(X, y)
-                    
-                    # 预测未来24小时
-                    future_X = np.array(range(len(resource_data), len(resource_data) + 24)).reshape(-1, 1)
-                    future_y = model.predict(future_X)
-                    
-                    predictions[resource_type] = {
-                        'current': y[-1],
-                        'predicted': future_y.tolist(),
-                        'trend': 'up' if model.coef_[0] > 0 else 'down',
-                        'slope': float(model.coef_[0])
-                    }
+                forecast = forecasts.get((resource_type, 'usage'))
+                if forecast:
+                    predictions[resource_type] = dict(
+                        series_predictions[f'{resource_type}.usage'],
+                        current=forecast['current']
+                    )
             
             # 生成预测报告
             report = AnalysisReport(
@@ -401,6 +439,7 @@ def predict_resource_usage(app):
                 report_type='prediction',
                 content={
                     'predictions': predictions,
+                    'series': series_predictions,
                     'timestamp': datetime.utcnow().isoformat(),
                     'analysis_period': {
                         'start': start_time.isoformat(),
@@ -409,22 +448,16 @@ def predict_resource_usage(app):
                 }
             )
             
-            # 生成预测图表
-            plt.figure(figsize=(12, 8))
+            # 生成预测图表，预测只在模型并入新的小时数据后变化，以模型水位为键
+            chart = line_chart('Resource Usage Prediction (Next 24 Hours)', 'Time', 'Usage %')
             for resource_type, pred in predictions.items():
-                plt.plot(pred['predicted'], label=f'{resource_type} (predicted)')
-            plt.title('Resource Usage Prediction (Next 24 Hours)')
-            plt.xlabel('Hours')
-            plt.ylabel('Usage %')
-            plt.legend()
-            
-            # 保存图表
-            plot_path = f'static/predictions_{datetime.now().strftime("%Y%m%d")}.png'
-            plt.savefig(plot_path)
-            plt.close()
+                add_series(chart, f'{resource_type} (predicted)', pred['timestamps'], pred['predicted'],
+                           pred['lower'], pred['upper'])
+            watermark = max((registry.watermark((resource_type, 'usage')) for resource_type in predictions), default=None)
             
             # 更新报告内容
-            report.content['plot_path'] = plot_path
+            report.content['chart'] = chart
+            report.content['plot_path'] = get_chart_renderer(app).submit('predictions', watermark, chart) if predictions else None
             
             db.session.add(report)
             db.session.commit()
@@ -0,0 +1,16 @@
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+
+def bucket_start(timestamp: datetime, resolution: int) -> datetime:
+    """计算时间戳所在时间桶的起点"""
+    seconds = int((timestamp - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % resolution)
+
+def to_epoch_ms(timestamp: datetime) -> int:
+    """UTC 时间转换为毫秒时间戳"""
+    return (timestamp - EPOCH) // timedelta(milliseconds=1)
+
+def from_epoch_ms(value: int) -> datetime:
+    """毫秒时间戳转换为 UTC 时间"""
+    return EPOCH + timedelta(milliseconds=value)
@@ -0,0 +1,194 @@
+from typing import Dict, Any, List, Optional
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import hashlib
+import multiprocessing
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import matplotlib
+    RENDER_AVAILABLE = True
+except ImportError:
+    RENDER_AVAILABLE = False
+    logger.info("matplotlib not installed, PNG charts disabled (JSON charts still available)")
+
+def line_chart(title: str, xlabel: str, ylabel: str) -> Dict[str, Any]:
+    """创建折线图描述，图表数据只包含可 JSON 序列化的预聚合序列"""
+    return {'title': title, 'xlabel': xlabel, 'ylabel': ylabel, 'series': []}
+
+def add_series(chart: Dict[str, Any], name: str, x: List, y: List[float],
+               lower: Optional[List[float]] = None, upper: Optional[List[float]] = None) -> Dict[str, Any]:
+    """向图表添加一条序列，x 为时间时转换为 ISO 字符串，lower/upper 为可选的置信区间"""
+    series = {'name': name, 'x': [item.isoformat() if isinstance(item, datetime) else item for item in x], 'y': list(y)}
+    if lower is not None and upper is not None:
+        series['lower'] = list(lower)
+        series['upper'] = list(upper)
+    chart['series'].append(series)
+    return chart
+
+def to_plotly(chart: Dict[str, Any]) -> Dict[str, Any]:
+    """把图表描述转换为 plotly 的 figure JSON（data + layout），由浏览器端渲染"""
+    data = []
+    for series in chart['series']:
+        if 'lower' in series:
+            data.append({'type': 'scatter', 'mode': 'lines', 'x': series['x'], 'y': series['upper'],
+                         'line': {'width': 0}, 'showlegend': False, 'hoverinfo': 'skip', 'legendgroup': series['name']})
+            data.append({'type': 'scatter', 'mode': 'lines', 'x': series['x'], 'y': series['lower'],
+                         'line': {'width': 0}, 'fill': 'tonexty', 'opacity': 0.2, 'showlegend': False,
+                         'hoverinfo': 'skip', 'legendgroup': series['name']})
+        data.append({'type': 'scatter', 'mode': 'lines', 'name': series['name'], 'x': series['x'], 'y': series['y'],
+                     'legendgroup': series['name']})
+    return {
+        'data': data,
+        'layout': {
+            'title': {'text': chart['title']},
+            'xaxis': {'title': {'text': chart['xlabel']}},
+            'yaxis': {'title': {'text': chart['ylabel']}}
+        }
+    }
+
+def render_chart(chart: Dict[str, Any], path: str, size: tuple = (12, 6)) -> str:
+    """在渲染进程中用面向对象的 Agg 接口绘制 PNG（不使用 pyplot 全局状态），返回文件路径"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+
+    figure = Figure(figsize=size)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    dates = False
+    for series in chart['series']:
+        x = series['x']
+        if x and isinstance(x[0], str):
+            x = [datetime.fromisoformat(item) for item in x]
+            dates = True
+        line, = axes.plot(x, series['y'], label=series['name'])
+        if 'lower' in series:
+            axes.fill_between(x, series['lower'], series['upper'], color=line.get_color(), alpha=0.2)
+    if dates:
+        locator = AutoDateLocator()
+        axes.xaxis.set_major_locator(locator)
+        axes.xaxis.set_major_formatter(ConciseDateFormatter(locator))
+    axes.set_title(chart['title'])
+    axes.set_xlabel(chart['xlabel'])
+    axes.set_ylabel(chart['ylabel'])
+    if chart['series']:
+        axes.legend()
+    axes.grid(True)
+
+    # 先写临时文件再替换，页面不会读到写了一半的图片
+    temporary = f'{path}.{os.getpid()}.tmp'
+    figure.savefig(temporary, format='png')
+    os.replace(temporary, path)
+    return path
+
+class ChartRenderer:
+    """报告图表渲染
+
+    PNG 交给独立的渲染进程（spawn 启动，不继承调度线程和 pyplot 状态）生成，
+    文件名由 (报告, 数据水位) 决定：同一水位的图表已存在或正在渲染时直接复用，
+    数据没有变化就不会重新渲染。每个报告只保留最近 chart_keep 张图片。
+    """
+
+    def __init__(self, config: Dict):
+        self.chart_dir = config.get('chart_dir', 'data/charts')
+        self.keep = config.get('chart_keep', 10)
+        self.enabled = RENDER_AVAILABLE and config.get('chart_render', True)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._rendered = 0
+        self._reused = 0
+
+    @staticmethod
+    def filename(report: str, watermark: Any) -> str:
+        """(报告, 数据水位) 对应的图片文件名"""
+        key = watermark.isoformat() if isinstance(watermark, datetime) else str(watermark)
+        digest = hashlib.sha1(f'{report}|{key}'.encode()).hexdigest()[:16]
+        return f'{report}_{digest}.png'
+
+    def submit(self, report: str, watermark: Any, chart: Dict[str, Any]) -> Optional[str]:
+        """提交渲染任务，立即返回图片文件名（位于 chart_dir）；渲染不可用时返回 None"""
+        if not self.enabled:
+            return None
+        name = self.filename(report, watermark)
+        path = os.path.join(self.chart_dir, name)
+        with self._lock:
+            if name in self._pending or os.path.exists(path):
+                self._reused += 1
+                return name
+            if self._executor is None:
+                os.makedirs(self.chart_dir, exist_ok=True)
+                self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+            future = self._executor.submit(render_chart, chart, path)
+            self._pending[name] = future
+        future.add_done_callback(lambda done: self._finished(report, name, done))
+        return name
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """等待已提交的渲染完成"""
+        with self._lock:
+            futures = list(self._pending.values())
+        for future in futures:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def _finished(self, report: str, name: str, future: Future) -> None:
+        with self._lock:
+            self._pending.pop(name, None)
+        error = future.exception()
+        if error:
+            logger.error(f"Failed to render chart {name}: {error}")
+            if isinstance(error, BrokenProcessPool):
+                # 渲染进程异常退出后丢弃进程池，下次提交时重新启动
+                with self._lock:
+                    executor, self._executor = self._executor, None
+                if executor is not None:
+                    executor.shutdown(wait=False)
+            return
+        with self._lock:
+            self._rendered += 1
+        self._prune(report)
+
+    def _prune(self, report: str) -> None:
+        """删除该报告较早的图片，只保留最近 keep 张"""
+        try:
+            files = [os.path.join(self.chart_dir, name) for name in os.listdir(self.chart_dir)
+                     if name.startswith(f'{report}_') and name.endswith('.png')]
+            files.sort(key=os.path.getmtime, reverse=True)
+            for path in files[self.keep:]:
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Failed to prune charts for {report}: {e}")
+
+    def close(self) -> None:
+        """关闭渲染进程"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """渲染状态"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'pending': len(self._pending),
+                'rendered': self._rendered,
+                'reused': self._reused
+            }
+
+def get_chart_renderer(app) -> ChartRenderer:
+    """获取应用的图表渲染器，未初始化时按应用配置创建"""
+    renderer = getattr(app, 'chart_renderer', None)
+    if renderer is None:
+        renderer = ChartRenderer(app.config.get('MONITOR', {}))
+        app.chart_renderer = renderer
+    return renderer
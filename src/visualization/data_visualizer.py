@@ -1,22 +1,22 @@
 import pandas as pd
-import sqlite3
-from typing import List
+from typing import List, Union
 from datetime import datetime, timedelta
+from src.database.metric_store import MetricStore, as_metric_store, resolve_metric, metric_name
 
 class DataVisualizer:
-    def __init__(self, db_path: str):
-        self.db_path = db_path
+    def __init__(self, store: Union[MetricStore, str]):
+        # 兼容传入数据库路径的旧用法
+        self.store = as_metric_store(store)
         
     def get_metrics_data(self, metrics: List[str], days: int = 7) -> pd.DataFrame:
-        """从数据库获取指定指标的历史数据"""
-        query = """
-            SELECT timestamp, metric_name, metric_value 
-            FROM metrics 
-            WHERE metric_name IN ({})
-            AND timestamp >= datetime('now', '-{} days')
-        """.format(','.join(['?'] * len(metrics)), days)
-        
-        with sqlite3.connect(self.db_path) as conn:
-            df = pd.read_sql_query(query, conn, params=metrics)
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            return df 
\ No newline at end of file
+        """从指标存储获取指定指标的历史数据"""
+        now = datetime.utcnow()
+        points = self.store.read_range(now - timedelta(days=days), now, [resolve_metric(metric) for metric in metrics])
+        rows = [
+            (timestamp, metric_name(type, metric), value)
+            for (type, metric), series_points in points.items()
+            for timestamp, value in series_points
+        ]
+        df = pd.DataFrame(rows, columns=['timestamp', 'metric_name', 'metric_value'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        return df
\ No newline at end of file
@@ -6,11 +6,23 @@ from src.scheduler import init_scheduler
 from src.backup import BackupManager
 from src.assets import AssetManager
 from src.monitor.system_monitor import SystemMonitor
+from src.monitor.sampler import MetricsSampler
+from src.monitor.collectors import get_collector_manager
+from src.database.ingest import MetricIngestQueue
+from src.database.rollup import RollupManager
+from src.database.query_cache import get_query_cache
+from src.database.metric_store import get_metric_store
+from src.database.streaming_stats import get_streaming_stats
+from src.analysis.anomaly_detector import get_anomaly_detector
+from src.alert.rule_evaluator import alert_on_anomalies
+from src.visualization.chart_renderer import get_chart_renderer
 from pytz import timezone
 import logging
 import os
+import atexit
 from src.web.auth import auth_bp
 from src.web.routes import main_bp, api_bp
+from src.cli import rebuild_rollups_command, rebuild_stats_command, upgrade_indexes_command
 from sqlalchemy.sql import text
 from sqlalchemy import text
 
@@ -82,7 +94,70 @@ def create_app(config=None):
             'bytes_sent': 1000000000,
             'bytes_recv': 1000000000
         },
-        'retention_days': 30
+        'retention_days': 30,
+        'rollup_sketch_accuracy': 0.01,  # 汇总桶分位数草图的相对精度，0 表示不保存草图
+        'sketch_query_buckets': 60,  # 范围分位数最多合并的汇总桶数
+        'query_cache_size': 256,  # 查询结果缓存的最大条目数
+        'compress_after_hours': 24,  # 超过该时长的原始样本压缩为块
+        'chunk_duration': 7200,  # 压缩块的时间窗口(秒)
+        'raw_backend': 'database',  # 原始样本存储: database 或 segments(内存映射段文件，适合秒级采样)
+        'segment_dir': 'data/segments',  # 段文件目录
+        'segment_seconds': 3600,  # 单个段文件覆盖的时间窗口(秒)
+        'segment_dtype': 'float64',  # 段文件数值类型: float32 或 float64
+        'stats_resolution': 3600,  # 流式统计的时间桶(秒)
+        'stats_retention_hours': 168,  # 流式统计保留时长
+        'stats_checkpoint_interval': 60,  # 流式统计写入检查点的间隔(秒)
+        'forecast_history_days': 28,  # 预测使用的历史天数(1小时汇总)
+        'forecast_daily_harmonics': 3,  # 日周期傅里叶项阶数
+        'forecast_weekly_harmonics': 2,  # 周周期傅里叶项阶数
+        'forecast_workers': 0,  # 序列较多时并行拟合的进程数，0 表示在当前进程内计算
+        'forecast_decay': 0.999,  # 预测模型每小时的遗忘因子，1 表示不遗忘
+        'forecast_cache_size': 1024,  # 预测结果 LRU 缓存的最大条目数
+        'anomaly_ewma_alpha': 0.02,  # 异常检测 EWMA 均值/方差的平滑系数
+        'anomaly_window': 120,  # 中位数/MAD 滑动窗口的样本数
+        'anomaly_warmup': 30,  # EWMA 检测器开始判定前的样本数
+        'anomaly_z_threshold': 4.0,  # EWMA z 分数阈值
+        'anomaly_mad_threshold': 5.0,  # MAD 稳健分数阈值
+        'anomaly_seasonal_threshold': 4.0,  # 周内小时基线分数阈值
+        'anomaly_min_detectors': 1,  # 判为异常至少需要触发的检测器数
+        'anomaly_merge_gap': 300,  # 同一序列间隔不超过该秒数的异常合并为一个事件
+        'anomaly_relative_scale': 0.01,  # 分数尺度下限相对基线绝对值的比例，避免平稳序列的微小变化被判为异常
+        'anomaly_shift_samples': 30,  # 连续异常达到该样本数时视为水平位移，基线移到新水平
+        'correlation_targets': ['cpu.usage'],  # 出现异常事件时生成根因相关性报告的序列
+        'correlation_context_hours': 6,  # 事件之前作为基线的时长
+        'correlation_max_points': 360,  # 对齐网格的最大点数，决定网格步长
+        'correlation_max_lag': 10,  # 滞后互相关的最大滞后步数
+        'correlation_top': 10,  # 报告中列出的关联序列数
+        'correlation_max_processes': 50,  # 参与分析的进程数（按窗口内 CPU 峰值）
+        'correlation_max_reports': 5,  # 每个目标每次定时分析最多生成的报告数（按事件分数绝对值）
+        'archive_after_days': 7,  # 超过该天数的原始样本转存为 Parquet 归档（需要 pyarrow，0 表示不归档）
+        'archive_retention_days': 365,  # 归档保留天数
+        'archive_dir': 'data/archive',  # 归档目录，按 day=/series= 分区
+        'chart_dir': 'data/charts',  # 报告 PNG 图表目录（需要 matplotlib）
+        'chart_keep': 10,  # 每个报告保留的图表数
+        'sample_interval': 5,  # 后台采样间隔(秒)
+        'sample_history': 720,  # 环形缓冲区保留的快照数
+        # 采集插件配置：interval 采集间隔(秒)，timeout 超时(秒)，enabled 是否启用
+        'collectors': {
+            'cpu': {'interval': 60},
+            'memory': {'interval': 60},
+            'disk': {'interval': 300},
+            'diskio': {'interval': 60},
+            'net': {'interval': 60},
+            'load': {'interval': 60},
+            'processes': {
+                'interval': 300,
+                'retention': {
+                    'top_cpu': 10,  # 按 CPU 保留的进程数
+                    'top_memory': 10,  # 按内存保留的进程数
+                    'min_cpu_percent': 0.5,  # 最低活跃阈值
+                    'min_memory_percent': 0.5,
+                    'aggregate_by_name': False  # 是否按进程名聚合
+                }
+            },
+            'temperatures': {'interval': 600, 'timeout': 30},
+            'connections': {'interval': 300}
+        }
     })
     
     # 添加 CSRF 保护
@@ -172,8 +247,55 @@ def create_app(config=None):
     # 初始化认证
     init_auth(app)
     
-    # 初始化系统监控
-    app.config['monitor'] = SystemMonitor(app.config['MONITOR'])
+    # 统一指标存储，所有写入路径（写入队列、采集插件、分析导出组件）共用
+    app.rollup_manager = RollupManager(app.config['MONITOR'])
+    app.metric_store = get_metric_store(app)
+    
+    # 每批数据落库后持续合并进多粒度汇总表
+    app.metric_store.add_listener(app.rollup_manager.ingest)
+    
+    # 流式统计在写入时累计，分析报告直接读取预先计算的状态
+    app.streaming_stats = get_streaming_stats(app)
+    app.metric_store.add_listener(app.streaming_stats.ingest)
+    
+    # 在线异常检测，异常事件在写入时立即落库，告警和仪表板无需等待定时分析
+    app.anomaly_detector = get_anomaly_detector(app)
+    app.metric_store.add_listener(app.anomaly_detector.ingest)
+    # 新异常事件立即评估 aggregation 为 anomaly 的告警规则
+    app.anomaly_detector.add_listener(alert_on_anomalies)
+    
+    # 汇总合并之后再失效查询缓存中包含最新时间桶的结果
+    app.query_cache = get_query_cache(app)
+    app.metric_store.add_listener(app.query_cache.on_ingest)
+    
+    def checkpoint_streaming_stats():
+        with app.app_context():
+            app.streaming_stats.checkpoint()
+    
+    # 退出时在写入队列停止之后保存最后一次检查点（atexit 按注册的逆序执行）
+    atexit.register(checkpoint_streaming_stats)
+    
+    # 初始化监控数据写入队列，所有采集方通过它批量落库
+    app.ingest_queue = MetricIngestQueue(app, app.config['MONITOR'])
+    app.ingest_queue.start()
+    atexit.register(app.ingest_queue.stop)
+    
+    # 初始化采集调度器，各采集插件按自己的间隔运行
+    app.collector_manager = get_collector_manager(app)
+    app.collector_manager.start()
+    atexit.register(app.collector_manager.stop)
+    
+    # 初始化系统监控，与采集调度器共用采集插件和进程跟踪器
+    app.config['monitor'] = SystemMonitor(app.config['MONITOR'], ingest_queue=app.ingest_queue,
+                                          collectors=app.collector_manager.registry)
+    
+    # 初始化后台指标采样器，实时接口统一读取其快照
+    app.sampler = MetricsSampler(app.config['MONITOR'])
+    app.sampler.start()
+    
+    # 报告图表在独立的渲染进程中生成，不占用调度线程
+    app.chart_renderer = get_chart_renderer(app)
+    atexit.register(app.chart_renderer.close)
     
     # 初始化任务调度器
     init_scheduler(app)
@@ -199,6 +321,11 @@ def create_app(config=None):
     app.register_blueprint(main_bp)
     app.register_blueprint(api_bp)
     
+    # 注册命令行命令
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(rebuild_stats_command)
+    app.cli.add_command(upgrade_indexes_command)
+    
     # 在 create_app 函数中添加控制台日志处理器
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(logging.Formatter(log_format))
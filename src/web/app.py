@@ -3,12 +3,14 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
 from src.models import db, User
+from src.monitor.sampler import MetricsSampler
+from src.monitor.collectors import get_collector_manager
+from src.database.schema import ensure_columns, ensure_indexes
 import os
 import logging
 from logging.handlers import RotatingFileHandler
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
-import psutil
 from datetime import datetime
 import yaml
 
@@ -37,6 +39,11 @@ def create_app():
     login_manager.login_view = 'auth.login'
     login_manager.init_app(app)
     
+    # 初始化后台指标采样器
+    app.config['MONITOR'] = config.get('monitor', {})
+    app.sampler = MetricsSampler(app.config['MONITOR'])
+    app.sampler.start()
+    
     @login_manager.user_loader
     def load_user(user_id):
         return User.query.get(int(user_id))
@@ -56,19 +63,17 @@ def create_app():
             # 检查数据库连接
             db.session.execute('SELECT 1')
             
-            # 检查系统资源
-            cpu_percent = psutil.cpu_percent(interval=0.1)
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
+            # 检查系统资源（读取采样器快照）
+            snapshot = app.sampler.current()
             
             return {
                 'status': 'healthy',
                 'timestamp': datetime.now().isoformat(),
                 'database': 'connected',
                 'system': {
-                    'cpu': cpu_percent,
-                    'memory': memory.percent,
-                    'disk': disk.percent
+                    'cpu': snapshot['cpu']['usage'],
+                    'memory': snapshot['memory']['percent'],
+                    'disk': snapshot['disk']['percent']
                 }
             }, 200
         except Exception as e:
@@ -99,6 +104,9 @@ def create_app():
     # 初始化数据库
     with app.app_context():
         db.create_all()
+        # create_all 不会修改已有的表，为旧数据库补加新列和索引
+        ensure_columns()
+        ensure_indexes()
         
         # 创建默认管理员用户（如果不存在）
         if not User.query.filter_by(username='admin').first():
@@ -117,47 +125,10 @@ def init_scheduler(app):
     """初始化定时任务"""
     scheduler = BackgroundScheduler()
     
-    def collect_metrics_job():
-        """收集系统指标"""
-        with app.app_context():
-            from src.models import MonitorData, db
-            
-            # 收集系统指标
-            cpu_percent = psutil.cpu_percent()
-            memory = psutil.virtual_memory()
-            disk = psutil.disk_usage('/')
-            
-            # 保存到数据库
-            metrics = MonitorData(
-                type='system',
-                metric='cpu_usage',
-                value=cpu_percent
-            )
-            db.session.add(metrics)
-            
-            metrics = MonitorData(
-                type='system',
-                metric='memory_usage',
-                value=memory.percent
-            )
-            db.session.add(metrics)
-            
-            metrics = MonitorData(
-                type='system',
-                metric='disk_usage',
-                value=disk.percent
-            )
-            db.session.add(metrics)
-            
-            db.session.commit()
-    
-    # 添加定时任务
-    scheduler.add_job(
-        func=collect_metrics_job,
-        trigger='interval',
-        minutes=5,
-        id='collect_metrics_job'
-    )
+    # 指标采集交给采集调度器，各插件按自己的间隔运行
+    app.collector_manager = get_collector_manager(app)
+    app.collector_manager.start()
+    atexit.register(app.collector_manager.stop)
     
     scheduler.start()
     atexit.register(lambda: scheduler.shutdown())
@@ -1,20 +1,29 @@
-from flask import Blueprint, render_template, jsonify, request, Response, stream_with_context, flash, redirect, url_for
+from flask import Blueprint, render_template, jsonify, request, Response, stream_with_context, flash, redirect, url_for, current_app, send_from_directory, abort
 from flask_login import login_required, current_user
-from src.models import Task, SystemLog, MonitorData, Asset, Backup, ProcessData, db, MetricAlert, AnalysisReport, AutomationRule
+from src.models import Task, SystemLog, Asset, Backup, ProcessData, db, MetricAlert, AnalysisReport, AutomationRule, AnomalyEvent
 from src.web.auth import permission_required
-import psutil
 from datetime import datetime, timedelta
 from sqlalchemy import desc
 import json
+import os
 import re
 import csv
 import io
-import subprocess
-from typing import Dict, Optional
+from typing import Optional
 import logging
 import nmap
 from flask_wtf.csrf import generate_csrf
 from src.utils.network_checker import NetworkChecker
+from src.database.rollup import get_rollup_manager
+from src.database.downsample import METHODS as DOWNSAMPLE_METHODS
+from src.database.metric_query import get_query_engine, parse_selector
+from src.database.metric_store import get_metric_store
+from src.alert.rule_evaluator import parse_aggregation
+from src.analysis.correlation import get_correlation_analyzer
+from src.database.query_cache import align_range, block_ranges, get_query_cache
+from src.database.streaming_stats import get_streaming_stats
+from src.database.sketch import QuantileSketch, sketch_quantiles
+from src.visualization.chart_renderer import get_chart_renderer, to_plotly
 
 main_bp = Blueprint('main', __name__)
 api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -24,10 +33,8 @@ logger = logging.getLogger(__name__)
 @main_bp.route('/')
 @login_required
 def index():
-    # 获取系统信息
-    cpu_percent = psutil.cpu_percent()
-    memory = psutil.virtual_memory()
-    disk = psutil.disk_usage('/')
+    # 获取系统信息（读取后台采样器的最新快照）
+    snapshot = current_app.sampler.current()
     
     # 获取最近的任务
     recent_tasks = Task.query.order_by(desc(Task.created_at)).limit(5).all()
@@ -36,9 +43,9 @@ def index():
     recent_logs = SystemLog.query.order_by(desc(SystemLog.timestamp)).limit(5).all()
     
     return render_template('index.html',
-                         cpu_percent=cpu_percent,
-                         memory_percent=memory.percent,
-                         disk_usage=disk.percent,
+                         cpu_percent=snapshot['cpu']['usage'],
+                         memory_percent=snapshot['memory']['percent'],
+                         disk_usage=snapshot['disk']['percent'],
                          network_speed="计算中...",
                          recent_tasks=recent_tasks,
                          recent_logs=recent_logs)
@@ -50,12 +57,15 @@ def monitor():
     end_time = datetime.utcnow()
     start_time = end_time - timedelta(hours=24)
     
-    monitor_data = MonitorData.query.filter(
-        MonitorData.timestamp.between(start_time, end_time)
-    ).order_by(MonitorData.timestamp.asc()).all()
+    # 按图表宽度降采样，返回的点数与时间范围无关
+    max_points = request.args.get('max_points', 500, type=int)
+    monitor_data = cached_read_range(start_time, end_time, max(max_points, 3))
     
-    # 获取进程信息
-    processes = ProcessData.query.order_by(desc(ProcessData.cpu_percent)).limit(10).all()
+    # 获取最近一次采集的 Top 进程，走 (timestamp, cpu_percent) 索引
+    latest_time = db.session.query(db.func.max(ProcessData.timestamp)).scalar()
+    processes = ProcessData.query.filter(
+        ProcessData.timestamp == latest_time
+    ).order_by(desc(ProcessData.cpu_percent)).limit(10).all() if latest_time else []
     
     return render_template('monitor.html',
                          monitor_data=monitor_data,
@@ -141,17 +151,15 @@ def logs():
 @login_required
 def metrics_summary():
     try:
-        cpu_percent = psutil.cpu_percent()
-        memory = psutil.virtual_memory()
-        disk = psutil.disk_usage('/')
+        snapshot = current_app.sampler.current()
         
         return jsonify({
             'status': 'success',
             'data': {
-                'cpu_percent': cpu_percent,
-                'memory_percent': memory.percent,
-                'disk_usage': disk.percent,
-                'timestamp': datetime.utcnow().isoformat()
+                'cpu_percent': snapshot['cpu']['usage'],
+                'memory_percent': snapshot['memory']['percent'],
+                'disk_usage': snapshot['disk']['percent'],
+                'timestamp': snapshot['timestamp']
             }
         })
     except Exception as e:
@@ -455,159 +463,208 @@ def export_assets():
             'message': str(e)
         }), 500 
 
-def get_cpu_temperature() -> Optional[float]:
-    """获取 CPU 温度"""
-    methods = [
-        # 方法1: 从 thermal_zone 读取
-        lambda: open('/sys/class/thermal/thermal_zone0/temp', 'r').read().strip(),
-        # 方法2: 从 coretemp 读取
-        lambda: open('/sys/class/hwmon/hwmon0/temp1_input', 'r').read().strip(),
-        # 方法3: 使用 sensors 命令
-        lambda: subprocess.check_output(['sensors'], universal_newlines=True)
-    ]
-    
-    for method in methods:
-        try:
-            result = method()
-            if isinstance(result, str) and 'Core 0' in result:
-                # sensors 命令输出
-                for line in result.split('\n'):
-                    if 'Core 0' in line:
-                        return float(line.split('+')[1].split('°')[0])
-            else:
-                # thermal_zone 或 hwmon 读取
-                return float(result) / 1000.0
-        except Exception as e:
-            logger.debug(f"Temperature reading method failed: {str(e)}")
-            continue
-            
-    logger.warning("Failed to read CPU temperature from all methods")
-    return None
-
-def get_disk_temperature() -> Dict[str, float]:
-    """获取硬盘温度"""
-    temperatures = {}
-    
-    try:
-        # 获取所有磁盘设备
-        disks = []
-        output = subprocess.check_output(['lsblk', '-d', '-o', 'NAME'], universal_newlines=True)
-        for line in output.split('\n')[1:]:  # 跳过标题行
-            if line.strip():
-                disks.append(line.strip())
-        
-        # 获取每个磁盘的温度
-        for disk in disks:
-            try:
-                output = subprocess.check_output(
-                    ['sudo', 'smartctl', '-A', f'/dev/{disk}'],
-                    universal_newlines=True
-                )
-                for line in output.split('\n'):
-                    if any(temp in line.lower() for temp in ['temperature_celsius', 'airflow_temp']):
-                        temp = float(line.split()[9])
-                        temperatures[f'/dev/{disk}'] = temp
-                        break
-            except Exception as e:
-                logger.debug(f"Failed to read temperature for disk {disk}: {str(e)}")
-                
-    except Exception as e:
-        logger.warning(f"Failed to list block devices: {str(e)}")
-        
-    if not temperatures:
-        logger.warning("No disk temperatures could be read")
-        
-    return temperatures
-
 @api_bp.route('/metrics/realtime')
 @login_required
 def get_realtime_metrics():
     """获取实时系统指标"""
     try:
-        # CPU 信息
-        cpu_percent = psutil.cpu_percent(interval=1)
-        cpu_count = psutil.cpu_count()
-        cpu_freq = psutil.cpu_freq()
-        
-        # 内存信息
-        memory = psutil.virtual_memory()
+        # 直接读取后台采样器的最新快照，不在请求线程中采样
+        snapshot = current_app.sampler.current()
         
-        # 磁盘信息
-        disk = psutil.disk_usage('/')
-        
-        # 网络信息
-        net_io = psutil.net_io_counters()
+        return jsonify({
+            'status': 'success',
+            'data': snapshot
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500 
+
+@api_bp.route('/metrics/recent')
+@login_required
+def get_recent_metrics():
+    """获取最近 N 个采样快照"""
+    try:
+        limit = request.args.get('limit', 60, type=int)
+        snapshots = current_app.sampler.history(limit)
         
-        # 系统负载
-        load_avg = psutil.getloadavg()
+        return jsonify({
+            'status': 'success',
+            'data': snapshots
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500 
+
+@api_bp.route('/metrics/history')
+@login_required
+def get_metrics_history():
+    """获取降采样后的历史序列，用于绘制图表"""
+    try:
+        hours = request.args.get('hours', 24, type=float)
+        max_points = request.args.get('max_points', 500, type=int)
+        method = request.args.get('method', 'lttb')
+        if method not in DOWNSAMPLE_METHODS:
+            return jsonify({
+                'status': 'error',
+                'message': f'Unsupported method: {method}'
+            }), 400
+        series = [
+            tuple(item.split('.', 1)) for item in request.args.getlist('series') if '.' in item
+        ] or None
         
-        # 获取TOP进程
-        processes = []
-        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'status']):
-            try:
-                pinfo = proc.info
-                processes.append({
-                    'pid': pinfo['pid'],
-                    'name': pinfo['name'],
-                    'cpu_percent': pinfo['cpu_percent'] or 0,
-                    'memory_percent': pinfo['memory_percent'] or 0,
-                    'status': pinfo['status']
-                })
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                pass
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(hours=hours)
+        result = cached_read_range(start_time, end_time, max(max_points, 3), series, method)
         
-        # 按 CPU 使用率排序,取前10个
-        processes.sort(key=lambda x: x['cpu_percent'], reverse=True)
-        processes = processes[:10]
+        return jsonify({
+            'status': 'success',
+            'data': {
+                f'{type}.{metric}': [
+                    {'timestamp': point[0].isoformat(), 'value': point[1], 'min': point[2], 'max': point[3]}
+                    for point in points
+                ]
+                for (type, metric), points in result.items()
+            }
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+def cached_read_range(start_time: datetime, end_time: datetime, max_points: int,
+                      series: Optional[list] = None, method: str = 'lttb') -> dict:
+    """带缓存的降采样读取，范围按每个点的时间跨度对齐，同一跨度内的重复轮询命中缓存"""
+    start_time, end_time = align_range(start_time, end_time, (end_time - start_time).total_seconds() / max_points)
+    key = ('read_range', start_time, end_time, max_points, tuple(series) if series else None, method)
+    return get_query_cache(current_app).get_or_compute(
+        key, end_time,
+        lambda: get_rollup_manager(current_app).read_range(
+            start_time, end_time, max_points=max_points, series=series, method=method
+        )
+    )
+
+@api_bp.route('/metrics/query')
+@login_required
+def query_metrics():
+    """时序查询：按选择器、时间范围、步长和聚合函数返回分桶后的序列"""
+    try:
+        end_time = parse_query_time(request.args.get('end')) or datetime.utcnow()
+        start_time = parse_query_time(request.args.get('start')) or end_time - timedelta(hours=1)
+        if start_time >= end_time:
+            raise ValueError('start must be earlier than end')
+        step = request.args.get('step', type=float) or max((end_time - start_time).total_seconds() / 300, 60)
+        agg = request.args.get('agg', 'avg')
+        percentile = request.args.get('q', 95, type=float)
+        selector = request.args.get('selector', 'cpu.usage')
         
-        # 获取温度信息
-        cpu_temp = get_cpu_temperature()
-        disk_temps = get_disk_temperature()
+        data = get_query_engine(current_app).query_json(selector, start_time, end_time, step, agg, percentile)
+        return jsonify({
+            'status': 'success',
+            'step': step,
+            'agg': agg,
+            'data': data
+        })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Metrics query failed: {e}")
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 500
+
+@api_bp.route('/metrics/percentiles')
+@login_required
+def query_percentiles():
+    """时间范围内各序列的分位数，由汇总桶中的分位数草图合并得到，不读取原始样本"""
+    try:
+        end_time = parse_query_time(request.args.get('end')) or datetime.utcnow()
+        start_time = parse_query_time(request.args.get('start')) or end_time - timedelta(hours=1)
+        if start_time >= end_time:
+            raise ValueError('start must be earlier than end')
+        qs = tuple(float(item) / 100 for item in request.args.get('q', '50,95,99').split(','))
+        if not all(0 <= q <= 1 for q in qs):
+            raise ValueError('Percentiles must be between 0 and 100')
+        series = parse_selector(request.args.get('selector', 'cpu.usage'))
+        wildcard_types = {type for type, metric in series if metric == '*'}
         
+        start_time, end_time = align_range(start_time, end_time, 60)
+        # 按小时对齐的块缓存草图，写入只使最新的一块失效；首尾块裁剪到查询范围后合并
+        blocks = [(max(block_start, start_time), min(block_end, end_time))
+                  for block_start, block_end in block_ranges(start_time, end_time, 3600)]
+        parts = get_query_cache(current_app).get_or_compute_blocks(
+            ('sketches', tuple(series)), blocks,
+            lambda block_start, block_end: get_metric_store(current_app).sketches(
+                block_start, block_end - timedelta(microseconds=1), None if wildcard_types else series
+            )
+        )
+        merged = {}
+        for part in parts:
+            for key, sketch in part.items():
+                merged.setdefault(key, QuantileSketch(sketch.relative_accuracy)).merge(sketch)
+        result = sketch_quantiles(merged, qs)
         return jsonify({
             'status': 'success',
             'data': {
-                'cpu': {
-                    'usage': cpu_percent,
-                    'count': cpu_count,
-                    'freq_current': cpu_freq.current if cpu_freq else 0,
-                    'freq_min': cpu_freq.min if cpu_freq else 0,
-                    'freq_max': cpu_freq.max if cpu_freq else 0,
-                    'load_avg': load_avg
-                },
-                'memory': {
-                    'total': memory.total,
-                    'available': memory.available,
-                    'used': memory.used,
-                    'percent': memory.percent
-                },
-                'disk': {
-                    'total': disk.total,
-                    'used': disk.used,
-                    'free': disk.free,
-                    'percent': disk.percent
-                },
-                'network': {
-                    'bytes_sent': net_io.bytes_sent,
-                    'bytes_recv': net_io.bytes_recv,
-                    'packets_sent': net_io.packets_sent,
-                    'packets_recv': net_io.packets_recv,
-                    'errin': net_io.errin,
-                    'errout': net_io.errout
-                },
-                'processes': processes,
-                'temperature': {
-                    'cpu': cpu_temp,
-                    'disks': disk_temps
-                },
-                'timestamp': datetime.now().isoformat()
+                f'{type}.{metric}': values for (type, metric), values in result.items()
+                if (type, metric) in series or type in wildcard_types
             }
         })
+    except ValueError as e:
+        return jsonify({
+            'status': 'error',
+            'message': str(e)
+        }), 400
     except Exception as e:
+        logger.error(f"Percentile query failed: {e}")
         return jsonify({
             'status': 'error',
             'message': str(e)
-        }), 500 
+        }), 500
+
+def parse_query_time(value: Optional[str]) -> Optional[datetime]:
+    """解析查询时间：ISO 8601 字符串或秒级 Unix 时间戳（UTC）"""
+    if not value:
+        return None
+    try:
+        return datetime.utcfromtimestamp(float(value))
+    except ValueError:
+        return datetime.fromisoformat(value)
+
+@api_bp.route('/metrics/ingest')
+@login_required
+def get_ingest_stats():
+    """获取监控数据写入队列状态"""
+    return jsonify({
+        'status': 'success',
+        'data': current_app.ingest_queue.get_stats()
+    })
+
+@api_bp.route('/metrics/cache')
+@login_required
+def get_query_cache_stats():
+    """获取查询缓存命中统计"""
+    return jsonify({
+        'status': 'success',
+        'data': get_query_cache(current_app).get_stats()
+    })
+
+@api_bp.route('/metrics/collectors')
+@login_required
+def get_collector_stats():
+    """获取各采集插件的运行状态和耗时"""
+    return jsonify({
+        'status': 'success',
+        'data': current_app.collector_manager.get_stats()
+    })
 
 @api_bp.route('/logs/export', methods=['GET'])
 @login_required
@@ -690,6 +747,11 @@ def log_system_event(level: str, event_type: str, message: str, user_id: Optiona
 def manage_alerts():
     if request.method == 'POST':
         data = request.get_json()
+        aggregation = data.get('aggregation', 'avg')
+        try:
+            parse_aggregation(aggregation)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
         alert = MetricAlert(
             name=data['name'],
             metric_type=data['metric_type'],
@@ -697,6 +759,7 @@ def manage_alerts():
             condition=data['condition'],
             threshold=float(data['threshold']),
             duration=int(data['duration']),
+            aggregation=aggregation,
             severity=data['severity'],
             notify_channels=data['notify_channels']
         )
@@ -709,6 +772,9 @@ def manage_alerts():
         'id': alert.id,
         'name': alert.name,
         'metric_type': alert.metric_type,
+        'metric_name': alert.metric_name,
+        'aggregation': alert.aggregation or 'avg',
+        'condition': alert.condition,
         'threshold': alert.threshold,
         'enabled': alert.enabled
     } for alert in alerts])
@@ -765,14 +831,37 @@ def analysis():
         report_type='prediction'
     ).order_by(AnalysisReport.created_at.desc()).first()
     
+    # 获取最新的根因相关性报告
+    correlation_report = AnalysisReport.query.filter_by(
+        report_type='correlation'
+    ).order_by(AnalysisReport.created_at.desc()).first()
+    
     return render_template('analysis.html',
                          performance_report=performance_report,
-                         prediction_report=prediction_report)
+                         prediction_report=prediction_report,
+                         correlation_report=correlation_report)
 
 @api_bp.route('/analysis/performance')
 @login_required
 def get_performance_analysis():
-    """获取性能分析数据"""
+    """获取性能分析数据
+
+    指定 hours 时返回最近 hours 小时的实时统计（读取流式统计状态），
+    否则返回最近的性能分析报告。
+    """
+    hours = request.args.get('hours', type=int)
+    if hours:
+        end_time = datetime.utcnow()
+        start_time = end_time - timedelta(hours=hours)
+        return jsonify({
+            'status': 'success',
+            'data': get_streaming_stats(current_app).summarize_by_series(start_time, end_time),
+            'period': {
+                'start': start_time.isoformat(),
+                'end': end_time.isoformat()
+            }
+        })
+    
     days = request.args.get('days', 7, type=int)
     reports = AnalysisReport.query.filter_by(
         report_type='performance'
@@ -787,6 +876,113 @@ def get_performance_analysis():
         'created_at': report.created_at.isoformat()
     } for report in reports])
 
+@api_bp.route('/anomalies')
+@login_required
+def get_anomalies():
+    """获取最近的异常事件（写入时在线检测），可按 type/metric/severity 过滤"""
+    hours = request.args.get('hours', 24, type=int)
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    query = AnomalyEvent.query.filter(AnomalyEvent.start_time >= datetime.utcnow() - timedelta(hours=hours))
+    for field in ('type', 'metric', 'severity'):
+        if request.args.get(field):
+            query = query.filter(getattr(AnomalyEvent, field) == request.args[field])
+    events = query.order_by(AnomalyEvent.start_time.desc()).limit(limit).all()
+    
+    return jsonify({
+        'status': 'success',
+        'data': [{
+            'id': event.id,
+            'type': event.type,
+            'metric': event.metric,
+            'start_time': event.start_time.isoformat(),
+            'end_time': event.end_time.isoformat(),
+            'detectors': event.detectors,
+            'direction': event.direction,
+            'value': event.value,
+            'expected': event.expected,
+            'score': event.score,
+            'sample_count': event.sample_count,
+            'severity': event.severity
+        } for event in events]
+    })
+
+@api_bp.route('/analysis/correlation', methods=['GET', 'POST'])
+@login_required
+def correlation_analysis():
+    """根因相关性分析
+
+    GET 返回最近的 correlation 报告；POST 按 target（默认 cpu.usage）和事件窗口
+    start/end（默认目标最近一次异常事件）生成新报告。
+    """
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            incident_start = parse_query_time(data.get('start'))
+            incident_end = parse_query_time(data.get('end'))
+            if incident_start and incident_end and incident_start >= incident_end:
+                raise ValueError('start must be earlier than end')
+            report = get_correlation_analyzer(current_app).create_report(
+                data.get('target', 'cpu.usage'), incident_start, incident_end
+            )
+        except ValueError as e:
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 400
+        except Exception as e:
+            logger.error(f"Correlation analysis failed: {e}")
+            db.session.rollback()
+            return jsonify({
+                'status': 'error',
+                'message': str(e)
+            }), 500
+    else:
+        report = AnalysisReport.query.filter_by(
+            report_type='correlation'
+        ).order_by(AnalysisReport.created_at.desc()).first()
+        if not report:
+            return jsonify({
+                'status': 'error',
+                'message': 'No correlation report available'
+            }), 404
+    
+    return jsonify({
+        'status': 'success',
+        'data': report.content,
+        'created_at': report.created_at.isoformat()
+    })
+
+@api_bp.route('/analysis/<report_type>/chart')
+@login_required
+def get_report_chart(report_type):
+    """获取最近一份报告的图表数据（plotly figure JSON，由浏览器端渲染）"""
+    report = AnalysisReport.query.filter_by(
+        report_type=report_type
+    ).order_by(
+        AnalysisReport.created_at.desc()
+    ).first()
+    
+    if not report or not (report.content or {}).get('chart'):
+        return jsonify({
+            'status': 'error',
+            'message': 'No chart data available'
+        }), 404
+    
+    return jsonify({
+        'status': 'success',
+        'data': to_plotly(report.content['chart']),
+        'created_at': report.created_at.isoformat()
+    })
+
+@main_bp.route('/charts/<path:name>')
+@login_required
+def chart_image(name):
+    """报告 PNG 图表"""
+    renderer = get_chart_renderer(current_app)
+    if not renderer.enabled:
+        abort(404)
+    return send_from_directory(os.path.abspath(renderer.chart_dir), name, max_age=86400)
+
 @api_bp.route('/analysis/prediction')
 @login_required
 def get_resource_prediction():
@@ -0,0 +1,34 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.models import db
+
+class DatabaseTestCase(unittest.TestCase):
+    """使用内存 SQLite 数据库的测试基类
+
+    每个测试创建独立的 Flask 应用并建表。默认推入应用上下文，测试结束时
+    释放会话并弹出上下文；被测组件在后台线程中自行进入应用上下文时，
+    子类把 push_context 设为 False。
+    """
+
+    push_context = True
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        if self.push_context:
+            self.ctx = self.app.app_context()
+            self.ctx.push()
+            db.create_all()
+        else:
+            with self.app.app_context():
+                db.create_all()
+
+    def tearDown(self):
+        if self.push_context:
+            db.session.remove()
+            self.ctx.pop()
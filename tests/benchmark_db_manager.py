@@ -0,0 +1,36 @@
+"""DatabaseManager 写入吞吐基准
+
+用法: python tests/benchmark_db_manager.py [保存次数]
+"""
+import sys
+import os
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.db_manager import DatabaseManager
+
+def main():
+    saves = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    metrics = {f'metric_{i}': float(i) for i in range(10)}
+
+    with tempfile.TemporaryDirectory() as directory:
+        # 不配置 mongodb / mysql，只测 SQLite，避免依赖外部服务
+        manager = DatabaseManager({
+            'db_path': os.path.join(directory, 'bench.db'),
+            'spool_dir': os.path.join(directory, 'spool')
+        })
+
+        start = time.perf_counter()
+        for _ in range(saves):
+            manager.save_metrics(metrics)
+        enqueued = time.perf_counter() - start
+        manager.flush()
+        elapsed = time.perf_counter() - start
+        manager.close()
+
+    print(f"{saves} saves x {len(metrics)} metrics: save_metrics {enqueued / saves * 1e6:.1f} us/call, "
+          f"{saves / elapsed:.0f} saves/s, {saves * len(metrics) / elapsed:.0f} rows/s end to end")
+
+if __name__ == '__main__':
+    main()
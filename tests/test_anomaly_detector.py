@@ -0,0 +1,114 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from datetime import datetime, timedelta
+from tests.base import DatabaseTestCase
+from src.models import db, AnomalyEvent, MetricAlert, SystemLog
+from src.database.streaming_stats import StreamingStats
+from src.analysis.anomaly_detector import AnomalyDetector
+from src.alert.rule_evaluator import alert_on_anomalies
+
+class TestAnomalyDetector(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rng = np.random.default_rng(0)
+        self.start = datetime(2024, 1, 1)
+
+    def _rows(self, values, start=None, interval=60, metric='usage'):
+        start = start or self.start
+        return [{'type': 'cpu', 'metric': metric, 'value': float(value), 'timestamp': start + timedelta(seconds=i * interval)}
+                for i, value in enumerate(values)]
+
+    def test_spike_opens_single_merged_event(self):
+        detector = AnomalyDetector({})
+        received = []
+        detector.add_listener(received.extend)
+        values = 50 + self.rng.normal(0, 1, 300)
+        values[200:203] = 90
+        detector.ingest(self._rows(values[:201]))
+        detector.ingest(self._rows(values[201:], start=self.start + timedelta(minutes=201)))
+
+        events = AnomalyEvent.query.all()
+        self.assertEqual(len(events), 1)
+        event = events[0]
+        self.assertEqual(event.start_time, self.start + timedelta(minutes=200))
+        self.assertEqual(event.end_time, self.start + timedelta(minutes=202))
+        self.assertEqual(event.sample_count, 3)
+        self.assertEqual(event.direction, 'high')
+        self.assertEqual(event.severity, 'critical')
+        self.assertIn('ewma', event.detectors)
+        self.assertIn('mad', event.detectors)
+        self.assertAlmostEqual(event.expected, 50, delta=2)
+        # 新事件只通知一次，后续合并的样本只更新记录
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0]['id'], event.id)
+        self.assertEqual(detector.get_stats()['anomalous_samples'], 3)
+
+    def test_anomaly_alert_rule(self):
+        db.session.add_all([
+            MetricAlert(name='cpu anomaly', metric_type='cpu', metric_name='usage', condition='>', threshold=8,
+                        aggregation='anomaly', severity='critical', enabled=True),
+            MetricAlert(name='memory anomaly', metric_type='memory', metric_name='usage', condition='>', threshold=8,
+                        aggregation='anomaly', severity='critical', enabled=True)
+        ])
+        db.session.commit()
+        detector = AnomalyDetector({})
+        detector.add_listener(alert_on_anomalies)
+        values = 50 + self.rng.normal(0, 1, 300)
+        values[200] = 90
+        detector.ingest(self._rows(values))
+
+        logs = SystemLog.query.filter_by(type='alert').all()
+        self.assertEqual(len(logs), 1)
+        self.assertEqual(logs[0].level, 'ERROR')
+        self.assertTrue(logs[0].message.startswith('cpu anomaly: anomaly(cpu.usage)'))
+
+    def test_clipping_keeps_baseline_after_level_shift(self):
+        detector = AnomalyDetector({'anomaly_merge_gap': 0})
+        detector.ingest(self._rows(50 + self.rng.normal(0, 1, 200)))
+        detector.ingest(self._rows([80] * 5, start=self.start + timedelta(minutes=200)))
+        # 异常值截断后再更新，EWMA 基线不被单次突变拉偏
+        state = detector._series[('cpu', 'usage')]
+        self.assertLess(state.mean, 55)
+        self.assertEqual(AnomalyEvent.query.count(), 5)
+
+    def test_stepwise_constant_series(self):
+        # 平稳的量化序列（如磁盘使用率）每 300 个样本上升一个步长 0.1，不应产生异常
+        detector = AnomalyDetector({})
+        values = [45.2 + 0.1 * (i // 300) for i in range(2000)]
+        rows = self._rows(values)
+        for row in rows:
+            row['type'], row['metric'] = 'disk', 'usage'
+        detector.ingest(rows)
+        self.assertEqual(detector.get_stats()['anomalous_samples'], 0)
+        self.assertEqual(AnomalyEvent.query.count(), 0)
+
+    def test_sustained_level_shift_rebases(self):
+        detector = AnomalyDetector({'anomaly_shift_samples': 10})
+        values = np.concatenate([50 + self.rng.normal(0, 1, 300), 80 + self.rng.normal(0, 1, 300)])
+        detector.ingest(self._rows(values))
+        # 连续异常 10 个样本后基线移到新水平，之后不再报告异常
+        self.assertEqual(AnomalyEvent.query.count(), 1)
+        self.assertEqual(AnomalyEvent.query.one().sample_count, 10)
+        self.assertAlmostEqual(detector._series[('cpu', 'usage')].mean, 80, delta=2)
+
+    def test_seasonal_baseline_from_streaming_stats(self):
+        # 上周同一小时数值较低，本周同一时刻较高的样本只被季节基线判为异常
+        now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        stats = StreamingStats({'stats_checkpoint_interval': 3600})
+        last_week = now - timedelta(days=7, hours=-1)
+        stats.ingest(self._rows(20 + self.rng.normal(0, 1, 60), start=last_week))
+
+        detector = AnomalyDetector({'anomaly_warmup': 10 ** 6, 'anomaly_window': 10 ** 6})
+        self.assertEqual(detector.seed(stats), 1)
+        detector.ingest(self._rows([21, 35], start=now + timedelta(hours=1), interval=60))
+        events = AnomalyEvent.query.all()
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].detectors, ['seasonal'])
+        self.assertEqual(events[0].value, 35)
+
+if __name__ == '__main__':
+    unittest.main() 
\ No newline at end of file
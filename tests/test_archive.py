@@ -0,0 +1,98 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from src.database.metric_store import MemoryMetricStore
+from src.database.archive import ParquetArchive, TieredMetricStore, archive_available, archive_cold_data
+
+@unittest.skipUnless(archive_available(), "pyarrow not installed")
+class TestParquetArchive(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.start = datetime(2024, 1, 1)
+        self.hot = MemoryMetricStore()
+        # 三天数据，每 10 分钟一个点
+        self.hot.write_batch([
+            {'timestamp': self.start + timedelta(minutes=10 * i), 'type': 'cpu', 'metric': metric, 'value': float(i)}
+            for i in range(3 * 144) for metric in ('usage', 'user')
+        ])
+        self.archive = ParquetArchive({'archive_dir': self.directory})
+        self.store = TieredMetricStore(self.hot, self.archive)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_archive_and_read(self):
+        end = self.start + timedelta(days=3)
+        expected = self.hot.read_range(self.start, end)
+        expected_stats = self.hot.aggregate(self.start, end)
+        expected_sums = self.hot.regression_sums(self.start, end)
+
+        archived = archive_cold_data(self.hot, self.archive, self.start + timedelta(days=2, hours=5))
+        self.assertEqual(archived, 2 * 144 * 2)
+        self.assertEqual(self.archive.watermark, self.start + timedelta(days=2))
+        self.assertEqual(self.hot.first_timestamp(), self.start + timedelta(days=2))
+
+        # 跨越归档水位的读取与归档前一致
+        self.assertEqual(self.store.read_range(self.start, end), expected)
+        stats = self.store.aggregate(self.start, end)
+        self.assertEqual(stats[('cpu', 'usage')]['count'], expected_stats[('cpu', 'usage')]['count'])
+        self.assertAlmostEqual(stats[('cpu', 'usage')]['avg'], expected_stats[('cpu', 'usage')]['avg'])
+        self.assertEqual(stats[('cpu', 'user')]['min'], 0.0)
+        sums = self.store.regression_sums(self.start, end)[('cpu', 'usage')]
+        for name in ('count', 'sum_x', 'sum_y', 'sum_xx', 'sum_xy', 'last_timestamp', 'first_timestamp'):
+            self.assertEqual(sums[name], expected_sums[('cpu', 'usage')][name])
+
+        averaged = self.store.read_range(self.start, end, [('cpu', 'usage')], step=3600)
+        self.assertEqual(averaged[('cpu', 'usage')][0], (self.start, 2.5))
+        self.assertEqual(len(averaged[('cpu', 'usage')]), 72)
+
+    def test_rearchive_same_day_replaces_partition(self):
+        day = self.start.date()
+        data = self.hot.read_range(self.start, self.start + timedelta(days=1) - timedelta(microseconds=1))
+        # 删除热数据失败后重复执行：同一天只保留一份
+        self.archive.write_day(day, data)
+        self.archive.write_day(day, data)
+        late = {('cpu', 'usage'): [(self.start + timedelta(minutes=5), 99.0)]}
+        self.archive.write_day(day, late)
+        stats = self.archive.aggregate(self.start, self.start + timedelta(days=1) - timedelta(microseconds=1))
+        self.assertEqual(stats[('cpu', 'user')]['count'], 144)
+        self.assertEqual(stats[('cpu', 'usage')]['count'], 145)
+        self.assertEqual(self.archive.get_stats()['files'], 2)
+
+    def test_step_read_uses_hot_step(self):
+        archive_cold_data(self.hot, self.archive, self.start + timedelta(days=2))
+        steps = []
+        read_range = self.hot.read_range
+        self.hot.read_range = lambda *args: steps.append(args[3] if len(args) > 3 else None) or read_range(*args)
+        averaged = self.store.read_range(self.start, self.start + timedelta(days=3), [('cpu', 'usage')], 3600)
+        self.assertEqual(steps, [3600])
+        points = averaged[('cpu', 'usage')]
+        self.assertEqual(len(points), 72)
+        self.assertEqual(points[24], (self.start + timedelta(days=1), 146.5))
+        self.assertEqual(points[48], (self.start + timedelta(days=2), 290.5))
+
+    def test_pruned_reads(self):
+        archive_cold_data(self.hot, self.archive, self.start + timedelta(days=2))
+        start = self.start + timedelta(days=1, hours=1)
+        points = self.archive.read_range(start, start + timedelta(minutes=30), [('cpu', 'user')])
+        self.assertEqual(list(points), [('cpu', 'user')])
+        self.assertEqual([value for _, value in points[('cpu', 'user')]], [150.0, 151.0, 152.0, 153.0])
+
+        stats = self.archive.aggregate(self.start, self.start + timedelta(hours=1) - timedelta(seconds=1))
+        self.assertEqual(stats[('cpu', 'usage')]['count'], 6)
+        self.assertEqual(self.archive.get_stats()['days'], 2)
+
+    def test_retention(self):
+        archive_cold_data(self.hot, self.archive, self.start + timedelta(days=2))
+        self.assertEqual(self.archive.delete_before(self.start + timedelta(days=1, hours=12)), 1)
+        self.assertEqual(self.archive.get_stats()['first_day'], '2024-01-02')
+        points = self.store.read_series('cpu', 'usage', self.start, self.start + timedelta(days=3))
+        self.assertEqual(points[0], (self.start + timedelta(days=1), 144.0))
+
+if __name__ == '__main__':
+    unittest.main() 
@@ -0,0 +1,53 @@
+import unittest
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from src.visualization.chart_renderer import ChartRenderer, add_series, line_chart, to_plotly
+
+class TestChartRenderer(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.start = datetime(2024, 1, 1)
+        self.chart = line_chart('Resource Usage Prediction', 'Time', 'Usage %')
+        timestamps = [self.start + timedelta(hours=i) for i in range(3)]
+        add_series(self.chart, 'cpu', timestamps, [1.0, 2.0, 3.0], [0.5, 1.5, 2.5], [1.5, 2.5, 3.5])
+        add_series(self.chart, 'memory', timestamps, [4.0, 5.0, 6.0])
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_plotly_figure(self):
+        figure = to_plotly(self.chart)
+        # 带置信区间的序列先画上下边界再画预测线
+        self.assertEqual(len(figure['data']), 4)
+        upper, lower, cpu, memory = figure['data']
+        self.assertEqual(upper['y'], [1.5, 2.5, 3.5])
+        self.assertEqual(lower['fill'], 'tonexty')
+        self.assertEqual(cpu['name'], 'cpu')
+        self.assertEqual(memory['x'][0], self.start.isoformat())
+        self.assertEqual(figure['layout']['title']['text'], 'Resource Usage Prediction')
+
+    def test_render_keyed_by_watermark(self):
+        renderer = ChartRenderer({'chart_dir': self.dir.name})
+        renderer.enabled = True
+        name = renderer.filename('predictions', self.start)
+        self.assertEqual(name, renderer.filename('predictions', self.start))
+        self.assertNotEqual(name, renderer.filename('predictions', self.start + timedelta(hours=1)))
+        self.assertNotEqual(name, renderer.filename('performance', self.start))
+
+        # 同一水位的图表已存在时不再提交渲染
+        open(os.path.join(self.dir.name, name), 'wb').close()
+        self.assertEqual(renderer.submit('predictions', self.start, self.chart), name)
+        self.assertIsNone(renderer._executor)
+        self.assertEqual(renderer.get_stats()['reused'], 1)
+
+    def test_disabled_without_renderer(self):
+        renderer = ChartRenderer({'chart_dir': self.dir.name, 'chart_render': False})
+        self.assertIsNone(renderer.submit('performance', self.start, self.chart))
+        self.assertEqual(os.listdir(self.dir.name), [])
+
+if __name__ == '__main__':
+    unittest.main() 
\ No newline at end of file
@@ -0,0 +1,91 @@
+import unittest
+import random
+import sys
+import os
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.base import DatabaseTestCase
+from src.models import db, MonitorSample, MetricChunk
+from src.database.chunk_store import ChunkStore, encode_chunk, decode_chunk
+from src.database.sample_store import SampleStore
+
+class TestGorillaEncoding(unittest.TestCase):
+    def test_round_trip(self):
+        random.seed(1)
+        timestamps = []
+        timestamp = 1700000000000
+        for _ in range(1000):
+            # 固定间隔叠加抖动和偶发的长间隔
+            timestamp += 5000 + random.randint(-30, 30) + (3600000 if random.random() < 0.01 else 0)
+            timestamps.append(timestamp)
+        values = [round(random.uniform(0, 100), 1) for _ in range(1000)]
+        values[10:20] = [values[9]] * 10
+        values[30] = float('inf')
+        values[31] = -0.0
+
+        decoded_timestamps, decoded_values = decode_chunk(encode_chunk(timestamps, values))
+        self.assertEqual(decoded_timestamps, timestamps)
+        self.assertEqual(decoded_values, values)
+
+    def test_empty_and_single(self):
+        self.assertEqual(decode_chunk(encode_chunk([], [])), ([], []))
+        self.assertEqual(decode_chunk(encode_chunk([1000], [42.5])), ([1000], [42.5]))
+
+    def test_regular_series_compresses(self):
+        timestamps = [1700000000000 + i * 5000 for i in range(720)]
+        values = [50.0 + (i % 10) * 0.5 for i in range(720)]
+        data = encode_chunk(timestamps, values)
+        self.assertLess(len(data), len(timestamps) * 4)
+
+class TestChunkStore(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = SampleStore()
+        self.base = datetime(2024, 1, 1)
+
+    def _write_samples(self, count):
+        rows = []
+        for i in range(count):
+            timestamp = self.base + timedelta(minutes=i)
+            rows.extend([
+                {'type': 'cpu', 'metric': 'usage', 'value': float(i % 50), 'timestamp': timestamp},
+                {'type': 'system', 'metric': 'load_1', 'value': 0.5, 'timestamp': timestamp}
+            ])
+        self.store.write(rows)
+        db.session.commit()
+
+    def test_compact_preserves_reads(self):
+        self._write_samples(300)
+        end = self.base + timedelta(minutes=299)
+        before = self.store.read_range(self.base, end)
+
+        compacted = self.store.compact(self.base + timedelta(hours=4), chunk_seconds=3600)
+        self.assertEqual(compacted, 480)
+        self.assertEqual(MonitorSample.query.count(), 60)
+        self.assertEqual(MetricChunk.query.count(), 8)
+        self.assertEqual(self.store.read_range(self.base, end), before)
+
+    def test_aggregate_and_value_filter(self):
+        self._write_samples(240)
+        self.store.compact(self.base + timedelta(hours=4), chunk_seconds=3600)
+        chunks = ChunkStore()
+
+        stats = chunks.aggregate(self.base + timedelta(minutes=30), self.base + timedelta(hours=4))
+        cpu = stats[('cpu', 'usage')]
+        self.assertEqual(cpu['count'], 210)
+        self.assertEqual(cpu['max'], 49.0)
+
+        rows = list(chunks.iter_rows(self.base, self.base + timedelta(hours=4), min_value=45))
+        self.assertEqual(len(rows), 4 * 5)
+        self.assertTrue(all(metric == 'usage' for _, _, metric, _ in rows))
+
+    def test_delete_before_drops_whole_chunks(self):
+        self._write_samples(240)
+        self.store.compact(self.base + timedelta(hours=4), chunk_seconds=3600)
+        self.store.delete_before(self.base + timedelta(hours=1, minutes=30))
+        db.session.commit()
+        self.assertEqual(MetricChunk.query.count(), 6)
+
+if __name__ == '__main__':
+    unittest.main() 
@@ -0,0 +1,114 @@
+import unittest
+import sys
+import os
+import time
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.base import DatabaseTestCase
+from src.models import db, ProcessData
+from src.monitor.collectors import (
+    COLLECTORS, Collector, CollectorRegistry, CollectorManager, register_collector
+)
+from src.monitor.system_monitor import SystemMonitor
+
+class SlowCollector(Collector):
+    name = 'test_slow'
+    default_interval = 3600
+    default_timeout = 0.01
+
+    def collect(self):
+        time.sleep(0.05)
+        return [self._row('test', 'slow', 1.0)]
+
+class TestCollectorRegistry(unittest.TestCase):
+    def test_builtin_collectors_registered(self):
+        for name in ['cpu', 'memory', 'disk', 'diskio', 'net', 'load', 'processes', 'temperatures', 'connections']:
+            self.assertIn(name, COLLECTORS)
+
+    def test_run_records_cost(self):
+        registry = CollectorRegistry({'memory': {'interval': 5}})
+        self.assertEqual(registry.get('memory').interval, 5)
+        rows = registry.run_all(['cpu', 'memory'])
+        self.assertIn(('memory', 'usage'), {(row['type'], row['metric']) for row in rows})
+
+        stats = registry.get_stats()['memory']
+        self.assertEqual(stats['runs'], 1)
+        self.assertEqual(stats['samples'], 3)
+        self.assertGreater(stats['total_wall_time'], 0)
+        self.assertEqual(registry.get_stats()['load']['runs'], 0)
+
+    def test_cpu_usage_from_fresh_thread(self):
+        collector = CollectorRegistry().get('cpu')
+        deadline = time.time() + 0.3
+        while time.time() < deadline:
+            pass
+        # 在线程池新线程上的首次采集也应覆盖构造以来的区间，而不是 0
+        result = []
+        worker = threading.Thread(target=lambda: result.extend(collector.collect()))
+        worker.start()
+        worker.join()
+        self.assertEqual(result[0]['metric'], 'usage')
+        self.assertGreater(result[0]['value'], 0.0)
+
+    def test_system_monitor_shares_registry(self):
+        registry = CollectorRegistry()
+        monitor = SystemMonitor({}, collectors=registry)
+        self.assertIs(monitor.collectors, registry)
+        self.assertIs(monitor.process_tracker, registry.get('processes').tracker)
+
+    def test_disabled_collector_skipped(self):
+        registry = CollectorRegistry({'cpu': {'enabled': False}})
+        self.assertEqual(registry.run_all(['cpu']), [])
+        self.assertNotIn('cpu', [collector.name for collector in registry.enabled()])
+
+    def test_timeout_discards_result(self):
+        register_collector(SlowCollector)
+        try:
+            registry = CollectorRegistry()
+            self.assertIsNone(registry.run(registry.get('test_slow')))
+            self.assertEqual(registry.get_stats()['test_slow']['timeouts'], 1)
+        finally:
+            COLLECTORS.pop('test_slow')
+
+class TestCollectorManager(DatabaseTestCase):
+    push_context = False
+
+    def setUp(self):
+        super().setUp()
+        self.received = []
+        disabled = {name: {'enabled': False} for name in COLLECTORS}
+        disabled.update({'memory': {'interval': 60}, 'load': {'interval': 10}, 'processes': {
+            'interval': 60,
+            'retention': {'top_cpu': 3, 'top_memory': 3, 'min_cpu_percent': 0, 'min_memory_percent': 0}
+        }})
+        self.manager = CollectorManager(self.app, {'collectors': disabled}, sink=self.received.extend)
+
+    def tearDown(self):
+        self.manager.stop()
+        super().tearDown()
+
+    def _wait_idle(self):
+        deadline = time.time() + 5
+        while self.manager.get_stats()['active'] and time.time() < deadline:
+            time.sleep(0.01)
+
+    def test_run_due_respects_intervals(self):
+        self.assertEqual(sorted(self.manager.run_due(now=1000.0)), ['load', 'memory', 'processes'])
+        self._wait_idle()
+        self.assertEqual(self.manager.run_due(now=1005.0), [])
+        self.assertEqual(self.manager.run_due(now=1010.0), ['load'])
+        self._wait_idle()
+
+        rows = self.received
+        self.assertEqual(len({row['timestamp'] for row in rows}), 2)
+        self.assertTrue(all(row['type'] in ('memory', 'system', 'process') for row in rows))
+
+    def test_processes_persisted(self):
+        self.manager.run_all()
+        with self.app.app_context():
+            self.assertTrue(1 <= ProcessData.query.count() <= 6)
+        self.assertEqual(self.manager.get_stats()['collectors']['processes']['runs'], 1)
+
+if __name__ == '__main__':
+    unittest.main() 
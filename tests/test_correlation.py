@@ -0,0 +1,96 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from datetime import datetime, timedelta
+from tests.base import DatabaseTestCase
+from src.models import db, ProcessData, AnomalyEvent, AnalysisReport
+from src.database.rollup import RollupManager, bucket_start
+from src.analysis.correlation import CorrelationAnalyzer, lagged_correlation, standardize
+
+class TestLaggedCorrelation(unittest.TestCase):
+    def test_matches_shifted_correlation(self):
+        rng = np.random.default_rng(0)
+        leader = rng.normal(0, 1, 200)
+        values = np.vstack([np.roll(leader, 3), leader, rng.normal(0, 1, 200)])
+        z, varying = standardize(values, np.ones_like(values, dtype=bool))
+        self.assertTrue(varying.all())
+        lagged = lagged_correlation(z, 5)
+        self.assertEqual(lagged.shape, (3, 3, 11))
+        # 同期相关与 corrcoef 一致
+        self.assertTrue(np.allclose(lagged[:, :, 5], np.corrcoef(values)))
+        # 序列 1 比序列 0 早 3 步：corr(x_0[t], x_1[t-3]) 最大
+        self.assertEqual(np.abs(lagged[0, 1]).argmax() - 5, -3)
+        self.assertTrue(np.allclose(lagged_correlation(z, 5, np.array([0]))[0], lagged[0]))
+
+class TestCorrelationAnalyzer(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rollups = RollupManager({'retention_days': 0})
+        self.now = bucket_start(datetime.utcnow(), 3600)
+        self.start = self.now - timedelta(hours=4)
+
+        # cpu 在第 200~219 分钟突增，内存提前 3 分钟上涨，worker 进程的 CPU 同步上涨（每 5 分钟采集一次）
+        rng = np.random.default_rng(1)
+        spike = np.zeros(240)
+        spike[200:220] = 30
+        rows = []
+        for i in range(240):
+            timestamp = self.start + timedelta(minutes=i)
+            rows.append({'type': 'cpu', 'metric': 'usage', 'value': 20 + spike[i] + rng.normal(), 'timestamp': timestamp})
+            rows.append({'type': 'memory', 'metric': 'usage', 'value': 50 + spike[min(i + 3, 239)] / 2 + rng.normal(), 'timestamp': timestamp})
+            for index in range(20):
+                rows.append({'type': 'custom', 'metric': f'noise{index}', 'value': rng.normal(), 'timestamp': timestamp})
+        self.rollups.ingest(rows)
+        db.session.bulk_insert_mappings(ProcessData, [
+            {'timestamp': self.start + timedelta(minutes=i), 'name': name, 'cpu_percent': cpu, 'memory_percent': 1.0}
+            for i in range(0, 240, 5)
+            for name, cpu in (('worker', 5 + spike[i]), ('idle', 1 + rng.normal(0, 0.1)))
+        ])
+        db.session.commit()
+        self.incident = (self.start + timedelta(minutes=200), self.start + timedelta(minutes=219))
+        self.analyzer = CorrelationAnalyzer(self.rollups, {'correlation_context_hours': 3, 'correlation_max_points': 240})
+
+    def test_ranks_contributors(self):
+        result = self.analyzer.analyze('cpu.usage', *self.incident, now=self.now)
+        self.assertEqual(result['step'], 60)
+        self.assertEqual(result['series_count'], 26)
+        top = {item['series']: item for item in result['contributors'][:2]}
+        self.assertEqual(set(top), {'memory.usage', 'process_cpu.worker'})
+        self.assertGreater(top['memory.usage']['lag_correlation'], 0.8)
+        self.assertEqual(top['memory.usage']['lead_seconds'], 180)
+        self.assertEqual(top['process_cpu.worker']['direction'], 'up')
+        self.assertEqual(result['matrix']['series'][0], 'cpu.usage')
+        self.assertAlmostEqual(result['matrix']['values'][0][0], 1.0)
+
+    def test_report_for_latest_anomaly(self):
+        db.session.add(AnomalyEvent(type='cpu', metric='usage', start_time=self.incident[0], end_time=self.incident[1],
+                                    detectors=['ewma'], direction='high', value=50, expected=20, score=30,
+                                    sample_count=20, severity='critical'))
+        db.session.commit()
+        self.assertEqual(self.analyzer.incident_window('cpu.usage', now=self.now), self.incident)
+        report = self.analyzer.create_report('cpu.usage', *self.incident)
+        self.assertEqual(AnalysisReport.query.filter_by(report_type='correlation').count(), 1)
+        self.assertEqual(report.content['incident']['start'], self.incident[0].isoformat())
+        self.assertTrue(report.content['chart']['series'])
+
+    def test_new_events_by_absolute_score(self):
+        since = datetime.utcnow() - timedelta(minutes=30)
+        for minute, direction, score in ((60, 'low', -40), (120, 'high', 30), (180, 'high', 5)):
+            start = self.start + timedelta(minutes=minute)
+            db.session.add(AnomalyEvent(type='cpu', metric='usage', start_time=start, end_time=start,
+                                        detectors=['ewma'], direction=direction, value=0, expected=20, score=score,
+                                        sample_count=1, severity='warning'))
+        db.session.add(AnomalyEvent(type='cpu', metric='usage', start_time=self.start, end_time=self.start,
+                                    detectors=['ewma'], direction='high', value=0, expected=20, score=50,
+                                    sample_count=1, severity='warning', created_at=since - timedelta(minutes=1)))
+        db.session.commit()
+        analyzer = CorrelationAnalyzer(self.rollups, {'correlation_max_reports': 2})
+        # 旧版指标名解析为 cpu.usage，低方向事件按绝对值排序
+        events = analyzer.new_events('cpu_percent', since)
+        self.assertEqual([event.score for event in events], [-40, 30])
+
+if __name__ == '__main__':
+    unittest.main() 
\ No newline at end of file
@@ -0,0 +1,137 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from src.database.db_manager import DatabaseManager
+from src.database.fanout import BackendWriter, SpoolFile
+from src.database.metric_store import MemoryMetricStore
+
+class FlakyBackend:
+    """可切换故障状态的测试后端"""
+
+    def __init__(self):
+        self.down = False
+        self.records = []
+
+    def write(self, records):
+        if self.down:
+            raise ConnectionError('backend down')
+        self.records.extend(records)
+
+class TestBackendWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = {
+            'spool_dir': self.directory,
+            'fanout_batch_size': 4,
+            'fanout_flush_interval': 0.05,
+            'fanout_queue_size': 5,
+            'fanout_retry_interval': 0
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _records(self, count):
+        return [{'timestamp': datetime.utcnow(), 'metrics': {'value': i}} for i in range(count)]
+
+    def test_spool_and_replay(self):
+        backend = FlakyBackend()
+        writer = BackendWriter('flaky', backend.write, self.config)
+        backend.down = True
+        for record in self._records(5):
+            writer.put(record)
+        writer.flush()
+        stats = writer.get_stats()
+        self.assertFalse(stats['healthy'])
+        self.assertEqual(stats['spool_depth'], 5)
+        self.assertEqual(stats['errors'], 1)
+        self.assertGreaterEqual(stats['lag'], 0)
+
+        # 重启后从溢写文件接管，恢复时按原顺序回放
+        writer = BackendWriter('flaky', backend.write, self.config)
+        self.assertEqual(writer.spool.count, 5)
+        backend.down = False
+        writer.put(self._records(1)[0])
+        writer.flush()
+        self.assertEqual([record['metrics']['value'] for record in backend.records], [0, 1, 2, 3, 4, 0])
+        self.assertIsInstance(backend.records[0]['timestamp'], datetime)
+        stats = writer.get_stats()
+        self.assertTrue(stats['healthy'])
+        self.assertEqual(stats['spool_depth'], 0)
+        self.assertEqual(stats['replayed'], 5)
+        self.assertFalse(os.path.exists(writer.spool.path))
+
+    def test_spool_limit_drops_oldest(self):
+        spool = SpoolFile(os.path.join(self.directory, 'limited.spool'), max_bytes=2000)
+        for batch in range(10):
+            spool.append([{'timestamp': datetime(2024, 1, 1) + timedelta(minutes=batch * 10 + i), 'value': batch * 10 + i}
+                          for i in range(10)])
+        self.assertLessEqual(spool.size, 2000)
+        self.assertEqual(spool.size, os.path.getsize(spool.path))
+        self.assertGreater(spool.dropped, 0)
+        self.assertEqual(spool.count + spool.dropped, 100)
+        self.assertEqual(spool.oldest, datetime(2024, 1, 1) + timedelta(minutes=spool.dropped))
+
+        # 按批回放，失败时保留未写入的记录
+        batches = []
+        limit = [2]
+
+        def write(records):
+            if len(batches) >= limit[0]:
+                raise ConnectionError('backend down')
+            batches.append([record['value'] for record in records])
+        remaining = spool.count
+        with self.assertRaises(ConnectionError):
+            spool.replay(write, 7)
+        self.assertEqual([len(batch) for batch in batches], [7, 7])
+        self.assertEqual(batches[0][0], spool.dropped)
+        self.assertEqual(spool.count, remaining - 14)
+        self.assertEqual(spool.oldest, datetime(2024, 1, 1) + timedelta(minutes=spool.dropped + 14))
+
+        limit[0] = len(batches) + 1
+        self.assertEqual(spool.replay(write, 100), remaining - 14)
+        self.assertEqual(batches[-1][-1], 99)
+        self.assertFalse(os.path.exists(spool.path))
+
+    def test_queue_overflow_spools(self):
+        backend = FlakyBackend()
+        writer = BackendWriter('overflow', backend.write, self.config)
+        for record in self._records(8):
+            writer.put(record)
+        stats = writer.get_stats()
+        self.assertEqual(stats['depth'], 5)
+        self.assertEqual(stats['spooled'], 3)
+        writer.flush()
+        self.assertEqual(len(backend.records), 8)
+
+    def test_slow_backend_does_not_block(self):
+        release = threading.Event()
+        backend = FlakyBackend()
+        store = MemoryMetricStore()
+        manager = DatabaseManager(self.config, store=store)
+        slow = BackendWriter('slow', lambda records: release.wait(5) and backend.write(records), self.config)
+        slow.start()
+        manager.writers['slow'] = slow
+        try:
+            for _ in range(3):
+                manager.save_metrics({'cpu_usage': 50.0, 'host': 'test'})
+            manager.writers['store'].flush()
+            now = datetime.utcnow()
+            points = store.read_range(now - timedelta(minutes=1), now)
+            # 旧版扁平指标名映射为统一的序列，非数值字段不写入
+            self.assertEqual(list(points), [('cpu', 'usage')])
+            self.assertEqual(len(points[('cpu', 'usage')]), 3)
+        finally:
+            release.set()
+            manager.close()
+        self.assertEqual(len(backend.records), 3)
+        self.assertEqual(set(manager.get_stats()), {'store', 'slow'})
+
+if __name__ == '__main__':
+    unittest.main() 
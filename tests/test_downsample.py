@@ -0,0 +1,47 @@
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.downsample import downsample, lttb_indices, minmax_indices
+
+class TestDownsample(unittest.TestCase):
+    def setUp(self):
+        base = datetime(2024, 1, 1)
+        values = np.sin(np.linspace(0, 20, 10000)) * 10 + 50
+        values[5000] = 100.0  # 尖峰
+        self.points = [(base + timedelta(seconds=5 * i), float(value)) for i, value in enumerate(values)]
+
+    def test_lttb_keeps_endpoints_and_peak(self):
+        result = downsample(self.points, 200)
+        self.assertEqual(len(result), 200)
+        self.assertEqual(result[0], self.points[0])
+        self.assertEqual(result[-1], self.points[-1])
+        self.assertIn(self.points[5000], result)
+        self.assertEqual(result, sorted(result))
+
+    def test_minmax_keeps_extremes(self):
+        result = downsample(self.points, 200, method='minmax')
+        self.assertLessEqual(len(result), 200)
+        values = [value for _, value in result]
+        self.assertEqual(max(values), 100.0)
+        self.assertEqual(min(values), min(value for _, value in self.points))
+
+    def test_short_series_unchanged(self):
+        self.assertEqual(downsample(self.points[:10], 200), self.points[:10])
+        self.assertEqual(list(lttb_indices(np.arange(5.0), np.arange(5.0), 10)), [0, 1, 2, 3, 4])
+        self.assertEqual(list(minmax_indices(np.arange(5.0), 10)), [0, 1, 2, 3, 4])
+
+    def test_rollup_points_preserved(self):
+        points = [point + (point[1], point[1], 1, point[1]) for point in self.points]
+        result = downsample(points, 100)
+        self.assertTrue(all(len(point) == 6 for point in result))
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            downsample(self.points, 100, method='average')
+
+if __name__ == '__main__':
+    unittest.main() 
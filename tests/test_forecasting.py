@@ -0,0 +1,55 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from datetime import datetime, timedelta
+from src.analysis.forecasting import Forecaster
+
+class TestForecaster(unittest.TestCase):
+    def setUp(self):
+        self.start = datetime(2024, 1, 1)
+        self.rng = np.random.default_rng(0)
+
+    def _series(self, hours, slope, amplitude, noise=0.5, missing=()):
+        return [
+            (self.start + timedelta(hours=h),
+             50 + slope * h + amplitude * np.sin(2 * np.pi * h / 24) + self.rng.normal(0, noise))
+            for h in range(hours) if h not in missing
+        ]
+
+    def test_daily_seasonality_and_bands(self):
+        series = {
+            ('cpu', 'usage'): self._series(14 * 24, 0.05, 10),
+            ('memory', 'usage'): self._series(14 * 24, -0.02, 0, missing=range(100, 130)),
+            ('disk', 'usage'): self._series(5, 0.1, 0)
+        }
+        forecasts = Forecaster().forecast(series, horizon=24)
+        # 样本不足以估计参数的序列不返回
+        self.assertEqual(set(forecasts), {('cpu', 'usage'), ('memory', 'usage')})
+
+        cpu = forecasts[('cpu', 'usage')]
+        hours = np.arange(14 * 24, 15 * 24)
+        expected = 50 + 0.05 * hours + 10 * np.sin(2 * np.pi * hours / 24)
+        self.assertLess(np.abs(np.array(cpu['predicted']) - expected).max(), 1.0)
+        self.assertEqual(cpu['timestamps'][0], self.start + timedelta(hours=14 * 24))
+        self.assertAlmostEqual(cpu['slope'], 0.05, places=2)
+        self.assertTrue(all(low < value < high for low, value, high in zip(cpu['lower'], cpu['predicted'], cpu['upper'])))
+        self.assertAlmostEqual(cpu['residual_std'], 0.5, delta=0.1)
+
+        memory = forecasts[('memory', 'usage')]
+        self.assertEqual(memory['samples'], 14 * 24 - 30)
+        self.assertEqual(memory['trend'], 'down')
+
+    def test_process_pool_matches_single_process(self):
+        series = {('cpu', str(i)): self._series(3 * 24, 0.01 * i, i % 5) for i in range(12)}
+        single = Forecaster({'forecast_block_size': 5}).forecast(series, horizon=6)
+        pooled = Forecaster({'forecast_block_size': 5, 'forecast_workers': 2}).forecast(series, horizon=6)
+        self.assertEqual(len(pooled), 12)
+        for key in series:
+            np.testing.assert_allclose(pooled[key]['predicted'], single[key]['predicted'])
+            np.testing.assert_allclose(pooled[key]['upper'], single[key]['upper'])
+
+if __name__ == '__main__':
+    unittest.main() 
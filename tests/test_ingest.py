@@ -0,0 +1,57 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+from tests.base import DatabaseTestCase
+from src.models import db, MonitorSample
+from src.database.ingest import MetricIngestQueue
+
+class TestMetricIngestQueue(DatabaseTestCase):
+    push_context = False
+
+    def setUp(self):
+        super().setUp()
+        self.config = {
+            'ingest_batch_size': 4,
+            'ingest_flush_interval': 0.05,
+            'ingest_queue_size': 10
+        }
+
+    def _rows(self, count):
+        now = datetime.utcnow()
+        return [
+            {'type': 'cpu', 'metric': 'usage', 'value': float(i), 'timestamp': now + timedelta(seconds=i)}
+            for i in range(count)
+        ]
+
+    def test_flush_in_batches(self):
+        ingest = MetricIngestQueue(self.app, self.config)
+        flushed = []
+        ingest.add_listener(lambda batch: flushed.append(len(batch)))
+        self.assertEqual(ingest.put(self._rows(10)), 10)
+        self.assertEqual(ingest.flush(), 10)
+        self.assertEqual(flushed, [4, 4, 2])
+        with self.app.app_context():
+            self.assertEqual(MonitorSample.query.count(), 10)
+        stats = ingest.get_stats()
+        self.assertEqual(stats['written'], 10)
+        self.assertEqual(stats['flushes'], 3)
+        self.assertEqual(stats['depth'], 0)
+
+    def test_drop_when_full(self):
+        ingest = MetricIngestQueue(self.app, self.config)
+        self.assertEqual(ingest.put(self._rows(15)), 10)
+        self.assertEqual(ingest.get_stats()['dropped'], 5)
+
+    def test_writer_thread(self):
+        ingest = MetricIngestQueue(self.app, self.config)
+        ingest.start()
+        ingest.put(self._rows(6))
+        ingest.stop(timeout=2)
+        with self.app.app_context():
+            self.assertEqual(MonitorSample.query.count(), 6)
+
+if __name__ == '__main__':
+    unittest.main() 
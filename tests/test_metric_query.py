@@ -0,0 +1,110 @@
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.base import DatabaseTestCase
+from src.models import db
+from src.database.rollup import RollupManager, bucket_start
+from src.database.sample_store import SampleStore
+from src.database.metric_query import MetricQueryEngine, BLOCK_POINTS, parse_selector
+from src.database.query_cache import QueryCache, block_ranges
+
+class TestMetricQueryEngine(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rollups = RollupManager({'retention_days': 1})
+        self.engine = MetricQueryEngine(self.rollups)
+        self.base = bucket_start(datetime.utcnow() - timedelta(hours=2), 3600)
+
+        # 20 分钟、每 10 秒一个样本；cpu 取 0..119，网络计数器每秒增长 100 字节，第 60 个样本处重置
+        rows = []
+        for i in range(120):
+            timestamp = self.base + timedelta(seconds=i * 10)
+            rows.append({'type': 'cpu', 'metric': 'usage', 'value': float(i), 'timestamp': timestamp})
+            counter = (i if i < 60 else i - 60) * 1000.0
+            rows.append({'type': 'network', 'metric': 'bytes_sent', 'value': counter, 'timestamp': timestamp})
+            rows.append({'type': 'network', 'metric': 'bytes_recv', 'value': 1.0, 'timestamp': timestamp})
+        SampleStore().write(rows)
+        db.session.commit()
+        self.rollups.ingest(rows)
+        self.end = self.base + timedelta(seconds=1199)
+
+    def test_parse_selector(self):
+        self.assertEqual(parse_selector('cpu.usage, network.*'), [('cpu', 'usage'), ('network', '*')])
+        with self.assertRaises(ValueError):
+            parse_selector('cpu')
+
+    def test_basic_aggregations(self):
+        for agg, expected in [('avg', 29.5), ('min', 0), ('max', 59), ('sum', 1770), ('count', 60)]:
+            timestamps, values = self.engine.query('cpu.usage', self.base, self.end, 600, agg)[('cpu', 'usage')]
+            self.assertEqual(len(values), 2)
+            self.assertAlmostEqual(values[0], expected)
+            self.assertEqual(timestamps[1] - timestamps[0], 600)
+
+    def test_rate_handles_counter_reset(self):
+        _, values = self.engine.query('network.bytes_sent', self.base, self.end, 60, 'rate')[('network', 'bytes_sent')]
+        self.assertEqual(len(values), 19)
+        # 重置所在的桶只计入重置后的增量
+        self.assertTrue(np.allclose(np.delete(values, 9), 100.0))
+        self.assertAlmostEqual(values[9], 5000.0 / 60)
+
+    def test_percentile(self):
+        # 汇总层级上由桶草图合并估计，相对误差约 1%
+        _, values = self.engine.query('cpu.usage', self.base, self.end, 600, 'percentile', 50)[('cpu', 'usage')]
+        self.assertTrue(np.allclose(values, [29.5, 89.5], rtol=0.03))
+        # 步长小于最细汇总粒度时按原始样本精确计算
+        _, values = self.engine.query('cpu.usage', self.base, self.end, 30, 'percentile', 50)[('cpu', 'usage')]
+        self.assertTrue(np.allclose(values[:3], [1, 4, 7]))
+
+    def test_wildcard_selector(self):
+        result = self.engine.query('network.*', self.base, self.end, 600, 'max')
+        self.assertEqual(set(result), {('network', 'bytes_sent'), ('network', 'bytes_recv')})
+
+    def test_cached_query(self):
+        engine = MetricQueryEngine(self.rollups, QueryCache({}))
+        first = engine.query('cpu.usage', self.base, self.end, 600, 'avg')
+        second = engine.query('cpu.usage', self.base + timedelta(seconds=5), self.end, 600, 'avg')
+        self.assertTrue(np.array_equal(first[('cpu', 'usage')][0], second[('cpu', 'usage')][0]))
+        self.assertEqual(engine.cache.get_stats()['misses'], 1)
+        self.assertTrue(np.allclose(first[('cpu', 'usage')][1], [29.5, 89.5]))
+
+    def test_sliding_window_keeps_closed_blocks(self):
+        engine = MetricQueryEngine(self.rollups, QueryCache({}))
+        start = self.base - timedelta(hours=6)
+        blocks = len(block_ranges(start, self.end, 60 * BLOCK_POINTS))
+        self.assertGreater(blocks, 2)
+        expected = engine.query('cpu.usage', start, self.end, 60, 'avg')[('cpu', 'usage')]
+
+        # 新数据只使最新的块失效，窗口滑动后历史块继续命中
+        engine.cache.on_ingest([{'type': 'cpu', 'metric': 'usage', 'value': 1.0, 'timestamp': self.end}])
+        result = engine.query('cpu.usage', start + timedelta(seconds=60), self.end, 60, 'avg')[('cpu', 'usage')]
+        stats = engine.cache.get_stats()
+        self.assertEqual((stats['misses'], stats['hits']), (blocks + 1, blocks - 1))
+        self.assertTrue(np.array_equal(result[1], expected[1]))
+
+    def test_cached_rate_across_blocks(self):
+        engine = MetricQueryEngine(self.rollups, QueryCache({}))
+        expected = self.engine.query('network.bytes_sent', self.base, self.end, 10, 'rate')[('network', 'bytes_sent')]
+        # 每块 30 个桶（5 分钟），数据跨越 4 个块，块内首个桶的速率依赖前一块的计数器
+        with patch('src.database.metric_query.BLOCK_POINTS', 30):
+            result = engine.query('network.bytes_sent', self.base, self.end, 10, 'rate')
+        self.assertEqual(engine.cache.get_stats()['size'], 4)
+        self.assertTrue(np.array_equal(result[('network', 'bytes_sent')][0], expected[0]))
+        self.assertTrue(np.allclose(result[('network', 'bytes_sent')][1], expected[1]))
+
+    def test_step_limits(self):
+        with self.assertRaises(ValueError):
+            self.engine.query('cpu.usage', self.base, self.end, 0.001)
+        with self.assertRaises(ValueError):
+            self.engine.query('cpu.usage', self.end - timedelta(days=30), self.end, 60)
+
+    def test_invalid_aggregation(self):
+        with self.assertRaises(ValueError):
+            self.engine.query('cpu.usage', self.base, self.end, 600, 'median')
+
+if __name__ == '__main__':
+    unittest.main() 
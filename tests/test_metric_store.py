@@ -0,0 +1,125 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from src.models import MonitorData, db
+from src.database.metric_store import MemoryMetricStore, create_metric_store, resolve_metric
+from src.analysis.metrics_analyzer import MetricsAnalyzer
+from src.export.data_exporter import DataExporter
+from src.database.streaming_stats import RunningStats
+
+class TestMetricStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.start = datetime(2024, 1, 1)
+        self.rows = []
+        for i in range(120):
+            timestamp = self.start + timedelta(seconds=10 * i)
+            self.rows.append({'timestamp': timestamp, 'type': 'cpu', 'metric': 'usage', 'value': float(i % 50)})
+            self.rows.append({'timestamp': timestamp, 'type': 'gpu', 'metric': 'usage', 'value': float(i)})
+        self.end = self.start + timedelta(minutes=20)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _stores(self):
+        sql = create_metric_store({'db_path': os.path.join(self.directory, 'metrics.db')})
+        return [MemoryMetricStore(), sql]
+
+    def test_backends_agree(self):
+        results = []
+        for store in self._stores():
+            self.assertEqual(store.write_batch(list(self.rows)), 240)
+            points = store.read_range(self.start, self.end, [('gpu', 'usage')])
+            self.assertEqual(len(points[('gpu', 'usage')]), 120)
+            self.assertEqual(points[('gpu', 'usage')][0], (self.start, 0.0))
+            averaged = store.read_range(self.start, self.end, [('gpu', 'usage')], step=60)
+            self.assertEqual(averaged[('gpu', 'usage')][0], (self.start, 2.5))
+            results.append(store.aggregate(self.start, self.end))
+            store.close()
+
+        memory, sql = results
+        self.assertEqual(memory[('cpu', 'usage')], {'min': 0.0, 'max': 49.0, 'avg': memory[('cpu', 'usage')]['avg'], 'count': 120})
+        for key in memory:
+            self.assertEqual(memory[key]['count'], sql[key]['count'])
+            self.assertAlmostEqual(memory[key]['avg'], sql[key]['avg'])
+            self.assertEqual((memory[key]['min'], memory[key]['max']), (sql[key]['min'], sql[key]['max']))
+
+    def test_sql_aggregate_includes_legacy_rows(self):
+        store = create_metric_store({'db_path': os.path.join(self.directory, 'metrics.db')})
+        store.write_batch(list(self.rows))
+        with store.app.app_context():
+            db.session.add(MonitorData(type='cpu', metric='usage', value=99.0, timestamp=self.start))
+            db.session.commit()
+        stats = store.aggregate(self.start, self.end, [('cpu', 'usage')])
+        self.assertEqual(stats[('cpu', 'usage')]['count'], 121)
+        self.assertEqual(stats[('cpu', 'usage')]['max'], 99.0)
+        store.close()
+
+    def test_regression_sums(self):
+        memory, sql = self._stores()
+        for store in (memory, sql):
+            store.write_batch(list(self.rows))
+        with sql.app.app_context():
+            db.session.add(MonitorData(type='disk', metric='usage', value=5.0, timestamp=self.start))
+            db.session.add(MonitorData(type='disk', metric='usage', value=7.0, timestamp=self.start + timedelta(minutes=1)))
+            # 前 10 分钟压缩为块，块内样本逐块解码参与统计
+            sql.samples.compact(self.start + timedelta(minutes=10), chunk_seconds=600)
+            db.session.commit()
+        memory.write_batch([
+            {'timestamp': self.start, 'type': 'disk', 'metric': 'usage', 'value': 5.0},
+            {'timestamp': self.start + timedelta(minutes=1), 'type': 'disk', 'metric': 'usage', 'value': 7.0}
+        ])
+
+        expected = memory.regression_sums(self.start, self.end)
+        actual = sql.regression_sums(self.start, self.end)
+        self.assertEqual(set(expected), set(actual))
+        for key, sums in expected.items():
+            for name, value in sums.items():
+                if isinstance(value, float):
+                    # SQLite 的 julianday 换算秒数有微秒级误差
+                    self.assertAlmostEqual(actual[key][name] / (abs(value) or 1), value / (abs(value) or 1), places=6)
+                else:
+                    self.assertEqual(actual[key][name], value)
+
+        # 指定序列时 extra 中的动态指标通过 JSON 提取在 SQL 中聚合
+        pushed = sql.regression_sums(self.start, self.end, [('gpu', 'usage')])[('gpu', 'usage')]
+        self.assertEqual((pushed['count'], pushed['sum_y'], pushed['last']), (120, float(sum(range(120))), 119.0))
+        self.assertAlmostEqual(pushed['sum_xy'] / expected[('gpu', 'usage')]['sum_xy'], 1.0, places=6)
+
+        # 由累加量计算的斜率与 polyfit 一致
+        points = memory.read_range(self.start, self.end, [('gpu', 'usage')])[('gpu', 'usage')]
+        seconds = [(timestamp - self.start).total_seconds() for timestamp, _ in points]
+        stats = RunningStats.from_sums(actual[('gpu', 'usage')], self.start)
+        self.assertAlmostEqual(stats.slope, np.polyfit(seconds, [value for _, value in points], 1)[0])
+        self.assertEqual(stats.last_value, 119.0)
+        sql.close()
+
+    def test_components_share_store(self):
+        store = MemoryMetricStore()
+        now = datetime.utcnow()
+        store.write_batch([
+            {'timestamp': now - timedelta(minutes=10 - i), 'type': 'cpu', 'metric': 'usage', 'value': float(i * 10)}
+            for i in range(5)
+        ])
+        # 旧版扁平指标名映射到统一的序列
+        self.assertEqual(resolve_metric('cpu_percent'), ('cpu', 'usage'))
+        analysis = MetricsAnalyzer(store).analyze_trends('cpu_percent')
+        self.assertEqual(analysis['current_value'], 40.0)
+        self.assertEqual(analysis['trend'], 'increasing')
+
+        path = os.path.join(self.directory, 'export.csv')
+        DataExporter(store).export_to_csv(path, metrics=['cpu.usage'])
+        df = pd.read_csv(path)
+        self.assertEqual(list(df.columns), ['timestamp', 'metric_name', 'metric_value'])
+        self.assertEqual(len(df), 5)
+        self.assertEqual(df['metric_name'].iloc[0], 'cpu.usage')
+
+if __name__ == '__main__':
+    unittest.main() 
@@ -0,0 +1,85 @@
+import unittest
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from datetime import datetime, timedelta
+from tests.base import DatabaseTestCase
+from src.models import db, ForecastModel
+from src.database.metric_store import MemoryMetricStore
+from src.utils.time_buckets import bucket_start
+from src.analysis.forecasting import Forecaster
+from src.analysis.model_registry import ModelRegistry
+
+class TestModelRegistry(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rng = np.random.default_rng(0)
+        # 最近 21 天的小时数据，截止到上一个完整小时
+        self.now = bucket_start(datetime.utcnow(), 3600)
+        self.start = self.now - timedelta(days=21)
+        self.store = MemoryMetricStore()
+        self.store.write_batch([
+            {'type': 'cpu', 'metric': metric, 'timestamp': self.start + timedelta(hours=h),
+             'value': 50 + slope * h + 10 * np.sin(2 * np.pi * h / 24) + self.rng.normal(0, 0.5)}
+            for h in range(21 * 24) for metric, slope in (('usage', 0.05), ('user', -0.02))
+        ])
+
+    def test_incremental_update_matches_batch_fit(self):
+        history = self.store.read_range(self.start, self.now, step=3600)
+        registry = ModelRegistry(self.store, {'forecast_decay': 1.0})
+        # 先训练前 14 天，再分两次并入剩余数据
+        registry.refresh(now=self.start + timedelta(days=14))
+        self.assertEqual(registry.watermark(('cpu', 'usage')), self.start + timedelta(days=14, hours=-1))
+        registry.refresh(now=self.start + timedelta(days=18, hours=5))
+        self.assertGreater(registry.refresh(now=self.now), 0)
+        # 没有新的完整小时时不重复并入
+        self.assertEqual(registry.refresh(now=self.now + timedelta(minutes=30)), 0)
+
+        batch = Forecaster().forecast(history, horizon=12)
+        for key in history:
+            forecast = registry.predict(key, horizon=12, refresh=False)
+            np.testing.assert_allclose(forecast['predicted'], batch[key]['predicted'], rtol=1e-6)
+            np.testing.assert_allclose(forecast['upper'], batch[key]['upper'], rtol=1e-6)
+            self.assertEqual(forecast['timestamps'], batch[key]['timestamps'])
+            self.assertEqual(forecast['samples'], 21 * 24)
+            self.assertAlmostEqual(forecast['slope'], batch[key]['slope'], places=6)
+
+    def test_prediction_cache(self):
+        registry = ModelRegistry(self.store, {'forecast_cache_size': 2})
+        first = registry.predict(('cpu', 'usage'), horizon=6)
+        self.assertEqual(len(first['predicted']), 6)
+        self.assertIs(registry.predict(('cpu', 'usage'), horizon=6), first)
+
+        started = time.perf_counter()
+        for _ in range(1000):
+            registry.predict(('cpu', 'usage'), horizon=6)
+        # 缓存命中只做字典查找，不读存储也不求解
+        self.assertLess((time.perf_counter() - started) / 1000, 1e-3)
+
+        registry.predict(('cpu', 'user'), horizon=6)
+        registry.predict(('cpu', 'usage'), horizon=12)
+        stats = registry.get_stats()
+        self.assertEqual(stats['cached_predictions'], 2)
+        self.assertEqual(stats['cache_misses'], 3)
+        self.assertIsNone(registry.predict(('disk', 'usage'), horizon=6))
+
+    def test_save_and_load(self):
+        registry = ModelRegistry(self.store)
+        registry.refresh(now=self.now)
+        self.assertEqual(registry.save(), 2)
+        self.assertEqual(ForecastModel.query.count(), 2)
+
+        restored = ModelRegistry(self.store)
+        self.assertEqual(restored.load(), 2)
+        np.testing.assert_allclose(
+            restored.predict(('cpu', 'usage'), horizon=6, refresh=False)['predicted'],
+            registry.predict(('cpu', 'usage'), horizon=6, refresh=False)['predicted']
+        )
+        # 特征布局变化的模型不恢复
+        self.assertEqual(ModelRegistry(self.store, {'forecast_weekly_harmonics': 0}).load(), 0)
+
+if __name__ == '__main__':
+    unittest.main() 
\ No newline at end of file
@@ -74,9 +74,10 @@ class TestMonitoringSystem(unittest.TestCase):
                 os.remove('test_export.csv')
 
     def tearDown(self):
-        # 清理测试数据库
-        if os.path.exists(self.config['db_path']):
-            os.remove(self.config['db_path'])
+        # 清理测试数据库（包括 WAL 模式的日志文件）
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.config['db_path'] + suffix):
+                os.remove(self.config['db_path'] + suffix)
 
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
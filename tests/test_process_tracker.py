@@ -0,0 +1,64 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.monitor.process_tracker import ProcessTracker, ProcessRetentionPolicy
+
+class TestProcessTracker(unittest.TestCase):
+    def setUp(self):
+        self.tracker = ProcessTracker()
+
+    def test_scan_tracks_current_process(self):
+        self.assertGreater(self.tracker.scan(), 0)
+        self.tracker.scan()
+        stats = self.tracker.get_stats()
+        self.assertEqual(stats['scans'], 2)
+        self.assertGreaterEqual(stats['last_scan_duration'], 0)
+
+        pids = [proc['pid'] for proc in self.tracker.top(limit=stats['tracked'], sort_by='memory_percent')]
+        self.assertIn(os.getpid(), pids)
+
+    def test_top_is_bounded_and_sorted(self):
+        self.tracker.scan()
+        self.tracker.scan()
+        top = self.tracker.top(limit=3)
+        self.assertLessEqual(len(top), 3)
+        values = [proc['cpu_percent'] for proc in top]
+        self.assertEqual(values, sorted(values, reverse=True))
+        for proc in top:
+            self.assertIn('name', proc)
+            self.assertIn('status', proc)
+
+class TestProcessRetentionPolicy(unittest.TestCase):
+    def setUp(self):
+        self.records = [
+            {'pid': 1, 'name': 'nginx', 'cpu_percent': 30.0, 'memory_percent': 1.0},
+            {'pid': 2, 'name': 'nginx', 'cpu_percent': 20.0, 'memory_percent': 1.0},
+            {'pid': 3, 'name': 'java', 'cpu_percent': 5.0, 'memory_percent': 40.0},
+            {'pid': 4, 'name': 'kworker', 'cpu_percent': 0.0, 'memory_percent': 0.0},
+            {'pid': 5, 'name': 'kworker', 'cpu_percent': 0.0, 'memory_percent': 0.0}
+        ]
+
+    def test_top_n_with_threshold(self):
+        policy = ProcessRetentionPolicy({'top_cpu': 2, 'top_memory': 1, 'min_cpu_percent': 1})
+        selected = policy.select(self.records)
+        self.assertEqual([record['pid'] for record in selected], [1, 2, 3])
+
+    def test_skip_idle_processes(self):
+        policy = ProcessRetentionPolicy({'top_cpu': 10, 'top_memory': 10})
+        pids = [record['pid'] for record in policy.select(self.records)]
+        self.assertNotIn(4, pids)
+        self.assertNotIn(5, pids)
+
+    def test_aggregate_by_name(self):
+        policy = ProcessRetentionPolicy({'top_cpu': 1, 'top_memory': 0, 'aggregate_by_name': True})
+        selected = policy.select(self.records)
+        self.assertEqual(len(selected), 1)
+        self.assertEqual(selected[0]['name'], 'nginx')
+        self.assertEqual(selected[0]['cpu_percent'], 50.0)
+        self.assertEqual(selected[0]['process_count'], 2)
+        self.assertIsNone(selected[0]['pid'])
+
+if __name__ == '__main__':
+    unittest.main() 
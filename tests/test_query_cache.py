@@ -0,0 +1,67 @@
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.query_cache import QueryCache, align_range
+
+class TestQueryCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = QueryCache({'query_cache_size': 2})
+        self.base = datetime(2024, 1, 1)
+        self.calls = 0
+
+    def _compute(self, value):
+        def compute():
+            self.calls += 1
+            return value
+        return compute
+
+    def test_align_range(self):
+        start, end = align_range(self.base + timedelta(seconds=70), self.base + timedelta(seconds=3650), 60)
+        self.assertEqual(start, self.base + timedelta(seconds=60))
+        self.assertEqual(end, self.base + timedelta(seconds=3660))
+        # 同一桶内的两次轮询得到相同的范围
+        self.assertEqual(align_range(self.base, self.base + timedelta(seconds=3605), 60)[1], end)
+
+    def test_hit_and_miss_counters(self):
+        end = self.base + timedelta(hours=1)
+        self.assertEqual(self.cache.get_or_compute('a', end, self._compute(1)), 1)
+        self.assertEqual(self.cache.get_or_compute('a', end, self._compute(2)), 1)
+        self.assertEqual(self.calls, 1)
+        stats = self.cache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_lru_eviction(self):
+        end = self.base
+        for key in ['a', 'b']:
+            self.cache.get_or_compute(key, end, self._compute(key))
+        self.cache.get_or_compute('a', end, self._compute('a'))
+        self.cache.get_or_compute('c', end, self._compute('c'))
+        self.assertEqual(self.cache.get_stats()['evictions'], 1)
+        self.cache.get_or_compute('a', end, self._compute('a'))
+        self.assertEqual(self.calls, 3)
+
+    def test_ingest_invalidates_only_newest_buckets(self):
+        self.cache.get_or_compute('history', self.base + timedelta(hours=1), self._compute('old'))
+        self.cache.get_or_compute('live', self.base + timedelta(hours=2), self._compute('new'))
+
+        self.cache.on_ingest([{'type': 'cpu', 'metric': 'usage', 'value': 1.0,
+                               'timestamp': self.base + timedelta(hours=1, minutes=30)}])
+        self.assertEqual(self.cache.get_stats()['invalidations'], 1)
+        self.cache.get_or_compute('history', self.base + timedelta(hours=1), self._compute('old'))
+        self.cache.get_or_compute('live', self.base + timedelta(hours=2), self._compute('new'))
+        self.assertEqual(self.calls, 3)
+
+    def test_concurrent_write_not_cached(self):
+        end = self.base + timedelta(hours=1)
+
+        def compute():
+            self.cache.invalidate_from(self.base)
+            return 'stale'
+        self.cache.get_or_compute('a', end, compute)
+        self.assertEqual(self.cache.get_stats()['size'], 0)
+
+if __name__ == '__main__':
+    unittest.main() 
@@ -0,0 +1,74 @@
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.base import DatabaseTestCase
+from src.models import db, MonitorData, MonitorRollup
+from src.database.rollup import RollupManager, RAW_RESOLUTION, bucket_start
+
+class TestRollupManager(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rollups = RollupManager({'retention_days': 1})
+        self.base = bucket_start(datetime.utcnow() - timedelta(hours=2), 3600)
+
+    def _rows(self, values, offset_seconds=0):
+        return [
+            {'type': 'cpu', 'metric': 'usage', 'value': value,
+             'timestamp': self.base + timedelta(seconds=offset_seconds + i * 10)}
+            for i, value in enumerate(values)
+        ]
+
+    def test_ingest_merges_buckets(self):
+        self.rollups.ingest(self._rows([10, 30, 20]))
+        self.rollups.ingest(self._rows([40], offset_seconds=40))
+        self.rollups.ingest(self._rows([50], offset_seconds=60))
+
+        minute = MonitorRollup.query.filter_by(resolution=60, bucket=self.base).one()
+        self.assertEqual(minute.sample_count, 4)
+        self.assertEqual(minute.min_value, 10)
+        self.assertEqual(minute.max_value, 40)
+        self.assertAlmostEqual(minute.avg_value, 25)
+        self.assertEqual(minute.last_value, 40)
+
+        hour = MonitorRollup.query.filter_by(resolution=3600, bucket=self.base).one()
+        self.assertEqual(hour.sample_count, 5)
+        self.assertEqual(hour.last_value, 50)
+        self.assertEqual(MonitorRollup.query.filter_by(resolution=60).count(), 2)
+
+    def test_select_resolution(self):
+        end = datetime.utcnow()
+        self.assertEqual(self.rollups.select_resolution(end - timedelta(hours=1), end), RAW_RESOLUTION)
+        self.assertEqual(self.rollups.select_resolution(end - timedelta(hours=24), end, step=300), 300)
+        self.assertEqual(self.rollups.select_resolution(end - timedelta(days=7), end, max_points=100), 3600)
+        # 超出 1分钟层级保留期时退到更粗的层级
+        self.assertEqual(self.rollups.select_resolution(end - timedelta(days=20), end, step=60), 300)
+
+    def test_read_series_and_raw_fallback(self):
+        rows = self._rows([10, 20, 30, 40, 50, 60, 70])
+        db.session.bulk_insert_mappings(MonitorData, [dict(row) for row in rows])
+        db.session.commit()
+        end = self.base + timedelta(hours=1)
+
+        raw = self.rollups.read_series('cpu', 'usage', self.base, end, step=300)
+        self.assertEqual(len(raw), 7)
+
+        self.rollups.ingest(rows)
+        points = self.rollups.read_series('cpu', 'usage', self.base, end, step=300)
+        self.assertEqual(len(points), 1)
+        self.assertAlmostEqual(points[0][1], 40)
+        self.assertEqual(points[0][4], 7)
+
+        self.assertEqual(self.rollups.rebuild(self.base, end), 7)
+        self.assertEqual(MonitorRollup.query.filter_by(resolution=300).one().sample_count, 7)
+
+    def test_apply_retention(self):
+        self.rollups.ingest(self._rows([10]))
+        deleted = self.rollups.apply_retention(now=self.base + timedelta(days=400))
+        self.assertEqual(deleted, 3)
+        self.assertEqual(MonitorRollup.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main() 
@@ -0,0 +1,90 @@
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.base import DatabaseTestCase
+from src.models import db, MonitorData, MonitorSample
+from src.database.sample_store import SampleStore
+from src.database.schema import ensure_columns, ensure_indexes
+
+class TestSampleStore(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = SampleStore()
+        self.base = datetime(2024, 1, 1)
+
+    def _write_samples(self, count):
+        rows = []
+        for i in range(count):
+            timestamp = self.base + timedelta(minutes=i)
+            rows.extend([
+                {'type': 'cpu', 'metric': 'usage', 'value': 10.0 + i, 'timestamp': timestamp},
+                {'type': 'memory', 'metric': 'usage', 'value': 50.0, 'timestamp': timestamp},
+                {'type': 'system', 'metric': 'load_1', 'value': 0.5 * i, 'timestamp': timestamp}
+            ])
+        self.assertEqual(self.store.write(rows), count)
+        db.session.commit()
+
+    def test_one_row_per_timestamp(self):
+        self._write_samples(3)
+        self.assertEqual(MonitorSample.query.count(), 3)
+        sample = MonitorSample.query.order_by(MonitorSample.timestamp).first()
+        self.assertEqual(sample.cpu_usage, 10.0)
+        self.assertEqual(sample.extra, {'system.load_1': 0.0})
+
+    def test_read_range(self):
+        self._write_samples(5)
+        db.session.add(MonitorData(type='cpu', metric='usage', value=1.0,
+                                   timestamp=self.base - timedelta(minutes=1)))
+        db.session.commit()
+
+        series = self.store.read_range(self.base - timedelta(hours=1), self.base + timedelta(hours=1))
+        self.assertEqual(set(series), {('cpu', 'usage'), ('memory', 'usage'), ('system', 'load_1')})
+        self.assertEqual([value for _, value in series[('cpu', 'usage')]], [1.0, 10.0, 11.0, 12.0, 13.0, 14.0])
+
+        load = self.store.read_range(self.base, self.base + timedelta(minutes=2), series=[('system', 'load_1')])
+        self.assertEqual(list(load), [('system', 'load_1')])
+        self.assertEqual([value for _, value in load[('system', 'load_1')]], [0.0, 0.5, 1.0])
+
+    def test_extra_series(self):
+        self._write_samples(3)
+        later = self.base + timedelta(hours=1)
+        self.store.write([{'type': 'gpu', 'metric': 'usage', 'value': 1.0, 'timestamp': later}])
+        db.session.commit()
+        self.assertEqual(self.store.extra_series(self.base, self.base + timedelta(minutes=5)), [('system', 'load_1')])
+        self.assertEqual(self.store.extra_series(self.base, later), [('gpu', 'usage'), ('system', 'load_1')])
+
+    def test_read_series(self):
+        self._write_samples(5)
+        db.session.add(MonitorData(type='cpu', metric='usage', value=1.0,
+                                   timestamp=self.base - timedelta(minutes=1)))
+        db.session.commit()
+
+        end = self.base + timedelta(hours=1)
+        for key in [('cpu', 'usage'), ('system', 'load_1')]:
+            self.assertEqual(self.store.read_series(*key, self.base - timedelta(hours=1), end),
+                             self.store.read_range(self.base - timedelta(hours=1), end)[key])
+        self.assertEqual(self.store.read_series('cpu', 'missing', self.base, end), [])
+
+    def test_ensure_indexes(self):
+        db.session.execute(db.text('DROP INDEX ix_monitor_data_series_time'))
+        db.session.commit()
+        self.assertEqual(ensure_indexes(), ['ix_monitor_data_series_time'])
+        self.assertEqual(ensure_indexes(), [])
+
+    def test_ensure_columns(self):
+        db.session.execute(db.text('ALTER TABLE monitor_rollup DROP COLUMN sketch'))
+        db.session.commit()
+        self.assertEqual(ensure_columns(), ['monitor_rollup.sketch'])
+        self.assertEqual(ensure_columns(), [])
+
+    def test_delete_before(self):
+        self._write_samples(5)
+        self.assertEqual(self.store.delete_before(self.base + timedelta(minutes=2)), 2)
+        db.session.commit()
+        self.assertEqual(MonitorSample.query.count(), 3)
+
+if __name__ == '__main__':
+    unittest.main() 
@@ -0,0 +1,46 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.monitor.sampler import MetricsSampler
+
+class TestMetricsSampler(unittest.TestCase):
+    def setUp(self):
+        self.config = {
+            'sample_interval': 0.05,
+            'sample_history': 3,
+            'temperature_interval': 3600
+        }
+        self.sampler = MetricsSampler(self.config)
+
+    def test_sample(self):
+        snapshot = self.sampler.sample()
+        self.assertIn('cpu', snapshot)
+        self.assertIn('memory', snapshot)
+        self.assertIn('disk', snapshot)
+        self.assertIn('network', snapshot)
+        self.assertIn('processes', snapshot)
+        self.assertIs(self.sampler.latest(), snapshot)
+
+    def test_ring_buffer(self):
+        self.assertIsNone(self.sampler.latest())
+        snapshots = [self.sampler.sample() for _ in range(5)]
+        history = self.sampler.history()
+        self.assertEqual(len(history), 3)
+        self.assertIs(history[-1], snapshots[-1])
+        self.assertEqual(self.sampler.history(2), snapshots[-2:])
+        self.assertEqual(self.sampler.history(0), [])
+
+    def test_background_thread(self):
+        self.sampler.start()
+        try:
+            self.assertTrue(self.sampler.is_running)
+            self.assertIsNotNone(self.sampler.current())
+        finally:
+            self.sampler.stop(timeout=1)
+        self.assertFalse(self.sampler.is_running)
+        self.assertGreaterEqual(self.sampler.get_stats()['samples'], 1)
+
+if __name__ == '__main__':
+    unittest.main() 
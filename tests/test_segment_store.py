@@ -0,0 +1,98 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from datetime import datetime, timedelta
+from src.database.segment_store import SegmentMetricStore
+
+class TestSegmentMetricStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = {'segment_dir': self.directory, 'segment_seconds': 600}
+        self.start = datetime(2024, 1, 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _rows(self, count, offset=0, metrics=('usage', 'user')):
+        return [
+            {'timestamp': self.start + timedelta(seconds=i), 'type': 'cpu', 'metric': metric, 'value': float(i)}
+            for i in range(offset, offset + count) for metric in metrics
+        ]
+
+    def test_write_and_read(self):
+        store = SegmentMetricStore(self.config)
+        store.write_batch(self._rows(1800))
+        # 600 秒一个段
+        self.assertEqual(store.get_stats()['segments'], 3)
+
+        end = self.start + timedelta(seconds=1799)
+        points = store.read_range(self.start + timedelta(seconds=10), end, [('cpu', 'usage')])
+        self.assertEqual(len(points[('cpu', 'usage')]), 1790)
+        self.assertEqual(points[('cpu', 'usage')][0], (self.start + timedelta(seconds=10), 10.0))
+
+        averaged = store.read_range(self.start, end, [('cpu', 'user')], step=60)
+        self.assertEqual(averaged[('cpu', 'user')][1], (self.start + timedelta(minutes=1), 89.5))
+
+        stats = store.aggregate(self.start, end)
+        self.assertEqual(stats[('cpu', 'usage')]['count'], 1800)
+        self.assertEqual(stats[('cpu', 'user')]['max'], 1799.0)
+        sums = store.regression_sums(self.start, end, [('cpu', 'usage')])[('cpu', 'usage')]
+        self.assertEqual((sums['count'], sums['sum_x'], sums['sum_xy']), (1800, sum(range(1800)), sum(i * i for i in range(1800))))
+        self.assertEqual((sums['last_timestamp'], sums['last']), (end, 1799.0))
+
+        # 单段范围读取直接引用映射内存
+        metrics, records = store.read_slices('cpu', self.start, self.start + timedelta(seconds=100))[0]
+        self.assertEqual(len(records), 101)
+        self.assertTrue(np.shares_memory(records, store._segments['cpu'][0].view()))
+        store.close()
+
+    def test_new_metric_and_reload(self):
+        store = SegmentMetricStore(self.config)
+        store.write_batch(self._rows(10))
+        store.write_batch(self._rows(10, offset=10, metrics=('usage', 'iowait')))
+        self.assertEqual(store.get_stats()['segments'], 2)
+        store.close()
+
+        # 模拟异常退出时写了一半的记录
+        path = sorted(os.path.join(self.directory, 'cpu', name)
+                      for name in os.listdir(os.path.join(self.directory, 'cpu')) if name.endswith('.seg'))[-1]
+        with open(path, 'ab') as f:
+            f.write(b'\x00' * 5)
+
+        store = SegmentMetricStore(self.config)
+        end = self.start + timedelta(seconds=30)
+        points = store.read_range(self.start, end)
+        self.assertEqual(len(points[('cpu', 'usage')]), 20)
+        self.assertEqual(len(points[('cpu', 'user')]), 10)
+        self.assertEqual(points[('cpu', 'iowait')][0], (self.start + timedelta(seconds=10), 10.0))
+        store.write_batch(self._rows(1, offset=20))
+        self.assertEqual(len(store.read_series('cpu', 'usage', self.start, end)), 21)
+        store.close()
+
+    def test_out_of_order_writes(self):
+        store = SegmentMetricStore(self.config)
+        store.write_batch(self._rows(5, offset=5))
+        store.write_batch(self._rows(5))
+        points = store.read_series('cpu', 'usage', self.start, self.start + timedelta(seconds=3))
+        self.assertEqual([value for _, value in points], [0.0, 1.0, 2.0, 3.0])
+        store.close()
+
+    def test_retention_drops_segments(self):
+        store = SegmentMetricStore(self.config)
+        store.write_batch(self._rows(1800))
+        deleted = store.delete_before(self.start + timedelta(seconds=900))
+        # 只删除整段过期的第一个段，跨越截止时间的段保留
+        self.assertEqual(deleted, 600)
+        self.assertEqual(len([name for name in os.listdir(os.path.join(self.directory, 'cpu'))
+                              if name.endswith('.seg')]), 2)
+        points = store.read_series('cpu', 'usage', self.start, self.start + timedelta(hours=1))
+        self.assertEqual(points[0][1], 600.0)
+        store.close()
+
+if __name__ == '__main__':
+    unittest.main() 
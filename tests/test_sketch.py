@@ -0,0 +1,105 @@
+import unittest
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from datetime import datetime, timedelta
+from tests.base import DatabaseTestCase
+from src.models import db, MetricAlert, MonitorRollup
+from src.database.sketch import QuantileSketch, quantile_name
+from src.database.rollup import RollupManager, bucket_start
+from src.database.metric_store import SQLMetricStore
+from src.alert.rule_evaluator import evaluate_alerts
+
+class TestQuantileSketch(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = np.concatenate([rng.lognormal(3, 1, 20000), -rng.exponential(5, 500), np.zeros(10)])
+
+    def test_relative_accuracy(self):
+        sketch = QuantileSketch(0.01).add_values(self.values)
+        ordered = np.sort(self.values)
+        for q in (0.01, 0.5, 0.95, 0.99):
+            expected = ordered[int(q * (len(ordered) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - expected), 0.01 * abs(expected) + 1e-9)
+        self.assertEqual(sketch.quantile(0), self.values.min())
+        self.assertEqual(sketch.quantile(1), self.values.max())
+        self.assertEqual(quantile_name(0.999), 'p99.9')
+
+    def test_merge_equals_union_and_round_trip(self):
+        whole = QuantileSketch().add_values(self.values)
+        merged = QuantileSketch()
+        for part in np.array_split(self.values, 7):
+            single = QuantileSketch()
+            for value in part[:100]:
+                single.add(float(value))
+            merged.merge(single.add_values(part[100:]))
+        self.assertEqual(merged.positive, whole.positive)
+        self.assertEqual(merged.negative, whole.negative)
+        self.assertEqual(merged.quantiles(), whole.quantiles())
+
+        decoded = QuantileSketch.from_bytes(whole.to_bytes())
+        self.assertEqual(decoded.quantiles(), whole.quantiles())
+        self.assertEqual(decoded.count, len(self.values))
+        with self.assertRaises(ValueError):
+            whole.merge(QuantileSketch(0.02).add_values([1.0]))
+
+class TestRollupQuantiles(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rollups = RollupManager({'retention_days': 0})
+        self.store = SQLMetricStore(self.app, self.rollups)
+        self.store.add_listener(self.rollups.ingest)
+        self.end = bucket_start(datetime.utcnow(), 3600)
+        self.start = self.end - timedelta(hours=6)
+
+        # 6 小时每 10 秒一个样本，分两批写入，同一汇总桶的草图跨批合并
+        self.values = np.random.default_rng(1).gamma(4, 10, 6 * 360)
+        rows = [{'type': 'cpu', 'metric': 'usage', 'value': float(value), 'timestamp': self.start + timedelta(seconds=i * 10)}
+                for i, value in enumerate(self.values)]
+        self.store.write_batch(rows[:1000])
+        self.store.write_batch(rows[1000:])
+
+    def test_quantiles_from_rollups_only(self):
+        # 删除原始样本后分位数仍可由汇总桶草图得到
+        self.store.delete_before(self.end)
+        self.assertEqual(self.store.read_range(self.start, self.end), {})
+
+        result = self.store.quantiles(self.start, self.end - timedelta(microseconds=1), (0.5, 0.99))[('cpu', 'usage')]
+        ordered = np.sort(self.values)
+        self.assertEqual(result['count'], len(self.values))
+        for name, q in (('p50', 0.5), ('p99', 0.99)):
+            expected = ordered[int(q * (len(ordered) - 1))]
+            self.assertAlmostEqual(result[name], expected, delta=0.011 * expected)
+
+    def test_percentile_alert_rule(self):
+        p99 = float(np.quantile(self.values, 0.99))
+        db.session.add_all([
+            MetricAlert(name='p99', metric_type='cpu', metric_name='usage', condition='>', threshold=p99 * 0.9,
+                        duration=6 * 3600, aggregation='p99', severity='critical', enabled=True),
+            MetricAlert(name='avg', metric_type='cpu', metric_name='usage', condition='>', threshold=p99 * 0.9,
+                        duration=6 * 3600, severity='warning', enabled=True)
+        ])
+        db.session.commit()
+        alerts = evaluate_alerts(self.store, self.end)
+        self.assertEqual([alert['name'] for alert in alerts], ['p99'])
+        self.assertAlmostEqual(alerts[0]['value'], p99, delta=0.02 * p99)
+
+    def test_last_value_alert_rule(self):
+        last = float(self.values[-1])
+        db.session.add(MetricAlert(name='last', metric_type='cpu', metric_name='usage', condition='>=', threshold=last,
+                                   duration=60, aggregation='last', severity='warning', enabled=True))
+        db.session.commit()
+        alerts = evaluate_alerts(self.store, self.end)
+        self.assertEqual([(alert['name'], alert['value']) for alert in alerts], [('last', last)])
+
+    def test_legacy_rollups_without_sketch(self):
+        MonitorRollup.query.update({'sketch': None})
+        db.session.commit()
+        # 汇总行缺少草图时回退到原始样本
+        result = self.store.quantiles(self.start, self.end)[('cpu', 'usage')]
+        self.assertEqual(result['count'], len(self.values))
+
+if __name__ == '__main__':
+    unittest.main() 
\ No newline at end of file
@@ -0,0 +1,98 @@
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from tests.base import DatabaseTestCase
+from src.models import db, MetricStats
+from src.database.metric_store import MemoryMetricStore
+from src.database.streaming_stats import RunningStats, StreamingStats, bucket_start, threshold_breaches
+
+class TestStreamingStats(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.config = {'stats_checkpoint_interval': 3600}
+        self.base = bucket_start(datetime.utcnow() - timedelta(hours=3), 3600)
+        # 三小时数据，每分钟一个点，线性上升并叠加波动
+        self.values = [10 + 0.05 * i + (i % 7) for i in range(180)]
+        self.rows = [
+            {'type': 'cpu', 'metric': metric, 'value': value, 'timestamp': self.base + timedelta(minutes=i)}
+            for i, value in enumerate(self.values) for metric in ('usage', 'user')
+        ]
+
+    def test_matches_batch_statistics(self):
+        engine = StreamingStats(self.config)
+        for offset in range(0, len(self.rows), 50):
+            engine.ingest(self.rows[offset:offset + 50])
+
+        stats = engine.summarize(self.base, self.base + timedelta(hours=3))[('cpu', 'usage')]
+        values = np.array(self.values)
+        seconds = np.arange(len(values)) * 60.0
+        self.assertEqual(stats.count, 180)
+        self.assertAlmostEqual(stats.mean, values.mean())
+        self.assertAlmostEqual(stats.variance, values.var(ddof=1))
+        self.assertAlmostEqual(stats.slope, np.polyfit(seconds, values, 1)[0])
+
+        # 只合并窗口内的桶
+        second_hour = engine.summarize(self.base + timedelta(hours=1), self.base + timedelta(hours=1, minutes=59))
+        self.assertEqual(second_hour[('cpu', 'user')].count, 60)
+        self.assertAlmostEqual(second_hour[('cpu', 'user')].mean, values[60:120].mean())
+
+        summary = engine.summarize_by_series(self.base, self.base + timedelta(hours=3))['cpu.usage']
+        self.assertEqual(summary['samples'], 180)
+        self.assertEqual(summary['trend'], 'up')
+        self.assertEqual((summary['min'], summary['max'], summary['current']), (10, values.max(), values[-1]))
+
+    def test_thresholds_checked_per_series(self):
+        # memory.available 以字节计，不能混入 memory.usage 的平均值和阈值判断
+        engine = StreamingStats(self.config)
+        engine.ingest([
+            row for i in range(60) for row in (
+                {'type': 'memory', 'metric': 'usage', 'value': 40.0, 'timestamp': self.base + timedelta(minutes=i)},
+                {'type': 'memory', 'metric': 'available', 'value': 8 * 1024 ** 3,
+                 'timestamp': self.base + timedelta(minutes=i)},
+                {'type': 'cpu', 'metric': 'usage', 'value': 90.0, 'timestamp': self.base + timedelta(minutes=i)},
+            )
+        ])
+        summaries = engine.summarize_by_series(self.base, self.base + timedelta(hours=1))
+        self.assertEqual(set(summaries), {'memory.usage', 'memory.available', 'cpu.usage'})
+        self.assertAlmostEqual(summaries['memory.usage']['avg'], 40.0)
+        self.assertEqual(threshold_breaches(summaries), [(('cpu', 'usage'), 90.0, 70)])
+
+    def test_merge_is_order_independent(self):
+        merged = RunningStats()
+        parts = [RunningStats() for _ in range(3)]
+        for i, value in enumerate(self.values):
+            parts[i % 3].update(self.base + timedelta(minutes=i), value)
+        for part in reversed(parts):
+            merged.merge(part)
+        self.assertAlmostEqual(merged.mean, np.mean(self.values))
+        self.assertAlmostEqual(merged.variance, np.var(self.values, ddof=1))
+        self.assertEqual(merged.first_value, self.values[0])
+        self.assertEqual(merged.last_value, self.values[-1])
+
+    def test_checkpoint_and_load(self):
+        engine = StreamingStats(self.config)
+        engine.ingest(self.rows[:200])
+        self.assertEqual(engine.checkpoint(), 4)
+        engine.ingest(self.rows[200:])
+        self.assertEqual(engine.checkpoint(), 4)
+        self.assertEqual(MetricStats.query.count(), 6)
+
+        restored = StreamingStats(self.config)
+        self.assertEqual(restored.load(), 6)
+        end = self.base + timedelta(hours=3)
+        self.assertEqual(restored.summarize_by_series(self.base, end), engine.summarize_by_series(self.base, end))
+
+    def test_rebuild_from_store(self):
+        store = MemoryMetricStore()
+        store.write_batch(self.rows)
+        engine = StreamingStats(self.config)
+        self.assertEqual(engine.rebuild(store, self.base, self.base + timedelta(hours=3)), 360)
+        self.assertEqual(engine.get_stats()['series'], 2)
+        self.assertEqual(MetricStats.query.count(), 6)
+
+if __name__ == '__main__':
+    unittest.main() 